@@ -5,12 +5,37 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+La encuesta pública (formularios/views.py), los datos de métricas y el estado
+de exportaciones son vistas async: bajo un servidor ASGI un envío lento desde
+un celular no ocupa un worker mientras llega. Para desplegar:
+
+    uvicorn core.asgi:application --workers 4
+
+(el resto del dashboard sigue siendo síncrono y Django lo corre en hilos).
+Comparación con el despliegue WSGI: scripts/carga_encuesta.py.
+
+Conexiones a Postgres: bajo ASGI cada petición corre su código síncrono en un
+hilo distinto, así que la conexión persistente de Django (CONN_MAX_AGE) no se
+reutiliza y solo deja conexiones abiertas. Por eso aquí el modo por defecto es
+el pool (DB_POOL=True, ver settings); con DB_POOL=False se abre una conexión por
+petición.
 """
 
 import os
 
+from decouple import config
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+if config('DB_POOL', default=True, cast=bool):
+    os.environ.setdefault('DB_POOL', 'True')
+else:
+    os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
+
+# Llena el pool antes de la primera petición; si la base no responde solo lo registra (core/conexiones.py)
+from core import conexiones  # noqa: E402
+
+conexiones.calentar()
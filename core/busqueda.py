@@ -0,0 +1,89 @@
+"""
+Búsqueda de texto insensible a tildes y mayúsculas sobre índices de trigramas (pg_trgm).
+
+Los índices GIN se crean sobre la expresión f_unaccent(columna) (ver migraciones
+empresas.0005 y formularios.0004). Para que Postgres los use, las consultas deben
+comparar exactamente esa misma expresión: por eso aquí no se usa __icontains
+(Django lo traduce a UPPER(col::text) LIKE ..., que ningún índice cubre), sino
+ILIKE y el operador de similitud de palabras (%>) directamente sobre SinTildes(col).
+
+pg_trgm ya ignora mayúsculas al extraer los trigramas, así que basta con quitar tildes.
+"""
+import unicodedata
+
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db.models import BooleanField, CharField, Func, Q, Value
+
+
+# Longitud mínima para buscar por similitud: con menos de 3 letras no hay trigramas útiles
+LONGITUD_MINIMA = 3
+
+
+class SinTildes(Func):
+    """
+    f_unaccent(texto): envoltorio IMMUTABLE de unaccent() creado en la migración,
+    necesario porque unaccent() es STABLE y no se puede usar en un índice.
+    """
+    function = 'f_unaccent'
+    output_field = CharField()
+
+
+class ContieneTexto(Func):
+    """columna ILIKE patrón (el patrón ya trae los comodines)."""
+    arg_joiner = ' ILIKE '
+    template = '(%(expressions)s)'
+    output_field = BooleanField()
+
+
+class PareceTexto(Func):
+    """columna %> texto: similitud de palabras sobre el umbral pg_trgm.word_similarity_threshold."""
+    arg_joiner = ' %%> '
+    template = '(%(expressions)s)'
+    output_field = BooleanField()
+
+
+def sin_tildes(texto):
+    """
+    Lo mismo que f_unaccent() + minúsculas, en Python: para filtrar datos que no
+    están en la base (registros archivados, formularios/archivo.py).
+    """
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).casefold()
+
+
+def _escapar_like(texto):
+    return texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def contiene(campo, texto):
+    """
+    Condición "campo contiene texto" ignorando tildes y mayúsculas, usable en
+    .filter(). Equivale a __icontains pero aprovecha el índice de trigramas.
+    """
+    patron = Value(f'%{_escapar_like(texto.strip())}%')
+    return ContieneTexto(SinTildes(campo), SinTildes(patron))
+
+
+def coincide(campo, texto):
+    """
+    Condición de búsqueda tolerante: contiene el texto o se le parece
+    (errores de digitación, palabras en otro orden).
+    """
+    condicion = Q(contiene(campo, texto))
+    if len(texto.strip()) >= LONGITUD_MINIMA:
+        condicion |= Q(PareceTexto(SinTildes(campo), SinTildes(Value(texto.strip()))))
+    return condicion
+
+
+def buscar(queryset, campo, texto):
+    """
+    Filtra `queryset` por `texto` en `campo` y lo ordena por relevancia
+    (similitud de palabras, de mayor a menor). Agrega la anotación `relevancia`.
+    """
+    texto = (texto or '').strip()
+    if not texto:
+        return queryset.none()
+
+    return queryset.filter(coincide(campo, texto)).annotate(
+        relevancia=TrigramWordSimilarity(SinTildes(Value(texto)), SinTildes(campo))
+    ).order_by('-relevancia')
@@ -0,0 +1,64 @@
+"""
+Conexiones a Postgres abiertas al arrancar cada worker.
+
+Sin esto la primera petición de cada worker paga la conexión (TCP + TLS +
+autenticación contra RDS, más la consulta de tipos de django.contrib.postgres)
+y, con pool, espera a que se llene. core/wsgi.py y core/asgi.py llaman a
+`calentar()` después de cargar Django; los modos de conexión están en la
+sección CONEXIONES A POSTGRES de settings.
+
+Se ejecuta al importar el módulo WSGI/ASGI en cada worker: con gunicorn no
+usar --preload, o la conexión abierta en el proceso maestro quedaría
+compartida entre los workers tras el fork.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Segundos que se espera a que el pool tenga sus min_size conexiones
+ESPERA_POOL = 10
+
+
+def calentar():
+    """
+    Abre las conexiones que el worker va a reutilizar: llena el pool hasta
+    min_size, o deja abierta la conexión persistente del hilo principal (el que
+    atiende las peticiones en gunicorn sync). Con una conexión por petición
+    (CONN_MAX_AGE=0 sin pool) no hay nada que reutilizar.
+
+    Nunca falla: corre al importar core/wsgi.py y core/asgi.py, y una base caída
+    al arrancar tumbaría el worker. Se registra el error y el worker conecta en
+    su primera petición.
+    """
+    if not settings.DB_CALENTAR:
+        return
+    try:
+        conexiones = connections.all(initialized_only=False)
+    except Exception:
+        logger.warning('No se pudieron cargar las conexiones a la base al arrancar', exc_info=True)
+        return
+    for conexion in conexiones:
+        try:
+            _calentar(conexion)
+        except Exception:
+            # Base caída, pool sin llenar a tiempo o pool mal configurado
+            logger.warning('No se pudieron abrir las conexiones de "%s" al arrancar', conexion.alias, exc_info=True)
+
+
+def _calentar(conexion):
+    pool = getattr(conexion, 'pool', None)
+    if not pool and not conexion.settings_dict['CONN_MAX_AGE']:
+        return
+    inicio = time.perf_counter()
+    if pool:
+        pool.open(wait=True, timeout=ESPERA_POOL)
+    else:
+        conexion.ensure_connection()
+    logger.info(
+        'Conexiones de "%s" abiertas en %.0f ms (%s)', conexion.alias, (time.perf_counter() - inicio) * 1000,
+        f"pool de {pool.min_size} a {pool.max_size}" if pool else 'persistente',
+    )
@@ -0,0 +1,197 @@
+"""
+Limitador de tasa compartido entre procesos.
+
+Los contadores viven en un archivo SQLite local (RATE_LIMIT_DB), así que todos
+los workers de gunicorn del mismo servidor ven el mismo conteo; cada consulta +
+incremento corre dentro de una transacción BEGIN IMMEDIATE, que es atómica
+entre procesos.
+
+Semántica de ventana deslizante aproximada: se guardan contadores por ventana
+fija y el uso actual se estima como
+
+    previa * (fracción de la ventana previa que aún cae en la ventana deslizante) + actual
+
+lo que evita el "doble cupo" en el borde de dos ventanas fijas sin guardar
+cada petición.
+
+Además de los contadores, una clave puede quedar bloqueada por un tiempo fijo
+(`bloquear`), con una fila aparte que no depende de la ventana: es el bloqueo
+del login tras agotar los intentos.
+
+Si el archivo no está disponible el limitador deja pasar (y lo registra en el
+log): un problema de disco no debe tumbar la encuesta.
+"""
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+Resultado = namedtuple('Resultado', ['permitido', 'usados', 'restantes', 'reintentar_en'])
+
+# Cada cuántas operaciones (por proceso) se borran contadores vencidos
+OPERACIONES_ENTRE_LIMPIEZAS = 1000
+
+# Número de "ventana" de la fila de bloqueo de una clave (las ventanas reales son >= 0)
+VENTANA_BLOQUEO = -1
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS contadores (
+    clave TEXT NOT NULL,
+    ventana INTEGER NOT NULL,
+    cantidad INTEGER NOT NULL,
+    expira REAL NOT NULL,
+    PRIMARY KEY (clave, ventana)
+) WITHOUT ROWID
+"""
+
+
+class Limitador:
+    """Contadores de ventana deslizante en un archivo SQLite compartido."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._local = threading.local()
+        self._operaciones = 0
+
+    def _conexion(self):
+        # sqlite3 no se comparte entre hilos ni sobrevive a un fork: una conexión por hilo y proceso
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None or self._local.pid != os.getpid():
+            directorio = os.path.dirname(self.ruta)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            conexion = sqlite3.connect(self.ruta, timeout=5, isolation_level=None, check_same_thread=False)
+            conexion.execute('PRAGMA journal_mode=WAL')
+            conexion.execute('PRAGMA synchronous=NORMAL')
+            conexion.execute(ESQUEMA)
+            self._local.conexion = conexion
+            self._local.pid = os.getpid()
+        return conexion
+
+    def _estimar(self, conexion, clave, ventana, ahora):
+        actual = int(ahora // ventana)
+        filas = dict(conexion.execute(
+            'SELECT ventana, cantidad FROM contadores WHERE clave = ? AND ventana IN (?, ?)',
+            (clave, actual - 1, actual),
+        ).fetchall())
+        transcurrido = (ahora % ventana) / ventana
+        usados = filas.get(actual - 1, 0) * (1 - transcurrido) + filas.get(actual, 0)
+        return actual, usados
+
+    def registrar(self, clave, limite, ventana, contar_siempre=False):
+        """
+        Cuenta una petición para `clave` si todavía cabe en `limite` por `ventana`
+        segundos. Consulta e incremento son una sola operación atómica. Con
+        contar_siempre la petición se cuenta aunque ya no quepa (intentos
+        fallidos de login: ninguno puede quedar sin contar).
+        """
+        ahora = time.time()
+        try:
+            conexion = self._conexion()
+            conexion.execute('BEGIN IMMEDIATE')
+            try:
+                actual, usados = self._estimar(conexion, clave, ventana, ahora)
+                permitido = self._cabe(usados, limite)
+                if permitido or contar_siempre:
+                    conexion.execute(
+                        'INSERT INTO contadores (clave, ventana, cantidad, expira) VALUES (?, ?, 1, ?) '
+                        'ON CONFLICT (clave, ventana) DO UPDATE SET cantidad = cantidad + 1',
+                        (clave, actual, (actual + 2) * ventana),
+                    )
+                    usados += 1
+                conexion.execute('COMMIT')
+            except BaseException:
+                conexion.execute('ROLLBACK')
+                raise
+            self._limpiar_si_toca(conexion, ahora)
+        except sqlite3.Error:
+            logger.exception('Limitador de tasa no disponible (%s); se deja pasar la petición', self.ruta)
+            return Resultado(True, 0, limite, 0)
+
+        return self._resultado(permitido, usados, limite, ventana, ahora)
+
+    async def aregistrar(self, clave, limite, ventana):
+        """
+        `registrar` para vistas async. BEGIN IMMEDIATE puede esperar el candado del
+        archivo: corre en un hilo del pool para no frenar el event loop.
+        """
+        return await sync_to_async(self.registrar, thread_sensitive=False)(clave, limite, ventana)
+
+    def consultar(self, clave, limite, ventana):
+        """Como `registrar`, pero sin contar la petición."""
+        ahora = time.time()
+        try:
+            _, usados = self._estimar(self._conexion(), clave, ventana, ahora)
+        except sqlite3.Error:
+            logger.exception('Limitador de tasa no disponible (%s)', self.ruta)
+            return Resultado(True, 0, limite, 0)
+        return self._resultado(self._cabe(usados, limite), usados, limite, ventana, ahora)
+
+    def bloquear(self, clave, segundos):
+        """Bloquea `clave` durante `segundos`, sin importar los contadores (ver bloqueo_restante)."""
+        try:
+            self._conexion().execute(
+                'INSERT INTO contadores (clave, ventana, cantidad, expira) VALUES (?, ?, 0, ?) '
+                'ON CONFLICT (clave, ventana) DO UPDATE SET expira = excluded.expira',
+                (clave, VENTANA_BLOQUEO, time.time() + segundos),
+            )
+        except sqlite3.Error:
+            logger.exception('Limitador de tasa no disponible (%s)', self.ruta)
+
+    def bloqueo_restante(self, clave):
+        """Segundos que le quedan al bloqueo de `clave` (0 si no está bloqueada)."""
+        try:
+            fila = self._conexion().execute(
+                'SELECT expira FROM contadores WHERE clave = ? AND ventana = ?', (clave, VENTANA_BLOQUEO),
+            ).fetchone()
+        except sqlite3.Error:
+            logger.exception('Limitador de tasa no disponible (%s)', self.ruta)
+            return 0
+        return max(0, math.ceil(fila[0] - time.time())) if fila else 0
+
+    def reiniciar(self, clave):
+        """Olvida los contadores y el bloqueo de `clave` (p. ej. tras un login exitoso)."""
+        try:
+            self._conexion().execute('DELETE FROM contadores WHERE clave = ?', (clave,))
+        except sqlite3.Error:
+            logger.exception('Limitador de tasa no disponible (%s)', self.ruta)
+
+    @staticmethod
+    def _cabe(usados, limite):
+        # Mismo umbral para registrar y consultar: con la estimación entre limite - 1 y
+        # limite (justo después del borde de una ventana) ninguno de los dos deja pasar
+        return usados + 1 <= limite
+
+    @staticmethod
+    def _resultado(permitido, usados, limite, ventana, ahora):
+        # Sin cupo: en el peor caso hay que esperar a que termine la ventana actual
+        reintentar_en = 0 if permitido else int(ventana - (ahora % ventana)) + 1
+        return Resultado(permitido, int(usados), max(0, int(limite - usados)), reintentar_en)
+
+    def _limpiar_si_toca(self, conexion, ahora):
+        self._operaciones += 1
+        if self._operaciones % OPERACIONES_ENTRE_LIMPIEZAS == 0:
+            conexion.execute('DELETE FROM contadores WHERE expira < ?', (ahora,))
+
+
+_limitador = None
+_candado = threading.Lock()
+
+
+def limitador():
+    """Limitador del proceso, apuntando a settings.RATE_LIMIT_DB."""
+    global _limitador
+    if _limitador is None or _limitador.ruta != settings.RATE_LIMIT_DB:
+        with _candado:
+            if _limitador is None or _limitador.ruta != settings.RATE_LIMIT_DB:
+                _limitador = Limitador(settings.RATE_LIMIT_DB)
+    return _limitador
@@ -0,0 +1,310 @@
+"""
+Métricas de la aplicación en formato Prometheus.
+
+Cada proceso (worker de gunicorn / uvicorn, procesar_exportaciones...) acumula
+sus contadores e histogramas en memoria y un hilo en segundo plano los vuelca
+cada METRICAS_INTERVALO segundos a su propio archivo JSON en METRICAS_DIR
+({pid}-{arranque}.json, escritura atómica con os.replace). GET /metrics suma
+los archivos de todos los procesos, así que el resultado es el del servidor
+completo sin importar qué worker atienda.
+
+Los archivos de procesos que ya terminaron (reinicios por max_requests,
+despliegues) se funden en `acumulado.json` para que los contadores no
+retrocedan ni se acumulen archivos. El directorio debe ser local al servidor,
+como el del spool y el limitador: cada servidor expone sus propias métricas.
+
+El endpoint solo responde si hay METRICAS_TOKEN, con `Authorization: Bearer <token>`.
+"""
+import atexit
+import fcntl
+import glob
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views.decorators.cache import never_cache
+
+logger = logging.getLogger(__name__)
+
+CONTADOR = 'counter'
+HISTOGRAMA = 'histogram'
+
+# Segundos: del GET rápido de la encuesta a una exportación grande en streaming
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# nombre: (tipo, ayuda, etiquetas)
+DEFINICIONES = {
+    'encuestas_peticiones_total': (
+        CONTADOR, 'Peticiones HTTP atendidas.', ('vista', 'metodo', 'estado'),
+    ),
+    'encuestas_peticion_duracion_segundos': (
+        HISTOGRAMA, 'Duración de las peticiones HTTP hasta devolver la respuesta.', ('vista', 'metodo'),
+    ),
+    'encuestas_envios_total': (
+        CONTADOR, 'Encuestas recibidas (guardadas o en el spool), por empresa.', ('empresa',),
+    ),
+    'encuestas_rate_limit_rechazos_total': (
+        CONTADOR, 'Peticiones rechazadas con 429 por rate_limit.', ('prefijo',),
+    ),
+    'encuestas_login_fallidos_total': (
+        CONTADOR, 'Intentos de login fallidos.', (),
+    ),
+    'encuestas_login_bloqueos_total': (
+        CONTADOR, 'Bloqueos temporales de login por exceso de intentos.', (),
+    ),
+    'encuestas_exportacion_filas_total': (
+        CONTADOR, 'Filas escritas en exportaciones CSV / XLSX.', ('formato',),
+    ),
+}
+
+ARCHIVO_ACUMULADO = 'acumulado.json'
+
+
+class Registro:
+    """Contadores e histogramas del proceso actual, con volcado periódico a disco."""
+
+    def __init__(self):
+        self._candado = threading.Lock()
+        self._pid = None
+
+    def _reiniciar_si_fork(self):
+        # Con --preload el módulo se importa antes del fork: cada worker empieza de cero
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._archivo = f'{self._pid}-{time.time_ns()}.json'
+            self._contadores = {}
+            self._histogramas = {}
+            self._pendiente = False
+            # Vuelca aunque no lleguen más peticiones; daemon: no retiene la salida del worker
+            threading.Thread(target=self._volcar_periodicamente, name='metricas', daemon=True).start()
+
+    def _volcar_periodicamente(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(settings.METRICAS_INTERVALO)
+            self.volcar()
+
+    def incrementar(self, nombre, cantidad=1, **etiquetas):
+        clave = (nombre, _etiquetas(nombre, etiquetas))
+        with self._candado:
+            self._reiniciar_si_fork()
+            self._contadores[clave] = self._contadores.get(clave, 0) + cantidad
+            self._pendiente = True
+
+    def observar(self, nombre, valor, **etiquetas):
+        clave = (nombre, _etiquetas(nombre, etiquetas))
+        with self._candado:
+            self._reiniciar_si_fork()
+            serie = self._histogramas.get(clave)
+            if serie is None:
+                # [conteo por bucket (no acumulado) ..., +Inf, suma]
+                serie = self._histogramas[clave] = [0] * (len(BUCKETS_LATENCIA) + 1) + [0.0]
+            serie[_bucket(valor)] += 1
+            serie[-1] += valor
+            self._pendiente = True
+
+    def volcar(self):
+        """Escribe el archivo del proceso si hubo cambios desde el último volcado."""
+        if not activo():
+            return
+        with self._candado:
+            self._reiniciar_si_fork()
+            if not self._pendiente:
+                return
+            datos = _serializar(self._contadores, self._histogramas)
+            self._pendiente = False
+            archivo = self._archivo
+
+        try:
+            _escribir(os.path.join(settings.METRICAS_DIR, archivo), datos)
+        except OSError:
+            logger.exception('No se pudieron guardar las métricas en %s', settings.METRICAS_DIR)
+
+
+registro = Registro()
+atexit.register(registro.volcar)
+
+
+def activo():
+    return getattr(settings, 'METRICAS_ACTIVAS', True)
+
+
+def incrementar(nombre, cantidad=1, **etiquetas):
+    if activo():
+        registro.incrementar(nombre, cantidad, **etiquetas)
+
+
+def observar(nombre, valor, **etiquetas):
+    if activo():
+        registro.observar(nombre, valor, **etiquetas)
+
+
+def _etiquetas(nombre, etiquetas):
+    return tuple(str(etiquetas.get(etiqueta, '')) for etiqueta in DEFINICIONES[nombre][2])
+
+
+def _bucket(valor):
+    for i, limite in enumerate(BUCKETS_LATENCIA):
+        if valor <= limite:
+            return i
+    return len(BUCKETS_LATENCIA)
+
+
+def _serializar(contadores, histogramas, fundidos=()):
+    return {
+        'fundidos': list(fundidos),
+        'contadores': [[nombre, list(etiquetas), valor] for (nombre, etiquetas), valor in contadores.items()],
+        'histogramas': [[nombre, list(etiquetas), serie] for (nombre, etiquetas), serie in histogramas.items()],
+    }
+
+
+def _escribir(ruta, datos):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f'{ruta}.tmp'
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(datos, archivo)
+    os.replace(temporal, ruta)
+
+
+def _leer(ruta):
+    try:
+        with open(ruta, encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except (OSError, ValueError):
+        # Archivo recién borrado por otro proceso o a medio escribir por un proceso muerto
+        return None
+
+
+def _sumar(total, datos):
+    for nombre, etiquetas, valor in datos.get('contadores', []):
+        if nombre in DEFINICIONES:
+            clave = (nombre, tuple(etiquetas))
+            total['contadores'][clave] = total['contadores'].get(clave, 0) + valor
+    for nombre, etiquetas, serie in datos.get('histogramas', []):
+        if nombre in DEFINICIONES and len(serie) == len(BUCKETS_LATENCIA) + 2:
+            clave = (nombre, tuple(etiquetas))
+            previa = total['histogramas'].get(clave)
+            total['histogramas'][clave] = serie if previa is None else [a + b for a, b in zip(previa, serie)]
+
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _compactar(directorio):
+    """
+    Funde en acumulado.json los archivos de procesos que ya no existen. El
+    acumulado anota qué archivos ya fundió: si el proceso muere antes de
+    borrarlos, no se vuelven a sumar.
+    """
+    ruta_acumulado = os.path.join(directorio, ARCHIVO_ACUMULADO)
+    acumulado = _leer(ruta_acumulado) or {}
+    fundidos = set(acumulado.get('fundidos', []))
+
+    muertos = []
+    for ruta in glob.glob(os.path.join(directorio, '*-*.json')):
+        nombre = os.path.basename(ruta)
+        pid = nombre.split('-', 1)[0]
+        if pid.isdigit() and not _proceso_vivo(int(pid)):
+            muertos.append(ruta)
+    if not muertos:
+        return
+
+    total = {'contadores': {}, 'histogramas': {}}
+    _sumar(total, acumulado)
+    for ruta in muertos:
+        if os.path.basename(ruta) not in fundidos:
+            datos = _leer(ruta)
+            if datos:
+                _sumar(total, datos)
+    nombres = {os.path.basename(ruta) for ruta in muertos}
+    _escribir(ruta_acumulado, _serializar(total['contadores'], total['histogramas'], sorted(nombres)))
+    for ruta in muertos:
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+
+
+def recolectar():
+    """Suma las métricas de todos los procesos del servidor."""
+    directorio = settings.METRICAS_DIR
+    registro.volcar()
+    total = {'contadores': {}, 'histogramas': {}}
+    try:
+        os.makedirs(directorio, exist_ok=True)
+        with open(os.path.join(directorio, '.candado'), 'w') as candado:
+            # Compactar y leer bajo el mismo candado: otra lectura concurrente no ve
+            # un proceso muerto sumado dos veces (en su archivo y en el acumulado)
+            fcntl.flock(candado, fcntl.LOCK_EX)
+            _compactar(directorio)
+            acumulado = _leer(os.path.join(directorio, ARCHIVO_ACUMULADO)) or {}
+            fundidos = set(acumulado.get('fundidos', []))
+            for ruta in glob.glob(os.path.join(directorio, '*.json')):
+                if os.path.basename(ruta) in fundidos:
+                    continue
+                datos = _leer(ruta)
+                if datos:
+                    _sumar(total, datos)
+    except OSError:
+        logger.exception('No se pudieron leer las métricas de %s', directorio)
+    return total
+
+
+def _valor_etiqueta(valor):
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formato_etiquetas(nombre, etiquetas, extra=()):
+    pares = list(zip(DEFINICIONES[nombre][2], etiquetas)) + list(extra)
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{clave}="{_valor_etiqueta(valor)}"' for clave, valor in pares) + '}'
+
+
+def exponer():
+    """Texto en el formato de exposición de Prometheus (version 0.0.4)."""
+    total = recolectar()
+    lineas = []
+    for nombre, (tipo, ayuda, _) in DEFINICIONES.items():
+        lineas.append(f'# HELP {nombre} {ayuda}')
+        lineas.append(f'# TYPE {nombre} {tipo}')
+        if tipo == CONTADOR:
+            for (serie_nombre, etiquetas), valor in sorted(total['contadores'].items()):
+                if serie_nombre == nombre:
+                    lineas.append(f'{nombre}{_formato_etiquetas(nombre, etiquetas)} {valor}')
+            continue
+
+        for (serie_nombre, etiquetas), serie in sorted(total['histogramas'].items()):
+            if serie_nombre != nombre:
+                continue
+            acumulado = 0
+            for limite, cantidad in zip(list(BUCKETS_LATENCIA) + ['+Inf'], serie[:-1]):
+                acumulado += cantidad
+                lineas.append(f'{nombre}_bucket{_formato_etiquetas(nombre, etiquetas, [("le", str(limite))])} {acumulado}')
+            lineas.append(f'{nombre}_sum{_formato_etiquetas(nombre, etiquetas)} {serie[-1]}')
+            lineas.append(f'{nombre}_count{_formato_etiquetas(nombre, etiquetas)} {acumulado}')
+    return '\n'.join(lineas) + '\n'
+
+
+@never_cache
+def vista_metricas(request):
+    """GET /metrics para Prometheus. Sin METRICAS_TOKEN configurado no existe."""
+    token = settings.METRICAS_TOKEN
+    if not token or not activo():
+        raise Http404
+    autorizacion = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(autorizacion.encode(), f'Bearer {token}'.encode()):
+        return HttpResponse('No autorizado', status=401, headers={'WWW-Authenticate': 'Bearer'})
+    return HttpResponse(exponer(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,198 @@
+"""
+Middleware de observabilidad: instrumentación SQL y métricas por petición.
+
+Cuenta las consultas que hace cada petición, su tiempo total y las más lentas
+(connection.execute_wrapper, sin DEBUG ni connection.queries), y lo publica:
+
+  - cabecera Server-Timing ("db" y "app") para usuarios con sesión del tablero,
+    visible en la pestaña Red / Timing del navegador;
+  - una línea JSON en el logger 'core.sql' por petición (nivel INFO, WARNING si
+    excede el presupuesto);
+  - presupuestos de consultas por vista (SQL_PRESUPUESTOS, por nombre de URL):
+    con SQL_PRESUPUESTO_ESTRICTO la petición que los excede lanza
+    PresupuestoConsultasExcedido, de modo que un test que la recorra falla.
+
+En las respuestas en streaming (exportaciones) solo se cuenta lo ejecutado
+antes de devolver la respuesta, no lo que consume el iterador después.
+
+MetricasMiddleware alimenta el histograma de latencia y el contador de
+peticiones por vista de core/metricas.py (GET /metrics).
+"""
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from . import metricas
+
+logger = logging.getLogger('core.sql')
+
+# Caracteres de SQL que se guardan de cada consulta lenta
+LARGO_SQL = 300
+
+
+class PresupuestoConsultasExcedido(Exception):
+    """Una vista hizo más consultas de las permitidas en SQL_PRESUPUESTOS."""
+
+
+class RegistroConsultas:
+    """Wrapper de execute: acumula número, tiempo y las consultas más lentas."""
+
+    def __init__(self, lentas):
+        self.lentas = lentas
+        self.total = 0
+        self.duracion = 0.0
+        self.mas_lentas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracion = time.perf_counter() - inicio
+            self.total += 1
+            self.duracion += duracion
+            if self.lentas:
+                self.mas_lentas.append((duracion, sql))
+                # Solo se conservan las N más lentas: memoria acotada en exportaciones largas
+                if len(self.mas_lentas) > self.lentas:
+                    self.mas_lentas.sort(key=lambda consulta: consulta[0], reverse=True)
+                    del self.mas_lentas[self.lentas:]
+
+    def instalar(self):
+        """Engancha el wrapper en todas las conexiones. Devuelve los context managers a cerrar."""
+        activos = []
+        for alias in connections:
+            envoltura = connections[alias].execute_wrapper(self)
+            envoltura.__enter__()
+            activos.append(envoltura)
+        return activos
+
+
+def usuario_autenticado(request):
+    """
+    Si la petición es de un usuario con sesión, solo cuando la vista ya lo
+    cargó (login_required y demás; request.user o request.auser()). Cargarlo
+    aquí, después de medir, agregaría consultas de sesión y usuario sin contar
+    a la encuesta pública y a /metrics.
+    """
+    usuario = request.__dict__.get('_cached_user') or request.__dict__.get('_acached_user')
+    return usuario is not None and usuario.is_authenticated
+
+
+class InstrumentacionSQLMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.activo = getattr(settings, 'SQL_INSTRUMENTACION', True)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.activo:
+            return self.get_response(request)
+
+        registro, activos, inicio = self.iniciar()
+        try:
+            response = self.get_response(request)
+        finally:
+            self.desinstalar(activos)
+        return self.terminar(request, response, registro, inicio, usuario_autenticado(request))
+
+    async def __acall__(self, request):
+        if not self.activo:
+            return await self.get_response(request)
+
+        # Las conexiones son por hilo y el ORM async corre en el hilo de sync_to_async
+        # de la petición (thread_sensitive): el wrapper se engancha en ese hilo
+        registro, activos, inicio = await sync_to_async(self.iniciar)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(self.desinstalar)(activos)
+        return self.terminar(request, response, registro, inicio, usuario_autenticado(request))
+
+    def iniciar(self):
+        registro = RegistroConsultas(getattr(settings, 'SQL_CONSULTAS_LENTAS', 3))
+        return registro, registro.instalar(), time.perf_counter()
+
+    @staticmethod
+    def desinstalar(activos):
+        for envoltura in reversed(activos):
+            envoltura.__exit__(None, None, None)
+
+    def terminar(self, request, response, registro, inicio, autenticado):
+        duracion = time.perf_counter() - inicio
+        vista = request.resolver_match.view_name if request.resolver_match else None
+        presupuesto = getattr(settings, 'SQL_PRESUPUESTOS', {}).get(vista)
+        excedido = presupuesto is not None and registro.total > presupuesto
+
+        datos = {
+            'metodo': request.method,
+            'ruta': request.path,
+            'vista': vista,
+            'status': response.status_code,
+            'ms': round(duracion * 1000, 1),
+            'consultas': registro.total,
+            'sql_ms': round(registro.duracion * 1000, 1),
+            'presupuesto': presupuesto,
+            'mas_lentas': [
+                {'ms': round(tiempo * 1000, 1), 'sql': sql[:LARGO_SQL]}
+                for tiempo, sql in sorted(registro.mas_lentas, key=lambda consulta: consulta[0], reverse=True)
+            ],
+        }
+        logger.log(logging.WARNING if excedido else logging.INFO, json.dumps(datos, ensure_ascii=False), extra={'sql': datos})
+
+        if excedido and getattr(settings, 'SQL_PRESUPUESTO_ESTRICTO', False):
+            raise PresupuestoConsultasExcedido(
+                f'{vista} hizo {registro.total} consultas (presupuesto: {presupuesto})'
+            )
+
+        # Solo para el personal del tablero: los tiempos internos no son para la encuesta pública
+        if autenticado:
+            response['Server-Timing'] = (
+                f'db;dur={datos["sql_ms"]};desc="{registro.total} consultas", '
+                f'app;dur={round((duracion - registro.duracion) * 1000, 1)}'
+            )
+        return response
+
+
+class MetricasMiddleware:
+    """Latencia y conteo de peticiones por vista (nombre de URL) para /metrics."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        inicio = time.perf_counter()
+        response = self.get_response(request)
+        self.registrar(request, response, inicio)
+        return response
+
+    async def __acall__(self, request):
+        inicio = time.perf_counter()
+        response = await self.get_response(request)
+        self.registrar(request, response, inicio)
+        return response
+
+    @staticmethod
+    def registrar(request, response, inicio):
+        # Por nombre de URL y no por ruta: las rutas llevan IDs y slugs (cardinalidad sin límite)
+        vista = request.resolver_match.view_name if request.resolver_match else 'sin_ruta'
+        metricas.observar('encuestas_peticion_duracion_segundos', time.perf_counter() - inicio,
+                          vista=vista, metodo=request.method)
+        metricas.incrementar('encuestas_peticiones_total', vista=vista, metodo=request.method,
+                             estado=f'{response.status_code // 100}xx')
@@ -4,32 +4,47 @@ Utilidades de seguridad para el sistema de encuestas.
 import re
 import html
 from functools import wraps
-from django.core.cache import cache
-from django.http import HttpResponseForbidden
+from asgiref.sync import iscoroutinefunction
+from django.http import HttpResponse
 
+from . import metricas
+from .limitador import limitador
 
-def sanitize_string(value):
+
+# Patrones de inyección de scripts, en un solo regex precompilado:
+# javascript:, vbscript:, data:text/html y manejadores de eventos (onclick=, onload=, etc.).
+# El lookahead descarta rápido las posiciones que no pueden iniciar ninguno.
+PATRON_PELIGROSO = re.compile(r'(?=[jvdo])(?:(?:java|vb)script:|data:text/html|on\w+\s*=)', re.IGNORECASE)
+
+# Entidad HTML cortada al final de un texto recortado (ej: "&am")
+_ENTIDAD_CORTADA = re.compile(r'&[#\w]*$')
+
+
+def sanitize_string(value, max_length=None):
     """
     Sanitiza una cadena para prevenir XSS.
-    Escapa caracteres HTML peligrosos.
+    Escapa caracteres HTML peligrosos y, si se indica max_length, recorta el
+    resultado a esa longitud (sin dejar una entidad HTML a medias).
     """
     if not isinstance(value, str):
         return value
 
+    # Escapar solo hasta donde se va a guardar: escapar nunca acorta el texto
+    if max_length is not None:
+        value = value[:max_length]
+
     # Escapar caracteres HTML
     sanitized = html.escape(value, quote=True)
 
-    # Eliminar posibles intentos de inyección de scripts
-    # Remover patrones peligrosos comunes
-    dangerous_patterns = [
-        r'javascript:',
-        r'vbscript:',
-        r'data:text/html',
-        r'on\w+\s*=',  # onclick=, onload=, etc.
-    ]
+    # Eliminar posibles intentos de inyección de scripts. Se repite hasta que no
+    # quede ninguno: al quitar uno se puede formar otro ("javajavascript:script:").
+    # Todos terminan en ':' o '=': sin esos caracteres no hay nada que buscar
+    removidos = ':' in sanitized or '=' in sanitized
+    while removidos:
+        sanitized, removidos = PATRON_PELIGROSO.subn('', sanitized)
 
-    for pattern in dangerous_patterns:
-        sanitized = re.sub(pattern, '', sanitized, flags=re.IGNORECASE)
+    if max_length is not None and len(sanitized) > max_length:
+        sanitized = _ENTIDAD_CORTADA.sub('', sanitized[:max_length])
 
     return sanitized
 
@@ -55,6 +70,21 @@ def sanitize_dict(data, exclude_keys=None):
     return sanitized
 
 
+def sanitize_fields(data, allowed_keys, max_lengths=None, default_max_length=255):
+    """
+    Sanitiza un formulario según su esquema: solo pasan las claves de
+    allowed_keys y cada valor se recorta a max_lengths[clave] (o a
+    default_max_length). Para valores repetidos se toma el último, como
+    QueryDict.items().
+    """
+    max_lengths = max_lengths or {}
+    return {
+        key: sanitize_string(value, max_lengths.get(key, default_max_length))
+        for key, value in data.items()
+        if key in allowed_keys
+    }
+
+
 def validate_hex_color(color):
     """
     Valida que un color sea un código hexadecimal válido.
@@ -73,39 +103,68 @@ def validate_hex_color(color):
     return '#000000'
 
 
-def rate_limit(key_prefix, max_requests=5, window_seconds=60):
+def rate_limit(key_prefix, max_requests=5, window_seconds=60, methods=None):
     """
     Decorador para limitar la tasa de peticiones.
 
+    El conteo es por prefijo, IP y (si la URL lo tiene) slug, y se comparte
+    entre todos los workers (ver core/limitador.py).
+
     Args:
-        key_prefix: Prefijo para la clave de cache (ej: 'encuesta')
+        key_prefix: Prefijo del contador (ej: 'encuesta_enviar')
         max_requests: Número máximo de peticiones permitidas
         window_seconds: Ventana de tiempo en segundos
+        methods: Métodos HTTP que cuentan (ej: ['POST']); None = todos.
+            Permite presupuestos distintos para ver y para enviar.
     """
+    metodos = {m.upper() for m in methods} if methods else None
+
+    def clave(request, kwargs):
+        # Obtener IP del cliente
+        ip = get_client_ip(request)
+        return f"rate_limit:{key_prefix}:{kwargs.get('slug', '')}:{ip}"
+
     def decorator(view_func):
-        @wraps(view_func)
-        def wrapper(request, *args, **kwargs):
-            # Obtener IP del cliente
-            ip = get_client_ip(request)
-            cache_key = f"rate_limit:{key_prefix}:{ip}"
+        # Vistas async (ASGI): misma lógica, sin bloquear el event loop con SQLite
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                if metodos is not None and request.method not in metodos:
+                    return await view_func(request, *args, **kwargs)
+
+                resultado = await limitador().aregistrar(clave(request, kwargs), max_requests, window_seconds)
+                if not resultado.permitido:
+                    return _respuesta_limite(resultado, key_prefix)
 
-            # Obtener contador actual
-            request_count = cache.get(cache_key, 0)
+                return await view_func(request, *args, **kwargs)
+            return async_wrapper
 
-            if request_count >= max_requests:
-                return HttpResponseForbidden(
-                    '<h1>Demasiadas solicitudes</h1>'
-                    '<p>Has excedido el límite de envíos. Por favor espera unos minutos antes de intentar nuevamente.</p>'
-                )
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if metodos is not None and request.method not in metodos:
+                return view_func(request, *args, **kwargs)
 
-            # Incrementar contador
-            cache.set(cache_key, request_count + 1, window_seconds)
+            # Consulta + incremento atómicos
+            resultado = limitador().registrar(clave(request, kwargs), max_requests, window_seconds)
+            if not resultado.permitido:
+                return _respuesta_limite(resultado, key_prefix)
 
             return view_func(request, *args, **kwargs)
         return wrapper
     return decorator
 
 
+def _respuesta_limite(resultado, key_prefix):
+    metricas.incrementar('encuestas_rate_limit_rechazos_total', prefijo=key_prefix)
+    response = HttpResponse(
+        '<h1>Demasiadas solicitudes</h1>'
+        '<p>Has excedido el límite de envíos. Por favor espera unos minutos antes de intentar nuevamente.</p>',
+        status=429,
+    )
+    response['Retry-After'] = str(resultado.reintentar_en)
+    return response
+
+
 def get_client_ip(request):
     """
     Obtiene la IP real del cliente, considerando proxies.
@@ -122,6 +181,10 @@ def get_client_ip(request):
 class LoginRateLimiter:
     """
     Limitador de intentos de login para prevenir fuerza bruta.
+    Usa el mismo limitador compartido que rate_limit: todos los intentos
+    fallidos se cuentan y, a los MAX_ATTEMPTS dentro de LOCKOUT_TIME, el
+    identificador queda bloqueado LOCKOUT_TIME segundos fijos; al terminar el
+    bloqueo vuelve a tener MAX_ATTEMPTS intentos.
     """
     MAX_ATTEMPTS = 5
     LOCKOUT_TIME = 300  # 5 minutos en segundos
@@ -130,36 +193,35 @@ class LoginRateLimiter:
     def get_cache_key(cls, identifier):
         return f"login_attempts:{identifier}"
 
+    @classmethod
+    def _estado(cls, identifier):
+        return limitador().consultar(cls.get_cache_key(identifier), cls.MAX_ATTEMPTS, cls.LOCKOUT_TIME)
+
     @classmethod
     def is_locked(cls, identifier):
         """Verifica si el identificador está bloqueado."""
-        cache_key = cls.get_cache_key(identifier)
-        attempts = cache.get(cache_key, {'count': 0, 'locked': False})
-        return attempts.get('locked', False)
+        return limitador().bloqueo_restante(cls.get_cache_key(identifier)) > 0 or not cls._estado(identifier).permitido
 
     @classmethod
     def record_attempt(cls, identifier, success=False):
         """Registra un intento de login."""
         cache_key = cls.get_cache_key(identifier)
-        attempts = cache.get(cache_key, {'count': 0, 'locked': False})
 
         if success:
             # Login exitoso: resetear contador
-            cache.delete(cache_key)
+            limitador().reiniciar(cache_key)
             return
 
         # Login fallido: incrementar contador
-        attempts['count'] += 1
-
-        if attempts['count'] >= cls.MAX_ATTEMPTS:
-            attempts['locked'] = True
-            cache.set(cache_key, attempts, cls.LOCKOUT_TIME)
-        else:
-            cache.set(cache_key, attempts, cls.LOCKOUT_TIME)
+        resultado = limitador().registrar(cache_key, cls.MAX_ATTEMPTS, cls.LOCKOUT_TIME, contar_siempre=True)
+        metricas.incrementar('encuestas_login_fallidos_total')
+        if resultado.restantes == 0:
+            # Cupo agotado: bloqueo fijo (el que anuncia la vista) y contadores en cero para después
+            limitador().reiniciar(cache_key)
+            limitador().bloquear(cache_key, cls.LOCKOUT_TIME)
+            metricas.incrementar('encuestas_login_bloqueos_total')
 
     @classmethod
     def get_remaining_attempts(cls, identifier):
         """Obtiene los intentos restantes."""
-        cache_key = cls.get_cache_key(identifier)
-        attempts = cache.get(cache_key, {'count': 0, 'locked': False})
-        return max(0, cls.MAX_ATTEMPTS - attempts['count'])
+        return cls._estado(identifier).restantes
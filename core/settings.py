@@ -11,8 +11,11 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import tempfile
+from importlib.util import find_spec
 from pathlib import Path
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -43,6 +46,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'empresas',
     'formularios',
     'dashboard',
@@ -51,6 +55,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Observabilidad (core/middleware.py): antes que el resto para medir también
+    # la sesión y la autenticación
+    'core.middleware.MetricasMiddleware',
+    'core.middleware.InstrumentacionSQLMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -90,10 +98,46 @@ DATABASES = {
         'PASSWORD': config('DB_PASSWORD'),
         'HOST': config('DB_HOST'),
         'PORT': config('DB_PORT', cast=int),
-        
+        # Conexión persistente por hilo (segundos), verificada antes de reutilizarla. Ver abajo.
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# ==========================================
+# CONEXIONES A POSTGRES
+# ==========================================
+# Abrir una conexión contra RDS (TCP + TLS + autenticación) cuesta más que las consultas
+# de una página liviana como encuesta_exito. Tres modos (scripts/benchmark_conexiones.py):
+#   - DB_CONN_MAX_AGE=0: una conexión nueva por petición.
+#   - DB_CONN_MAX_AGE>0 (por defecto): conexión persistente por hilo. Para WSGI (gunicorn);
+#     bajo ASGI cada petición corre en un hilo distinto y no se reutiliza.
+#   - DB_POOL=True: pool de conexiones en el proceso, compartido por todos los hilos. Es el
+#     modo por defecto de core/asgi.py. Usa psycopg 3 con psycopg_pool (requirements.txt).
+# Con pool, cada worker mantiene hasta DB_POOL_MAX conexiones: workers x DB_POOL_MAX no debe
+# pasar del max_connections de la instancia RDS.
+DB_POOL = config('DB_POOL', default=False, cast=bool)
+if DB_POOL and not (find_spec('psycopg') and find_spec('psycopg_pool')):
+    # Sin esto el error aparece recién en la primera consulta
+    raise ImproperlyConfigured('DB_POOL=True requiere psycopg 3 con pool: pip install "psycopg[binary,pool]"')
+if DB_POOL:
+    # Django no admite pool y conexiones persistentes a la vez
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': config('DB_POOL_MIN', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX', default=10, cast=int),
+            # Segundos esperando una conexión libre antes de fallar la petición
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=float),
+            # Cierra las conexiones ociosas por encima de min_size
+            'max_idle': config('DB_POOL_MAX_IDLE', default=300, cast=float),
+            # Con CONN_HEALTH_CHECKS, Django le pide al pool verificar cada conexión antes de prestarla
+        },
+    }
+
+# Abrir las conexiones al arrancar cada worker (core/conexiones.py) y no en su primera petición
+DB_CALENTAR = config('DB_CALENTAR', default=True, cast=bool)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -139,9 +183,17 @@ STATICFILES_DIRS = [
 STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Las URLs firmadas de media se reutilizan durante esta ventana (segundos) y siguen
+# vigentes al menos otra ventana más (ver core/storages.py)
+MEDIA_URL_VENTANA = config('MEDIA_URL_VENTANA', default=3600, cast=int)
+
 
 # 3. Lógica de Almacenamiento (S3 vs Local)
-if not DEBUG:
+# Sin S3, media y estáticos van al disco local: los tests y CI corren con DEBUG=False
+# sin credenciales de AWS
+ALMACENAMIENTO_S3 = config('ALMACENAMIENTO_S3', default=not DEBUG, cast=bool)
+
+if ALMACENAMIENTO_S3:
     # ---------------------------------------------------------
     # CONFIGURACIÓN AWS S3 (Producción - Privado con Firmas)
     # ---------------------------------------------------------
@@ -162,29 +214,18 @@ if not DEBUG:
 
     S3_PREFIX = 'encuestas_gf'
 
-    from storages.backends.s3boto3 import S3Boto3Storage
-
-    class StaticStorage(S3Boto3Storage):
-        location = f'{S3_PREFIX}/static'
-        default_acl = None
-
-    class MediaStorage(S3Boto3Storage):
-        location = f'{S3_PREFIX}/media'
-        file_overwrite = False
-        default_acl = None
-
     # URLs Base (Boto3 se encargará de rellenar el dominio y la firma)
     STATIC_URL = f'/static/'
     MEDIA_URL = f'/media/'
 
     STORAGES = {
-        "default": {"BACKEND": "core.settings.MediaStorage"},
-        "staticfiles": {"BACKEND": "core.settings.StaticStorage"},
+        "default": {"BACKEND": "core.storages.MediaStorage"},
+        "staticfiles": {"BACKEND": "core.storages.StaticStorage"},
     }
 
 else:
     # ---------------------------------------------------------
-    # CONFIGURACIÓN LOCAL (Desarrollo)
+    # CONFIGURACIÓN LOCAL (Desarrollo y tests)
     # ---------------------------------------------------------
     STATIC_URL = '/static/'
     MEDIA_URL = '/media/'
@@ -227,6 +268,8 @@ if not DEBUG:
     # Forzar HTTPS
     SECURE_SSL_REDIRECT = True
     SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+    # Prometheus consulta /metrics directo al servidor, sin pasar por el proxy HTTPS
+    SECURE_REDIRECT_EXEMPT = [r'^metrics$']
 
     # Cookies seguras
     SESSION_COOKIE_SECURE = True
@@ -248,11 +291,97 @@ if not DEBUG:
 
 
 # ==========================================
-# CONFIGURACIÓN DE CACHE (Para Rate Limiting)
+# CONFIGURACIÓN DE CACHE
 # ==========================================
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-snowflake',
-    }
-}
\ No newline at end of file
+    },
+    # Compartida entre los procesos del servidor (workers de gunicorn):
+    # esquemas compilados de la encuesta pública y su sello de versión
+    'compartida': {
+        'BACKEND': config('CACHE_COMPARTIDA_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('CACHE_COMPARTIDA_LOCATION', default=os.path.join(tempfile.gettempdir(), 'encuestas_cache')),
+    },
+}
+
+# ==========================================
+# RATE LIMITING
+# ==========================================
+# Contadores compartidos por todos los workers del servidor (archivo SQLite local, ver core/limitador.py)
+RATE_LIMIT_DB = config('RATE_LIMIT_DB', default=os.path.join(tempfile.gettempdir(), 'encuestas_rate_limit.sqlite3'))
+
+# Presupuestos por minuto de la encuesta pública, por slug e IP. Ver y enviar van
+# por separado: abrir la encuesta desde una oficina tras una sola IP no debe gastar los envíos.
+RATE_LIMIT_VER_ENCUESTA = config('RATE_LIMIT_VER_ENCUESTA', default=120, cast=int)
+RATE_LIMIT_ENVIAR_ENCUESTA = config('RATE_LIMIT_ENVIAR_ENCUESTA', default=10, cast=int)
+
+# ==========================================
+# SPOOL DE ENVÍOS (campañas masivas)
+# ==========================================
+# Con el spool activo, el POST de la encuesta guarda el envío en un diario SQLite
+# local y `python manage.py vaciar_spool` lo pasa a la base por lotes (ver formularios/spool.py).
+# El diario debe estar en disco persistente y ser el mismo para la web y el proceso que vacía.
+SPOOL_ENCUESTAS = config('SPOOL_ENCUESTAS', default=False, cast=bool)
+SPOOL_ENCUESTAS_DB = config('SPOOL_ENCUESTAS_DB', default=os.path.join(tempfile.gettempdir(), 'encuestas_spool.sqlite3'))
+
+# ==========================================
+# INSTRUMENTACIÓN SQL
+# ==========================================
+# Consultas y tiempo SQL por petición: cabecera Server-Timing y una línea JSON en el
+# logger 'core.sql' (ver core/middleware.py)
+SQL_INSTRUMENTACION = config('SQL_INSTRUMENTACION', default=True, cast=bool)
+SQL_CONSULTAS_LENTAS = config('SQL_CONSULTAS_LENTAS', default=3, cast=int)
+
+# Máximo de consultas por vista (nombre de URL), contando sesión y usuario. Al excederlo se
+# registra un WARNING; con SQL_PRESUPUESTO_ESTRICTO la petición falla (para los tests y CI).
+# Incluyen 2 de margen: al abrir cada conexión django.contrib.postgres consulta pg_type
+# (con CONN_MAX_AGE=0 eso pasa en cada petición)
+SQL_PRESUPUESTOS = {
+    'dashboard_home': 8,
+    'metricas_globales': 6,
+    'ver_metricas': 11,
+    'metricas_datos': 7,
+    # +1: vigencias archivadas de la empresa (formularios/archivo.py)
+    'ver_todos_registros': 9,
+    'exportar_excel': 9,
+    'buscar_respondientes': 7,
+    'ver_detalle_respuesta': 6,
+    # Encuesta pública: la empresa sale del esquema en caché
+    'ver_encuesta': 5,
+    'token_encuesta': 4,
+}
+SQL_PRESUPUESTO_ESTRICTO = config('SQL_PRESUPUESTO_ESTRICTO', default=False, cast=bool)
+
+# ==========================================
+# MÉTRICAS (Prometheus)
+# ==========================================
+# Cada proceso vuelca sus métricas a un archivo en METRICAS_DIR (local al servidor) y
+# GET /metrics las suma; sin METRICAS_TOKEN el endpoint responde 404 (ver core/metricas.py)
+METRICAS_ACTIVAS = config('METRICAS_ACTIVAS', default=True, cast=bool)
+METRICAS_DIR = config('METRICAS_DIR', default=os.path.join(tempfile.gettempdir(), 'encuestas_metricas'))
+METRICAS_INTERVALO = config('METRICAS_INTERVALO', default=5, cast=float)
+METRICAS_TOKEN = config('METRICAS_TOKEN', default='')
+
+# ==========================================
+# EXPORTACIONES
+# ==========================================
+# Por encima de este número de filas, "Exportar" crea un trabajo en segundo plano
+# (procesado por `python manage.py procesar_exportaciones`) en vez de descargar en la petición
+EXPORTACION_MAX_SINCRONA = config('EXPORTACION_MAX_SINCRONA', default=50000, cast=int)
+
+# ==========================================
+# ENCUESTAS PUBLICADAS (HTML pre-renderizado)
+# ==========================================
+# Al guardar una empresa se re-publica su encuesta en el storage de media
+# (ver formularios/publicacion.py y `python manage.py publicar_encuestas`)
+ENCUESTAS_PUBLICADAS = config('ENCUESTAS_PUBLICADAS', default=True, cast=bool)
+ENCUESTAS_PUBLICADAS_DIR = 'encuestas_publicadas'
+
+# ==========================================
+# LOGOS DE EMPRESAS
+# ==========================================
+# Al subir un logo se guardan versiones reducidas en WebP y PNG (ver empresas/logos.py);
+# llevan el hash del original en el nombre y se suben con caché de un año
+LOGOS_VARIANTES_DIR = 'logos_empresas/variantes'
@@ -1,20 +1,92 @@
 # core/storages.py
-from storages.backends.s3boto3 import S3Boto3Storage
+"""
+Storages de S3 para producción (ver STORAGES en settings).
+
+Media (logos, encuestas publicadas, exportaciones) es privado: cada URL va
+firmada y la firma vence. boto3 firma con la hora actual, así que cada `url()`
+da una URL distinta y el navegador nunca reutiliza la imagen que ya descargó.
+
+MediaStorage reparte el tiempo en ventanas de MEDIA_URL_VENTANA segundos y,
+durante toda una ventana, entrega la misma URL, firmada por dos ventanas: una
+URL entregada sigue vigente al menos MEDIA_URL_VENTANA segundos más. La URL se
+guarda en la cache compartida, para que todos los workers entreguen la misma,
+y en memoria del proceso, para no leer la cache por cada logo de un listado.
+
+`open()` de S3Boto3Storage descarga el objeto completo a un temporal en la
+primera lectura; `leer_rango` pide solo un tramo de bytes (archivos de
+vigencias archivadas, formularios/archivo.py).
+"""
+import time
+
 from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestFilesMixin
+from django.core.cache import caches
+from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name
 
-class StaticStorage(S3Boto3Storage):
+
+class StaticStorage(ManifestFilesMixin, S3Boto3Storage):
     """
     Guarda los archivos estáticos (CSS, JS, Imágenes del sistema)
-    en la ruta: s3://vadomdata/{S3_CLIENT_PREFIX}/static/
+    en la ruta: s3://vadomdata/{S3_PREFIX}/static/
+
+    collectstatic sube cada archivo con el hash del contenido en el nombre
+    (app.3f2a9c.css) y reescribe los url() del CSS: un cambio es un archivo
+    nuevo, así que navegadores y CDN los guardan un año sin revalidar. Sin
+    firma: una URL firmada vence y cambia en cada render (y las páginas
+    publicadas la guardan). El bucket debe permitir lectura pública de
+    {S3_PREFIX}/static/*.
     """
-    location = f'{settings.S3_CLIENT_PREFIX}/static'
+    location = f'{settings.S3_PREFIX}/static'
     default_acl = None  # Importante: Desactiva ACLs
+    querystring_auth = False
+    object_parameters = {'CacheControl': 'public, max-age=31536000, immutable'}
+
 
 class MediaStorage(S3Boto3Storage):
     """
     Guarda los archivos subidos por usuarios (Logos, adjuntos)
-    en la ruta: s3://vadomdata/{S3_CLIENT_PREFIX}/media/
+    en la ruta: s3://vadomdata/{S3_PREFIX}/media/
     """
-    location = f'{settings.S3_CLIENT_PREFIX}/media'
+    location = f'{settings.S3_PREFIX}/media'
     default_acl = None
-    file_overwrite = False  # No sobrescribir archivos con el mismo nombre
\ No newline at end of file
+    file_overwrite = False  # No sobrescribir archivos con el mismo nombre
+
+    def __init__(self, **settings_overrides):
+        super().__init__(**settings_overrides)
+        # nombre -> (ventana, URL firmada)
+        self._urls = {}
+
+    def get_object_parameters(self, name):
+        parametros = super().get_object_parameters(name)
+        # Las variantes de logos llevan el hash del original en el nombre: nunca cambian
+        if name.startswith(f'{self.location}/{settings.LOGOS_VARIANTES_DIR}/'):
+            parametros['CacheControl'] = 'private, max-age=31536000, immutable'
+        return parametros
+
+    def leer_rango(self, name, inicio, largo):
+        """`largo` bytes de `name` desde `inicio`, con un GET con cabecera Range."""
+        objeto = self.bucket.Object(self._normalize_name(clean_name(name)))
+        return objeto.get(Range=f'bytes={inicio}-{inicio + largo - 1}')['Body'].read()
+
+    def url(self, name, parameters=None, expire=None, http_method=None):
+        if parameters or expire or http_method:
+            return super().url(name, parameters, expire, http_method)
+
+        duracion = settings.MEDIA_URL_VENTANA
+        ahora = time.time()
+        ventana = int(ahora // duracion)
+        guardada = self._urls.get(name)
+        if guardada and guardada[0] == ventana:
+            return guardada[1]
+
+        cache = caches['compartida']
+        clave = f'url_firmada:{self.location}/{name}:{ventana}'
+        url = cache.get(clave)
+        if url is None:
+            url = super().url(name, expire=2 * duracion)
+            # Si otro worker la firmó primero, se entrega la suya
+            if not cache.add(clave, url, timeout=(ventana + 1) * duracion - ahora):
+                url = cache.get(clave) or url
+        self._urls[name] = (ventana, url)
+        return url
@@ -0,0 +1,369 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.http import HttpResponse, QueryDict
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from empresas.models import EmpresaCliente
+from . import conexiones
+from .limitador import Limitador
+from .security import LoginRateLimiter, rate_limit, sanitize_fields, sanitize_string
+
+
+class ConLimitadorTemporal:
+    """Cada prueba con su propio archivo de contadores (RATE_LIMIT_DB)."""
+
+    def setUp(self):
+        super().setUp()
+        carpeta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, carpeta)
+        self.ruta_limitador = os.path.join(carpeta, 'limitador.sqlite3')
+        ajuste = override_settings(RATE_LIMIT_DB=self.ruta_limitador)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+
+    def en(self, instante):
+        """Fija la hora que ve el limitador."""
+        reloj = mock.patch('core.limitador.time')
+        reloj.start().time.return_value = instante
+        self.addCleanup(reloj.stop)
+
+
+class LimitadorTests(ConLimitadorTemporal, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.limitador = Limitador(self.ruta_limitador)
+
+    def test_registra_hasta_el_limite(self):
+        self.en(1000)
+        resultados = [self.limitador.registrar('ip', 3, 60) for _ in range(4)]
+        self.assertEqual([r.permitido for r in resultados], [True, True, True, False])
+        self.assertEqual(resultados[2].restantes, 0)
+        # 1000 % 60 = 40: la ventana actual termina en 20 s
+        self.assertEqual(resultados[3].reintentar_en, 21)
+        self.assertTrue(self.limitador.registrar('otra-ip', 3, 60).permitido)
+
+    def test_ventana_deslizante_en_el_borde(self):
+        self.en(59)
+        for _ in range(5):
+            self.limitador.registrar('ip', 5, 60)
+        # Medio segundo después del borde la ventana previa pesa 4.96: no queda cupo
+        self.en(60.5)
+        self.assertFalse(self.limitador.consultar('ip', 5, 60).permitido)
+        self.assertFalse(self.limitador.registrar('ip', 5, 60).permitido)
+        # Con la ventana previa casi vencida vuelve a haber cupo
+        self.en(115)
+        self.assertTrue(self.limitador.consultar('ip', 5, 60).permitido)
+        self.assertTrue(self.limitador.registrar('ip', 5, 60).permitido)
+
+    def test_consultar_y_registrar_usan_el_mismo_umbral(self):
+        self.en(59)
+        for _ in range(5):
+            self.limitador.registrar('ip', 5, 60)
+        # Estimación entre 4 y 5 (5 * 0.9 = 4.5)
+        self.en(66)
+        self.assertEqual(self.limitador.consultar('ip', 5, 60).permitido, self.limitador.registrar('ip', 5, 60).permitido)
+        self.assertFalse(self.limitador.consultar('ip', 5, 60).permitido)
+
+    def test_contar_siempre(self):
+        self.en(1000)
+        for _ in range(5):
+            resultado = self.limitador.registrar('ip', 2, 60, contar_siempre=True)
+        self.assertFalse(resultado.permitido)
+        self.assertEqual(resultado.usados, 5)
+
+    def test_bloqueo_fijo(self):
+        self.en(1000)
+        self.limitador.bloquear('ip', 300)
+        self.assertEqual(self.limitador.bloqueo_restante('ip'), 300)
+        # El bloqueo no gasta cupo
+        self.assertTrue(self.limitador.consultar('ip', 5, 60).permitido)
+        self.en(1299.5)
+        self.assertEqual(self.limitador.bloqueo_restante('ip'), 1)
+        self.en(1300)
+        self.assertEqual(self.limitador.bloqueo_restante('ip'), 0)
+
+        self.limitador.bloquear('ip', 300)
+        self.limitador.reiniciar('ip')
+        self.assertEqual(self.limitador.bloqueo_restante('ip'), 0)
+
+
+def vista_encuesta(request, slug):
+    return HttpResponse('ok')
+
+
+class SanitizadorTests(SimpleTestCase):
+
+    def test_etiquetas_anidadas_quedan_escapadas(self):
+        limpio = sanitize_string('<scr<script>ipt>alert(1)</script>')
+        self.assertEqual(limpio, '&lt;scr&lt;script&gt;ipt&gt;alert(1)&lt;/script&gt;')
+        self.assertNotIn('<', limpio)
+
+    def test_patrones_anidados_se_quitan_hasta_el_final(self):
+        casos = {
+            'javajavascript:script:alert(1)': 'alert(1)',
+            'JaVaScRiPt:x': 'x',
+            'vbvbscript:script:x': 'x',
+            '<img src=x oonerror=nerror=alert(1)>': '&lt;img src=x alert(1)&gt;',
+            'data:text/html,<b>': ',&lt;b&gt;',
+            'onclick =x': 'x',
+            'Correo: ana@acme.co; área = ventas': 'Correo: ana@acme.co; área = ventas',
+        }
+        for entrada, esperado in casos.items():
+            with self.subTest(entrada=entrada):
+                self.assertEqual(sanitize_string(entrada), esperado)
+
+    def test_recorte_no_deja_entidades_a_medias(self):
+        casos = [
+            ('a' * 9 + '&b', 10, 'a' * 9),   # '&amp;' empieza en la posición 9
+            ('<<<<', 6, '&lt;'),             # '&lt;&l'
+            ('"' * 3, 7, '&quot;'),
+            ('&#39;', 3, ''),
+            ('ñandú', 3, 'ñan'),
+        ]
+        for entrada, limite, esperado in casos:
+            with self.subTest(entrada=entrada, limite=limite):
+                limpio = sanitize_string(entrada, limite)
+                self.assertEqual(limpio, esperado)
+                self.assertLessEqual(len(limpio), limite)
+
+    def test_valores_que_no_son_texto_pasan_igual(self):
+        for valor in (None, 5, ['<b>']):
+            with self.subTest(valor=valor):
+                self.assertIs(sanitize_string(valor, 3), valor)
+
+    def test_campos_segun_el_esquema(self):
+        datos = QueryDict(mutable=True)
+        datos.setlist('nombre', ['Ana', 'Eva <b>'])
+        datos.update({
+            'p5_sagrilaft_conoce': 'SI', 'observaciones': 'x' * 20,
+            'csrfmiddlewaretoken': 'token', 'campo_inventado': '<script>',
+        })
+        limpio = sanitize_fields(
+            datos, {'nombre', 'p5_sagrilaft_conoce', 'observaciones', 'ausente'},
+            {'p5_sagrilaft_conoce': 2, 'observaciones': 5}, default_max_length=8,
+        )
+        # Solo las claves del esquema; de un valor repetido, el último (QueryDict.items())
+        self.assertEqual(limpio, {'nombre': 'Eva &lt;', 'p5_sagrilaft_conoce': 'SI', 'observaciones': 'xxxxx'})
+
+
+class RateLimitTests(ConLimitadorTemporal, SimpleTestCase):
+    """Presupuestos separados para ver y para enviar, como ver_encuesta_publica."""
+
+    def setUp(self):
+        super().setUp()
+        self.vista = rate_limit('ver', max_requests=3, window_seconds=60, methods=['GET'])(
+            rate_limit('enviar', max_requests=2, window_seconds=60, methods=['POST'])(vista_encuesta)
+        )
+        self.factory = RequestFactory()
+
+    def pedir(self, metodo, slug='acme', ip='10.0.0.1'):
+        request = getattr(self.factory, metodo)(f'/encuesta/{slug}/', REMOTE_ADDR=ip)
+        return self.vista(request, slug=slug).status_code
+
+    def test_enviar_no_gasta_el_cupo_de_ver(self):
+        self.assertEqual([self.pedir('post') for _ in range(3)], [200, 200, 429])
+        self.assertEqual([self.pedir('get') for _ in range(4)], [200, 200, 200, 429])
+        # Otra IP y otra encuesta tienen su propio cupo
+        self.assertEqual(self.pedir('post', ip='10.0.0.2'), 200)
+        self.assertEqual(self.pedir('post', slug='otra'), 200)
+
+    def test_respuesta_429_con_retry_after(self):
+        self.en(1000)
+        request = self.factory.post('/encuesta/acme/', REMOTE_ADDR='10.0.0.1')
+        for _ in range(2):
+            self.vista(request, slug='acme')
+        respuesta = self.vista(request, slug='acme')
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertEqual(respuesta['Retry-After'], '21')
+
+
+@override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'compartida': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pruebas-core'},
+    },
+)
+class EncuestaPublicaLimiteTests(ConLimitadorTemporal, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        EmpresaCliente.objects.create(nombre='Acme', slug='acme')
+
+    def test_envios_de_mas_responden_429_y_la_encuesta_sigue_visible(self):
+        # RATE_LIMIT_ENVIAR_ENCUESTA (10) se lee al importar la vista
+        url = reverse('ver_encuesta', args=['acme'])
+        # El primer envío carga el esquema (cache fría) y se pasa del presupuesto de ver_encuesta: WARNING
+        with self.assertLogs('core.sql', 'INFO'):
+            envios = [self.client.post(url, {'tipo_tercero': 'CLIENTE', 'nombre': 'Ana'}) for _ in range(11)]
+        self.assertEqual({respuesta.status_code for respuesta in envios[:10]}, {302})
+        self.assertEqual(envios[10].status_code, 429)
+        self.assertTrue(envios[10].has_header('Retry-After'))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoginBloqueoTests(ConLimitadorTemporal, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user('auditor', password='clave-correcta')
+
+    def login(self, password='incorrecta'):
+        return self.client.post(reverse('login'), {'username': 'auditor', 'password': password})
+
+    def test_bloqueo_tras_los_intentos_fallidos(self):
+        self.en(1000)
+        for _ in range(LoginRateLimiter.MAX_ATTEMPTS - 1):
+            self.assertEqual(self.login().status_code, 200)
+        self.assertFalse(LoginRateLimiter.is_locked('127.0.0.1'))
+
+        self.login()
+        self.assertTrue(LoginRateLimiter.is_locked('127.0.0.1'))
+        # Bloqueado: ni la clave correcta entra
+        self.assertRedirects(self.login('clave-correcta'), reverse('login'), fetch_redirect_response=False)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+        # Pasados LOCKOUT_TIME segundos vuelve a tener todos los intentos
+        self.en(1000 + LoginRateLimiter.LOCKOUT_TIME)
+        self.assertFalse(LoginRateLimiter.is_locked('127.0.0.1'))
+        self.assertEqual(LoginRateLimiter.get_remaining_attempts('127.0.0.1'), LoginRateLimiter.MAX_ATTEMPTS)
+        self.assertEqual(self.login('clave-correcta').status_code, 302)
+        self.assertIn('_auth_user_id', self.client.session)
+
+    def test_el_borde_de_ventana_no_abre_el_bloqueo(self):
+        # Los 5 fallos al final de una ventana de LOCKOUT_TIME
+        self.en(LoginRateLimiter.LOCKOUT_TIME - 1)
+        for _ in range(LoginRateLimiter.MAX_ATTEMPTS):
+            self.login()
+
+        self.en(LoginRateLimiter.LOCKOUT_TIME + 0.5)
+        for _ in range(20):
+            self.assertTrue(LoginRateLimiter.is_locked('127.0.0.1'))
+            self.login('clave-correcta')
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_login_exitoso_reinicia_los_intentos(self):
+        self.en(1000)
+        for _ in range(LoginRateLimiter.MAX_ATTEMPTS - 1):
+            self.login()
+        self.assertEqual(self.login('clave-correcta').status_code, 302)
+        self.assertEqual(LoginRateLimiter.get_remaining_attempts('127.0.0.1'), LoginRateLimiter.MAX_ATTEMPTS)
+
+
+@override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'compartida': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pruebas-core'},
+    },
+)
+class InstrumentacionSQLTests(ConLimitadorTemporal, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        EmpresaCliente.objects.create(nombre='Acme', slug='acme')
+        cls.usuario = User.objects.create_user('auditor', password='x', is_staff=True)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.usuario)
+
+    def get(self, url):
+        with self.assertLogs('core.sql', 'INFO') as logs, CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        # Todo lo que se ejecutó quedó dentro de la medición
+        self.assertEqual(logs.records[-1].sql['consultas'], len(consultas))
+        return respuesta, ' '.join(consulta['sql'] for consulta in consultas)
+
+    def test_tablero_cuenta_sesion_y_usuario(self):
+        respuesta, sql = self.get(reverse('lista_empresas'))
+        self.assertIn('"auth_user"', sql)
+        self.assertIn('Server-Timing', respuesta)
+
+    def test_encuesta_publica_no_carga_el_usuario(self):
+        # Aunque el navegador traiga la cookie de sesión del tablero
+        respuesta, sql = self.get(reverse('ver_encuesta', args=['acme']))
+        self.assertNotIn('"auth_user"', sql)
+        self.assertNotIn('Server-Timing', respuesta)
+
+    async def test_encuesta_publica_asgi_no_carga_el_usuario(self):
+        await self.async_client.aforce_login(self.usuario)
+        with mock.patch('django.contrib.auth.middleware.auth.aget_user') as aget_user:
+            with self.assertLogs('core.sql', 'INFO'):
+                respuesta = await self.async_client.get(reverse('ver_encuesta', args=['acme']))
+        self.assertEqual(respuesta.status_code, 200)
+        aget_user.assert_not_called()
+        self.assertNotIn('Server-Timing', respuesta)
+
+
+class ConexionFalsa:
+
+    def __init__(self, pool=None, conn_max_age=60, error_pool=None):
+        self.alias = 'default'
+        self.settings_dict = {'CONN_MAX_AGE': conn_max_age}
+        self._pool = pool
+        self.error_pool = error_pool
+        self.ensure_connection = mock.Mock()
+
+    @property
+    def pool(self):
+        if self.error_pool:
+            raise self.error_pool
+        return self._pool
+
+
+@override_settings(DB_CALENTAR=True)
+class CalentarTests(SimpleTestCase):
+    """core/conexiones.py: el worker arranca aunque la base no responda."""
+
+    def calentar(self, *conexiones_falsas):
+        with mock.patch('core.conexiones.connections') as conexiones_django:
+            conexiones_django.all.return_value = list(conexiones_falsas)
+            conexiones.calentar()
+        return conexiones_django
+
+    def test_llena_el_pool_o_abre_la_conexion_persistente(self):
+        pool = mock.Mock(min_size=2, max_size=10)
+        con_pool = ConexionFalsa(pool=pool, conn_max_age=0)
+        persistente = ConexionFalsa()
+        por_peticion = ConexionFalsa(conn_max_age=0)
+        with self.assertLogs('core.conexiones', 'INFO') as logs:
+            self.calentar(con_pool, persistente, por_peticion)
+        pool.open.assert_called_once_with(wait=True, timeout=conexiones.ESPERA_POOL)
+        persistente.ensure_connection.assert_called_once_with()
+        por_peticion.ensure_connection.assert_not_called()
+        self.assertEqual(len(logs.records), 2)
+        self.assertIn('pool de 2 a 10', logs.output[0])
+
+    def test_base_caida_solo_se_registra(self):
+        pool = mock.Mock(min_size=2, max_size=10)
+        pool.open.side_effect = TimeoutError('pool sin llenar')
+        caida = ConexionFalsa()
+        caida.ensure_connection.side_effect = ConnectionRefusedError
+        mal_configurada = ConexionFalsa(error_pool=ImproperlyConfigured('sin psycopg_pool'))
+        with self.assertLogs('core.conexiones', 'WARNING') as logs:
+            self.calentar(ConexionFalsa(pool=pool, conn_max_age=0), caida, mal_configurada)
+        self.assertEqual(len(logs.records), 3)
+        self.assertTrue(all(registro.exc_info for registro in logs.records))
+
+    def test_error_al_cargar_las_conexiones(self):
+        with mock.patch('core.conexiones.connections') as conexiones_django, \
+                self.assertLogs('core.conexiones', 'WARNING'):
+            conexiones_django.all.side_effect = ImproperlyConfigured('backend')
+            conexiones.calentar()
+
+    @override_settings(DB_CALENTAR=False)
+    def test_desactivado(self):
+        persistente = ConexionFalsa()
+        conexiones_django = self.calentar(persistente)
+        conexiones_django.all.assert_not_called()
+        persistente.ensure_connection.assert_not_called()
@@ -2,11 +2,15 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from . import metricas
 from .auth_views import SecureLoginView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
 
+    # Métricas para Prometheus (requiere METRICAS_TOKEN)
+    path('metrics', metricas.vista_metricas, name='metricas_prometheus'),
+
     # --- AUTENTICACIÓN ---
     # Login con protección anti brute-force
     path('accounts/login/', SecureLoginView.as_view(), name='login'),
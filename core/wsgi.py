@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_wsgi_application()
+
+# Conexiones a Postgres listas antes de la primera petición; si la base no responde solo lo registra (core/conexiones.py)
+from core import conexiones  # noqa: E402
+
+conexiones.calentar()
@@ -1,3 +1,9 @@
 from django.contrib import admin
+from .models import TrabajoExportacion
 
-# Register your models here.
+
+@admin.register(TrabajoExportacion)
+class TrabajoExportacionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'empresa', 'formato', 'estado', 'filas_procesadas', 'total_filas', 'creado', 'finalizado')
+    list_filter = ('estado', 'formato')
+    readonly_fields = ('filtros', 'archivo', 'error', 'creado', 'iniciado', 'finalizado', 'worker', 'latido')
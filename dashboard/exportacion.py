@@ -0,0 +1,216 @@
+"""
+Exportación de registros de encuesta (CSV y XLSX).
+
+Las filas se generan de a una desde un cursor del lado del servidor, así que la
+memoria no crece con el número de registros y los primeros bytes salen de
+inmediato hacia el navegador.
+"""
+import csv
+import datetime
+import io
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core import busqueda, metricas
+from formularios import archivo, catalogo
+from . import xlsx
+
+
+# Formatos disponibles: extensión -> content type
+FORMATOS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+# Registros que trae cada viaje del cursor del lado del servidor
+CHUNK_SIZE = 2000
+
+# Bytes acumulados antes de entregar un bloque al servidor web
+TAMANO_BLOQUE = 64 * 1024
+
+
+def _inicio_dia(valor):
+    """'YYYY-MM-DD' -> medianoche en la zona horaria local, o None si la fecha no es válida."""
+    try:
+        fecha = parse_date(valor or '')
+    except ValueError:
+        return None
+    if fecha is None:
+        return None
+    return timezone.make_aware(datetime.datetime.combine(fecha, datetime.time.min))
+
+
+def filtrar_registros(registros, params):
+    """
+    Aplica los filtros de la tabla (tipo, fecha_inicio, fecha_fin, nombre)
+    que llegan por GET, para exportar exactamente lo que se ve.
+
+    Las fechas se comparan como rango sobre fecha_registro (y no con __date)
+    para que la consulta use el índice (empresa, fecha_registro).
+    """
+    f_tipo = params.get('tipo')
+    f_inicio = params.get('fecha_inicio')
+    f_fin = params.get('fecha_fin')
+    f_nombre = params.get('nombre')
+
+    if f_tipo:
+        registros = registros.filter(tipo_tercero=f_tipo)
+    inicio = _inicio_dia(f_inicio)
+    if inicio:
+        registros = registros.filter(fecha_registro__gte=inicio)
+    fin = _inicio_dia(f_fin)
+    if fin:
+        registros = registros.filter(fecha_registro__lt=fin + datetime.timedelta(days=1))
+    if f_nombre:
+        # Sin tildes ni mayúsculas, sobre el índice de trigramas
+        registros = registros.filter(busqueda.contiene('nombre_respondiente', f_nombre))
+    return registros
+
+
+def filtrar_archivo(archivados, params):
+    """Los mismos filtros de `filtrar_registros` sobre los registros archivados (formularios/archivo.py)."""
+    inicio = _inicio_dia(params.get('fecha_inicio'))
+    fin = _inicio_dia(params.get('fecha_fin'))
+    return archivados.filtrar(
+        tipo=params.get('tipo'),
+        desde=inicio,
+        hasta=fin + datetime.timedelta(days=1) if fin else None,
+        nombre=params.get('nombre'),
+    )
+
+
+def columnas(empresa):
+    """
+    Columnas dinámicas de la empresa: (campos_seccion1, preguntas del catálogo).
+    """
+    config = empresa.config_encuesta or {}
+    return config.get('campos_seccion1', []), catalogo.catalogo_preguntas(empresa)
+
+
+def encabezados(empresa):
+    campos_seccion1, preguntas = columnas(empresa)
+
+    headers = [
+        'ID', 'Fecha Registro', 'Tipo Tercero', 'Nombre / Razón Social',
+        'Área', 'Cargo', 'IP Origen'
+    ]
+
+    # Columnas de campos adicionales personalizados (ej: NIT/Cédula)
+    for campo in campos_seccion1:
+        headers.append(campo.get('label', campo.get('name', 'Campo')))
+
+    # Columnas de preguntas (adicionales y de los bloques contratados) según el catálogo
+    for pregunta in preguntas:
+        headers.append(pregunta['etiqueta'])
+
+    headers.append('Observaciones')
+    return headers
+
+
+def valores_fila(reg, campos_seccion1, preguntas):
+    """Valores crudos de un registro, en el orden de `encabezados`."""
+    data = reg.respuestas_data  # El JSON
+
+    row = [
+        reg.id,
+        reg.fecha_registro,
+        reg.tipo_tercero,
+        reg.nombre_respondiente,
+        reg.area,
+        reg.cargo,
+        reg.ip_origen
+    ]
+
+    # Datos de campos adicionales personalizados
+    for campo in campos_seccion1:
+        row.append(data.get(campo.get('name', ''), '-'))
+
+    # Respuestas en el mismo orden que los encabezados del catálogo
+    for pregunta in preguntas:
+        row.append(data.get(pregunta['name'], '-'))
+
+    row.append(data.get('observaciones', ''))
+    return row
+
+
+def iterar_registros(registros, formato, progreso=None, archivados=None):
+    """
+    Recorre el queryset con un cursor del lado del servidor, por lotes, e
+    intercala en orden los registros archivados que cumplan los filtros.
+    Si se pasa `progreso`, se llama con el número de filas leídas tras cada lote.
+    Las filas entregadas se suman a la métrica de exportación por lote, no por fila.
+    """
+    filas = 0
+    try:
+        for reg in archivo.iterar_combinado(registros.iterator(chunk_size=CHUNK_SIZE), archivados):
+            yield reg
+            filas += 1
+            if filas % CHUNK_SIZE == 0:
+                metricas.incrementar('encuestas_exportacion_filas_total', CHUNK_SIZE, formato=formato)
+                if progreso is not None:
+                    progreso(filas)
+    finally:
+        # También si el navegador corta la descarga a medias
+        metricas.incrementar('encuestas_exportacion_filas_total', filas % CHUNK_SIZE, formato=formato)
+    if progreso is not None:
+        progreso(filas)
+
+
+def generar_csv(empresa, registros, progreso=None, archivados=None):
+    """
+    Genera el CSV en bloques de bytes: BOM + encabezado primero, luego las filas
+    en bloques de ~64 KB. Usa punto y coma (;), el estándar de Excel en español.
+    """
+    campos_seccion1, preguntas = columnas(empresa)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+
+    # IMPORTANTE: El BOM hace que Excel reconozca tildes y ñ
+    buffer.write(u'\ufeff')
+    writer.writerow(encabezados(empresa))
+    yield buffer.getvalue().encode('utf8')
+    buffer.seek(0)
+    buffer.truncate()
+
+    for reg in iterar_registros(registros, 'csv', progreso, archivados):
+        row = valores_fila(reg, campos_seccion1, preguntas)
+        # Hora local, como en el XLSX y en el tablero (fecha_registro está en UTC)
+        row[1] = timezone.localtime(reg.fecha_registro).strftime("%d/%m/%Y %H:%M")
+        writer.writerow(row)
+
+        if buffer.tell() >= TAMANO_BLOQUE:
+            yield buffer.getvalue().encode('utf8')
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf8')
+
+
+def _texto_o_vacio(valor):
+    # En XLSX todo lo que no es ID ni fecha va como texto (NIT/cédula conservan ceros)
+    return None if valor is None else str(valor)
+
+
+def generar_xlsx(empresa, registros, progreso=None, archivados=None):
+    """
+    Genera el .xlsx en streaming: ID como número, fecha como fecha real de Excel
+    y el resto como texto.
+    """
+    campos_seccion1, preguntas = columnas(empresa)
+
+    def filas():
+        for reg in iterar_registros(registros, 'xlsx', progreso, archivados):
+            row = valores_fila(reg, campos_seccion1, preguntas)
+            yield row[:2] + [_texto_o_vacio(v) for v in row[2:]]
+
+    return xlsx.generar_xlsx(encabezados(empresa), filas(), nombre_hoja=empresa.nombre)
+
+
+def generar(formato, empresa, registros, progreso=None, archivados=None):
+    """Generador de bytes para el formato pedido ('csv' o 'xlsx')."""
+    if formato == 'xlsx':
+        return generar_xlsx(empresa, registros, progreso, archivados)
+    return generar_csv(empresa, registros, progreso, archivados)
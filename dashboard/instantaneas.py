@@ -0,0 +1,333 @@
+"""
+Instantáneas de reportes pesados.
+
+El reporte de métricas globales recorre todas las empresas (KPIs, top 10,
+tendencia de 12 meses, conocimiento por bloque, listado completo): unas 20
+consultas cuyo costo crece con los datos, para un reporte que puede tener
+algunos minutos de atraso. Se calcula completo cada cierto tiempo
+(`python manage.py generar_instantaneas`, desde cron o en bucle con --cada) o a
+pedido (botón "Actualizar" de la página), se guarda serializado en
+InstantaneaReporte y la página solo lee esa fila. Si todavía no hay ninguna
+(base recién creada, sin cron), la página avisa y la primera se calcula en un
+hilo aparte: fuera de la petición y de su presupuesto de consultas.
+"""
+import json
+import logging
+import threading
+import time
+
+from dateutil.relativedelta import relativedelta
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from empresas.models import EmpresaCliente
+from formularios.models import RegistroEncuesta, ResumenDiario, VigenciaEmpresa
+from .models import InstantaneaReporte
+
+logger = logging.getLogger(__name__)
+
+
+METRICAS_GLOBALES = 'metricas_globales'
+
+# Una sola generación en segundo plano a la vez por proceso
+_generando = threading.Lock()
+
+
+def calcular_metricas_globales():
+    """Contexto completo de la página de métricas globales, solo con tipos serializables en JSON."""
+    hoy = timezone.localtime()
+    inicio_mes_actual = hoy.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    inicio_mes_anterior = (inicio_mes_actual - relativedelta(months=1))
+    inicio_anio = hoy.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    # Los conteos salen del resumen diario: filas de envíos (pregunta '_total') por día
+    envios = ResumenDiario.objects.filter(pregunta=ResumenDiario.PREGUNTA_TOTAL)
+    total_envios = Coalesce(
+        Sum('resumen_diario__cantidad', filter=Q(resumen_diario__pregunta=ResumenDiario.PREGUNTA_TOTAL)), 0
+    )
+
+    def sumar(queryset):
+        return queryset.aggregate(n=Sum('cantidad'))['n'] or 0
+
+    # ==========================================
+    # KPIs PRINCIPALES
+    # ==========================================
+    total_empresas = EmpresaCliente.objects.filter(activo=True).count()
+    total_respuestas = sumar(envios)
+
+    # Respuestas este mes vs mes anterior
+    respuestas_mes_actual = sumar(envios.filter(fecha__gte=inicio_mes_actual.date()))
+    respuestas_mes_anterior = sumar(envios.filter(
+        fecha__gte=inicio_mes_anterior.date(),
+        fecha__lt=inicio_mes_actual.date()
+    ))
+
+    # Calcular variación porcentual
+    if respuestas_mes_anterior > 0:
+        variacion_mensual = round(((respuestas_mes_actual - respuestas_mes_anterior) / respuestas_mes_anterior) * 100, 1)
+    else:
+        variacion_mensual = 100 if respuestas_mes_actual > 0 else 0
+
+    # Respuestas este año
+    respuestas_anio = sumar(envios.filter(fecha__gte=inicio_anio.date()))
+
+    # Promedio de respuestas por empresa
+    promedio_por_empresa = round(total_respuestas / total_empresas, 1) if total_empresas > 0 else 0
+
+    # ==========================================
+    # TOP 10 EMPRESAS CON MÁS RESPUESTAS
+    # ==========================================
+    top_empresas = EmpresaCliente.objects.filter(activo=True).annotate(
+        total_respuestas=total_envios
+    ).order_by('-total_respuestas').values('nombre', 'total_respuestas')[:10]
+
+    top_empresas_labels = [e['nombre'][:20] + '...' if len(e['nombre']) > 20 else e['nombre'] for e in top_empresas]
+    top_empresas_data = [e['total_respuestas'] for e in top_empresas]
+
+    # ==========================================
+    # DISTRIBUCIÓN POR TIPO DE TERCERO (GLOBAL)
+    # ==========================================
+    distribucion_tipo = envios.values('tipo_tercero').annotate(
+        total=Sum('cantidad')
+    ).order_by('-total')
+
+    tipo_labels = [d['tipo_tercero'] or 'Sin especificar' for d in distribucion_tipo]
+    tipo_data = [d['total'] for d in distribucion_tipo]
+
+    # ==========================================
+    # DISTRIBUCIÓN POR ALIADO
+    # ==========================================
+    distribucion_aliado = EmpresaCliente.objects.filter(activo=True).values('aliado').annotate(
+        total=Count('id')
+    )
+
+    aliado_labels = []
+    aliado_data = []
+    for d in distribucion_aliado:
+        if d['aliado'] == 'GFR':
+            aliado_labels.append('Gestión Financiera de Riesgos')
+        elif d['aliado'] == 'LEGAL_SHIELD':
+            aliado_labels.append('Legal Shield')
+        else:
+            aliado_labels.append(d['aliado'])
+        aliado_data.append(d['total'])
+
+    # ==========================================
+    # TENDENCIA MENSUAL (ÚLTIMOS 12 MESES)
+    # ==========================================
+    hace_12_meses = hoy - relativedelta(months=12)
+
+    tendencia_mensual = envios.filter(
+        fecha__gte=hace_12_meses.date()
+    ).annotate(
+        mes=TruncMonth('fecha')
+    ).values('mes').annotate(
+        total=Sum('cantidad')
+    ).order_by('mes')
+
+    # Crear lista completa de 12 meses (incluyendo meses sin datos)
+    meses_nombres = ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun', 'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
+    tendencia_labels = []
+    tendencia_data = []
+
+    # Crear diccionario con datos existentes
+    datos_por_mes = {d['mes'].strftime('%Y-%m'): d['total'] for d in tendencia_mensual}
+
+    # Iterar últimos 12 meses
+    for i in range(11, -1, -1):
+        fecha_mes = hoy - relativedelta(months=i)
+        clave = fecha_mes.strftime('%Y-%m')
+        tendencia_labels.append(f"{meses_nombres[fecha_mes.month - 1]} {fecha_mes.year}")
+        tendencia_data.append(datos_por_mes.get(clave, 0))
+
+    # ==========================================
+    # CONOCIMIENTO POR BLOQUE (GLOBAL)
+    # ==========================================
+    def conocimiento_bloque(campo_bloque, pregunta):
+        """Total de envíos y respuestas 'SI' de las empresas activas con el bloque contratado."""
+        conteo = ResumenDiario.objects.filter(
+            empresa__activo=True, **{f'empresa__{campo_bloque}': True}
+        ).aggregate(
+            total=Sum('cantidad', filter=Q(pregunta=ResumenDiario.PREGUNTA_TOTAL)),
+            conocen=Sum('cantidad', filter=Q(pregunta=pregunta, valor='SI')),
+        )
+        total = conteo['total'] or 0
+        conocen = conteo['conocen'] or 0
+        pct = round((conocen / total) * 100, 1) if total > 0 else 0
+        return total, conocen, pct
+
+    # SAGRILAFT
+    total_sagrilaft, conocen_sagrilaft, pct_conoce_sagrilaft = conocimiento_bloque('tiene_sagrilaft', 'p5_sagrilaft_conoce')
+    no_conocen_sagrilaft = total_sagrilaft - conocen_sagrilaft
+
+    # PTEE
+    total_ptee, conocen_ptee, pct_conoce_ptee = conocimiento_bloque('tiene_ptee', 'p9_ptee_conoce')
+    no_conocen_ptee = total_ptee - conocen_ptee
+
+    # SARLAFT
+    total_sarlaft, conocen_sarlaft, pct_conoce_sarlaft = conocimiento_bloque('tiene_sarlaft', 'p5_sarlaft_conoce')
+
+    # ==========================================
+    # EMPRESAS SIN ACTIVIDAD (últimos 30 días)
+    # ==========================================
+    hace_30_dias = hoy - relativedelta(days=30)
+    empresas_activas_reciente = envios.filter(
+        fecha__gte=hace_30_dias.date()
+    ).values_list('empresa_id', flat=True).distinct()
+
+    empresas_sin_actividad = EmpresaCliente.objects.filter(
+        activo=True
+    ).exclude(
+        id__in=empresas_activas_reciente
+    ).annotate(
+        total_respuestas=total_envios
+    ).order_by('-total_respuestas').values('id', 'nombre', 'total_respuestas')[:10]
+
+    # ==========================================
+    # ACTIVIDAD RECIENTE
+    # ==========================================
+    ultimas_respuestas = RegistroEncuesta.objects.order_by('-fecha_registro').values(
+        'tipo_tercero', 'fecha_registro', empresa_nombre=F('empresa__nombre')
+    )[:15]
+
+    # ==========================================
+    # LISTADO COMPLETO DE EMPRESAS
+    # ==========================================
+    # La última respuesta va en subconsulta para no multiplicar la suma del resumen con un segundo JOIN
+    # Del índice de vigencias: sigue ahí aunque la vigencia esté archivada
+    ultima_respuesta = VigenciaEmpresa.objects.filter(
+        empresa=OuterRef('pk')
+    ).order_by('-anio').values('ultima')[:1]
+
+    todas_empresas = EmpresaCliente.objects.filter(activo=True).annotate(
+        total_respuestas=total_envios,
+        ultima_respuesta=Subquery(ultima_respuesta)
+    ).order_by('-total_respuestas', 'nombre').values(
+        'id', 'nombre', 'slug', 'logo', 'logo_variantes', 'aliado', 'tiene_sagrilaft', 'tiene_sarlaft', 'tiene_ptee',
+        'total_respuestas', 'ultima_respuesta',
+    )
+
+    return {
+        # KPIs
+        'total_empresas': total_empresas,
+        'total_respuestas': total_respuestas,
+        'respuestas_mes_actual': respuestas_mes_actual,
+        'respuestas_mes_anterior': respuestas_mes_anterior,
+        'variacion_mensual': variacion_mensual,
+        'respuestas_anio': respuestas_anio,
+        'promedio_por_empresa': promedio_por_empresa,
+
+        # Top empresas
+        'top_empresas_labels': top_empresas_labels,
+        'top_empresas_data': top_empresas_data,
+
+        # Distribución tipo tercero
+        'tipo_labels': tipo_labels,
+        'tipo_data': tipo_data,
+
+        # Distribución aliado
+        'aliado_labels': aliado_labels,
+        'aliado_data': aliado_data,
+
+        # Tendencia mensual
+        'tendencia_labels': tendencia_labels,
+        'tendencia_data': tendencia_data,
+
+        # Conocimiento SAGRILAFT
+        'total_sagrilaft': total_sagrilaft,
+        'conocen_sagrilaft': conocen_sagrilaft,
+        'no_conocen_sagrilaft': no_conocen_sagrilaft,
+        'pct_conoce_sagrilaft': pct_conoce_sagrilaft,
+
+        # Conocimiento PTEE
+        'total_ptee': total_ptee,
+        'conocen_ptee': conocen_ptee,
+        'no_conocen_ptee': no_conocen_ptee,
+        'pct_conoce_ptee': pct_conoce_ptee,
+
+        # Conocimiento SARLAFT
+        'total_sarlaft': total_sarlaft,
+        'conocen_sarlaft': conocen_sarlaft,
+        'pct_conoce_sarlaft': pct_conoce_sarlaft,
+
+        # Empresas sin actividad
+        'empresas_sin_actividad': list(empresas_sin_actividad),
+
+        # Actividad reciente
+        'ultimas_respuestas': list(ultimas_respuestas),
+
+        # Listado completo de empresas
+        'todas_empresas': list(todas_empresas),
+    }
+
+
+def generar_metricas_globales():
+    """Calcula el reporte y reemplaza la instantánea guardada. Devuelve la InstantaneaReporte."""
+    inicio = time.perf_counter()
+    # Ida y vuelta por JSON: la instancia devuelta queda igual a la leída de la base (fechas como texto)
+    datos = json.loads(json.dumps(calcular_metricas_globales(), cls=DjangoJSONEncoder))
+    duracion_ms = int((time.perf_counter() - inicio) * 1000)
+
+    instantanea, _ = InstantaneaReporte.objects.update_or_create(
+        reporte=METRICAS_GLOBALES,
+        defaults={'datos': datos, 'generado': timezone.now(), 'duracion_ms': duracion_ms},
+    )
+    return instantanea
+
+
+def generar_en_segundo_plano():
+    """
+    Lanza generar_metricas_globales en un hilo. Devuelve False si este proceso
+    ya tiene una generación en curso.
+    """
+    if not _generando.acquire(blocking=False):
+        return False
+
+    def generar():
+        try:
+            generar_metricas_globales()
+        except Exception:
+            logger.exception('No se pudo generar la instantánea de métricas globales')
+        finally:
+            # La conexión es del hilo: si no se cierra queda abierta hasta que el servidor la corte
+            connection.close()
+            _generando.release()
+
+    threading.Thread(target=generar, name='instantanea-metricas-globales', daemon=True).start()
+    return True
+
+
+def metricas_globales():
+    """
+    Contexto de la página a partir de la instantánea (una sola consulta), o
+    None si todavía no existe ninguna.
+    """
+    instantanea = InstantaneaReporte.objects.filter(reporte=METRICAS_GLOBALES).first()
+    if instantanea is None:
+        return None
+
+    contexto = dict(instantanea.datos)
+    almacenamiento_logos = EmpresaCliente._meta.get_field('logo').storage
+
+    # El JSON guarda las fechas como texto
+    for registro in contexto['ultimas_respuestas']:
+        registro['fecha_registro'] = _fecha(registro['fecha_registro'])
+    for empresa in contexto['todas_empresas']:
+        empresa['ultima_respuesta'] = _fecha(empresa['ultima_respuesta'])
+        # Las URLs firmadas del storage vencen: se firman al mostrar, no al generar.
+        # Las instantáneas anteriores a las versiones reducidas no traen logo_variantes
+        mini = (empresa.get('logo_variantes') or {}).get('mini')
+        empresa['logo_url'] = almacenamiento_logos.url(mini['png'] if mini else empresa['logo']) if empresa['logo'] else ''
+        empresa['logo_webp'] = almacenamiento_logos.url(mini['webp']) if mini else ''
+
+    contexto['fecha_reporte'] = instantanea.generado
+    contexto['duracion_ms'] = instantanea.duracion_ms
+    return contexto
+
+
+def _fecha(valor):
+    return parse_datetime(valor) if isinstance(valor, str) else valor
@@ -0,0 +1,215 @@
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from dashboard import instantaneas
+from empresas.models import EmpresaCliente
+from formularios.management.commands.generar_datos_prueba import PREFIJO_SLUG
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide las vistas del tablero (métricas, registros, exportación, métricas globales) '
+        'pasando por todo el stack de Django: tiempo por petición, número de consultas y pico '
+        'de memoria de Python. Escribe los resultados en JSON para comparar entre commits.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--empresa', type=int, action='append',
+            help='ID de la empresa a medir (repetible; por defecto las sintéticas o la más grande)'
+        )
+        parser.add_argument('--usuario', help='Usuario con el que se inicia sesión (por defecto, el primer superusuario)')
+        parser.add_argument('--repeticiones', type=int, default=5, help='Peticiones cronometradas por vista')
+        parser.add_argument('--sin-exportacion', action='store_true', help='No medir exportar_excel')
+        parser.add_argument('--salida', help='Archivo JSON de resultados (por defecto, a la salida estándar)')
+        parser.add_argument('--comparar', help='JSON de una corrida anterior para mostrar la diferencia')
+
+    def handle(self, *args, **options):
+        if options['repeticiones'] < 1:
+            raise CommandError('--repeticiones debe ser al menos 1.')
+
+        self.cliente = Client(HTTP_HOST=self.host())
+        self.cliente.force_login(self.usuario(options['usuario']))
+
+        # La página lee la instantánea: se calcula antes con los datos actuales, como lo haría el cron
+        instantaneas.generar_metricas_globales()
+        resultados = [self.medir('metricas_globales', reverse('metricas_globales'), options['repeticiones'])]
+        for empresa in self.empresas(options['empresa']):
+            for vista, url in self.vistas(empresa, options['sin_exportacion']):
+                resultado = self.medir(vista, url, options['repeticiones'])
+                resultado['empresa_id'] = empresa.id
+                resultado['registros'] = empresa.n
+                resultados.append(resultado)
+
+        reporte = {
+            'generado': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'commit': self.commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'base_datos': f'{connection.vendor} {connection.pg_version if connection.vendor == "postgresql" else ""}'.strip(),
+            'repeticiones': options['repeticiones'],
+            'resultados': resultados,
+        }
+
+        self.imprimir(resultados)
+        if options['comparar']:
+            self.comparar(resultados, options['comparar'])
+
+        contenido = json.dumps(reporte, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                archivo.write(contenido + '\n')
+            self.stderr.write(f"Resultados guardados en {options['salida']}")
+        else:
+            self.stdout.write(contenido)
+
+    def host(self):
+        # El cliente de pruebas usa 'testserver', que en producción no está en ALLOWED_HOSTS
+        for host in settings.ALLOWED_HOSTS:
+            if host != '*':
+                return host.lstrip('.')
+        return 'localhost'
+
+    def usuario(self, nombre):
+        if nombre:
+            try:
+                return User.objects.get(username=nombre)
+            except User.DoesNotExist:
+                raise CommandError(f'No existe el usuario {nombre}')
+
+        usuario = User.objects.filter(is_superuser=True, is_active=True).order_by('id').first()
+        if usuario is None:
+            raise CommandError('No hay superusuarios. Crea uno o indica --usuario.')
+        return usuario
+
+    def empresas(self, ids):
+        empresas = EmpresaCliente.objects.annotate(n=Count('registros')).order_by('-n')
+        if ids:
+            encontradas = list(empresas.filter(id__in=ids))
+            faltantes = set(ids) - {e.id for e in encontradas}
+            if faltantes:
+                raise CommandError(f"No existen las empresas {', '.join(map(str, sorted(faltantes)))}")
+            return encontradas
+
+        sinteticas = list(empresas.filter(slug__startswith=PREFIJO_SLUG))
+        if sinteticas:
+            return sinteticas
+        mayor = empresas.first()
+        if mayor is None:
+            raise CommandError('No hay empresas. Genera datos con generar_datos_prueba.')
+        return [mayor]
+
+    def vistas(self, empresa, sin_exportacion):
+        anio = datetime.date.today().year
+        metricas = reverse('ver_metricas', args=[empresa.id])
+        registros = reverse('ver_todos_registros', args=[empresa.id])
+        vistas = [
+            ('ver_metricas', metricas),
+            ('ver_metricas (vigencia anterior)', f'{metricas}?vigencia={anio - 1}'),
+            ('metricas_datos', reverse('metricas_datos', args=[empresa.id])),
+            ('ver_todos_registros', registros),
+            ('ver_todos_registros (tipo PROVEEDOR)', f'{registros}?tipo=PROVEEDOR'),
+        ]
+        if not sin_exportacion:
+            vistas.append(('exportar_excel (csv)', reverse('exportar_excel', args=[empresa.id]) + '?formato=csv'))
+        return vistas
+
+    def medir(self, vista, url, repeticiones):
+        # La exportación siempre en streaming: se mide la vista, no el encolado del trabajo
+        with override_settings(EXPORTACION_MAX_SINCRONA=sys.maxsize):
+            self.peticion(url)  # calentamiento: caché de plantillas, conexiones, etc.
+
+            tiempos = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                self.peticion(url)
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+
+            # Consultas y memoria en una corrida aparte: tracemalloc hace más lento todo
+            tracemalloc.start()
+            try:
+                with CaptureQueriesContext(connection) as consultas:
+                    status, tamano = self.peticion(url)
+                _, pico = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+        return {
+            'vista': vista,
+            'url': url,
+            'status': status,
+            'ms_min': round(min(tiempos), 1),
+            'ms_mediana': round(statistics.median(tiempos), 1),
+            'ms_max': round(max(tiempos), 1),
+            'consultas': len(consultas),
+            'memoria_pico_kb': round(pico / 1024),
+            'bytes': tamano,
+        }
+
+    def peticion(self, url):
+        """Hace la petición y consume la respuesta completa. Devuelve (status, bytes)."""
+        respuesta = self.cliente.get(url, secure=True)
+        if respuesta.streaming:
+            # Sin juntar el contenido en memoria: solo se cuentan los bytes
+            tamano = sum(len(bloque) for bloque in respuesta.streaming_content)
+        else:
+            tamano = len(respuesta.content)
+        # Sin respuesta.close(): el cliente de pruebas ya la cierra sin disparar request_finished;
+        # cerrarla otra vez cierra la conexión a la base (close_old_connections) en cada petición
+        return respuesta.status_code, tamano
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def imprimir(self, resultados):
+        self.stderr.write(f"{'vista':<40}{'empresa':>8}{'status':>7}{'mediana ms':>12}{'consultas':>10}{'memoria KB':>12}")
+        for r in resultados:
+            self.stderr.write(
+                f"{r['vista']:<40}{r.get('empresa_id', '-'):>8}{r['status']:>7}{r['ms_mediana']:>12}"
+                f"{r['consultas']:>10}{r['memoria_pico_kb']:>12}"
+            )
+
+    def comparar(self, resultados, ruta):
+        with open(ruta, encoding='utf-8') as archivo:
+            anterior = json.load(archivo)
+        previos = {(r['vista'], r.get('empresa_id')): r for r in anterior['resultados']}
+
+        self.stderr.write('')
+        self.stderr.write(self.style.MIGRATE_HEADING(f"Comparación con {ruta} (commit {anterior.get('commit')})"))
+        for r in resultados:
+            previo = previos.get((r['vista'], r.get('empresa_id')))
+            if previo is None:
+                continue
+            cambio = (r['ms_mediana'] - previo['ms_mediana']) / previo['ms_mediana'] * 100 if previo['ms_mediana'] else 0
+            linea = (
+                f"{r['vista']:<40}{r.get('empresa_id', '-'):>8}"
+                f"{previo['ms_mediana']:>10} -> {r['ms_mediana']:<10}{cambio:>+7.1f}%"
+                f"{previo['consultas']:>6} -> {r['consultas']:<4}"
+            )
+            # Más de un 20 % más lenta o con más consultas: posible regresión
+            if cambio > 20 or r['consultas'] > previo['consultas']:
+                self.stderr.write(self.style.WARNING(linea))
+            else:
+                self.stderr.write(linea)
@@ -0,0 +1,140 @@
+import datetime
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from core import busqueda
+from dashboard import exportacion
+from empresas.models import EmpresaCliente
+from formularios import catalogo, particiones, sino
+from formularios.models import RegistroEncuesta, ResumenDiario
+
+
+# Particiones que recorre un plan: "Seq Scan on formularios_registroencuesta_2025 ..."
+PARTICION_EN_PLAN = re.compile(rf'\bon ({re.escape(particiones.TABLA)}_(?:\d{{4}}|default))\b')
+
+
+class Command(BaseCommand):
+    help = (
+        'Imprime el plan de ejecución (EXPLAIN ANALYZE) de las consultas del tablero '
+        'sobre una empresa, para detectar regresiones de plan (Seq Scan, Sort en disco, etc.).'
+    )
+
+    # Consultas acotadas a un año: con la tabla particionada solo deben leer la partición de la vigencia
+    CONSULTAS_VIGENCIA = (
+        'metricas: tabla de la vigencia (50 más recientes)',
+        'metricas: tabla filtrada por tipo',
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID de la empresa (por defecto, la que tiene más registros)')
+        parser.add_argument('--vigencia', type=int, help='Año para las consultas de métricas (por defecto, el actual)')
+        parser.add_argument('--solo', help='Ejecutar solo las consultas cuyo nombre contenga este texto')
+        parser.add_argument(
+            '--sin-analyze', action='store_true',
+            help='Solo EXPLAIN (plan estimado), sin ejecutar las consultas'
+        )
+        parser.add_argument(
+            '--verificar-poda', action='store_true',
+            help='Falla si una consulta de la vigencia recorre particiones de otros años'
+        )
+
+    def handle(self, *args, **options):
+        empresa = self.obtener_empresa(options['empresa'])
+        vigencia = options['vigencia'] or datetime.date.today().year
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Empresa: {empresa.nombre} (id {empresa.id}) - vigencia {vigencia}'))
+
+        particionada = particiones.particionada()
+        if options['verificar_poda'] and not particionada:
+            raise CommandError('La tabla de registros no está particionada (migración formularios 0007).')
+
+        opciones_explain = {} if options['sin_analyze'] else {'analyze': True, 'buffers': True}
+        sin_poda = []
+        for nombre, queryset in self.consultas(empresa, vigencia):
+            if options['solo'] and options['solo'] not in nombre:
+                continue
+            self.stdout.write('')
+            self.stdout.write(self.style.SUCCESS(f'== {nombre}'))
+            plan = queryset.explain(**opciones_explain)
+            self.stdout.write(plan)
+            if not particionada:
+                continue
+
+            recorridas = sorted(set(PARTICION_EN_PLAN.findall(plan)))
+            if recorridas:
+                self.stdout.write(f"Particiones: {', '.join(recorridas)}")
+            if nombre in self.CONSULTAS_VIGENCIA and set(recorridas) - {particiones.nombre(vigencia)}:
+                sin_poda.append(nombre)
+                self.stdout.write(self.style.WARNING(f'Sin poda: se esperaba solo {particiones.nombre(vigencia)}'))
+
+        if sin_poda and options['verificar_poda']:
+            raise CommandError(f"Consultas de la vigencia que recorren otros años: {'; '.join(sin_poda)}")
+
+    def obtener_empresa(self, empresa_id):
+        if empresa_id:
+            try:
+                return EmpresaCliente.objects.get(id=empresa_id)
+            except EmpresaCliente.DoesNotExist:
+                raise CommandError(f'No existe la empresa con id {empresa_id}')
+
+        empresa = EmpresaCliente.objects.annotate(n=Count('registros')).order_by('-n').first()
+        if empresa is None:
+            raise CommandError('No hay empresas registradas.')
+        return empresa
+
+    def consultas(self, empresa, vigencia):
+        """
+        Las consultas que arma el tablero, en el mismo orden en que se ejecutan.
+        Se devuelven como querysets (las agregaciones, como .values() equivalentes)
+        porque EXPLAIN solo se puede pedir sobre un queryset.
+        """
+        registros = empresa.registros.all()
+        registros_anio = registros.filter(fecha_registro__year=vigencia).order_by('-fecha_registro')
+        hoy = datetime.date.today()
+        filtros_tabla = {
+            'fecha_inicio': (hoy - datetime.timedelta(days=30)).isoformat(),
+            'fecha_fin': hoy.isoformat(),
+        }
+        tipo = registros.exclude(tipo_tercero='').values_list('tipo_tercero', flat=True).first() or 'PROVEEDOR'
+        preguntas = catalogo.catalogo_preguntas(empresa, solo_activas=False)
+
+        return [
+            # ver_metricas
+            ('metricas: tabla de la vigencia (50 más recientes)', registros_anio[:50]),
+            ('metricas: tabla filtrada por tipo', registros_anio.filter(tipo_tercero=tipo)[:50]),
+            ('metricas: conteos de la vigencia (resumen diario)', ResumenDiario.objects.filter(
+                empresa=empresa, fecha__year=vigencia
+            ).values('tipo_tercero', 'pregunta', 'valor').annotate(cantidad=Count('id')).order_by()),
+            ('metricas: años disponibles (índice de vigencias)', empresa.vigencias.all()),
+            # ver_todos_registros / exportar_excel
+            ('registros: página 1 (últimos 30 días)', exportacion.filtrar_registros(
+                registros, filtros_tabla
+            ).order_by('-fecha_registro')[:50]),
+            ('registros: filtro por nombre', exportacion.filtrar_registros(
+                registros, {'nombre': 'a'}
+            ).order_by('-fecha_registro')[:50]),
+            ('exportacion: conteo previo', exportacion.filtrar_registros(
+                registros, filtros_tabla
+            ).values('empresa').annotate(n=Count('id')).order_by()),
+            # Conocimiento y distribución calculados directo sobre el JSON (reconstruir_resumen --verificar)
+            ('conocimiento: respondieron SI a p5_sagrilaft_conoce', registros.filter(
+                catalogo.respondio('p5_sagrilaft_conoce', 'SI')
+            ).values('id')),
+            ('conocimiento: SI / NO de todas las preguntas (JSON)', registros.order_by().values('empresa').annotate(
+                **catalogo.agregados_estadisticas(preguntas)
+            )),
+            ('conocimiento: SI / NO de todas las preguntas (máscaras de bits)', registros.order_by().values('empresa').annotate(
+                **catalogo.agregados_estadisticas(preguntas, sino.indice(empresa))
+            )),
+            ('distribucion: registros por tipo de tercero', registros.exclude(
+                tipo_tercero=''
+            ).values('tipo_tercero').annotate(n=Count('id')).order_by()),
+            # buscar_respondientes (todas las empresas)
+            ('busqueda: respondientes por nombre', busqueda.buscar(
+                RegistroEncuesta.objects.all(), 'nombre_respondiente', 'jose perez'
+            )[:50]),
+            # metricas_globales
+            ('global: últimas respuestas', RegistroEncuesta.objects.select_related('empresa').order_by('-fecha_registro')[:10]),
+        ]
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from dashboard import instantaneas
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula la instantánea de métricas globales. Sin opciones la genera una vez '
+        '(para cron); con --cada queda en bucle regenerándola cada N segundos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cada', type=float, help='Segundos entre regeneraciones (por defecto, una sola vez)')
+
+    def handle(self, *args, **options):
+        while True:
+            # Proceso de larga vida: descartar conexiones caídas o vencidas entre corridas
+            close_old_connections()
+            instantanea = instantaneas.generar_metricas_globales()
+            self.stdout.write(self.style.SUCCESS(
+                f'Métricas globales generadas en {instantanea.duracion_ms} ms ({instantanea.generado:%Y-%m-%d %H:%M:%S}).'
+            ))
+
+            if not options['cada']:
+                break
+            time.sleep(options['cada'])
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from dashboard import trabajos
+from dashboard.models import TrabajoExportacion
+
+
+class Command(BaseCommand):
+    help = (
+        'Worker de exportaciones en segundo plano: toma los trabajos pendientes de la '
+        'tabla TrabajoExportacion y deja el archivo en el almacenamiento de media.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true', help='Procesar los pendientes y terminar')
+        parser.add_argument('--intervalo', type=float, default=5, help='Segundos de espera cuando no hay trabajos')
+        parser.add_argument(
+            '--reencolar-minutos', type=int, default=5,
+            help='Trabajos PROCESANDO sin latido del worker por más de estos minutos vuelven a la cola (worker caído)'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Esperando exportaciones...')
+        revisar_abandonados = 0
+        while True:
+            # Worker de larga vida: descartar conexiones caídas o vencidas entre trabajos
+            close_old_connections()
+
+            # Cualquier worker recoge los trabajos de uno caído, no solo el que arranca
+            if time.monotonic() >= revisar_abandonados:
+                reencolados = trabajos.reencolar_abandonados(options['reencolar_minutos'])
+                if reencolados:
+                    self.stdout.write(self.style.WARNING(f'{reencolados} trabajo(s) abandonado(s) devueltos a la cola.'))
+                revisar_abandonados = time.monotonic() + trabajos.LATIDO_SEGUNDOS
+
+            trabajo = trabajos.tomar_siguiente()
+
+            if trabajo is None:
+                if options['una_vez']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+
+            self.stdout.write(f'Exportación #{trabajo.id} ({trabajo.empresa.nombre}, {trabajo.formato})...')
+            trabajo = trabajos.procesar(trabajo)
+
+            if trabajo.worker != trabajos.identidad():
+                self.stdout.write(self.style.WARNING('  Reencolado mientras se procesaba: se descartó el resultado'))
+            elif trabajo.estado == TrabajoExportacion.COMPLETADO:
+                self.stdout.write(self.style.SUCCESS(f'  {trabajo.filas_procesadas} filas -> {trabajo.archivo.name}'))
+            else:
+                self.stdout.write(self.style.ERROR(f'  Error: {trabajo.error}'))
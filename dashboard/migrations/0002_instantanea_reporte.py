@@ -0,0 +1,24 @@
+# Generated by Django 5.2.9 on 2026-10-18 08:54
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InstantaneaReporte',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reporte', models.CharField(max_length=50, unique=True)),
+                ('datos', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('generado', models.DateTimeField()),
+                ('duracion_ms', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
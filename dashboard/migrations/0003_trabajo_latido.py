@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-18 10:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0002_instantanea_reporte'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajoexportacion',
+            name='latido',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trabajoexportacion',
+            name='worker',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
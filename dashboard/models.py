@@ -1,3 +1,80 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from empresas.models import EmpresaCliente
 
-# Create your models here.
+
+class TrabajoExportacion(models.Model):
+    """
+    Exportación grande procesada en segundo plano por `python manage.py procesar_exportaciones`.
+    La propia tabla es la cola: el worker toma los trabajos PENDIENTE con
+    SELECT ... FOR UPDATE SKIP LOCKED, sin broker externo.
+    """
+    PENDIENTE = 'PENDIENTE'
+    PROCESANDO = 'PROCESANDO'
+    COMPLETADO = 'COMPLETADO'
+    ERROR = 'ERROR'
+    ESTADOS = [
+        (PENDIENTE, 'Pendiente'),
+        (PROCESANDO, 'Procesando'),
+        (COMPLETADO, 'Completado'),
+        (ERROR, 'Error'),
+    ]
+
+    FORMATOS = [
+        ('csv', 'CSV'),
+        ('xlsx', 'Excel (.xlsx)'),
+    ]
+
+    empresa = models.ForeignKey(EmpresaCliente, on_delete=models.CASCADE, related_name='exportaciones')
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    formato = models.CharField(max_length=10, choices=FORMATOS, default='csv')
+    # Mismos parámetros GET de la tabla (tipo, fecha_inicio, fecha_fin, nombre)
+    filtros = models.JSONField(default=dict, blank=True)
+
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=PENDIENTE, db_index=True)
+    total_filas = models.PositiveIntegerField(default=0)
+    filas_procesadas = models.PositiveIntegerField(default=0)
+    archivo = models.FileField(upload_to='exportaciones/', blank=True)
+    error = models.TextField(blank=True)
+
+    creado = models.DateTimeField(auto_now_add=True)
+    iniciado = models.DateTimeField(null=True, blank=True)
+    finalizado = models.DateTimeField(null=True, blank=True)
+    # Worker que lo procesa (host:pid) y última vez que avisó que sigue vivo (ver dashboard/trabajos.py)
+    worker = models.CharField(max_length=100, blank=True)
+    latido = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-creado']
+
+    def __str__(self):
+        return f"Exportación #{self.id} {self.empresa.nombre} ({self.estado})"
+
+    @property
+    def progreso(self):
+        """Porcentaje de avance (0-100)."""
+        if self.estado == self.COMPLETADO:
+            return 100
+        if not self.total_filas:
+            return 0
+        return min(99, int(self.filas_procesadas * 100 / self.total_filas))
+
+    @property
+    def nombre_archivo(self):
+        return f"Reporte_{self.empresa.slug}_{self.filtros.get('fecha_inicio') or 'inicio'}_a_{self.filtros.get('fecha_fin') or 'fin'}.{self.formato}"
+
+
+class InstantaneaReporte(models.Model):
+    """
+    Contexto precalculado de un reporte pesado, serializado en JSON (ver dashboard/instantaneas.py).
+    Una fila por reporte; cada generación la reemplaza.
+    """
+    reporte = models.CharField(max_length=50, unique=True)
+    datos = models.JSONField(encoder=DjangoJSONEncoder)
+    generado = models.DateTimeField()
+    # Lo que tardó el cálculo: lo que costaría la página sin instantánea
+    duracion_ms = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.reporte} ({self.generado:%Y-%m-%d %H:%M})"
@@ -0,0 +1,183 @@
+"""
+Paginación por cursor (keyset) para la tabla de registros.
+
+En lugar de OFFSET, cada página pide "los registros anteriores/posteriores a
+(fecha_registro, id)" y Postgres llega directo por el índice
+(empresa, fecha_registro): la página 500 cuesta lo mismo que la primera.
+
+Los cursores viajan en la URL firmados con django.core.signing, así que no se
+pueden manipular; llevan además una huella de los filtros para descartar un
+cursor que se combine con otros filtros.
+
+Los registros archivados (formularios/archivo.py) se intercalan en cada página
+con el mismo orden y los mismos cursores.
+"""
+import hashlib
+import json
+
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_date, parse_datetime
+
+from formularios import archivo, catalogo, resumen, sino
+
+
+TAMANO_PAGINA = 50
+
+# Segundos que se guardan el total y los conteos de resultados cuando hay que contarlos (búsqueda por nombre)
+TTL_TOTAL = 300
+
+SALT_CURSOR = 'dashboard.paginacion.cursor'
+
+SIGUIENTE = 's'
+ANTERIOR = 'a'
+
+
+class Pagina:
+    """Una página de registros con los cursores para moverse desde ella."""
+
+    def __init__(self, registros, numero, cursor_siguiente=None, cursor_anterior=None):
+        self.registros = registros
+        self.numero = numero
+        self.cursor_siguiente = cursor_siguiente
+        self.cursor_anterior = cursor_anterior
+
+    def __iter__(self):
+        return iter(self.registros)
+
+    def __len__(self):
+        return len(self.registros)
+
+    @property
+    def has_next(self):
+        return self.cursor_siguiente is not None
+
+    @property
+    def has_previous(self):
+        return self.cursor_anterior is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+def huella_filtros(filtros):
+    """Resumen corto y estable de los filtros activos."""
+    activos = {clave: valor for clave, valor in sorted(filtros.items()) if valor}
+    return hashlib.sha1(json.dumps(activos, sort_keys=True).encode('utf8')).hexdigest()[:12]
+
+
+def crear_cursor(registro, direccion, numero, filtros):
+    return signing.dumps(
+        {
+            'f': registro.fecha_registro.isoformat(),
+            'i': registro.id,
+            'd': direccion,
+            'n': numero,
+            'h': huella_filtros(filtros),
+        },
+        salt=SALT_CURSOR,
+        compress=True,
+    )
+
+
+def leer_cursor(token, filtros):
+    """Devuelve el cursor decodificado, o None si no es válido o es de otros filtros."""
+    if not token:
+        return None
+    try:
+        cursor = signing.loads(token, salt=SALT_CURSOR)
+    except signing.BadSignature:
+        return None
+
+    fecha = parse_datetime(cursor.get('f') or '')
+    if fecha is None or not isinstance(cursor.get('i'), int) or cursor.get('h') != huella_filtros(filtros):
+        return None
+    cursor['f'] = fecha
+    return cursor
+
+
+def paginar(registros, token, filtros, tamano=TAMANO_PAGINA, archivados=None):
+    """
+    Página de `registros` (ordenados por -fecha_registro, -id) a partir del
+    cursor `token`. Sin cursor, o con uno inválido, devuelve la primera página.
+    `archivados` son los registros archivados de la empresa con los mismos filtros.
+    """
+    cursor = leer_cursor(token, filtros)
+
+    if cursor is None:
+        filas = archivo.combinar(registros.order_by('-fecha_registro', '-id'), archivados, tamano + 1)
+        hay_mas = len(filas) > tamano
+        filas = filas[:tamano]
+        numero = 1
+        hay_siguiente, hay_anterior = hay_mas, False
+    else:
+        fecha, ultimo_id = cursor['f'], cursor['i']
+        if cursor['d'] == SIGUIENTE:
+            # fecha_registro <= f va aparte para que el rango use el índice
+            filas = archivo.combinar(registros.filter(
+                Q(fecha_registro__lt=fecha) | Q(fecha_registro=fecha, id__lt=ultimo_id),
+                fecha_registro__lte=fecha,
+            ).order_by('-fecha_registro', '-id'), archivados, tamano + 1, cursor=(fecha, ultimo_id))
+            hay_mas = len(filas) > tamano
+            filas = filas[:tamano]
+            numero = cursor['n'] + 1
+            hay_siguiente, hay_anterior = hay_mas, True
+        else:
+            # Hacia atrás se recorre en orden ascendente y se invierte
+            filas = archivo.combinar(registros.filter(
+                Q(fecha_registro__gt=fecha) | Q(fecha_registro=fecha, id__gt=ultimo_id),
+                fecha_registro__gte=fecha,
+            ).order_by('fecha_registro', 'id'), archivados, tamano + 1, ascendente=True, cursor=(fecha, ultimo_id))
+            hay_mas = len(filas) > tamano
+            filas = filas[:tamano][::-1]
+            numero = max(cursor['n'] - 1, 1)
+            hay_siguiente, hay_anterior = True, hay_mas
+
+        if not filas:
+            # El cursor apunta más allá de los datos (p. ej. se borraron registros)
+            return paginar(registros, None, filtros, tamano, archivados)
+
+    return Pagina(
+        filas,
+        numero,
+        cursor_siguiente=crear_cursor(filas[-1], SIGUIENTE, numero, filtros) if hay_siguiente else None,
+        cursor_anterior=crear_cursor(filas[0], ANTERIOR, numero, filtros) if hay_anterior else None,
+    )
+
+
+def estadisticas_resultados(empresa, registros, filtros, archivados=None):
+    """
+    Total y conteos SI / NO / sin respuesta de las preguntas activas en los
+    registros que cumplen los filtros (formato de catalogo.estadisticas_registros).
+    Tipo y fechas se resuelven con el resumen diario (exacto, incluye los
+    archivados); la búsqueda por nombre obliga a contar: una consulta que suma
+    las máscaras de bits de las respuestas (formularios/sino.py), sin leer el
+    JSON, más los archivados que la cumplen. Ese conteo se guarda en cache unos minutos.
+    """
+    preguntas = catalogo.catalogo_preguntas(empresa)
+    if not filtros.get('nombre'):
+        conteos = resumen.conteos_rango(
+            empresa,
+            tipo=filtros.get('tipo'),
+            desde=_fecha(filtros.get('fecha_inicio')),
+            hasta=_fecha(filtros.get('fecha_fin')),
+        )
+        return catalogo.estadisticas_resumen(conteos, preguntas)
+
+    def contar():
+        stats = catalogo.estadisticas_registros(registros, preguntas, sino.indice(empresa))
+        if archivados:
+            catalogo.sumar_estadisticas(stats, archivados.iterar(), preguntas)
+        return stats
+
+    clave = f'estadisticas_registros:{empresa.id}:{huella_filtros(filtros)}'
+    return cache.get_or_set(clave, contar, TTL_TOTAL)
+
+
+def _fecha(valor):
+    try:
+        return parse_date(valor or '')
+    except ValueError:
+        return None
@@ -1,3 +1,599 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core import signing
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Value
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core import busqueda
+from core.middleware import PresupuestoConsultasExcedido
+from empresas.models import EmpresaCliente
+from formularios import archivo, resumen
+from formularios.models import RegistroEncuesta
+from formularios.tests import ConMediaTemporal, crear_registros
+from . import exportacion, instantaneas, paginacion, trabajos, xlsx
+from .models import InstantaneaReporte, TrabajoExportacion
+
+
+class TrabajosExportacionTests(ConMediaTemporal, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = EmpresaCliente.objects.create(nombre='Acme', slug='acme')
+        RegistroEncuesta.objects.bulk_create([
+            RegistroEncuesta(
+                empresa=cls.empresa, tipo_tercero='CLIENTE', nombre_respondiente=f'Persona {i}',
+                area='Ventas', cargo='Analista', respuestas_data={'p1_conocimiento': 'SI'},
+            )
+            for i in range(5)
+        ])
+
+    def encolar(self):
+        return trabajos.encolar(self.empresa, AnonymousUser(), 'csv', {}, 5)
+
+    def test_tomar_registra_worker_y_latido(self):
+        self.encolar()
+        trabajo = trabajos.tomar_siguiente()
+        self.assertEqual(trabajo.estado, TrabajoExportacion.PROCESANDO)
+        self.assertEqual(trabajo.worker, trabajos.identidad())
+        self.assertIsNotNone(trabajo.latido)
+
+    def test_reencola_solo_los_que_no_laten(self):
+        ahora = timezone.now()
+        largo = self.encolar()
+        caido = self.encolar()
+        anterior = self.encolar()
+        # Largo pero vivo: empezó hace horas y su worker sigue latiendo
+        TrabajoExportacion.objects.filter(id=largo.id).update(
+            estado=TrabajoExportacion.PROCESANDO, iniciado=ahora - datetime.timedelta(hours=3), latido=ahora,
+        )
+        TrabajoExportacion.objects.filter(id=caido.id).update(
+            estado=TrabajoExportacion.PROCESANDO, iniciado=ahora, latido=ahora - datetime.timedelta(minutes=10),
+            worker='otro:1',
+        )
+        # Tomado antes de que existiera el latido
+        TrabajoExportacion.objects.filter(id=anterior.id).update(
+            estado=TrabajoExportacion.PROCESANDO, iniciado=ahora - datetime.timedelta(minutes=10),
+        )
+
+        self.assertEqual(trabajos.reencolar_abandonados(5), 2)
+        estados = dict(TrabajoExportacion.objects.values_list('id', 'estado'))
+        self.assertEqual(estados[largo.id], TrabajoExportacion.PROCESANDO)
+        self.assertEqual(estados[caido.id], TrabajoExportacion.PENDIENTE)
+        self.assertEqual(estados[anterior.id], TrabajoExportacion.PENDIENTE)
+        self.assertEqual(TrabajoExportacion.objects.get(id=caido.id).worker, '')
+
+    def test_procesar_completa(self):
+        self.encolar()
+        trabajo = trabajos.procesar(trabajos.tomar_siguiente())
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, TrabajoExportacion.COMPLETADO)
+        self.assertEqual(trabajo.filas_procesadas, 5)
+        self.assertTrue(default_storage.exists(trabajo.archivo.name))
+
+    def test_descarta_el_resultado_si_otro_worker_lo_tomo(self):
+        self.encolar()
+        trabajo = trabajos.tomar_siguiente()
+        # Mientras tanto se reencoló y lo tomó otro worker
+        TrabajoExportacion.objects.filter(id=trabajo.id).update(worker='otro:1')
+
+        with self.assertLogs('dashboard.trabajos', 'WARNING'):
+            trabajo = trabajos.procesar(trabajo)
+        self.assertEqual(trabajo.estado, TrabajoExportacion.PROCESANDO)
+        self.assertEqual(trabajo.worker, 'otro:1')
+        self.assertEqual(trabajo.archivo.name, '')
+        self.assertEqual(default_storage.listdir('exportaciones')[1], [])
+
+
+class ExportacionCsvTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = EmpresaCliente.objects.create(
+            nombre='Acme', slug='acme', config_encuesta={'campos_seccion1': [{'name': 'nit', 'label': 'NIT'}]},
+        )
+        crear_registros(cls.empresa, [{'nit': f'00{i}', 'p5_sagrilaft_conoce': 'SI'} for i in range(7)])
+        crear_registros(cls.empresa, [{'nit': '0099', 'observaciones': 'Línea 1\nLínea 2; "citada"'}],
+                        tipo='PROVEEDOR', nombre='Pérez; Hnos "SA"')
+        cls.usuario = User.objects.create_user('auditor', password='x', is_staff=True)
+
+    def filas(self, contenido):
+        texto = contenido.decode('utf8')
+        self.assertTrue(texto.startswith('\ufeff'))
+        return list(csv.reader(io.StringIO(texto[1:]), delimiter=';'))
+
+    def test_descarga_en_streaming(self):
+        self.client.force_login(self.usuario)
+        with self.assertLogs('core.sql', 'INFO'):
+            respuesta = self.client.get(reverse('exportar_excel', args=[self.empresa.id]), {'tipo': 'PROVEEDOR'})
+        self.assertTrue(respuesta.streaming)
+        self.assertEqual(respuesta['Content-Type'], 'text/csv')
+        self.assertEqual(respuesta['Content-Disposition'], 'attachment; filename="Reporte_acme_inicio_a_fin.csv"')
+
+        encabezado, *filas = self.filas(b''.join(respuesta.streaming_content))
+        self.assertEqual(encabezado, exportacion.encabezados(self.empresa))
+        self.assertEqual(encabezado[7], 'NIT')
+        # Solo lo filtrado; ;, comillas y saltos de línea sobreviven al ida y vuelta
+        self.assertEqual(len(filas), 1)
+        self.assertEqual(filas[0][2:4], ['PROVEEDOR', 'Pérez; Hnos "SA" 0'])
+        self.assertEqual(filas[0][7], '0099')
+        self.assertEqual(filas[0][-1], 'Línea 1\nLínea 2; "citada"')
+        registro = self.empresa.registros.get(tipo_tercero='PROVEEDOR')
+        self.assertEqual(filas[0][1], timezone.localtime(registro.fecha_registro).strftime('%d/%m/%Y %H:%M'))
+
+    def test_bloques_y_progreso(self):
+        registros = self.empresa.registros.order_by('-fecha_registro', '-id')
+        progreso = []
+        with mock.patch.object(exportacion, 'TAMANO_BLOQUE', 200), mock.patch.object(exportacion, 'CHUNK_SIZE', 3):
+            bloques = exportacion.generar_csv(self.empresa, registros, progreso=progreso.append)
+            # El encabezado sale antes de consultar la base
+            with self.assertNumQueries(0):
+                primero = next(bloques)
+            resto = list(bloques)
+
+        self.assertEqual(len(self.filas(primero)), 1)
+        self.assertGreater(len(resto), 1)
+        self.assertTrue(all(len(bloque) >= 200 for bloque in resto[:-1]))
+        filas = self.filas(primero + b''.join(resto))[1:]
+        self.assertEqual([int(fila[0]) for fila in filas], list(registros.values_list('id', flat=True)))
+        self.assertEqual(progreso, [3, 6, 8])
+
+
+class ExportacionXlsxTests(TestCase):
+
+    NS = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+
+    def hoja(self, contenido):
+        """Filas de la hoja como listas de (tipo, estilo, valor) por celda."""
+        with zipfile.ZipFile(io.BytesIO(contenido)) as libro:
+            self.assertIsNone(libro.testzip())
+            self.assertIn('xl/styles.xml', libro.namelist())
+            self.nombre_hoja = ElementTree.fromstring(libro.read('xl/workbook.xml')).find('.//x:sheet', self.NS).get('name')
+            raiz = ElementTree.fromstring(libro.read('xl/worksheets/sheet1.xml'))
+        filas = []
+        for fila in raiz.iterfind('.//x:row', self.NS):
+            celdas = []
+            for celda in fila:
+                texto = celda.find('x:is/x:t', self.NS)
+                valor = celda.find('x:v', self.NS)
+                celdas.append((
+                    celda.get('t'), celda.get('s'),
+                    texto.text if texto is not None else valor.text if valor is not None else None,
+                ))
+            filas.append(celdas)
+        return filas
+
+    def test_tipos_de_celda(self):
+        hora = timezone.make_aware(datetime.datetime(2024, 3, 1, 12, 0))
+        fila = [7, 2.5, hora, datetime.date(2024, 3, 1), '00123', 'a<b & "c"\x01', None, '', True]
+        encabezado, celdas = self.hoja(b''.join(xlsx.generar_xlsx(['ID', 'Fecha'], [fila], nombre_hoja='Acme: [S.A.]/x')))
+
+        self.assertEqual(encabezado, [('inlineStr', '3', 'ID'), ('inlineStr', '3', 'Fecha')])
+        self.assertEqual(celdas, [
+            (None, None, '7'),
+            (None, None, '2.5'),
+            # 01/03/2024 12:00 hora local: serial 45352 + medio día
+            (None, str(xlsx.ESTILO_FECHA_HORA), '45352.5'),
+            (None, str(xlsx.ESTILO_FECHA), '45352.0'),
+            # Texto: conserva los ceros a la izquierda, se escapa y pierde los caracteres de control
+            ('inlineStr', None, '00123'),
+            ('inlineStr', None, 'a<b & "c"'),
+            (None, None, None),
+            (None, None, None),
+            ('b', None, '1'),
+        ])
+        self.assertEqual(self.nombre_hoja, 'Acme S.A.x')
+
+    def test_entrega_bloques_mientras_lee_las_filas(self):
+        # Texto poco comprimible: el deflate entrega bytes antes de terminar
+        nombres = [os.urandom(16).hex() for _ in range(3000)]
+        leidas = []
+
+        def filas():
+            for i, nombre in enumerate(nombres):
+                leidas.append(i)
+                yield [i, nombre]
+
+        bloques = xlsx.generar_xlsx(['ID', 'Nombre'], filas())
+        primero = next(bloques)
+        self.assertEqual(leidas, [])
+        entregas = []
+        for bloque in bloques:
+            entregas.append((len(leidas), bloque))
+        # Hubo entregas con filas aún sin leer
+        self.assertLess(entregas[0][0], len(nombres))
+        filas_hoja = self.hoja(primero + b''.join(bloque for _, bloque in entregas))
+        self.assertEqual([celdas[1][2] for celdas in filas_hoja[1:]], nombres)
+
+    def test_exportar_en_xlsx(self):
+        empresa = EmpresaCliente.objects.create(
+            nombre='Acme', slug='acme', config_encuesta={'campos_seccion1': [{'name': 'nit', 'label': 'NIT'}]},
+        )
+        registro, = crear_registros(empresa, [{'nit': '00123', 'p5_sagrilaft_conoce': 'SI'}])
+        self.client.force_login(User.objects.create_user('auditor', password='x', is_staff=True))
+        with self.assertLogs('core.sql', 'INFO'):
+            respuesta = self.client.get(reverse('exportar_excel', args=[empresa.id]), {'formato': 'xlsx'})
+        self.assertTrue(respuesta.streaming)
+        self.assertEqual(respuesta['Content-Type'], exportacion.FORMATOS['xlsx'])
+        self.assertTrue(respuesta['Content-Disposition'].endswith('.xlsx"'))
+
+        encabezado, celdas = self.hoja(b''.join(respuesta.streaming_content))
+        self.assertEqual([celda[2] for celda in encabezado], exportacion.encabezados(empresa))
+        self.assertEqual(celdas[0], (None, None, str(registro.id)))
+        self.assertEqual(celdas[1][1], str(xlsx.ESTILO_FECHA_HORA))
+        self.assertEqual(celdas[7], ('inlineStr', None, '00123'))
+
+
+class PaginacionCursorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = EmpresaCliente.objects.create(nombre='Acme', slug='acme')
+        crear_registros(cls.empresa, [{}] * 13)
+        # Empates de fecha: el id decide el orden
+        inicio = timezone.now() - datetime.timedelta(days=1)
+        for i, registro in enumerate(cls.empresa.registros.order_by('id')):
+            RegistroEncuesta.objects.filter(id=registro.id).update(fecha_registro=inicio + datetime.timedelta(hours=i // 3))
+        cls.orden = list(cls.empresa.registros.order_by('-fecha_registro', '-id').values_list('id', flat=True))
+        cls.filtros = {'tipo': 'CLIENTE', 'nombre': None}
+
+    def paginar(self, token=None, filtros=None):
+        return paginacion.paginar(self.empresa.registros.filter(tipo_tercero='CLIENTE'), token,
+                                  filtros or self.filtros, tamano=5)
+
+    def ids(self, pagina):
+        return [registro.id for registro in pagina]
+
+    def test_ida_y_vuelta(self):
+        paginas = [self.paginar()]
+        while paginas[-1].has_next:
+            paginas.append(self.paginar(paginas[-1].cursor_siguiente))
+        self.assertEqual([len(pagina) for pagina in paginas], [5, 5, 3])
+        self.assertEqual([pagina.numero for pagina in paginas], [1, 2, 3])
+        self.assertEqual(sum((self.ids(pagina) for pagina in paginas), []), self.orden)
+        self.assertFalse(paginas[0].has_previous)
+
+        # Hacia atrás desde la última se ven las mismas páginas
+        atras = self.paginar(paginas[2].cursor_anterior)
+        self.assertEqual((atras.numero, self.ids(atras)), (2, self.ids(paginas[1])))
+        primera = self.paginar(atras.cursor_anterior)
+        self.assertEqual((primera.numero, self.ids(primera)), (1, self.ids(paginas[0])))
+        self.assertFalse(primera.has_previous)
+
+    def test_cursor_manipulado_vuelve_a_la_primera_pagina(self):
+        segunda = self.paginar(self.paginar().cursor_siguiente)
+        ultimo = self.empresa.registros.get(id=self.orden[-1])
+        falsificado = signing.dumps(
+            {'f': ultimo.fecha_registro.isoformat(), 'i': ultimo.id, 'd': paginacion.SIGUIENTE, 'n': 7,
+             'h': paginacion.huella_filtros(self.filtros)},
+            salt='otra-sal', compress=True,
+        )
+        cursores = {
+            'firma alterada': segunda.cursor_siguiente[:-2] + ('AA' if segunda.cursor_siguiente[-2:] != 'AA' else 'BB'),
+            'otra sal': falsificado,
+            'basura': 'no-es-un-cursor',
+        }
+        for caso, token in cursores.items():
+            with self.subTest(caso):
+                pagina = self.paginar(token)
+                self.assertEqual((pagina.numero, self.ids(pagina)), (1, self.orden[:5]))
+
+    def test_cursor_de_otros_filtros_se_descarta(self):
+        token = self.paginar().cursor_siguiente
+        pagina = self.paginar(token, filtros={'tipo': 'CLIENTE', 'nombre': 'ana'})
+        self.assertEqual((pagina.numero, self.ids(pagina)), (1, self.orden[:5]))
+
+    def test_cursor_mas_alla_de_los_datos(self):
+        token = self.paginar(self.paginar().cursor_siguiente).cursor_siguiente
+        self.empresa.registros.filter(id__in=self.orden[10:]).delete()
+        pagina = self.paginar(token)
+        self.assertEqual((pagina.numero, self.ids(pagina)), (1, self.orden[:5]))
+
+
+class BusquedaTextoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.acme = EmpresaCliente.objects.create(nombre='Ñandú Comercial', slug='nandu')
+        cls.beta = EmpresaCliente.objects.create(nombre='Beta Logística', slug='beta')
+        crear_registros(cls.acme, [{}], nombre='José Pérez')
+        crear_registros(cls.acme, [{}], nombre='Luis Gómez')
+        crear_registros(cls.beta, [{}], nombre='JOSE PEREZ')
+        crear_registros(cls.beta, [{}], nombre='Descuento 50% para_todos')
+        crear_registros(cls.beta, [{}], nombre='Descuento 500 paraXtodos')
+        cls.usuario = User.objects.create_user('auditor', password='x', is_staff=True)
+
+    def nombres(self, condicion):
+        return sorted(RegistroEncuesta.objects.filter(condicion).values_list('nombre_respondiente', flat=True))
+
+    def test_contiene_sin_tildes_ni_mayusculas(self):
+        self.assertEqual(self.nombres(busqueda.contiene('nombre_respondiente', 'perez')), ['JOSE PEREZ 0', 'José Pérez 0'])
+        self.assertEqual(self.nombres(busqueda.contiene('nombre_respondiente', ' GÓMEZ ')), ['Luis Gómez 0'])
+
+    def test_comodines_se_buscan_literalmente(self):
+        self.assertEqual(self.nombres(busqueda.contiene('nombre_respondiente', '50%')), ['Descuento 50% para_todos 0'])
+        self.assertEqual(self.nombres(busqueda.contiene('nombre_respondiente', 'para_')), ['Descuento 50% para_todos 0'])
+
+    def test_coincide_tolera_errores_de_digitacion(self):
+        self.assertEqual(self.nombres(busqueda.coincide('nombre_respondiente', 'Gomes')), ['Luis Gómez 0'])
+        # Con menos de 3 letras solo cuenta "contiene"
+        self.assertEqual(self.nombres(busqueda.coincide('nombre_respondiente', 'zz')), [])
+
+    def test_buscar_ordena_por_parecido(self):
+        resultados = busqueda.buscar(RegistroEncuesta.objects.all(), 'nombre_respondiente', 'jose perez')
+        self.assertEqual(
+            sorted(r.nombre_respondiente for r in resultados[:2]), ['JOSE PEREZ 0', 'José Pérez 0'],
+        )
+        self.assertEqual(list(busqueda.buscar(RegistroEncuesta.objects.all(), 'nombre_respondiente', '  ')), [])
+
+    def test_sin_tildes_en_python_igual_que_en_la_base(self):
+        for texto in ['Ñandú Pérez', 'ÁÉÍÓÚ üñ', 'Logística']:
+            with self.subTest(texto=texto):
+                en_base = EmpresaCliente.objects.annotate(t=busqueda.SinTildes(Value(texto))).values_list('t', flat=True)[0]
+                self.assertEqual(busqueda.sin_tildes(texto), en_base.lower())
+
+    def test_las_consultas_usan_los_indices_de_trigramas(self):
+        consultas = [
+            (RegistroEncuesta.objects.filter(busqueda.coincide('nombre_respondiente', 'perez')), 'registro_nombre_trgm'),
+            (EmpresaCliente.objects.filter(busqueda.coincide('nombre', 'nandu')), 'empresa_nombre_trgm'),
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        for consulta, indice in consultas:
+            with self.subTest(indice=indice):
+                plan = consulta.explain()
+                # Tanto el ILIKE como la similitud (%>) son condiciones del índice, no filtros posteriores
+                self.assertRegex(plan, r'Index Cond: \(f_unaccent\(.*\~\~\*')
+                self.assertRegex(plan, r'Index Cond: \(f_unaccent\(.*%>')
+                # En la tabla particionada cada partición tiene su copia del índice, con otro nombre
+                if indice == 'empresa_nombre_trgm':
+                    self.assertIn(indice, plan)
+
+    def test_vistas_de_busqueda(self):
+        self.client.force_login(self.usuario)
+        with self.assertLogs('core.sql', 'INFO'):
+            respondientes = self.client.get(reverse('buscar_respondientes'), {'q': 'pérez'})
+            corta = self.client.get(reverse('buscar_respondientes'), {'q': 'p'})
+            empresas = self.client.get(reverse('lista_empresas'), {'q': 'NANDU'})
+        self.assertEqual(
+            sorted(r.nombre_respondiente for r in respondientes.context['resultados']), ['JOSE PEREZ 0', 'José Pérez 0'],
+        )
+        self.assertEqual(corta.context['resultados'], [])
+        self.assertEqual([e.slug for e in empresas.context['empresas']], ['nandu'])
+
+
+class MetricasVigenciasTests(ConMediaTemporal, TestCase):
+    """El selector de años y la última respuesta de ver_metricas salen del índice de vigencias."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = EmpresaCliente.objects.create(nombre='Acme', slug='acme')
+        cls.actual = timezone.localdate().year
+        cls.ultimas = {}
+        registros = []
+        for anio in (cls.actual - 2, cls.actual - 1):
+            fechas = [timezone.make_aware(datetime.datetime(anio, mes, 15, 9)) for mes in (6, 2, 9)]
+            registros += [
+                RegistroEncuesta.objects.create(
+                    empresa=cls.empresa, tipo_tercero='CLIENTE', nombre_respondiente=f'Persona {i}',
+                    area='Ventas', cargo='Analista', respuestas_data={'p5_sagrilaft_conoce': 'SI'}, fecha_registro=fecha,
+                )
+                for i, fecha in enumerate(fechas)
+            ]
+            cls.ultimas[anio] = max(fechas)
+        resumen.acumular(cls.empresa, registros)
+        archivo.archivar(cls.empresa, cls.actual - 2)
+        cls.sin_envios = EmpresaCliente.objects.create(nombre='Beta', slug='beta')
+        cls.usuario = User.objects.create_user('auditor', password='x', is_staff=True)
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def metricas(self, empresa, vigencia=None):
+        with self.assertLogs('core.sql', 'INFO'):
+            respuesta = self.client.get(
+                reverse('ver_metricas', args=[empresa.id]), {'vigencia': vigencia} if vigencia else {}
+            )
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.context
+
+    def test_lista_de_anios(self):
+        # Con la vigencia archivada y el año actual aunque aún no tenga envíos
+        self.assertEqual(self.metricas(self.empresa)['lista_anios'], [self.actual, self.actual - 1, self.actual - 2])
+        self.assertEqual(self.metricas(self.sin_envios)['lista_anios'], [self.actual])
+
+    def test_ultima_respuesta_de_la_vigencia(self):
+        for anio in (self.actual - 1, self.actual - 2):
+            with self.subTest(anio=anio):
+                contexto = self.metricas(self.empresa, anio)
+                self.assertEqual(contexto['ultima_respuesta'], self.ultimas[anio])
+                self.assertEqual(contexto['total'], 3)
+                self.assertEqual(len(contexto['registros']), 3)
+
+    def test_vigencia_sin_envios(self):
+        contexto = self.metricas(self.empresa)
+        self.assertEqual(contexto['anio_seleccionado'], self.actual)
+        self.assertIsNone(contexto['ultima_respuesta'])
+        self.assertEqual(contexto['total'], 0)
+        self.assertEqual(list(contexto['registros']), [])
+
+
+class TodosRegistrosTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = EmpresaCliente.objects.create(nombre='Acme', slug='acme')
+        crear_registros(cls.empresa, [{'p5_sagrilaft_conoce': 'SI'}, {'p5_sagrilaft_conoce': 'NO'}], nombre='Ana Pérez')
+        crear_registros(cls.empresa, [{'p5_sagrilaft_conoce': 'SI'}], tipo='PROVEEDOR', nombre='Luis Gómez')
+        cls.usuario = User.objects.create_user('auditor', password='x', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def respuestas(self, **filtros):
+        respuesta = self.client.get(reverse('ver_todos_registros', args=[self.empresa.id]), filtros)
+        self.assertEqual(respuesta.status_code, 200)
+        conteos = {fila['pregunta']['name']: (fila['si'], fila['no']) for fila in respuesta.context['respuestas']}
+        return respuesta.context['total'], conteos['p5_sagrilaft_conoce']
+
+    def test_sin_busqueda_sale_del_resumen(self):
+        self.assertEqual(self.respuestas(), (3, (2, 1)))
+        self.assertEqual(self.respuestas(tipo='PROVEEDOR'), (1, (1, 0)))
+
+    def test_busqueda_por_nombre_cuenta_las_mascaras(self):
+        self.assertEqual(self.respuestas(nombre='perez'), (2, (1, 1)))
+
+
+@override_settings(SQL_PRESUPUESTO_ESTRICTO=True)
+class MetricasGlobalesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        empresa = EmpresaCliente.objects.create(nombre='Acme', slug='acme')
+        crear_registros(empresa, [{'p5_sagrilaft_conoce': 'SI'}, {'p5_sagrilaft_conoce': 'NO'}])
+        cls.usuario = User.objects.create_user('auditor', password='x', is_staff=True)
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def get(self):
+        with self.assertLogs('core.sql', 'INFO'):
+            respuesta = self.client.get(reverse('metricas_globales'))
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta
+
+    def test_primera_carga_sin_instantanea(self):
+        # Sin instantánea no se calcula dentro de la petición (se pasaría de su presupuesto)
+        with mock.patch.object(instantaneas, 'generar_en_segundo_plano') as generar:
+            respuesta = self.get()
+        generar.assert_called_once_with()
+        self.assertTemplateUsed(respuesta, 'dashboard/metricas_globales_pendiente.html')
+        self.assertFalse(InstantaneaReporte.objects.exists())
+
+    def test_generacion_en_segundo_plano(self):
+        with mock.patch.object(instantaneas.threading, 'Thread') as hilo:
+            self.assertTrue(instantaneas.generar_en_segundo_plano())
+            # Una sola a la vez por proceso
+            self.assertFalse(instantaneas.generar_en_segundo_plano())
+            hilo.assert_called_once()
+            # El hilo, aquí en el de la prueba: sin cerrar su conexión
+            with mock.patch.object(instantaneas, 'connection'):
+                hilo.call_args.kwargs['target']()
+        self.assertFalse(instantaneas._generando.locked())
+        self.assertTrue(InstantaneaReporte.objects.exists())
+
+    def test_lee_la_instantanea_guardada(self):
+        instantaneas.generar_metricas_globales()
+        respuesta = self.get()
+        self.assertTemplateUsed(respuesta, 'dashboard/metricas_globales.html')
+        # El JSON guarda las fechas como texto: la página las recibe como datetime
+        self.assertIsInstance(respuesta.context['ultimas_respuestas'][0]['fecha_registro'], datetime.datetime)
+        self.assertIsInstance(respuesta.context['todas_empresas'][0]['ultima_respuesta'], datetime.datetime)
+        self.assertEqual(respuesta.context['total_respuestas'], 2)
+
+
+class BenchmarkTableroTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generar_datos_prueba', empresas=3, registros=60, anios=2, semilla=3, stdout=io.StringIO())
+        User.objects.create_superuser('admin', password='x')
+
+    def test_escribe_json_con_cada_vista(self):
+        carpeta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, carpeta)
+        salida = os.path.join(carpeta, 'benchmark.json')
+
+        # El middleware registra una línea en core.sql por cada petición medida
+        with self.assertLogs('core.sql', 'INFO'):
+            call_command('benchmark_tablero', repeticiones=1, salida=salida, stdout=io.StringIO(), stderr=io.StringIO())
+
+        with open(salida, encoding='utf-8') as archivo:
+            reporte = json.load(archivo)
+        self.assertEqual(reporte['repeticiones'], 1)
+        resultados = reporte['resultados']
+        # Métricas globales más las seis vistas de cada empresa sintética
+        self.assertEqual(len(resultados), 1 + 3 * 6)
+        for resultado in resultados:
+            with self.subTest(vista=resultado['vista'], empresa=resultado.get('empresa_id')):
+                self.assertEqual(resultado['status'], 200)
+                self.assertGreater(resultado['consultas'], 0)
+                self.assertGreater(resultado['bytes'], 0)
+
+
+@override_settings(SQL_PRESUPUESTO_ESTRICTO=True)
+class PresupuestosConsultasTests(ConMediaTemporal, TestCase):
+    """Las vistas del tablero dentro de SQL_PRESUPUESTOS: si una se pasa, la petición lanza la excepción."""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generar_datos_prueba', empresas=4, registros=400, anios=3, semilla=5, stdout=io.StringIO())
+        # Vigencias viejas al archivo: las vistas combinan la tabla con los archivos
+        cls.archivada = timezone.localdate().year - 2
+        call_command('archivar_vigencias', hasta=cls.archivada, stdout=io.StringIO())
+        # La instantánea la genera generar_instantaneas (cron); la página solo la lee
+        instantaneas.generar_metricas_globales()
+        cls.empresas = list(EmpresaCliente.objects.order_by('id'))
+        cls.usuario = User.objects.create_user('auditor', password='x', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def get(self, vista, args=(), params=None):
+        with self.assertLogs('core.sql', 'INFO'):
+            respuesta = self.client.get(reverse(vista, args=args), params)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta
+
+    def test_tablero_y_metricas_globales(self):
+        self.get('dashboard_home')
+        self.get('metricas_globales')
+
+    def test_metricas_de_cada_empresa(self):
+        for empresa in self.empresas:
+            for vigencia in (timezone.localdate().year, self.archivada):
+                with self.subTest(empresa=empresa.slug, vigencia=vigencia):
+                    self.get('ver_metricas', [empresa.id], {'vigencia': vigencia})
+
+    def test_registros_con_filtros_y_paginas(self):
+        for empresa in self.empresas:
+            nombre = empresa.registros.values_list('nombre_respondiente', flat=True).first().split()[0]
+            busquedas = [
+                {},
+                {'tipo': 'CLIENTE', 'fecha_inicio': f'{self.archivada}-01-01', 'fecha_fin': f'{self.archivada + 1}-12-31'},
+                {'nombre': nombre},
+            ]
+            for filtros in busquedas:
+                with self.subTest(empresa=empresa.slug, filtros=filtros):
+                    pagina = self.get('ver_todos_registros', [empresa.id], filtros).context['page_obj']
+                    # Siguiente página por cursor, mezclando tabla y archivo
+                    if pagina.has_next:
+                        self.get('ver_todos_registros', [empresa.id], {**filtros, 'cursor': pagina.cursor_siguiente})
+
+    @override_settings(SQL_PRESUPUESTOS={'dashboard_home': 1})
+    def test_exceder_el_presupuesto_lanza_excepcion(self):
+        with self.assertLogs('core.sql', 'WARNING'):
+            with self.assertRaisesMessage(PresupuestoConsultasExcedido, 'presupuesto: 1'):
+                self.client.get(reverse('dashboard_home'))
+
+    @override_settings(SQL_PRESUPUESTOS={'dashboard_home': 1}, SQL_PRESUPUESTO_ESTRICTO=False)
+    def test_sin_modo_estricto_solo_registra_warning(self):
+        with self.assertLogs('core.sql', 'WARNING'):
+            self.assertEqual(self.client.get(reverse('dashboard_home')).status_code, 200)
@@ -0,0 +1,157 @@
+"""
+Cola de exportaciones en segundo plano.
+
+La tabla TrabajoExportacion hace de cola (sin broker externo). El worker
+(`python manage.py procesar_exportaciones`) toma un trabajo con
+SELECT ... FOR UPDATE SKIP LOCKED, genera el archivo con el mismo código de la
+exportación en streaming y lo guarda en el almacenamiento por defecto
+(MediaStorage en producción).
+
+Mientras procesa, el worker renueva `latido` cada LATIDO_SEGUNDOS desde un hilo
+aparte (también durante la subida del archivo). Un trabajo PROCESANDO sin
+latido reciente es de un worker caído: cualquier worker lo devuelve a la cola
+(ver reencolar_abandonados); uno largo pero vivo no se procesa dos veces.
+"""
+import datetime
+import logging
+import os
+import socket
+import tempfile
+import threading
+
+from django.core.files import File
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from formularios import archivo
+from . import exportacion
+from .models import TrabajoExportacion
+
+logger = logging.getLogger(__name__)
+
+
+# Cada cuántas filas se guarda el avance en la base de datos
+FILAS_ENTRE_AVANCES = exportacion.CHUNK_SIZE * 5
+
+# Cada cuántos segundos el worker marca que sigue procesando su trabajo
+LATIDO_SEGUNDOS = 30
+
+
+def identidad():
+    """host:pid del worker, guardado en el trabajo que toma."""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def encolar(empresa, usuario, formato, filtros, total_filas):
+    """Crea un trabajo pendiente con los filtros de la tabla."""
+    filtros = {clave: filtros.get(clave) for clave in ('tipo', 'fecha_inicio', 'fecha_fin', 'nombre') if filtros.get(clave)}
+    return TrabajoExportacion.objects.create(
+        empresa=empresa,
+        usuario=usuario if usuario.is_authenticated else None,
+        formato=formato,
+        filtros=filtros,
+        total_filas=total_filas,
+    )
+
+
+def tomar_siguiente():
+    """
+    Marca como PROCESANDO el trabajo pendiente más antiguo y lo devuelve.
+    SKIP LOCKED permite correr varios workers sin que tomen el mismo trabajo.
+    """
+    with transaction.atomic():
+        trabajo = TrabajoExportacion.objects.select_for_update(skip_locked=True).filter(
+            estado=TrabajoExportacion.PENDIENTE
+        ).order_by('creado').first()
+        if trabajo is None:
+            return None
+
+        trabajo.estado = TrabajoExportacion.PROCESANDO
+        trabajo.iniciado = trabajo.latido = timezone.now()
+        trabajo.worker = identidad()
+        trabajo.filas_procesadas = 0
+        trabajo.save(update_fields=['estado', 'iniciado', 'latido', 'worker', 'filas_procesadas'])
+        return trabajo
+
+
+def reencolar_abandonados(minutos):
+    """
+    Devuelve a la cola los trabajos PROCESANDO cuyo worker no da señales hace
+    más de `minutos` (worker caído). Los que no tienen latido (tomados antes de
+    que existiera) se juzgan por la hora de inicio.
+    """
+    limite = timezone.now() - datetime.timedelta(minutes=minutos)
+    return TrabajoExportacion.objects.filter(
+        Q(latido__lt=limite) | Q(latido__isnull=True, iniciado__lt=limite),
+        estado=TrabajoExportacion.PROCESANDO,
+    ).update(estado=TrabajoExportacion.PENDIENTE, worker='', latido=None)
+
+
+def _propios(trabajo):
+    """El trabajo, solo si sigue PROCESANDO a cargo de este worker."""
+    return TrabajoExportacion.objects.filter(
+        id=trabajo.id, estado=TrabajoExportacion.PROCESANDO, worker=trabajo.worker
+    )
+
+
+def _latir(trabajo, detener):
+    try:
+        while not detener.wait(LATIDO_SEGUNDOS):
+            try:
+                _propios(trabajo).update(latido=timezone.now())
+            except Exception:
+                # Un corte momentáneo de la base no debe detener el latido
+                logger.exception('No se pudo renovar el latido de la exportación #%s', trabajo.id)
+    finally:
+        # La conexión es de este hilo: nadie más la cierra
+        connection.close()
+
+
+def procesar(trabajo):
+    """Genera el archivo del trabajo, registrando avance y filas exportadas."""
+    empresa = trabajo.empresa
+    registros = exportacion.filtrar_registros(empresa.registros.all(), trabajo.filtros).order_by('-fecha_registro')
+    archivados = exportacion.filtrar_archivo(archivo.de_empresa(empresa), trabajo.filtros)
+
+    ultimo_avance = {'filas': 0}
+
+    def progreso(filas):
+        if filas - ultimo_avance['filas'] >= FILAS_ENTRE_AVANCES:
+            ultimo_avance['filas'] = filas
+            TrabajoExportacion.objects.filter(id=trabajo.id).update(filas_procesadas=filas)
+        trabajo.filas_procesadas = filas
+
+    detener = threading.Event()
+    latido = threading.Thread(target=_latir, args=(trabajo, detener), name=f'latido-{trabajo.id}', daemon=True)
+    latido.start()
+    try:
+        # El archivo se arma en disco local y luego se sube de una vez al storage
+        with tempfile.TemporaryFile() as temporal:
+            for bloque in exportacion.generar(trabajo.formato, empresa, registros, progreso, archivados):
+                temporal.write(bloque)
+            temporal.seek(0)
+            trabajo.archivo.save(trabajo.nombre_archivo, File(temporal), save=False)
+    except Exception as exc:
+        logger.exception('Falló la exportación #%s', trabajo.id)
+        trabajo.estado = TrabajoExportacion.ERROR
+        trabajo.error = str(exc)[:2000]
+    else:
+        trabajo.estado = TrabajoExportacion.COMPLETADO
+        trabajo.total_filas = trabajo.filas_procesadas
+    finally:
+        detener.set()
+        latido.join()
+
+    trabajo.finalizado = timezone.now()
+    # Si el trabajo se reencoló mientras tanto (este worker pasó demasiado sin latir), otro worker lo tiene
+    guardado = _propios(trabajo).update(
+        estado=trabajo.estado, error=trabajo.error, archivo=trabajo.archivo.name or '',
+        filas_procesadas=trabajo.filas_procesadas, total_filas=trabajo.total_filas, finalizado=trabajo.finalizado,
+    )
+    if not guardado:
+        logger.warning('La exportación #%s ya no es de este worker: se descarta su resultado', trabajo.id)
+        if trabajo.archivo:
+            trabajo.archivo.delete(save=False)
+        trabajo.refresh_from_db()
+    return trabajo
@@ -4,12 +4,18 @@ from . import views
 urlpatterns = [
     path('', views.dashboard_home, name='dashboard_home'),
     path('metricas-globales/', views.metricas_globales, name='metricas_globales'),
+    path('metricas-globales/actualizar/', views.actualizar_metricas_globales, name='actualizar_metricas_globales'),
     path('empresas/', views.lista_empresas, name='lista_empresas'),
     path('nueva-empresa/', views.crear_empresa, name='crear_empresa'),
     path('empresa/<int:id>/editar/', views.editar_empresa, name='editar_empresa'),
     path('empresa/<int:id>/registros/', views.ver_todos_registros, name='ver_todos_registros'),
     path('empresa/<int:id>/metricas/', views.ver_metricas, name='ver_metricas'),
+    path('empresa/<int:id>/metricas/datos/', views.metricas_datos, name='metricas_datos'),
     path('empresa/<int:id>/exportar/', views.exportar_excel, name='exportar_excel'),    
+    path('exportaciones/<int:id>/', views.estado_exportacion, name='estado_exportacion'),
+    path('exportaciones/<int:id>/estado/', views.estado_exportacion_json, name='estado_exportacion_json'),
+    path('exportaciones/<int:id>/descargar/', views.descargar_exportacion, name='descargar_exportacion'),
+    path('buscar/', views.buscar_respondientes, name='buscar_respondientes'),
     path('respuesta/<int:id>/detalle/', views.ver_detalle_respuesta, name='ver_detalle_respuesta'),
     path('usuarios/', views.usuarios_internos, name='usuarios_internos'),
     path('usuarios/<int:id>/eliminar/', views.eliminar_usuario, name='eliminar_usuario'),
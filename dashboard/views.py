@@ -1,18 +1,24 @@
 import datetime
-from django.db.models.functions import ExtractYear, ExtractMonth, TruncMonth
-from django.shortcuts import get_object_or_404, render, redirect
+import math
+from django.db.models.functions import ExtractYear, ExtractMonth
+from django.shortcuts import aget_object_or_404, get_object_or_404, render, redirect
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth.decorators import login_required
 from .forms import EmpresaForm, NuevoUsuarioForm
 from empresas.models import EmpresaCliente
 from django.contrib.auth.models import User
-from django.db.models import Count, Q, Avg
-from formularios.models import RegistroEncuesta
-from django.core.paginator import Paginator
-import csv
-from django.http import HttpResponse
-from django.utils import timezone
-from dateutil.relativedelta import relativedelta
+from django.db.models import Q, Avg, Sum, Value
+from django.contrib.postgres.search import TrigramWordSimilarity
+from formularios.models import RegistroEncuesta, VigenciaEmpresa
+from formularios import archivo, catalogo, resumen
+from django.conf import settings
+from django.contrib import messages
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_POST
+from . import exportacion, instantaneas, paginacion, trabajos
+from .models import TrabajoExportacion
+from core import busqueda
 
 
 
@@ -20,10 +26,12 @@ from dateutil.relativedelta import relativedelta
 def dashboard_home(request):
     # Métricas Globales
     total_empresas = EmpresaCliente.objects.filter(activo=True).count()
-    total_registros = RegistroEncuesta.objects.count()
+    # Del índice de vigencias: incluye los registros archivados y evita contar la tabla entera
+    total_registros = VigenciaEmpresa.objects.aggregate(n=Sum('total'))['n'] or 0
 
     # Actividad Reciente (Últimos 10 registros de CUALQUIER empresa)
-    ultimos_registros = RegistroEncuesta.objects.all().order_by('-fecha_registro')[:10]
+    # select_related: la plantilla muestra el nombre de la empresa de cada registro
+    ultimos_registros = RegistroEncuesta.objects.select_related('empresa').order_by('-fecha_registro')[:10]
 
     return render(request, 'dashboard/global_home.html', {
         'total_empresas': total_empresas,
@@ -36,235 +44,23 @@ def dashboard_home(request):
 def metricas_globales(request):
     """
     Dashboard de métricas globales con KPIs estratégicos de todo el sistema.
+    Se sirve desde la instantánea precalculada (ver dashboard/instantaneas.py).
     """
-    hoy = timezone.now()
-    inicio_mes_actual = hoy.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    inicio_mes_anterior = (inicio_mes_actual - relativedelta(months=1))
-    inicio_anio = hoy.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-
-    # ==========================================
-    # KPIs PRINCIPALES
-    # ==========================================
-    total_empresas = EmpresaCliente.objects.filter(activo=True).count()
-    total_respuestas = RegistroEncuesta.objects.count()
-
-    # Respuestas este mes vs mes anterior
-    respuestas_mes_actual = RegistroEncuesta.objects.filter(fecha_registro__gte=inicio_mes_actual).count()
-    respuestas_mes_anterior = RegistroEncuesta.objects.filter(
-        fecha_registro__gte=inicio_mes_anterior,
-        fecha_registro__lt=inicio_mes_actual
-    ).count()
-
-    # Calcular variación porcentual
-    if respuestas_mes_anterior > 0:
-        variacion_mensual = round(((respuestas_mes_actual - respuestas_mes_anterior) / respuestas_mes_anterior) * 100, 1)
-    else:
-        variacion_mensual = 100 if respuestas_mes_actual > 0 else 0
-
-    # Respuestas este año
-    respuestas_anio = RegistroEncuesta.objects.filter(fecha_registro__gte=inicio_anio).count()
-
-    # Promedio de respuestas por empresa
-    promedio_por_empresa = round(total_respuestas / total_empresas, 1) if total_empresas > 0 else 0
-
-    # ==========================================
-    # TOP 10 EMPRESAS CON MÁS RESPUESTAS
-    # ==========================================
-    top_empresas = EmpresaCliente.objects.filter(activo=True).annotate(
-        total_respuestas=Count('registros')
-    ).order_by('-total_respuestas')[:10]
-
-    top_empresas_labels = [e.nombre[:20] + '...' if len(e.nombre) > 20 else e.nombre for e in top_empresas]
-    top_empresas_data = [e.total_respuestas for e in top_empresas]
-
-    # ==========================================
-    # DISTRIBUCIÓN POR TIPO DE TERCERO (GLOBAL)
-    # ==========================================
-    distribucion_tipo = RegistroEncuesta.objects.values('tipo_tercero').annotate(
-        total=Count('id')
-    ).order_by('-total')
-
-    tipo_labels = [d['tipo_tercero'] or 'Sin especificar' for d in distribucion_tipo]
-    tipo_data = [d['total'] for d in distribucion_tipo]
-
-    # ==========================================
-    # DISTRIBUCIÓN POR ALIADO
-    # ==========================================
-    distribucion_aliado = EmpresaCliente.objects.filter(activo=True).values('aliado').annotate(
-        total=Count('id')
-    )
+    contexto = instantaneas.metricas_globales()
+    if contexto is None:
+        # Primera visita sin instantánea: se calcula aparte y la página se recarga sola
+        instantaneas.generar_en_segundo_plano()
+        return render(request, 'dashboard/metricas_globales_pendiente.html')
+    return render(request, 'dashboard/metricas_globales.html', contexto)
 
-    aliado_labels = []
-    aliado_data = []
-    for d in distribucion_aliado:
-        if d['aliado'] == 'GFR':
-            aliado_labels.append('Gestión Financiera de Riesgos')
-        elif d['aliado'] == 'LEGAL_SHIELD':
-            aliado_labels.append('Legal Shield')
-        else:
-            aliado_labels.append(d['aliado'])
-        aliado_data.append(d['total'])
-
-    # ==========================================
-    # TENDENCIA MENSUAL (ÚLTIMOS 12 MESES)
-    # ==========================================
-    hace_12_meses = hoy - relativedelta(months=12)
-
-    tendencia_mensual = RegistroEncuesta.objects.filter(
-        fecha_registro__gte=hace_12_meses
-    ).annotate(
-        mes=TruncMonth('fecha_registro')
-    ).values('mes').annotate(
-        total=Count('id')
-    ).order_by('mes')
-
-    # Crear lista completa de 12 meses (incluyendo meses sin datos)
-    meses_nombres = ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun', 'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
-    tendencia_labels = []
-    tendencia_data = []
-
-    # Crear diccionario con datos existentes
-    datos_por_mes = {d['mes'].strftime('%Y-%m'): d['total'] for d in tendencia_mensual}
-
-    # Iterar últimos 12 meses
-    for i in range(11, -1, -1):
-        fecha_mes = hoy - relativedelta(months=i)
-        clave = fecha_mes.strftime('%Y-%m')
-        tendencia_labels.append(f"{meses_nombres[fecha_mes.month - 1]} {fecha_mes.year}")
-        tendencia_data.append(datos_por_mes.get(clave, 0))
-
-    # ==========================================
-    # CONOCIMIENTO SAGRILAFT (GLOBAL)
-    # ==========================================
-    empresas_sagrilaft = EmpresaCliente.objects.filter(activo=True, tiene_sagrilaft=True)
-    registros_sagrilaft = RegistroEncuesta.objects.filter(empresa__in=empresas_sagrilaft)
-    total_sagrilaft = registros_sagrilaft.count()
-
-    if total_sagrilaft > 0:
-        conocen_sagrilaft = registros_sagrilaft.filter(respuestas_data__p5_sagrilaft_conoce='SI').count()
-        no_conocen_sagrilaft = total_sagrilaft - conocen_sagrilaft
-        pct_conoce_sagrilaft = round((conocen_sagrilaft / total_sagrilaft) * 100, 1)
-    else:
-        conocen_sagrilaft = 0
-        no_conocen_sagrilaft = 0
-        pct_conoce_sagrilaft = 0
-
-    # ==========================================
-    # CONOCIMIENTO PTEE (GLOBAL)
-    # ==========================================
-    empresas_ptee = EmpresaCliente.objects.filter(activo=True, tiene_ptee=True)
-    registros_ptee = RegistroEncuesta.objects.filter(empresa__in=empresas_ptee)
-    total_ptee = registros_ptee.count()
-
-    if total_ptee > 0:
-        conocen_ptee = registros_ptee.filter(respuestas_data__p9_ptee_conoce='SI').count()
-        no_conocen_ptee = total_ptee - conocen_ptee
-        pct_conoce_ptee = round((conocen_ptee / total_ptee) * 100, 1)
-    else:
-        conocen_ptee = 0
-        no_conocen_ptee = 0
-        pct_conoce_ptee = 0
-
-    # ==========================================
-    # CONOCIMIENTO SARLAFT (GLOBAL)
-    # ==========================================
-    empresas_sarlaft = EmpresaCliente.objects.filter(activo=True, tiene_sarlaft=True)
-    registros_sarlaft = RegistroEncuesta.objects.filter(empresa__in=empresas_sarlaft)
-    total_sarlaft = registros_sarlaft.count()
-
-    if total_sarlaft > 0:
-        conocen_sarlaft = registros_sarlaft.filter(respuestas_data__p5_sarlaft_conoce='SI').count()
-        pct_conoce_sarlaft = round((conocen_sarlaft / total_sarlaft) * 100, 1)
-    else:
-        conocen_sarlaft = 0
-        pct_conoce_sarlaft = 0
-
-    # ==========================================
-    # EMPRESAS SIN ACTIVIDAD (últimos 30 días)
-    # ==========================================
-    hace_30_dias = hoy - relativedelta(days=30)
-    empresas_activas_reciente = RegistroEncuesta.objects.filter(
-        fecha_registro__gte=hace_30_dias
-    ).values_list('empresa_id', flat=True).distinct()
-
-    empresas_sin_actividad = EmpresaCliente.objects.filter(
-        activo=True
-    ).exclude(
-        id__in=empresas_activas_reciente
-    ).annotate(
-        total_respuestas=Count('registros')
-    ).order_by('-total_respuestas')[:10]
-
-    # ==========================================
-    # ACTIVIDAD RECIENTE
-    # ==========================================
-    ultimas_respuestas = RegistroEncuesta.objects.select_related('empresa').order_by('-fecha_registro')[:15]
-
-    # ==========================================
-    # LISTADO COMPLETO DE EMPRESAS
-    # ==========================================
-    from django.db.models import Max
-    todas_empresas = EmpresaCliente.objects.filter(activo=True).annotate(
-        total_respuestas=Count('registros'),
-        ultima_respuesta=Max('registros__fecha_registro')
-    ).order_by('-total_respuestas', 'nombre')
-
-    return render(request, 'dashboard/metricas_globales.html', {
-        # KPIs
-        'total_empresas': total_empresas,
-        'total_respuestas': total_respuestas,
-        'respuestas_mes_actual': respuestas_mes_actual,
-        'respuestas_mes_anterior': respuestas_mes_anterior,
-        'variacion_mensual': variacion_mensual,
-        'respuestas_anio': respuestas_anio,
-        'promedio_por_empresa': promedio_por_empresa,
-
-        # Top empresas
-        'top_empresas': top_empresas,
-        'top_empresas_labels': top_empresas_labels,
-        'top_empresas_data': top_empresas_data,
-
-        # Distribución tipo tercero
-        'tipo_labels': tipo_labels,
-        'tipo_data': tipo_data,
-
-        # Distribución aliado
-        'aliado_labels': aliado_labels,
-        'aliado_data': aliado_data,
-
-        # Tendencia mensual
-        'tendencia_labels': tendencia_labels,
-        'tendencia_data': tendencia_data,
-
-        # Conocimiento SAGRILAFT
-        'total_sagrilaft': total_sagrilaft,
-        'conocen_sagrilaft': conocen_sagrilaft,
-        'no_conocen_sagrilaft': no_conocen_sagrilaft,
-        'pct_conoce_sagrilaft': pct_conoce_sagrilaft,
-
-        # Conocimiento PTEE
-        'total_ptee': total_ptee,
-        'conocen_ptee': conocen_ptee,
-        'no_conocen_ptee': no_conocen_ptee,
-        'pct_conoce_ptee': pct_conoce_ptee,
-
-        # Conocimiento SARLAFT
-        'total_sarlaft': total_sarlaft,
-        'conocen_sarlaft': conocen_sarlaft,
-        'pct_conoce_sarlaft': pct_conoce_sarlaft,
-
-        # Empresas sin actividad
-        'empresas_sin_actividad': empresas_sin_actividad,
-
-        # Actividad reciente
-        'ultimas_respuestas': ultimas_respuestas,
-
-        # Listado completo de empresas
-        'todas_empresas': todas_empresas,
-
-        # Fecha actual
-        'fecha_reporte': hoy,
-    })
+
+@login_required
+@require_POST
+def actualizar_metricas_globales(request):
+    """Recalcula la instantánea de métricas globales a pedido."""
+    instantanea = instantaneas.generar_metricas_globales()
+    messages.success(request, f'Métricas globales actualizadas ({instantanea.duracion_ms} ms).')
+    return redirect('metricas_globales')
 
 # 2. SECCIÓN EMPRESAS Y CLIENTES 
 @login_required
@@ -278,8 +74,12 @@ def lista_empresas(request):
 
     # 3. Aplicar Filtros
     if query:
-        # Busca por nombre O por slug (insensible a mayúsculas)
-        empresas = empresas.filter(Q(nombre__icontains=query) | Q(slug__icontains=query))
+        # Busca por nombre (sin tildes, tolerante a errores) O por slug; lo más parecido primero
+        empresas = empresas.filter(
+            busqueda.coincide('nombre', query) | Q(slug__icontains=query)
+        ).annotate(
+            relevancia=TrigramWordSimilarity(busqueda.SinTildes(Value(query)), busqueda.SinTildes('nombre'))
+        ).order_by('-relevancia', '-created_at')
     
     if filtro_aliado:
         empresas = empresas.filter(aliado=filtro_aliado)
@@ -335,37 +135,25 @@ def ver_metricas(request, id):
     # Configuración personalizada de encuesta (si existe)
     config = empresa.config_encuesta or {}
     tipos_tercero_config = config.get('tipos_tercero', [])
-    preguntas_seccion1 = config.get('preguntas_seccion1', [])
-
-    # Crear mapeo de value -> label para tipos de tercero personalizados
-    tipos_tercero_map = {t['value']: t['label'] for t in tipos_tercero_config} if tipos_tercero_config else {
-        'CLIENTE': 'Cliente',
-        'PROVEEDOR': 'Proveedor',
-        'EMPLEADO': 'Empleado',
-        'OTRO': 'Otro'
-    }
 
     # 1. GESTIÓN DE AÑOS (VIGENCIAS)
-    # Extraemos los años disponibles en los registros para llenar el selector
-    anios_disponibles = empresa.registros.annotate(anio=ExtractYear('fecha_registro')).values_list('anio', flat=True).distinct().order_by('-anio')
+    # El índice de vigencias (un registro por año con envíos, archivados incluidos) llena el selector
+    vigencias = {v.anio: v for v in empresa.vigencias.all()}
 
     anio_actual = datetime.date.today().year
 
     # Intentamos obtener el año de la URL, si no, usamos el actual
-    try:
-        anio_seleccionado = int(request.GET.get('vigencia', anio_actual))
-    except ValueError:
-        anio_seleccionado = anio_actual
+    anio_seleccionado = vigencia_solicitada(request)
+    vigencia = vigencias.get(anio_seleccionado)
 
     # Aseguramos que el año actual aparezca en la lista aunque no haya registros aún
-    lista_anios = list(anios_disponibles)
+    lista_anios = sorted(vigencias, reverse=True)
     if anio_actual not in lista_anios:
         lista_anios.insert(0, anio_actual)
 
     # 2. QUERYSET BASE (Filtrado por Año)
-    # Todos los cálculos estadísticos se basan en este conjunto del año seleccionado
+    # Solo alimenta la tabla visual; las estadísticas se leen del resumen diario
     registros_anio = empresa.registros.filter(fecha_registro__year=anio_seleccionado).order_by('-fecha_registro')
-    total = registros_anio.count()
 
     # 3. FILTROS ADICIONALES (Solo para la Tabla Visual)
     # Estos filtros permiten buscar en la tabla sin afectar los gráficos globales del año
@@ -373,104 +161,145 @@ def ver_metricas(request, id):
     f_inicio = request.GET.get('fecha_inicio')
     f_fin = request.GET.get('fecha_fin')
 
-    registros_tabla = registros_anio
-
-    if f_tipo:
-        registros_tabla = registros_tabla.filter(tipo_tercero=f_tipo)
-    if f_inicio:
-        registros_tabla = registros_tabla.filter(fecha_registro__date__gte=f_inicio)
-    if f_fin:
-        registros_tabla = registros_tabla.filter(fecha_registro__date__lte=f_fin)
+    filtros_tabla = {'tipo': f_tipo, 'fecha_inicio': f_inicio, 'fecha_fin': f_fin}
+    registros_tabla = exportacion.filtrar_registros(registros_anio, filtros_tabla)
 
     # Limitamos a 50 para no saturar el DOM, el resto se ve en "Ver Todos"
-    registros_visuales = registros_tabla[:50]
+    # Año sin envíos según el índice: no hay tabla ni conteos que consultar
+    if vigencia is None:
+        registros_visuales = []
+    else:
+        # Las vigencias archivadas ya no están en la tabla, pero se siguen consultando igual
+        archivados_anio = archivo.de_empresa(empresa).de_anio(anio_seleccionado)
+        if archivados_anio:
+            registros_visuales = archivo.combinar(
+                registros_tabla.order_by('-fecha_registro', '-id'), exportacion.filtrar_archivo(archivados_anio, filtros_tabla), 50
+            )
+        else:
+            registros_visuales = list(registros_tabla[:50])
 
     # 4. CÁLCULO DE GRÁFICOS Y KPIs
-
-    # A) Demografía (Distribución por Tipo de Tercero)
-    # NOTA: .order_by() vacío al final es CRÍTICO para limpiar el ordenamiento por fecha
-    # y permitir que el annotate agrupe correctamente.
-    data_distribucion = registros_anio.values('tipo_tercero').annotate(total=Count('id')).order_by()
-
-    # Usar labels personalizados si existen
-    labels_tipos = [tipos_tercero_map.get(item['tipo_tercero'], item['tipo_tercero']) for item in data_distribucion]
-    data_tipos = [item['total'] for item in data_distribucion]
-
-    # B) SAGRILAFT (Si aplica)
-    stats_sagrilaft = {}
-    if empresa.tiene_sagrilaft:
-        # Pregunta 5: Conocimiento del Sistema
-        conocen = registros_anio.filter(respuestas_data__p5_sagrilaft_conoce='SI').count()
-        no_conocen = total - conocen
-        stats_sagrilaft['conocimiento'] = [conocen, no_conocen]
-
-        # Pregunta 8: Canales de Denuncia
-        saben_denunciar = registros_anio.filter(respuestas_data__p8_sagrilaft_denuncia='SI').count()
-        no_saben = total - saben_denunciar
-        stats_sagrilaft['denuncia'] = [saben_denunciar, no_saben]
-
-    # C) SARLAFT (NUEVO - Si aplica)
-    stats_sarlaft = {}
-    if empresa.tiene_sarlaft:
-        # Pregunta 5: Conocimiento del Sistema SARLAFT
-        conocen_sar = registros_anio.filter(respuestas_data__p5_sarlaft_conoce='SI').count()
-        no_conocen_sar = total - conocen_sar
-        stats_sarlaft['conocimiento'] = [conocen_sar, no_conocen_sar]
-
-        # Pregunta 8: Canales de Denuncia SARLAFT
-        saben_denunciar_sar = registros_anio.filter(respuestas_data__p8_sarlaft_denuncia='SI').count()
-        no_saben_sar = total - saben_denunciar_sar
-        stats_sarlaft['denuncia'] = [saben_denunciar_sar, no_saben_sar]
-
-    # D) PTEE (Si aplica)
-    stats_ptee = {}
-    if empresa.tiene_ptee:
-        # Pregunta 9: Conocimiento del PTEE
-        conocen_ptee = registros_anio.filter(respuestas_data__p9_ptee_conoce='SI').count()
-        no_conocen_ptee = total - conocen_ptee
-        stats_ptee['conocimiento'] = [conocen_ptee, no_conocen_ptee]
-
-    # E) Preguntas adicionales de Sección 1 (si hay configuración personalizada)
-    stats_preguntas_adicionales = []
-    if preguntas_seccion1 and total > 0:
-        for pregunta in preguntas_seccion1:
-            nombre = pregunta.get('name', '')
-            texto = pregunta.get('texto', '')
-            si_count = registros_anio.filter(**{f'respuestas_data__{nombre}': 'SI'}).count()
-            no_count = total - si_count
-            stats_preguntas_adicionales.append({
-                'nombre': nombre,
-                'texto': texto,
-                'si': si_count,
-                'no': no_count
-            })
+    # Todos los conteos salen del resumen diario (una sola consulta), no del JSON crudo
+    conteos = resumen.conteos_vigencia(empresa, anio_seleccionado) if vigencia else resumen.conteos_vacios()
+    graficos = datos_graficos(empresa, conteos)
 
     # 5. RENDERIZADO
     return render(request, 'dashboard/metricas.html', {
         'empresa': empresa,
-        'total': total,
+        'total': graficos['total'],
+        'ultima_respuesta': vigencia.ultima if vigencia else None,
         'registros': registros_visuales,
         # Variables de contexto para filtros y años
         'lista_anios': lista_anios,
         'anio_seleccionado': anio_seleccionado,
         'filtros': {'tipo': f_tipo, 'inicio': f_inicio, 'fin': f_fin},
         # Datos para Chart.js
-        'labels_tipos': labels_tipos,
-        'data_tipos': data_tipos,
-        'stats_sagrilaft': stats_sagrilaft,
-        'stats_sarlaft': stats_sarlaft,
-        'stats_ptee': stats_ptee,
+        'labels_tipos': graficos['labels_tipos'],
+        'data_tipos': graficos['data_tipos'],
+        'stats_sagrilaft': graficos['stats_sagrilaft'],
+        'stats_sarlaft': graficos['stats_sarlaft'],
+        'stats_ptee': graficos['stats_ptee'],
         # Configuración personalizada
         'tipos_tercero_config': tipos_tercero_config,
+        'stats_preguntas_adicionales': graficos['stats_preguntas_adicionales'],
+    })
+
+
+def vigencia_solicitada(request):
+    """Año pedido en ?vigencia= (el actual si falta o no es un número)."""
+    try:
+        return int(request.GET.get('vigencia', datetime.date.today().year))
+    except ValueError:
+        return datetime.date.today().year
+
+
+def datos_graficos(empresa, conteos):
+    """KPIs y series de Chart.js de una vigencia, a partir de los conteos del resumen."""
+    total = conteos['total']
+
+    # Crear mapeo de value -> label para tipos de tercero personalizados
+    tipos_tercero_config = (empresa.config_encuesta or {}).get('tipos_tercero', [])
+    tipos_tercero_map = {t['value']: t['label'] for t in tipos_tercero_config} if tipos_tercero_config else {
+        'CLIENTE': 'Cliente',
+        'PROVEEDOR': 'Proveedor',
+        'EMPLEADO': 'Empleado',
+        'OTRO': 'Otro'
+    }
+
+    preguntas = catalogo.catalogo_preguntas(empresa)
+    stats = catalogo.estadisticas_resumen(conteos, preguntas)
+
+    # B) Gráficos de los bloques contratados (SAGRILAFT, SARLAFT, PTEE)
+    graficos = catalogo.graficos_bloques(empresa, stats)
+
+    # C) Preguntas adicionales de Sección 1 (si hay configuración personalizada)
+    stats_preguntas_adicionales = []
+    if total > 0:
+        for pregunta in catalogo.preguntas_adicionales(empresa):
+            si_count = stats[pregunta['name']]['si']
+            stats_preguntas_adicionales.append({
+                'nombre': pregunta['name'],
+                'texto': pregunta['texto'],
+                'si': si_count,
+                'no': total - si_count
+            })
+
+    return {
+        'total': total,
+        # A) Demografía (Distribución por Tipo de Tercero), con labels personalizados si existen
+        'labels_tipos': [tipos_tercero_map.get(tipo, tipo) for tipo in conteos['por_tipo']],
+        'data_tipos': list(conteos['por_tipo'].values()),
+        'stats_sagrilaft': graficos.get('SAGRILAFT', {}),
+        'stats_sarlaft': graficos.get('SARLAFT', {}),
+        'stats_ptee': graficos.get('PTEE', {}),
         'stats_preguntas_adicionales': stats_preguntas_adicionales,
+    }
+
+
+@login_required
+async def metricas_datos(request, id):
+    """
+    Los mismos datos de los gráficos de ver_metricas, en JSON (async): para
+    refrescar los gráficos sin recargar la página durante una campaña.
+    """
+    empresa = await aget_object_or_404(EmpresaCliente, id=id)
+    anio = vigencia_solicitada(request)
+    conteos = await resumen.aconteos_vigencia(empresa, anio)
+    return JsonResponse({'vigencia': anio, **datos_graficos(empresa, conteos)})
+
+
+@login_required
+def buscar_respondientes(request):
+    """
+    Búsqueda global de respondientes en todas las empresas, por nombre o razón
+    social, sin importar tildes ni mayúsculas y ordenada por parecido.
+    """
+    query = request.GET.get('q', '').strip()
+
+    resultados = []
+    if len(query) >= 2:
+        resultados = busqueda.buscar(
+            RegistroEncuesta.objects.select_related('empresa').only(
+                'id', 'nombre_respondiente', 'tipo_tercero', 'fecha_registro', 'area', 'cargo',
+                'empresa__id', 'empresa__nombre', 'empresa__slug',
+            ),
+            'nombre_respondiente', query
+        ).order_by('-relevancia', '-fecha_registro')[:50]
+
+    return render(request, 'dashboard/busqueda.html', {
+        'query': query,
+        'resultados': resultados,
     })
 
 @login_required
 def ver_detalle_respuesta(request, id):
-    registro = get_object_or_404(RegistroEncuesta, id=id)
+    registro = RegistroEncuesta.objects.select_related('empresa').filter(id=id).first() or archivo.buscar(id)
+    if registro is None:
+        raise Http404('No existe el registro.')
     return render(request, 'dashboard/detalle_respuesta.html', {
         'registro': registro,
-        'empresa': registro.empresa
+        'empresa': registro.empresa,
+        'respuestas': catalogo.respuestas_etiquetadas(registro.empresa, registro.respuestas_data),
     })
 
 
@@ -478,31 +307,34 @@ def ver_detalle_respuesta(request, id):
 @login_required
 def ver_todos_registros(request, id):
     empresa = get_object_or_404(EmpresaCliente, id=id)
-    registros = empresa.registros.all().order_by('-fecha_registro')
 
-    # Filtros
+    # Filtros (los mismos que usa la exportación)
     f_tipo = request.GET.get('tipo')
     f_inicio = request.GET.get('fecha_inicio')
     f_fin = request.GET.get('fecha_fin')
     f_nombre = request.GET.get('nombre') # Filtro extra por nombre
 
-    if f_tipo:
-        registros = registros.filter(tipo_tercero=f_tipo)
-    if f_inicio:
-        registros = registros.filter(fecha_registro__date__gte=f_inicio)
-    if f_fin:
-        registros = registros.filter(fecha_registro__date__lte=f_fin)
-    if f_nombre:
-        registros = registros.filter(nombre_respondiente__icontains=f_nombre)
+    registros = exportacion.filtrar_registros(empresa.registros.all(), request.GET)
+    archivados = exportacion.filtrar_archivo(archivo.de_empresa(empresa), request.GET)
 
-    # Paginación: Mostrar 50 por página
-    paginator = Paginator(registros, 50)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Paginación por cursor (50 por página): sin OFFSET ni COUNT(*) en cada página
+    filtros_activos = {'tipo': f_tipo, 'fecha_inicio': f_inicio, 'fecha_fin': f_fin, 'nombre': f_nombre}
+    pagina = paginacion.paginar(registros, request.GET.get('cursor'), filtros_activos, archivados=archivados)
+    stats = paginacion.estadisticas_resultados(empresa, registros, filtros_activos, archivados)
+    total = stats['total']
+
+    # SI / NO de cada pregunta activa en los resultados (la cache puede ser de antes de un cambio de configuración)
+    respuestas = [
+        {'pregunta': pregunta, **stats[pregunta['name']]}
+        for pregunta in catalogo.catalogo_preguntas(empresa) if pregunta['name'] in stats
+    ]
 
     return render(request, 'dashboard/todos_registros.html', {
         'empresa': empresa,
-        'page_obj': page_obj,
+        'page_obj': pagina,
+        'total': total,
+        'respuestas': respuestas,
+        'total_paginas': max(math.ceil(total / paginacion.TAMANO_PAGINA), pagina.numero),
         'filtros': {'tipo': f_tipo, 'inicio': f_inicio, 'fin': f_fin, 'nombre': f_nombre}
     })
 
@@ -510,124 +342,70 @@ def ver_todos_registros(request, id):
 
 @login_required
 def exportar_excel(request, id):
-    # SEGURIDAD: Límite máximo de registros para evitar memory exhaustion
-    MAX_EXPORT_RECORDS = 10000
-
     empresa = get_object_or_404(EmpresaCliente, id=id)
-    registros = empresa.registros.all().order_by('-fecha_registro')
-
-    # Configuración personalizada de encuesta (si existe)
-    config = empresa.config_encuesta or {}
-    campos_seccion1 = config.get('campos_seccion1', [])
-    preguntas_seccion1 = config.get('preguntas_seccion1', [])
 
     # 1. APLICAMOS LOS MISMOS FILTROS (Para exportar lo que se ve)
-    f_tipo = request.GET.get('tipo')
-    f_inicio = request.GET.get('fecha_inicio')
-    f_fin = request.GET.get('fecha_fin')
-    f_nombre = request.GET.get('nombre')
-
-    if f_tipo:
-        registros = registros.filter(tipo_tercero=f_tipo)
-    if f_inicio:
-        registros = registros.filter(fecha_registro__date__gte=f_inicio)
-    if f_fin:
-        registros = registros.filter(fecha_registro__date__lte=f_fin)
-    if f_nombre:
-        registros = registros.filter(nombre_respondiente__icontains=f_nombre)
-
-    # SEGURIDAD: Aplicar límite máximo
-    total_registros = registros.count()
-    registros = registros[:MAX_EXPORT_RECORDS]
-
-    # 2. PREPARAMOS EL ARCHIVO HTTP (Tipo CSV compatible con Excel)
-    response = HttpResponse(content_type='text/csv')
-    nombre_archivo = f"Reporte_{empresa.slug}_{request.GET.get('fecha_inicio', 'inicio')}_a_{request.GET.get('fecha_fin', 'fin')}.csv"
+    registros = exportacion.filtrar_registros(empresa.registros.all(), request.GET).order_by('-fecha_registro')
+    # Las vigencias archivadas se intercalan en orden al generar el archivo
+    archivados = exportacion.filtrar_archivo(archivo.de_empresa(empresa), request.GET)
+
+    formato = request.GET.get('formato', 'csv')
+    if formato not in exportacion.FORMATOS:
+        formato = 'csv'
+
+    # 2. EXPORTACIONES GRANDES: se delegan a un trabajo en segundo plano
+    # para no ocupar un worker web ni chocar con el timeout del proxy.
+    total_filas = registros.count() + archivados.contar()
+    if total_filas > settings.EXPORTACION_MAX_SINCRONA:
+        trabajo = trabajos.encolar(empresa, request.user, formato, request.GET, total_filas)
+        messages.info(
+            request,
+            f'La exportación tiene {total_filas} registros y se está generando en segundo plano. '
+            'Esta página se actualiza sola; podrás descargarla cuando termine.'
+        )
+        return redirect('estado_exportacion', id=trabajo.id)
+
+    # 3. RESPUESTA EN STREAMING (CSV compatible con Excel o XLSX nativo)
+    # Las filas salen de un cursor del lado del servidor con memoria constante.
+
+    response = StreamingHttpResponse(
+        exportacion.generar(formato, empresa, registros, archivados=archivados),
+        content_type=exportacion.FORMATOS[formato]
+    )
+    nombre_archivo = f"Reporte_{empresa.slug}_{request.GET.get('fecha_inicio', 'inicio')}_a_{request.GET.get('fecha_fin', 'fin')}.{formato}"
     response['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
+    return response
 
-    # IMPORTANTE: Esto agrega el BOM para que Excel reconozca tildes y ñ
-    response.write(u'\ufeff'.encode('utf8'))
 
-    # Usamos punto y coma (;) que es el estándar de Excel en español
-    writer = csv.writer(response, delimiter=';')
 
-    # 3. ESCRIBIMOS EL ENCABEZADO
-    headers = [
-        'ID', 'Fecha Registro', 'Tipo Tercero', 'Nombre / Razón Social',
-        'Área', 'Cargo', 'IP Origen'
-    ]
+@login_required
+def estado_exportacion(request, id):
+    trabajo = get_object_or_404(TrabajoExportacion.objects.select_related('empresa'), id=id)
+    return render(request, 'dashboard/estado_exportacion.html', {
+        'trabajo': trabajo,
+        'empresa': trabajo.empresa,
+    })
 
-    # Columnas de campos adicionales personalizados (ej: NIT/Cédula)
-    for campo in campos_seccion1:
-        headers.append(campo.get('label', campo.get('name', 'Campo')))
-
-    # Columnas de preguntas adicionales personalizadas
-    for pregunta in preguntas_seccion1:
-        headers.append(pregunta.get('texto', pregunta.get('name', 'Pregunta'))[:50])
-
-    # Agregamos columnas dinámicas según lo contratado
-    if empresa.tiene_sagrilaft:
-        headers.extend([
-            'SAGRILAFT - ¿Conoce Sistema?',
-            'SAGRILAFT - ¿Datos Actualizados?',
-            'SAGRILAFT - ¿Fue Informado?',
-            'SAGRILAFT - ¿Conoce Canales Denuncia?'
-        ])
-
-    if empresa.tiene_ptee:
-        headers.extend([
-            'PTEE - ¿Conoce Programa?',
-            'PTEE - ¿Conoce Código Ética?',
-            'PTEE - ¿Sabe Conflicto Interés?',
-            'PTEE - ¿Conoce Canales Soborno?'
-        ])
-
-    headers.append('Observaciones')
-    writer.writerow(headers)
-
-    # 4. ESCRIBIMOS LAS FILAS
-    for reg in registros:
-        data = reg.respuestas_data  # El JSON
-
-        row = [
-            reg.id,
-            reg.fecha_registro.strftime("%d/%m/%Y %H:%M"),
-            reg.tipo_tercero,
-            reg.nombre_respondiente,
-            reg.area,
-            reg.cargo,
-            reg.ip_origen
-        ]
-
-        # Datos de campos adicionales personalizados
-        for campo in campos_seccion1:
-            row.append(data.get(campo.get('name', ''), '-'))
-
-        # Datos de preguntas adicionales personalizadas
-        for pregunta in preguntas_seccion1:
-            row.append(data.get(pregunta.get('name', ''), '-'))
-
-        if empresa.tiene_sagrilaft:
-            row.extend([
-                data.get('p5_sagrilaft_conoce', '-'),
-                data.get('p6_sagrilaft_actualizado', '-'),
-                data.get('p7_sagrilaft_informado', '-'),
-                data.get('p8_sagrilaft_denuncia', '-')
-            ])
-
-        if empresa.tiene_ptee:
-            row.extend([
-                data.get('p9_ptee_conoce', '-'),
-                data.get('p10_ptee_codigo', '-'),
-                data.get('p11_ptee_conflicto', '-'),
-                data.get('p12_ptee_corrupcion', '-')
-            ])
-
-        row.append(data.get('observaciones', ''))
-
-        writer.writerow(row)
 
-    return response
+@login_required
+async def estado_exportacion_json(request, id):
+    """Estado del trabajo para el polling de la página de estado."""
+    trabajo = await aget_object_or_404(TrabajoExportacion, id=id)
+    return JsonResponse({
+        'estado': trabajo.estado,
+        'progreso': trabajo.progreso,
+        'filas_procesadas': trabajo.filas_procesadas,
+        'total_filas': trabajo.total_filas,
+        'error': trabajo.error,
+        'descarga': reverse('descargar_exportacion', args=[trabajo.id]) if trabajo.estado == TrabajoExportacion.COMPLETADO else None,
+    })
+
+
+@login_required
+def descargar_exportacion(request, id):
+    trabajo = get_object_or_404(TrabajoExportacion, id=id, estado=TrabajoExportacion.COMPLETADO)
+    # En producción la URL es una firma temporal de S3; el archivo no pasa por Django
+    return redirect(trabajo.archivo.url)
 
 
 
@@ -0,0 +1,216 @@
+"""
+Escritor XLSX en streaming.
+
+Genera un libro de una sola hoja escribiendo las partes del ZIP fila por fila:
+el libro nunca está completo en memoria y los bytes se entregan a medida que se
+comprimen. Las celdas se tipan según el valor de Python:
+
+- int / float      -> número
+- datetime / date  -> fecha real de Excel (serial + formato dd/mm/yyyy)
+- str              -> texto en línea (los NIT/cédulas conservan ceros a la izquierda)
+- None             -> celda vacía
+"""
+import datetime
+import functools
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+
+# Filas escritas entre cada entrega de bytes
+FILAS_POR_BLOQUE = 500
+
+# Excel cuenta los días desde el 30/12/1899
+EPOCA_EXCEL = datetime.datetime(1899, 12, 30)
+
+# Caracteres de control que XML 1.0 no admite
+_CARACTERES_INVALIDOS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+# Caracteres que Excel no admite en el nombre de una hoja
+_CARACTERES_HOJA = re.compile(r'[\[\]:*?/\\]')
+
+# Estilos definidos en STYLES: 0 = normal, 1 = fecha y hora, 2 = fecha, 3 = encabezado
+ESTILO_FECHA_HORA = 1
+ESTILO_FECHA = 2
+ESTILO_ENCABEZADO = 3
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{nombre}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="2">'
+    '<numFmt numFmtId="164" formatCode="dd/mm/yyyy hh:mm"/>'
+    '<numFmt numFmtId="165" formatCode="dd/mm/yyyy"/>'
+    '</numFmts>'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="4">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+HOJA_INICIO = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetViews><sheetView workbookViewId="0">'
+    '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+    '</sheetView></sheetViews>'
+    '<sheetData>'
+)
+
+HOJA_FIN = '</sheetData></worksheet>'
+
+
+class _Sumidero:
+    """Destino de escritura del ZIP: acumula bytes hasta que el generador los entrega."""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, data):
+        self.partes.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        data = b''.join(self.partes)
+        self.partes = []
+        return data
+
+
+def _texto(valor):
+    return escape(_CARACTERES_INVALIDOS.sub('', valor))
+
+
+def _serial_excel(valor):
+    if isinstance(valor, datetime.datetime):
+        if timezone.is_aware(valor):
+            valor = timezone.make_naive(valor)
+        delta = valor - EPOCA_EXCEL
+    else:
+        delta = datetime.datetime(valor.year, valor.month, valor.day) - EPOCA_EXCEL
+    return delta.days + delta.seconds / 86400
+
+
+@functools.lru_cache(maxsize=4096)
+def _celda_texto(valor, estilo=''):
+    # Las respuestas se repiten mucho (SI, NO, tipos de tercero): se escapan una sola vez
+    return f'<c t="inlineStr"{estilo}><is><t xml:space="preserve">{_texto(valor)}</t></is></c>'
+
+
+def _celda(valor):
+    if type(valor) is str:
+        return _celda_texto(valor) if valor else '<c/>'
+    if valor is None:
+        return '<c/>'
+    if isinstance(valor, bool):
+        return f'<c t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float)):
+        return f'<c><v>{valor}</v></c>'
+    if isinstance(valor, datetime.datetime):
+        return f'<c s="{ESTILO_FECHA_HORA}"><v>{_serial_excel(valor)}</v></c>'
+    if isinstance(valor, datetime.date):
+        return f'<c s="{ESTILO_FECHA}"><v>{_serial_excel(valor)}</v></c>'
+    return _celda_texto(str(valor))
+
+
+def _fila(valores):
+    return '<row>' + ''.join(map(_celda, valores)) + '</row>'
+
+
+def _fila_encabezado(valores):
+    estilo = f' s="{ESTILO_ENCABEZADO}"'
+    return '<row>' + ''.join(_celda_texto(str(v), estilo) for v in valores) + '</row>'
+
+
+def generar_xlsx(encabezados, filas, nombre_hoja='Registros'):
+    """
+    Genera el archivo .xlsx como una secuencia de bloques de bytes.
+    `filas` puede ser cualquier iterable (por ejemplo, un cursor del lado del servidor).
+    """
+    sumidero = _Sumidero()
+    nombre_hoja = _CARACTERES_HOJA.sub('', nombre_hoja)[:31] or 'Registros'
+
+    with zipfile.ZipFile(sumidero, 'w', compression=zipfile.ZIP_DEFLATED) as libro:
+        libro.writestr('[Content_Types].xml', CONTENT_TYPES)
+        libro.writestr('_rels/.rels', RELS)
+        libro.writestr('xl/workbook.xml', WORKBOOK.format(nombre=_texto(nombre_hoja)))
+        libro.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS)
+        libro.writestr('xl/styles.xml', STYLES)
+
+        # force_zip64: el tamaño de la hoja no se conoce de antemano
+        with libro.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as hoja:
+            hoja.write(HOJA_INICIO.encode('utf8'))
+            hoja.write(_fila_encabezado(encabezados).encode('utf8'))
+            yield sumidero.vaciar()
+
+            pendientes = []
+            for valores in filas:
+                pendientes.append(_fila(valores))
+                if len(pendientes) >= FILAS_POR_BLOQUE:
+                    hoja.write(''.join(pendientes).encode('utf8'))
+                    pendientes = []
+                    data = sumidero.vaciar()
+                    if data:
+                        yield data
+
+            if pendientes:
+                hoja.write(''.join(pendientes).encode('utf8'))
+            hoja.write(HOJA_FIN.encode('utf8'))
+
+    yield sumidero.vaciar()
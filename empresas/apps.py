@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class EmpresasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'empresas'
+
+    def ready(self):
+        # Conecta la señal que genera las versiones reducidas de los logos subidos
+        from . import logos  # noqa: F401
@@ -0,0 +1,108 @@
+"""
+Versiones reducidas de los logos de las empresas.
+
+Las páginas muestran el logo a 32-48 px (listados, métricas) o a 96 px de alto
+(encuesta pública, página de gracias), pero el original subido puede pesar
+varios MB. Al guardar la empresa con un logo nuevo (señal pre_save) se generan,
+para cada variante, un WebP y un PNG de respaldo al doble del tamaño mostrado
+(pantallas de alta densidad), y sus nombres quedan en
+EmpresaCliente.logo_variantes. Las plantillas los sirven con <picture> (ver
+EmpresaCliente.urls_logo).
+
+Los nombres llevan el hash del original y el tamaño: una versión nunca cambia
+de contenido, así que se sube con caché de un año (core/storages.py), y dos
+empresas con el mismo logo comparten archivos. Por eso, al cambiar el logo, las
+versiones anteriores no se borran.
+
+Los logos subidos antes de esto se procesan con
+`python manage.py generar_variantes_logo`.
+"""
+import hashlib
+import io
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+from PIL import Image, ImageOps
+
+from .models import EmpresaCliente
+
+logger = logging.getLogger(__name__)
+
+
+# Variante -> caja máxima (ancho, alto) en px, ya al doble del tamaño mostrado
+VARIANTES = {
+    'mini': (96, 96),
+    'grande': (768, 192),
+}
+
+CALIDAD_WEBP = 85
+
+
+def nombre_variante(digest, caja, formato):
+    return f'{settings.LOGOS_VARIANTES_DIR}/{digest}-{caja[0]}x{caja[1]}.{formato}'
+
+
+def reducir(imagen, caja, formato):
+    """Bytes de la imagen reducida (nunca ampliada) para caber en la caja."""
+    copia = imagen.copy()
+    copia.thumbnail(caja, Image.Resampling.LANCZOS)
+    salida = io.BytesIO()
+    if formato == 'webp':
+        copia.save(salida, 'WEBP', quality=CALIDAD_WEBP, method=6)
+    else:
+        copia.save(salida, 'PNG', optimize=True)
+    return salida.getvalue()
+
+
+def crear_variantes(contenido, storage):
+    """
+    Genera y guarda en el storage las versiones reducidas de un logo (bytes del
+    original). Devuelve el valor de logo_variantes. Las que ya existen (mismo
+    original) no se vuelven a subir.
+    """
+    digest = hashlib.sha256(contenido).hexdigest()[:16]
+    imagen = ImageOps.exif_transpose(Image.open(io.BytesIO(contenido)))
+    # Conserva la transparencia; CMYK, escala de grises, etc. pasan a RGB
+    con_alfa = imagen.mode in ('RGBA', 'LA', 'PA') or (imagen.mode == 'P' and 'transparency' in imagen.info)
+    imagen = imagen.convert('RGBA' if con_alfa else 'RGB')
+
+    variantes = {}
+    for variante, caja in VARIANTES.items():
+        variantes[variante] = {}
+        for formato in ('webp', 'png'):
+            nombre = nombre_variante(digest, caja, formato)
+            if not storage.exists(nombre):
+                nombre = storage.save(nombre, ContentFile(reducir(imagen, caja, formato)))
+            variantes[variante][formato] = nombre
+    return variantes
+
+
+def leer_logo(logo):
+    """Bytes del logo: el ya guardado en el storage o el recién subido."""
+    if logo._committed:
+        with logo.storage.open(logo.name, 'rb') as archivo:
+            return archivo.read()
+    # Sin cerrarlo (un archivo temporal se borraría): falta que el storage lo guarde
+    logo.seek(0)
+    contenido = logo.read()
+    logo.seek(0)
+    return contenido
+
+
+@receiver(pre_save, sender=EmpresaCliente)
+def _generar_variantes(sender, instance, **kwargs):
+    if not instance.logo:
+        instance.logo_variantes = {}
+        return
+    # Solo los logos recién subidos: el archivo aún no está en el storage
+    if instance.logo._committed:
+        return
+    try:
+        instance.logo_variantes = crear_variantes(leer_logo(instance.logo), instance.logo.storage)
+    except Exception:
+        # Sin versiones reducidas las páginas muestran el original: no impide guardar la empresa
+        logger.exception('No se pudieron generar las versiones del logo de %s', instance.slug)
+        instance.logo_variantes = {}
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from empresas import logos
+from empresas.models import EmpresaCliente
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera las versiones reducidas (WebP y PNG) del logo de las empresas que aún no las tienen. '
+        'Con --todas también las que ya tienen, por ejemplo tras cambiar los tamaños en empresas/logos.py.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slug', help='Procesar solo esta empresa')
+        parser.add_argument('--todas', action='store_true', help='Regenerar también las que ya tienen versiones')
+
+    def handle(self, *args, **options):
+        empresas = EmpresaCliente.objects.exclude(logo='').exclude(logo__isnull=True).order_by('id')
+        if options['slug']:
+            empresas = empresas.filter(slug=options['slug'])
+        if not options['todas']:
+            empresas = empresas.filter(logo_variantes={})
+
+        generadas = fallidas = 0
+        for empresa in empresas:
+            try:
+                empresa.logo_variantes = logos.crear_variantes(logos.leer_logo(empresa.logo), empresa.logo.storage)
+            except Exception as exc:
+                fallidas += 1
+                self.stderr.write(f'{empresa.slug}: {exc}')
+                continue
+            # save() y no update(): invalida el esquema en caché y re-publica la encuesta con el logo nuevo
+            empresa.save(update_fields=['logo_variantes'])
+            generadas += 1
+            self.stdout.write(f"{empresa.slug}: {', '.join(sorted(empresa.logo_variantes))}")
+
+        self.stdout.write(self.style.SUCCESS(f'{generadas} logo(s) procesado(s), {fallidas} con error.'))
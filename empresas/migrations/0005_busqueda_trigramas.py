@@ -0,0 +1,34 @@
+# Generated by Django 5.2.9 on 2026-10-18 08:31
+
+import core.busqueda
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension, UnaccentExtension
+from django.db import migrations
+
+
+# unaccent() es STABLE (depende del diccionario configurado) y Postgres no la
+# acepta en un índice; el envoltorio fija el diccionario y se declara IMMUTABLE.
+CREAR_F_UNACCENT = """
+CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+AS $func$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $func$;
+"""
+
+BORRAR_F_UNACCENT = "DROP FUNCTION IF EXISTS f_unaccent(text);"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0004_config_encuesta'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        UnaccentExtension(),
+        migrations.RunSQL(CREAR_F_UNACCENT, BORRAR_F_UNACCENT),
+        migrations.AddIndex(
+            model_name='empresacliente',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(core.busqueda.SinTildes('nombre'), name='gin_trgm_ops'), name='empresa_nombre_trgm'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 08:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0005_busqueda_trigramas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='empresacliente',
+            name='indice_preguntas',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
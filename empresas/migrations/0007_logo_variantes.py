@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 09:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0006_indice_preguntas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='empresacliente',
+            name='logo_variantes',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -1,5 +1,8 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
 
+from core.busqueda import SinTildes
+
 class EmpresaCliente(models.Model):
 
     # Opciones para el selector
@@ -20,6 +23,9 @@ class EmpresaCliente(models.Model):
     
     # Identidad Visual
     logo = models.ImageField(upload_to='logos_empresas/', blank=True, null=True)
+    # Versiones reducidas del logo: {variante: {'webp': nombre, 'png': nombre}}.
+    # Se generan al subirlo (ver empresas/logos.py)
+    logo_variantes = models.JSONField(default=dict, blank=True, editable=False)
     color_primario = models.CharField(max_length=7, default="#000000")
     email_soporte = models.EmailField()
 
@@ -40,5 +46,37 @@ class EmpresaCliente(models.Model):
         help_text="JSON con tipos de tercero, campos y preguntas adicionales"
     )
 
+    # Número de bit de cada pregunta en las máscaras SI/NO de RegistroEncuesta
+    # (posición en la lista). Solo crece: ver formularios/sino.py
+    indice_preguntas = models.JSONField(default=list, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Búsqueda por nombre sin tildes (core.busqueda)
+            GinIndex(OpClass(SinTildes('nombre'), name='gin_trgm_ops'), name='empresa_nombre_trgm'),
+        ]
+
     def __str__(self):
-        return self.nombre
\ No newline at end of file
+        return self.nombre
+
+    def urls_logo(self, variante):
+        """
+        URLs de una versión reducida del logo, para <picture>: {'webp': ..., 'img': ...}.
+        Mientras no tenga versiones reducidas, 'img' es el original y 'webp' queda vacío.
+        """
+        if not self.logo:
+            return {'webp': '', 'img': ''}
+        nombres = (self.logo_variantes or {}).get(variante)
+        if not nombres:
+            return {'webp': '', 'img': self.logo.url}
+        return {'webp': self.logo.storage.url(nombres['webp']), 'img': self.logo.storage.url(nombres['png'])}
+
+    @property
+    def logo_mini(self):
+        """Logo para listados y tablas (hasta 48 px)."""
+        return self.urls_logo('mini')
+
+    @property
+    def logo_grande(self):
+        """Logo de la encuesta pública y la vista previa (96 px de alto)."""
+        return self.urls_logo('grande')
\ No newline at end of file
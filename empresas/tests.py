@@ -1,3 +1,142 @@
-from django.test import TestCase
+import hashlib
+import io
+from importlib.util import find_spec
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image
+
+from formularios.tests import ConMediaTemporal
+from . import logos
+from .models import EmpresaCliente
+
+
+def imagen_png(color=(200, 30, 30, 128), tamano=(400, 200)):
+    salida = io.BytesIO()
+    Image.new('RGBA', tamano, color).save(salida, 'PNG')
+    return salida.getvalue()
+
+
+# Los archivos al disco (temporal) aunque el entorno use S3
+@override_settings(STORAGES={
+    **settings.STORAGES, 'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+})
+class VariantesLogoTests(ConMediaTemporal, TestCase):
+
+    def crear_empresa(self, slug, contenido, archivo='logo.png'):
+        return EmpresaCliente.objects.create(
+            nombre=slug, slug=slug, logo=SimpleUploadedFile(archivo, contenido, content_type='image/png'),
+        )
+
+    def test_genera_webp_y_png_de_cada_variante(self):
+        empresa = self.crear_empresa('acme', imagen_png())
+        self.assertEqual(set(empresa.logo_variantes), set(logos.VARIANTES))
+        for variante, caja in logos.VARIANTES.items():
+            for formato in ('webp', 'png'):
+                with self.subTest(variante=variante, formato=formato):
+                    with default_storage.open(empresa.logo_variantes[variante][formato], 'rb') as archivo:
+                        imagen = Image.open(archivo)
+                        imagen.load()
+                    self.assertEqual(imagen.format, formato.upper())
+                    # El fondo semitransparente se conserva
+                    self.assertEqual(imagen.mode, 'RGBA')
+                    # 400x200 reducido a la caja, sin deformar ni ampliar
+                    escala = min(caja[0] / 400, caja[1] / 200, 1)
+                    self.assertEqual(imagen.size, (round(400 * escala), round(200 * escala)))
+
+    def test_nombres_dependen_solo_del_hash_del_original(self):
+        contenido = imagen_png()
+        primera = self.crear_empresa('acme', contenido, 'acme.png')
+        segunda = self.crear_empresa('otra', contenido, 'otro-nombre.png')
+        self.assertEqual(primera.logo_variantes, segunda.logo_variantes)
+
+        digest = hashlib.sha256(contenido).hexdigest()[:16]
+        self.assertEqual(
+            primera.logo_variantes['mini']['webp'], logos.nombre_variante(digest, logos.VARIANTES['mini'], 'webp'),
+        )
+        distinta = self.crear_empresa('azul', imagen_png(color=(30, 30, 200, 128)))
+        self.assertNotEqual(distinta.logo_variantes['mini']['webp'], primera.logo_variantes['mini']['webp'])
+
+    def test_guardar_sin_cambiar_el_logo_no_regenera(self):
+        empresa = self.crear_empresa('acme', imagen_png())
+        variantes = empresa.logo_variantes
+
+        with mock.patch.object(logos, 'crear_variantes', wraps=logos.crear_variantes) as crear:
+            empresa.nombre = 'Acme S.A.S.'
+            empresa.save()
+            recargada = EmpresaCliente.objects.get(id=empresa.id)
+            recargada.save()
+        crear.assert_not_called()
+        recargada.refresh_from_db()
+        self.assertEqual(recargada.logo_variantes, variantes)
+
+    def test_mismo_original_no_vuelve_a_subir_las_variantes(self):
+        contenido = imagen_png()
+        logos.crear_variantes(contenido, default_storage)
+        with mock.patch.object(logos, 'reducir', wraps=logos.reducir) as reducir:
+            logos.crear_variantes(contenido, default_storage)
+        reducir.assert_not_called()
+
+
+@skipUnless(find_spec('storages'), 'MediaStorage requiere django-storages (solo en producción)')
+@override_settings(
+    S3_PREFIX='pruebas',
+    MEDIA_URL_VENTANA=3600,
+    AWS_STORAGE_BUCKET_NAME='pruebas',
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'compartida': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pruebas-urls'},
+    },
+)
+class MediaStorageTests(SimpleTestCase):
+
+    def setUp(self):
+        # core.storages lee S3_PREFIX al importarse
+        from core import storages
+
+        self.storages = storages
+        caches['compartida'].clear()
+        firmas = iter(range(1, 100))
+        patcher = mock.patch.object(
+            storages.S3Boto3Storage, 'url', autospec=True,
+            side_effect=lambda storage, name, *args, **kwargs: f'https://s3/{name}?firma={next(firmas)}',
+        )
+        self.firmar = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def url(self, storage, instante):
+        with mock.patch.object(self.storages.time, 'time', return_value=instante):
+            return storage.url('logos_empresas/acme.png')
+
+    def test_misma_url_dentro_de_la_ventana(self):
+        storage = self.storages.MediaStorage()
+        inicio = 10 * 3600
+        primera = self.url(storage, inicio + 5)
+        self.assertEqual(self.url(storage, inicio + 3599), primera)
+        # Otro worker (otra instancia) recibe la misma URL desde la cache compartida
+        self.assertEqual(self.url(self.storages.MediaStorage(), inicio + 1800), primera)
+        self.firmar.assert_called_once()
+        # Firmada por dos ventanas: sigue vigente una ventana después de entregarla
+        self.assertEqual(self.firmar.call_args.kwargs['expire'], 2 * 3600)
+
+    def test_url_nueva_en_la_siguiente_ventana(self):
+        storage = self.storages.MediaStorage()
+        inicio = 10 * 3600
+        primera = self.url(storage, inicio + 3599)
+        segunda = self.url(storage, inicio + 3600)
+        self.assertNotEqual(segunda, primera)
+        self.assertEqual(self.url(storage, inicio + 7000), segunda)
+        self.assertEqual(self.firmar.call_count, 2)
+
+    def test_leer_rango_pide_solo_esos_bytes(self):
+        storage = self.storages.MediaStorage()
+        with mock.patch.object(self.storages.MediaStorage, 'bucket', new_callable=mock.PropertyMock) as bucket:
+            objeto = bucket.return_value.Object.return_value
+            objeto.get.return_value = {'Body': io.BytesIO(b'0123456789')}
+            self.assertEqual(storage.leer_rango('archivo_vigencias/acme_2024.jsonl.gz', 100, 10), b'0123456789')
+        bucket.return_value.Object.assert_called_once_with('pruebas/media/archivo_vigencias/acme_2024.jsonl.gz')
+        objeto.get.assert_called_once_with(Range='bytes=100-109')
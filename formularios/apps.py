@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class FormulariosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'formularios'
+
+    def ready(self):
+        # Conecta las señales que invalidan el esquema compilado, re-publican la encuesta
+        # y calculan las máscaras SI/NO de cada registro; crea las particiones anuales al migrar
+        from . import esquema, particiones, publicacion, sino  # noqa: F401
@@ -0,0 +1,363 @@
+"""
+Archivo frío de vigencias cerradas.
+
+`python manage.py archivar_vigencias` saca de RegistroEncuesta los registros
+de un año ya cerrado de una empresa y los guarda en el almacenamiento por
+defecto (MediaStorage en producción) como JSON Lines comprimido: un registro
+por línea, ordenados por (-fecha_registro, -id), en bloques de
+FILAS_POR_BLOQUE filas que son cada uno un miembro gzip independiente. El
+archivo completo se lee con zcat; el índice de bloques (posición, tamaño,
+rango de fechas e ids, conteo por tipo de tercero) vive en ArchivoVigencia y
+permite leer solo los bloques que pide una página o un filtro. En S3 cada
+bloque se pide con un GET con Range (MediaStorage.leer_rango): el open() de
+django-storages descargaría el archivo completo.
+
+El resumen diario no se toca: gráficos, KPIs y totales de la vigencia siguen
+saliendo de ResumenDiario. Las vistas que muestran registros sueltos (tabla de
+métricas, todos los registros, exportación, detalle) combinan la tabla con los
+archivos a través de `Archivados`, así que el archivado no se nota salvo en el
+tiempo de respuesta de los años viejos.
+
+`archivar_vigencias --restaurar` devuelve los registros a la tabla.
+"""
+import datetime
+import gzip
+import heapq
+import json
+import tempfile
+import uuid
+
+from django.core.files import File
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.busqueda import sin_tildes
+from .models import ArchivoVigencia, RegistroEncuesta
+from .spool import CANDADO_VACIADO
+
+
+# Registros por bloque comprimido: lo mínimo que se lee para mostrar una página
+FILAS_POR_BLOQUE = 1000
+
+# Registros que trae cada viaje del cursor al archivar
+CHUNK_SIZE = 2000
+
+CAMPOS = RegistroEncuesta._meta.concrete_fields
+
+
+def clave(registro):
+    """Orden de la tabla de registros: (-fecha_registro, -id) es esta clave descendente."""
+    return registro.fecha_registro, registro.id
+
+
+def _a_json(valor):
+    # Fechas con microsegundos completos (DjangoJSONEncoder los recorta a milisegundos)
+    if isinstance(valor, datetime.datetime):
+        return valor.isoformat()
+    if isinstance(valor, uuid.UUID):
+        return str(valor)
+    raise TypeError(f'{type(valor).__name__} no es serializable')
+
+
+def serializar(registro):
+    datos = {campo.attname: campo.value_from_object(registro) for campo in CAMPOS}
+    return json.dumps(datos, ensure_ascii=False, default=_a_json, separators=(',', ':')).encode('utf8')
+
+
+def deserializar(datos, empresa=None):
+    registro = RegistroEncuesta(**{campo.attname: campo.to_python(datos.get(campo.attname)) for campo in CAMPOS})
+    registro._state.adding = False
+    if empresa is not None:
+        # Evita una consulta por registro al mostrar la empresa
+        registro.empresa = empresa
+    return registro
+
+
+class Archivados:
+    """
+    Registros archivados de una empresa (una o varias vigencias) con los
+    filtros de la tabla de registros. Se recorren en el mismo orden que la
+    tabla y se combinan con ella con `combinar`.
+    """
+
+    def __init__(self, archivos, tipo=None, desde=None, hasta=None, nombre=None):
+        self.archivos = sorted(archivos, key=lambda archivo: archivo.anio, reverse=True)
+        self.tipo = tipo or None
+        # desde incluido, hasta excluido (fechas con zona horaria)
+        self.desde = desde
+        self.hasta = hasta
+        self.nombre = sin_tildes(nombre.strip()) if nombre and nombre.strip() else None
+
+    def __bool__(self):
+        return bool(self.archivos)
+
+    @property
+    def anios(self):
+        return [archivo.anio for archivo in self.archivos]
+
+    def filtrar(self, tipo=None, desde=None, hasta=None, nombre=None):
+        return Archivados(self.archivos, tipo, desde, hasta, nombre)
+
+    def de_anio(self, anio):
+        filtros = {'tipo': self.tipo, 'desde': self.desde, 'hasta': self.hasta}
+        return Archivados([archivo for archivo in self.archivos if archivo.anio == anio], **filtros, nombre=self.nombre)
+
+    def _bloque_posible(self, bloque, ascendente, cursor, tope=None):
+        if self.tipo and self.tipo not in bloque['tipos']:
+            return False
+        primero, ultimo = parse_datetime(bloque['desde']), parse_datetime(bloque['hasta'])
+        if (self.desde and ultimo < self.desde) or (self.hasta and primero >= self.hasta):
+            return False
+        if cursor is not None:
+            # Los bloques guardan su rango de fechas: se salta lo que queda del lado ya visto
+            if (ascendente and ultimo < cursor[0]) or (not ascendente and primero > cursor[0]):
+                return False
+        if tope is not None:
+            if (ascendente and primero > tope[0]) or (not ascendente and ultimo < tope[0]):
+                return False
+        return True
+
+    def _cumple(self, datos, fecha):
+        if self.tipo and datos['tipo_tercero'] != self.tipo:
+            return False
+        if (self.desde and fecha < self.desde) or (self.hasta and fecha >= self.hasta):
+            return False
+        return not self.nombre or self.nombre in sin_tildes(datos['nombre_respondiente'])
+
+    def _filas(self, archivo, bloques):
+        """
+        Diccionarios de los bloques indicados de un archivo, en el orden en que
+        se piden. Solo se leen y descomprimen esos bloques (ver _leer_bloques).
+        """
+        for contenido in _leer_bloques(archivo.archivo.storage, archivo.archivo.name, bloques):
+            yield from (json.loads(linea) for linea in gzip.decompress(contenido).splitlines())
+
+    def iterar(self, ascendente=False, cursor=None, limite=None, tope=None):
+        """
+        Registros que cumplen los filtros, de más reciente a más antiguo (o al
+        revés con `ascendente`). Con `cursor` = (fecha, id), solo los que van
+        después de él en ese orden, como la paginación por cursor; con `tope`,
+        se detiene al pasar esa clave.
+        """
+        if limite is not None and limite <= 0:
+            return
+        entregados = 0
+        for archivo in (self.archivos[::-1] if ascendente else self.archivos):
+            bloques = archivo.indice[::-1] if ascendente else archivo.indice
+            bloques = [bloque for bloque in bloques if self._bloque_posible(bloque, ascendente, cursor, tope)]
+            if not bloques:
+                continue
+            filas = self._filas(archivo, bloques)
+            if ascendente:
+                filas = _invertir_por_bloque(filas, bloques)
+            for datos in filas:
+                fecha = parse_datetime(datos['fecha_registro'])
+                posicion = (fecha, datos['id'])
+                if tope is not None and ((ascendente and posicion > tope) or (not ascendente and posicion < tope)):
+                    filas.close()
+                    return
+                if cursor is not None and ((ascendente and posicion <= cursor) or (not ascendente and posicion >= cursor)):
+                    continue
+                if not self._cumple(datos, fecha):
+                    continue
+                yield deserializar(datos, archivo.empresa)
+                entregados += 1
+                if limite is not None and entregados >= limite:
+                    filas.close()
+                    return
+
+    def contar(self):
+        """Registros que cumplen los filtros; sin filtro por nombre, casi siempre solo con el índice."""
+        total = 0
+        for archivo in self.archivos:
+            for bloque in archivo.indice:
+                if not self._bloque_posible(bloque, False, None):
+                    continue
+                primero, ultimo = parse_datetime(bloque['desde']), parse_datetime(bloque['hasta'])
+                completo = (not self.desde or primero >= self.desde) and (not self.hasta or ultimo < self.hasta)
+                if completo and not self.nombre:
+                    total += bloque['tipos'].get(self.tipo, 0) if self.tipo else bloque['filas']
+                    continue
+                total += sum(
+                    1 for datos in self._filas(archivo, [bloque])
+                    if self._cumple(datos, parse_datetime(datos['fecha_registro']))
+                )
+        return total
+
+
+def _leer_bloques(storage, nombre, bloques):
+    """
+    Bytes comprimidos de cada bloque, en el orden pedido y a medida que se
+    consumen: una página que se llena con el primer bloque no lee los demás.
+    Con un storage que sabe leer rangos (MediaStorage en S3) es un GET por
+    bloque; si no, el archivo local se abre una vez y se salta a cada bloque.
+    """
+    leer_rango = getattr(storage, 'leer_rango', None)
+    if leer_rango is not None:
+        for bloque in bloques:
+            yield leer_rango(nombre, bloque['inicio'], bloque['largo'])
+        return
+    with storage.open(nombre, 'rb') as manejador:
+        for bloque in bloques:
+            manejador.seek(bloque['inicio'])
+            yield manejador.read(bloque['largo'])
+
+
+def _invertir_por_bloque(filas, bloques):
+    """Dentro de cada bloque las filas van de más reciente a más antigua: en orden ascendente se invierten."""
+    for bloque in bloques:
+        yield from [next(filas) for _ in range(bloque['filas'])][::-1]
+    filas.close()
+
+
+def de_empresa(empresa):
+    """Archivos de la empresa (una consulta). Si no tiene, el resultado es falso."""
+    archivos = list(ArchivoVigencia.objects.filter(empresa=empresa))
+    for archivo in archivos:
+        archivo.empresa = empresa
+    return Archivados(archivos)
+
+
+def combinar(registros, archivados, limite, ascendente=False, cursor=None):
+    """
+    Los primeros `limite` registros entre un queryset (ya filtrado, ordenado y
+    con el cursor aplicado) y los archivados con los mismos filtros.
+    """
+    filas = list(registros[:limite])
+    if archivados:
+        # Si la tabla ya llenó la página, del archivo solo sirve lo que quede antes de su última fila
+        tope = clave(filas[-1]) if len(filas) >= limite else None
+        filas += list(archivados.iterar(ascendente=ascendente, cursor=cursor, limite=limite, tope=tope))
+        filas.sort(key=clave, reverse=not ascendente)
+    return filas[:limite]
+
+
+def iterar_combinado(registros, archivados):
+    """Recorre un iterador de registros ordenado por (-fecha_registro, -id) intercalando los archivados."""
+    if not archivados:
+        return registros
+    return heapq.merge(registros, archivados.iterar(), key=clave, reverse=True)
+
+
+def buscar(registro_id):
+    """Un registro archivado por id (para el detalle), o None."""
+    candidatos = ArchivoVigencia.objects.select_related('empresa').filter(
+        id_min__lte=registro_id, id_max__gte=registro_id
+    )
+    for archivo in candidatos:
+        bloques = [b for b in archivo.indice if b['id_min'] <= registro_id <= b['id_max']]
+        for datos in Archivados([archivo])._filas(archivo, bloques):
+            if datos['id'] == registro_id:
+                return deserializar(datos, archivo.empresa)
+    return None
+
+
+def _escribir(registros, destino):
+    """Escribe los registros en bloques gzip y devuelve (índice, total)."""
+    indice = []
+    lote = []
+
+    def cerrar_bloque():
+        comprimido = gzip.compress(b'\n'.join(serializar(r) for r in lote) + b'\n', mtime=0)
+        tipos = {}
+        for registro in lote:
+            tipos[registro.tipo_tercero] = tipos.get(registro.tipo_tercero, 0) + 1
+        indice.append({
+            'inicio': destino.tell(),
+            'largo': len(comprimido),
+            'filas': len(lote),
+            # Orden descendente: el primero es el más reciente
+            'desde': lote[-1].fecha_registro.isoformat(),
+            'hasta': lote[0].fecha_registro.isoformat(),
+            'id_min': min(r.id for r in lote),
+            'id_max': max(r.id for r in lote),
+            'tipos': tipos,
+        })
+        destino.write(comprimido)
+        lote.clear()
+
+    total = 0
+    for registro in registros:
+        lote.append(registro)
+        total += 1
+        if len(lote) >= FILAS_POR_BLOQUE:
+            cerrar_bloque()
+    if lote:
+        cerrar_bloque()
+    return indice, total
+
+
+def archivar(empresa, anio):
+    """
+    Pasa los registros de `anio` de la empresa a un archivo comprimido y los
+    borra de la tabla. Si la vigencia ya estaba archivada (llegaron envíos
+    atrasados del spool), reescribe el archivo con los nuevos incluidos.
+    Devuelve el ArchivoVigencia, o None si no había nada que archivar.
+    """
+    if anio >= timezone.localdate().year:
+        raise ValueError(f'La vigencia {anio} sigue abierta: solo se archivan años anteriores al actual.')
+
+    with transaction.atomic():
+        # Ningún vaciado del spool inserta registros mientras se copian y se borran
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [CANDADO_VACIADO])
+
+        anterior = ArchivoVigencia.objects.select_for_update().filter(empresa=empresa, anio=anio).first()
+        en_tabla = empresa.registros.filter(fecha_registro__year=anio)
+        if not en_tabla.exists():
+            return anterior
+
+        registros = en_tabla.order_by('-fecha_registro', '-id').iterator(chunk_size=CHUNK_SIZE)
+        if anterior is not None:
+            anterior.empresa = empresa
+            registros = iterar_combinado(registros, Archivados([anterior]))
+
+        archivo = anterior or ArchivoVigencia(empresa=empresa, anio=anio)
+        nombre_anterior = anterior.archivo.name if anterior else None
+        total_anterior = anterior.total if anterior else 0
+        with tempfile.TemporaryFile() as temporal:
+            archivo.indice, archivo.total = _escribir(registros, temporal)
+            temporal.seek(0)
+            archivo.archivo.save(f'{empresa.slug}_{anio}.jsonl.gz', File(temporal), save=False)
+
+        guardado = archivo.archivo
+        try:
+            archivo.id_min = min(bloque['id_min'] for bloque in archivo.indice)
+            archivo.id_max = max(bloque['id_max'] for bloque in archivo.indice)
+            archivo.save()
+            # Sin descontar del resumen: los registros archivados siguen contando
+            borrados, _ = en_tabla.delete(descontar=False)
+            if borrados != archivo.total - total_anterior:
+                raise RuntimeError(f'Se archivaron {archivo.total} registros pero se borraron {borrados}.')
+        except Exception:
+            guardado.storage.delete(guardado.name)
+            raise
+
+    if nombre_anterior:
+        guardado.storage.delete(nombre_anterior)
+    return archivo
+
+
+def restaurar(archivo, tamano=CHUNK_SIZE):
+    """Devuelve a la tabla los registros de un archivo y lo elimina. Devuelve cuántos restauró."""
+    with transaction.atomic():
+        lote = []
+        restaurados = 0
+        for registro in Archivados([archivo]).iterar():
+            # Conservan id, fecha, spool_id y máscaras SI/NO: bulk_create sin recalcular nada
+            registro._state.adding = True
+            lote.append(registro)
+            if len(lote) >= tamano:
+                RegistroEncuesta.objects.bulk_create(lote)
+                restaurados += len(lote)
+                lote = []
+        if lote:
+            RegistroEncuesta.objects.bulk_create(lote)
+            restaurados += len(lote)
+
+        nombre = archivo.archivo.name
+        storage = archivo.archivo.storage
+        archivo.delete()
+    storage.delete(nombre)
+    return restaurados
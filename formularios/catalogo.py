@@ -0,0 +1,211 @@
+"""
+Catálogo de preguntas de la encuesta.
+
+Reúne en un solo lugar las preguntas fijas de cada bloque (SAGRILAFT, SARLAFT,
+PTEE) y las adicionales de `config_encuesta`, para que el tablero, la
+exportación y el detalle de respuesta usen las mismas claves y etiquetas.
+"""
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+# Bloques fijos en el orden en que aparecen en la encuesta.
+# 'campo' es el booleano de EmpresaCliente que activa el bloque y 'graficos'
+# indica qué pregunta alimenta cada gráfico del tablero.
+BLOQUES = [
+    {
+        'campo': 'tiene_sagrilaft',
+        'bloque': 'SAGRILAFT',
+        'preguntas': [
+            ('p5_sagrilaft_conoce', '¿Conoce Sistema?'),
+            ('p6_sagrilaft_actualizado', '¿Datos Actualizados?'),
+            ('p7_sagrilaft_informado', '¿Fue Informado?'),
+            ('p8_sagrilaft_denuncia', '¿Conoce Canales Denuncia?'),
+        ],
+        'graficos': {'conocimiento': 'p5_sagrilaft_conoce', 'denuncia': 'p8_sagrilaft_denuncia'},
+    },
+    {
+        'campo': 'tiene_sarlaft',
+        'bloque': 'SARLAFT',
+        'preguntas': [
+            ('p5_sarlaft_conoce', '¿Conoce Sistema?'),
+            ('p6_sarlaft_actualizado', '¿Datos Actualizados?'),
+            ('p7_sarlaft_informado', '¿Fue Informado?'),
+            ('p8_sarlaft_denuncia', '¿Conoce Canales Denuncia?'),
+        ],
+        'graficos': {'conocimiento': 'p5_sarlaft_conoce', 'denuncia': 'p8_sarlaft_denuncia'},
+    },
+    {
+        'campo': 'tiene_ptee',
+        'bloque': 'PTEE',
+        'preguntas': [
+            ('p9_ptee_conoce', '¿Conoce Programa?'),
+            ('p10_ptee_codigo', '¿Conoce Código Ética?'),
+            ('p11_ptee_conflicto', '¿Sabe Conflicto Interés?'),
+            ('p12_ptee_corrupcion', '¿Conoce Canales Soborno?'),
+        ],
+        'graficos': {'conocimiento': 'p9_ptee_conoce'},
+    },
+]
+
+PREGUNTAS_FIJAS = [nombre for bloque in BLOQUES for nombre, _ in bloque['preguntas']]
+
+
+def preguntas_adicionales(empresa):
+    """Preguntas SI/NO definidas en config_encuesta['preguntas_seccion1']."""
+    config = empresa.config_encuesta or {}
+    return [
+        {
+            'name': p['name'],
+            'texto': p.get('texto', p['name']),
+            'bloque': 'ADICIONAL',
+            'etiqueta': p.get('texto', p['name'])[:50],
+        }
+        for p in config.get('preguntas_seccion1', []) if p.get('name')
+    ]
+
+
+def catalogo_preguntas(empresa, solo_activas=True):
+    """
+    Lista ordenada de preguntas de una empresa: primero las adicionales de la
+    sección 1 y luego las de cada bloque. Con solo_activas=False incluye los
+    bloques no contratados (útil para el resumen, que no depende de la configuración).
+    """
+    preguntas = preguntas_adicionales(empresa)
+    for bloque in BLOQUES:
+        if solo_activas and not getattr(empresa, bloque['campo']):
+            continue
+        for nombre, texto in bloque['preguntas']:
+            preguntas.append({
+                'name': nombre,
+                'texto': texto,
+                'bloque': bloque['bloque'],
+                'etiqueta': f"{bloque['bloque']} - {texto}",
+            })
+    return preguntas
+
+
+def graficos_bloques(empresa, stats):
+    """
+    Datos [sí, no] de los gráficos de cada bloque activo, por nombre de bloque:
+    {'SAGRILAFT': {'conocimiento': [si, no], 'denuncia': [si, no]}, ...}
+    Como en el tablero original, "no" agrupa todo lo que no es SI.
+    """
+    total = stats['total']
+    graficos = {}
+    for bloque in BLOQUES:
+        if not getattr(empresa, bloque['campo']):
+            continue
+        graficos[bloque['bloque']] = {
+            nombre: [stats[pregunta]['si'], total - stats[pregunta]['si']]
+            for nombre, pregunta in bloque['graficos'].items()
+        }
+    return graficos
+
+
+def respondio(clave, valor):
+    """
+    Filtro "respuestas_data contiene {clave: valor}". Se expresa como contención
+    (@>) para que Postgres pueda usar el índice GIN jsonb_path_ops.
+    """
+    return Q(respuestas_data__contains={clave: valor})
+
+
+def bit(campo, numero):
+    """Expresión 0/1: el bit `numero` de la máscara `campo` (ver formularios/sino.py)."""
+    return F(campo).bitrightshift(numero).bitand(1)
+
+
+def agregados_estadisticas(preguntas, indice=None):
+    """
+    Agregados SI / NO / sin respuesta de cada pregunta, para .aggregate() o .annotate().
+
+    Con `indice` ({pregunta: bit}, formularios.sino.indice) las preguntas que
+    tienen bit se cuentan sumando bits de las máscaras, sin leer el JSON; las
+    demás se cuentan sobre respuestas_data.
+    """
+    indice = indice or {}
+    agregados = {'total': Count('id')}
+    for i, pregunta in enumerate(preguntas):
+        clave = pregunta['name']
+        numero = indice.get(clave)
+        if numero is None:
+            agregados[f'si_{i}'] = Count('id', filter=respondio(clave, 'SI'))
+            agregados[f'no_{i}'] = Count('id', filter=respondio(clave, 'NO'))
+            agregados[f'nr_{i}'] = Count('id', filter=~Q(respuestas_data__has_key=clave))
+        else:
+            agregados[f'si_{i}'] = Coalesce(Sum(bit('respuestas_si', numero)), 0)
+            agregados[f'no_{i}'] = Coalesce(Sum(bit('respuestas_no', numero)), 0)
+            agregados[f'nr_{i}'] = Count('id') - Coalesce(Sum(bit('respuestas_contestadas', numero)), 0)
+    return agregados
+
+
+def estadisticas_registros(registros, preguntas, indice=None):
+    """
+    Conteos SI / NO / sin respuesta de todas las preguntas en una sola consulta
+    de agregación condicional sobre el queryset de registros (ver agregados_estadisticas).
+    """
+    agregados = agregados_estadisticas(preguntas, indice)
+    fila = registros.order_by().aggregate(**agregados)
+
+    stats = {'total': fila['total']}
+    for i, pregunta in enumerate(preguntas):
+        stats[pregunta['name']] = {
+            'si': fila[f'si_{i}'],
+            'no': fila[f'no_{i}'],
+            'sin_respuesta': fila[f'nr_{i}'],
+        }
+    return stats
+
+
+def estadisticas_resumen(conteos, preguntas):
+    """
+    Mismo formato que estadisticas_registros, pero a partir de los conteos del
+    resumen diario (formularios.resumen.conteos_vigencia).
+    """
+    total = conteos['total']
+    stats = {'total': total}
+    for pregunta in preguntas:
+        valores = conteos['respuestas'].get(pregunta['name'], {})
+        stats[pregunta['name']] = {
+            'si': valores.get('SI', 0),
+            'no': valores.get('NO', 0),
+            'sin_respuesta': total - sum(valores.values()),
+        }
+    return stats
+
+
+def sumar_estadisticas(stats, registros, preguntas):
+    """
+    Suma a `stats` (formato de estadisticas_registros) registros ya cargados
+    en memoria, como los de una vigencia archivada.
+    """
+    for reg in registros:
+        data = reg.respuestas_data or {}
+        stats['total'] += 1
+        for pregunta in preguntas:
+            clave = pregunta['name']
+            if clave not in data:
+                stats[clave]['sin_respuesta'] += 1
+            elif data[clave] == 'SI':
+                stats[clave]['si'] += 1
+            elif data[clave] == 'NO':
+                stats[clave]['no'] += 1
+    return stats
+
+
+def respuestas_etiquetadas(empresa, respuestas_data):
+    """
+    Respuestas de un registro como lista de (etiqueta, valor): primero los campos
+    y preguntas conocidas en orden del catálogo, luego cualquier otra clave.
+    """
+    config = empresa.config_encuesta or {}
+    etiquetas = {c['name']: c.get('label', c['name']) for c in config.get('campos_seccion1', []) if c.get('name')}
+    for pregunta in catalogo_preguntas(empresa, solo_activas=False):
+        etiquetas[pregunta['name']] = pregunta['texto'] if pregunta['bloque'] == 'ADICIONAL' else pregunta['etiqueta']
+    etiquetas['observaciones'] = 'Observaciones'
+
+    data = {k: v for k, v in (respuestas_data or {}).items() if k != 'csrfmiddlewaretoken'}
+    resultado = [(etiqueta, data.pop(clave)) for clave, etiqueta in etiquetas.items() if clave in data]
+    resultado.extend(data.items())
+    return resultado
@@ -0,0 +1,245 @@
+"""
+Esquema compilado de la encuesta pública.
+
+Para cada empresa se arma una sola vez todo lo que la encuesta necesita
+(secciones numeradas, tipos de tercero, campos, preguntas, claves permitidas y
+longitudes máximas) y se reutiliza en cada visita.
+En plena campaña, el GET de la encuesta no toca la base de datos.
+
+La cache compartida entre procesos guarda solo los valores de CAMPOS_EMPRESA
+(tipos simples, sin pickles de modelos); cada proceso rearma con ellos la
+empresa y compila el esquema, lo que no hace consultas.
+
+Invalidación: guardar o borrar cualquier EmpresaCliente (EmpresaForm, admin,
+scripts de aprovisionamiento) cambia un sello de versión en la cache compartida
+entre procesos; cada proceso compara su sello con ese y descarta lo compilado
+si cambió. Los cambios hechos con QuerySet.update() no disparan señales: después
+de uno de esos hay que llamar a `invalidar()`.
+"""
+import time
+
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.urls import reverse
+
+from empresas.models import EmpresaCliente
+from . import catalogo
+from .models import RegistroEncuesta, ResumenDiario
+
+
+# Tipos de tercero por defecto (para empresas sin configuración personalizada)
+TIPOS_TERCERO_DEFAULT = [
+    {'value': 'CLIENTE', 'label': 'Cliente'},
+    {'value': 'PROVEEDOR', 'label': 'Proveedor'},
+    {'value': 'EMPLEADO', 'label': 'Empleado'},
+    {'value': 'OTRO', 'label': 'Otro'},
+]
+
+# Longitud máxima (ya escapado) de lo que se guarda en respuestas_data
+LONGITUD_CAMPO = 255            # campos de texto de la sección 1 (sin 'maxlength' en la config)
+LONGITUD_OBSERVACIONES = 5000   # texto libre
+LONGITUD_OPCION = ResumenDiario._meta.get_field('valor').max_length  # SI / NO / NO_RECUERDO...
+
+CLAVE_VERSION = 'esquema_encuesta:version'
+
+# Campos de EmpresaCliente que usan la encuesta, la página de gracias, el logo y
+# guardar_envio (resumen e índice SI/NO)
+CAMPOS_EMPRESA = (
+    'id', 'nombre', 'slug', 'aliado', 'logo', 'logo_variantes', 'color_primario', 'email_soporte',
+    'tiene_sagrilaft', 'tiene_sarlaft', 'tiene_ptee', 'activo', 'config_encuesta', 'indice_preguntas',
+)
+
+# Subirlo cuando cambie CAMPOS_EMPRESA: lo ya guardado en la cache compartida
+# con el formato anterior deja de usarse
+FORMATO = 5
+
+# Los esquemas de versiones viejas quedan huérfanos en la cache compartida; expiran solos
+TTL_ESQUEMA = 24 * 60 * 60
+
+# Esquemas compilados en este proceso: slug -> EsquemaEncuesta
+_esquemas = {}
+
+
+class EsquemaEncuesta:
+    """Todo lo que la encuesta pública de una empresa necesita, precalculado."""
+
+    def __init__(self, empresa, version):
+        self.empresa = empresa
+        self.version = version
+
+        config = empresa.config_encuesta or {}
+        self.tipos_tercero = config.get('tipos_tercero', TIPOS_TERCERO_DEFAULT)
+        self.campos_seccion1 = config.get('campos_seccion1', [])
+        self.preguntas_seccion1 = config.get('preguntas_seccion1', [])
+        self.preguntas = catalogo.catalogo_preguntas(empresa)
+        self.secciones = self._numerar_secciones(empresa)
+
+        # Claves de respuestas_data que el formulario puede enviar
+        self.claves_permitidas = frozenset(
+            [campo['name'] for campo in self.campos_seccion1 if campo.get('name')]
+            + [pregunta['name'] for pregunta in self.preguntas]
+            + ['observaciones']
+        )
+        # Valores de tipo_tercero que la encuesta ofrece (el envío se rechaza con cualquier otro)
+        self.tipos_validos = frozenset(tipo['value'] for tipo in self.tipos_tercero)
+
+        # Longitud máxima de cada clave de respuestas_data y de cada columna del registro
+        self.longitudes = {campo['name']: campo.get('maxlength', LONGITUD_CAMPO)
+                           for campo in self.campos_seccion1 if campo.get('name')}
+        self.longitudes.update({pregunta['name']: LONGITUD_OPCION for pregunta in self.preguntas})
+        self.longitudes['observaciones'] = LONGITUD_OBSERVACIONES
+        self.longitudes_registro = {
+            campo: RegistroEncuesta._meta.get_field(campo).max_length
+            for campo in ('tipo_tercero', 'nombre_respondiente', 'area', 'cargo')
+        }
+
+    @staticmethod
+    def _numerar_secciones(empresa):
+        # Información General siempre es 1; los bloques contratados siguen en orden
+        seccion_num = 1
+        secciones = {'info_general': seccion_num}
+
+        if empresa.tiene_sagrilaft:
+            seccion_num += 1
+            secciones['sagrilaft'] = seccion_num
+
+        if empresa.tiene_sarlaft:
+            seccion_num += 1
+            secciones['sarlaft'] = seccion_num
+
+        if empresa.tiene_ptee:
+            seccion_num += 1
+            secciones['ptee'] = seccion_num
+
+        seccion_num += 1
+        secciones['observaciones'] = seccion_num
+        return secciones
+
+    @property
+    def activa(self):
+        return self.empresa.activo
+
+    def logo_urls(self, publicado=False):
+        """URLs del logo para <picture>: {'webp': ..., 'img': ...} (ver EmpresaCliente.urls_logo)."""
+        if not self.empresa.logo:
+            return {'webp': '', 'img': ''}
+        # La URL firmada del storage vence; la página publicada usa una redirección estable
+        if publicado:
+            url = reverse('logo_encuesta', args=[self.empresa.slug])
+            return {'webp': f'{url}?formato=webp' if self.empresa.logo_variantes else '', 'img': url}
+        return self.empresa.logo_grande
+
+    def contexto(self, publicado=False):
+        """Contexto de la plantilla encuesta_publica.html."""
+        logo = self.logo_urls(publicado)
+        return {
+            'empresa': self.empresa,
+            'logo_url': logo['img'],
+            'logo_webp': logo['webp'],
+            'publicado': publicado,
+            'secciones': self.secciones,
+            'tipos_tercero': self.tipos_tercero,
+            'campos_seccion1': self.campos_seccion1,
+            'preguntas_seccion1': self.preguntas_seccion1,
+            'longitud_observaciones': LONGITUD_OBSERVACIONES,
+        }
+
+    def contexto_gracias(self, publicado=False):
+        """Contexto de la plantilla gracias.html."""
+        logo = self.logo_urls(publicado)
+        return {
+            'empresa': self.empresa,
+            'logo_url': logo['img'],
+            'logo_webp': logo['webp'],
+            'publicado': publicado,
+        }
+
+
+def _cache():
+    return caches['compartida']
+
+
+def version_actual():
+    """Sello de versión vigente; si la cache se vació se crea uno nuevo."""
+    cache = _cache()
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, time.time_ns(), None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+async def aversion_actual():
+    """`version_actual` para vistas async."""
+    cache = _cache()
+    version = await cache.aget(CLAVE_VERSION)
+    if version is None:
+        await cache.aadd(CLAVE_VERSION, time.time_ns(), None)
+        version = await cache.aget(CLAVE_VERSION)
+    return version
+
+
+def invalidar():
+    """Cambia el sello de versión: todos los procesos recompilan en su próxima visita."""
+    _cache().set(CLAVE_VERSION, time.time_ns(), None)
+    _esquemas.clear()
+
+
+def _empresa(campos):
+    """EmpresaCliente armada con los valores de CAMPOS_EMPRESA, sin consultar la base."""
+    # from_db espera los valores en el orden de los campos del modelo
+    nombres = [campo.attname for campo in EmpresaCliente._meta.concrete_fields if campo.attname in campos]
+    return EmpresaCliente.from_db(DEFAULT_DB_ALIAS, nombres, [campos[nombre] for nombre in nombres])
+
+
+def obtener(slug):
+    """
+    Esquema compilado de la empresa con ese slug, o None si no existe.
+    Orden de búsqueda: memoria del proceso, cache compartida (los campos de la
+    empresa) y, solo si ninguna tiene la versión vigente, la base de datos.
+    """
+    version = version_actual()
+
+    esquema = _esquemas.get(slug)
+    if esquema is not None and esquema.version == version:
+        return esquema
+
+    clave = f'esquema_encuesta:{FORMATO}:{version}:{slug}'
+    campos = _cache().get(clave)
+    if campos is None:
+        campos = EmpresaCliente.objects.filter(slug=slug).values(*CAMPOS_EMPRESA).first()
+        if campos is None:
+            return None
+        _cache().set(clave, campos, TTL_ESQUEMA)
+
+    esquema = _esquemas[slug] = EsquemaEncuesta(_empresa(campos), version)
+    return esquema
+
+
+async def aobtener(slug):
+    """`obtener` para vistas async: cache con aget/aset y, si falta, ORM async."""
+    version = await aversion_actual()
+
+    esquema = _esquemas.get(slug)
+    if esquema is not None and esquema.version == version:
+        return esquema
+
+    clave = f'esquema_encuesta:{FORMATO}:{version}:{slug}'
+    campos = await _cache().aget(clave)
+    if campos is None:
+        campos = await EmpresaCliente.objects.filter(slug=slug).values(*CAMPOS_EMPRESA).afirst()
+        if campos is None:
+            return None
+        await _cache().aset(clave, campos, TTL_ESQUEMA)
+
+    esquema = _esquemas[slug] = EsquemaEncuesta(_empresa(campos), version)
+    return esquema
+
+
+@receiver(post_save, sender=EmpresaCliente)
+@receiver(post_delete, sender=EmpresaCliente)
+def _empresa_modificada(sender, **kwargs):
+    # Tras el commit: si no, otro proceso podría recompilar con los datos anteriores
+    transaction.on_commit(invalidar)
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
+
+from empresas.models import EmpresaCliente
+from formularios import archivo
+from formularios.models import ArchivoVigencia
+
+
+class Command(BaseCommand):
+    help = (
+        'Pasa los registros de vigencias cerradas a archivos comprimidos en el almacenamiento '
+        '(formularios/archivo.py) y los borra de la tabla. El tablero y la exportación los siguen '
+        'mostrando; el resumen diario no cambia. Con --restaurar los devuelve a la tabla.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--anio', type=int, action='append', default=[], help='Vigencia a archivar (repetible)')
+        parser.add_argument('--hasta', type=int, help='Archivar todas las vigencias con registros hasta este año, incluido')
+        parser.add_argument('--empresa', type=int, action='append', help='ID de la empresa (repetible; por defecto, todas)')
+        parser.add_argument('--restaurar', action='store_true', help='Devolver a la tabla las vigencias indicadas')
+
+    def handle(self, *args, **options):
+        if not options['anio'] and options['hasta'] is None:
+            raise CommandError('Indica --anio o --hasta.')
+        actual = timezone.localdate().year
+        if any(anio >= actual for anio in options['anio']) or (options['hasta'] or 0) >= actual:
+            raise CommandError(f'Solo se archivan vigencias cerradas (anteriores a {actual}).')
+
+        empresas = EmpresaCliente.objects.order_by('id')
+        if options['empresa']:
+            empresas = empresas.filter(id__in=options['empresa'])
+
+        for empresa in empresas:
+            if options['restaurar']:
+                self.restaurar(empresa, options)
+            else:
+                self.archivar(empresa, options)
+
+    def anios(self, anios_con_datos, options):
+        elegidos = set(options['anio'])
+        if options['hasta'] is not None:
+            elegidos |= {anio for anio in anios_con_datos if anio <= options['hasta']}
+        return sorted(elegidos & set(anios_con_datos))
+
+    def archivar(self, empresa, options):
+        con_datos = empresa.registros.annotate(anio=ExtractYear('fecha_registro')).values_list('anio', flat=True).distinct()
+        for anio in self.anios(con_datos, options):
+            guardado = archivo.archivar(empresa, anio)
+            self.stdout.write(
+                f'{empresa.nombre} {anio}: {guardado.total} registros en {guardado.archivo.name} '
+                f'({guardado.archivo.size // 1024} KB, {len(guardado.indice)} bloques)'
+            )
+
+    def restaurar(self, empresa, options):
+        archivos = {a.anio: a for a in ArchivoVigencia.objects.filter(empresa=empresa)}
+        for anio in self.anios(archivos, options):
+            restaurados = archivo.restaurar(archivos[anio])
+            self.stdout.write(f'{empresa.nombre} {anio}: {restaurados} registros devueltos a la tabla')
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from formularios import particiones
+
+
+class Command(BaseCommand):
+    help = (
+        'Crea las particiones anuales de RegistroEncuesta que falten (año actual y siguientes) '
+        'y mueve a ellas las filas que hubieran caído en la partición DEFAULT. '
+        'Programar en cron, por ejemplo una vez al mes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--anios', type=int, default=1, help='Años hacia adelante, además del actual')
+        parser.add_argument(
+            '--anio', type=int, action='append', default=[],
+            help='Crear además la partición de este año (repetible), p. ej. para vaciar DEFAULT'
+        )
+
+    def handle(self, *args, **options):
+        if options['anios'] < 0:
+            raise CommandError('--anios no puede ser negativo.')
+        if not particiones.particionada():
+            raise CommandError('La tabla de registros no está particionada (migración formularios 0007).')
+
+        creadas = particiones.asegurar(options['anios'])
+        existentes = set(particiones.existentes())
+        creadas += [(anio, particiones.crear(anio)) for anio in sorted(set(options['anio']) - existentes)]
+        for anio, movidas in creadas:
+            self.stdout.write(f'Partición {particiones.nombre(anio)} creada ({movidas} fila(s) movidas desde DEFAULT).')
+
+        self.stdout.write(f"Particiones: {', '.join(map(str, particiones.existentes()))}")
+        pendientes = particiones.en_default()
+        if pendientes:
+            self.stdout.write(self.style.WARNING(
+                'Filas en DEFAULT: ' + ', '.join(f'{anio}: {n}' for anio, n in pendientes.items())
+                + '. Créales partición con --anio.'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS('La partición DEFAULT está vacía.'))
@@ -0,0 +1,194 @@
+import datetime
+import itertools
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from empresas.models import EmpresaCliente
+from formularios import catalogo, resumen, sino
+from formularios.models import RegistroEncuesta
+
+
+# Las empresas generadas se reconocen por el slug; --borrar solo toca estas
+PREFIJO_SLUG = 'sintetica-'
+
+# Combinaciones aliado / bloques contratados que existen en producción
+PERFILES = [
+    {'aliado': 'GFR', 'tiene_sagrilaft': True, 'tiene_sarlaft': False, 'tiene_ptee': False},
+    {'aliado': 'GFR', 'tiene_sagrilaft': True, 'tiene_sarlaft': False, 'tiene_ptee': True},
+    {'aliado': 'LEGAL_SHIELD', 'tiene_sagrilaft': False, 'tiene_sarlaft': True, 'tiene_ptee': True},
+]
+
+# Encuesta personalizada al estilo de Prodesa (scripts/crear_prodesa.py)
+CONFIG_PERSONALIZADA = {
+    'tipos_tercero': [
+        {'value': 'CLIENTE', 'label': 'Cliente'},
+        {'value': 'PROVEEDOR', 'label': 'Proveedor'},
+        {'value': 'COLABORADOR', 'label': 'Colaborador'},
+        {'value': 'CONTRATISTA', 'label': 'Contratista'},
+        {'value': 'PROPIEDAD_HORIZONTAL', 'label': 'Propiedad Horizontal'},
+        {'value': 'OTRO', 'label': 'Otro'},
+    ],
+    'campos_seccion1': [
+        {'name': 'nit_cedula', 'label': 'NIT o Cédula de la Contraparte', 'type': 'text', 'required': True},
+    ],
+    'preguntas_seccion1': [
+        {'name': 'tiene_programa_laft', 'texto': '¿Cuenta con programa de prevención de riesgos LA/FT/FPADM?', 'tipo': 'si_no'},
+        {'name': 'tiene_oficial_uiaf_laft', 'texto': '¿Cuenta con oficial de cumplimiento registrado en UIAF (LA/FT)?', 'tipo': 'si_no'},
+        {'name': 'tiene_oficial_uiaf_ptee', 'texto': '¿Cuenta con oficial de cumplimiento registrado en UIAF (PTEE)?', 'tipo': 'si_no'},
+    ],
+}
+
+# Pesos aproximados de lo que se ve en campañas reales
+PESOS_TIPO = {'PROVEEDOR': 45, 'CLIENTE': 30, 'EMPLEADO': 15, 'COLABORADOR': 15, 'CONTRATISTA': 10}
+PESO_TIPO_OTROS = 3
+# Las campañas se lanzan en marzo-abril y octubre-noviembre
+PESO_MES = {3: 3, 4: 3, 10: 3, 11: 3, 12: 0.5}
+# Cada año llegan más respuestas que el anterior
+CRECIMIENTO_ANUAL = 1.5
+
+NOMBRES = ['María', 'José', 'Luis', 'Ana', 'Carlos', 'Ñusta', 'Andrés', 'Lucía', 'Jorge', 'Valentina', 'Óscar', 'Camila']
+APELLIDOS = ['Gómez', 'Rodríguez', 'Martínez', 'López', 'Pérez', 'Muñoz', 'Díaz', 'Restrepo', 'Castaño', 'Ibáñez']
+RAZONES = ['Comercializadora', 'Inversiones', 'Construcciones', 'Transportes', 'Soluciones', 'Distribuidora']
+AREAS = ['Compras', 'Cartera', 'Talento Humano', 'Operaciones', 'Gerencia', 'Jurídica', 'Contabilidad']
+CARGOS = ['Analista', 'Coordinador', 'Director', 'Gerente', 'Auxiliar', 'Representante Legal']
+OBSERVACIONES = [
+    'Sin observaciones.',
+    'Solicito capacitación sobre el canal de denuncias.',
+    'No tenía claro a quién reportar operaciones inusuales.',
+    'Actualizaremos la información en el próximo trimestre.',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Crea empresas sintéticas (slug "sintetica-*") con registros de encuesta realistas '
+        'para medir el tablero con volumen: combinaciones de aliado y bloques, encuestas '
+        'personalizadas y varios años de envíos. Solo para bases de prueba.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresas', type=int, default=6, help='Empresas a crear')
+        parser.add_argument('--registros', type=int, default=100_000, help='Registros en total, repartidos entre las empresas')
+        parser.add_argument('--anios', type=int, default=3, help='Años de historia (hasta hoy)')
+        parser.add_argument('--semilla', type=int, default=42, help='Semilla aleatoria (misma semilla, mismos datos)')
+        parser.add_argument('--lote', type=int, default=5000, help='Registros por bulk_create')
+        parser.add_argument('--borrar', action='store_true', help='Borrar antes las empresas sintéticas existentes')
+
+    def handle(self, *args, **options):
+        if options['empresas'] < 1 or options['registros'] < 0 or options['anios'] < 1:
+            raise CommandError('--empresas y --anios deben ser positivos y --registros no negativo.')
+
+        azar = random.Random(options['semilla'])
+
+        if options['borrar']:
+            borradas, _ = EmpresaCliente.objects.filter(slug__startswith=PREFIJO_SLUG).delete()
+            self.stdout.write(f'{borradas} fila(s) sintética(s) borrada(s) (empresas, registros y resumen).')
+        elif EmpresaCliente.objects.filter(slug__startswith=PREFIJO_SLUG).exists():
+            raise CommandError('Ya hay empresas sintéticas. Usa --borrar para reemplazarlas.')
+
+        dias, pesos_dias = self.calendario(options['anios'])
+
+        # Pocas empresas grandes y muchas pequeñas (ley de Zipf)
+        pesos_empresas = [1 / (i + 1) for i in range(options['empresas'])]
+        suma = sum(pesos_empresas)
+        for i, peso in enumerate(pesos_empresas):
+            empresa = self.crear_empresa(i, azar)
+            cantidad = round(options['registros'] * peso / suma)
+            self.generar_registros(empresa, cantidad, dias, pesos_dias, options['lote'], azar)
+            self.stdout.write(f'{empresa.nombre} ({empresa.slug}, id {empresa.id}): {cantidad} registros')
+
+        self.stdout.write(self.style.SUCCESS(
+            'Datos sintéticos generados. Ejecuta generar_instantaneas para verlos en métricas globales.'
+        ))
+
+    def calendario(self, anios):
+        """Días de los últimos `anios` años con su peso relativo (estacionalidad y crecimiento)."""
+        hoy = timezone.localdate()
+        dias = [hoy - datetime.timedelta(days=n) for n in range(anios * 365)]
+        pesos = [
+            PESO_MES.get(dia.month, 1)
+            * CRECIMIENTO_ANUAL ** (dia.year - hoy.year)
+            * (0.3 if dia.weekday() >= 5 else 1)
+            for dia in dias
+        ]
+        return dias, pesos
+
+    def crear_empresa(self, i, azar):
+        perfil = PERFILES[i % len(PERFILES)]
+        # Una de cada cuatro con encuesta personalizada
+        personalizada = i % 4 == 3
+        return EmpresaCliente.objects.create(
+            nombre=f'{azar.choice(RAZONES)} Sintética {i + 1} S.A.S.',
+            slug=f'{PREFIJO_SLUG}{i + 1}',
+            email_soporte=f'cumplimiento{i + 1}@sintetica.example',
+            color_primario=f'#{azar.randrange(16 ** 6):06x}',
+            config_encuesta=CONFIG_PERSONALIZADA if personalizada else None,
+            **perfil,
+        )
+
+    def generar_registros(self, empresa, cantidad, dias, pesos_dias, lote, azar):
+        config = empresa.config_encuesta or {}
+        tipos = [t['value'] for t in config.get('tipos_tercero', [])] or [
+            valor for valor, _ in RegistroEncuesta.TIPO_TERCERO_CHOICES
+        ]
+        pesos_tipos = [PESOS_TIPO.get(tipo, PESO_TIPO_OTROS) for tipo in tipos]
+        campos = [c['name'] for c in config.get('campos_seccion1', [])]
+
+        # Cada empresa tiene su propio nivel de conocimiento por pregunta
+        preguntas = [(p['name'], azar.uniform(0.55, 0.92)) for p in catalogo.catalogo_preguntas(empresa)]
+        indice = sino.indice(empresa)
+        zona = timezone.get_current_timezone()
+
+        # Cumulativos una sola vez: random.choices los recalcularía en cada llamada
+        acumulado_dias = list(itertools.accumulate(pesos_dias))
+        acumulado_tipos = list(itertools.accumulate(pesos_tipos))
+
+        for inicio in range(0, cantidad, lote):
+            tamano = min(lote, cantidad - inicio)
+            fechas = azar.choices(dias, cum_weights=acumulado_dias, k=tamano)
+            registros = []
+            for dia, tipo in zip(fechas, azar.choices(tipos, cum_weights=acumulado_tipos, k=tamano)):
+                # Horario laboral, con pico a media mañana
+                hora = datetime.time(max(6, min(21, int(azar.gauss(11, 3)))), azar.randrange(60), azar.randrange(60))
+                registro = RegistroEncuesta(
+                    empresa=empresa,
+                    tipo_tercero=tipo,
+                    nombre_respondiente=self.nombre(tipo, azar),
+                    area=azar.choice(AREAS),
+                    cargo=azar.choice(CARGOS),
+                    respuestas_data=self.respuestas(preguntas, campos, azar),
+                    fecha_registro=datetime.datetime.combine(dia, hora, tzinfo=zona),
+                    ip_origen=f'10.{azar.randrange(256)}.{azar.randrange(256)}.{azar.randrange(1, 255)}',
+                )
+                # bulk_create no dispara pre_save: las máscaras SI/NO se calculan aquí
+                sino.completar(registro, indice)
+                registros.append(registro)
+
+            with transaction.atomic():
+                RegistroEncuesta.objects.bulk_create(registros)
+                resumen.acumular(empresa, registros)
+
+    def nombre(self, tipo, azar):
+        if tipo in ('PROVEEDOR', 'CLIENTE', 'CONTRATISTA', 'PROPIEDAD_HORIZONTAL'):
+            return f'{azar.choice(RAZONES)} {azar.choice(APELLIDOS)} S.A.S.'
+        return f'{azar.choice(NOMBRES)} {azar.choice(APELLIDOS)} {azar.choice(APELLIDOS)}'
+
+    def respuestas(self, preguntas, campos, azar):
+        data = {campo: str(azar.randrange(800_000_000, 999_999_999)) for campo in campos}
+        for nombre, conocimiento in preguntas:
+            dado = azar.random()
+            if dado < 0.02:
+                continue  # sin responder (encuestas viejas o preguntas agregadas después)
+            if nombre.endswith('_actualizado'):
+                data[nombre] = 'SI_ACTUALIZADO' if dado < conocimiento else azar.choice(['NO_ACTUALIZADO', 'NO_SOLICITADO'])
+            elif nombre.endswith('_conoce') and dado > 0.97:
+                data[nombre] = 'NO_RECUERDO'
+            else:
+                data[nombre] = 'SI' if dado < conocimiento else 'NO'
+        if azar.random() < 0.2:
+            data['observaciones'] = azar.choice(OBSERVACIONES)
+        return data
+
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from empresas.models import EmpresaCliente
+from formularios import publicacion
+
+
+class Command(BaseCommand):
+    help = (
+        'Pre-renderiza la encuesta pública y la página de gracias de cada empresa y las guarda '
+        'en el storage de media. Correr tras cada despliegue que cambie las plantillas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slug', help='Publicar solo esta empresa')
+
+    def handle(self, *args, **options):
+        empresas = EmpresaCliente.objects.all().order_by('id')
+        if options['slug']:
+            empresas = empresas.filter(slug=options['slug'])
+
+        publicadas = retiradas = 0
+        for empresa in empresas:
+            rutas = publicacion.publicar(empresa)
+            if rutas:
+                publicadas += 1
+                self.stdout.write(f"{empresa.slug}: {', '.join(rutas)}")
+            else:
+                retiradas += 1
+                self.stdout.write(f"{empresa.slug}: inactiva, páginas retiradas")
+
+        self.stdout.write(self.style.SUCCESS(f'{publicadas} encuesta(s) publicada(s), {retiradas} retirada(s).'))
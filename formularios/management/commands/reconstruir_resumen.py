@@ -0,0 +1,93 @@
+import itertools
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from empresas.models import EmpresaCliente
+from formularios.models import ResumenDiario, VigenciaEmpresa
+from formularios import archivo, catalogo, resumen
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye desde cero el resumen diario de respuestas y el índice de vigencias '
+        'a partir de RegistroEncuesta (y de las vigencias archivadas). '
+        'Ejecutar fuera de campañas: los envíos que lleguen durante la reconstrucción pueden quedar fuera.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID de la empresa a reconstruir (por defecto, todas)')
+        parser.add_argument('--chunk', type=int, default=2000, help='Registros leídos por lote')
+        parser.add_argument(
+            '--verificar', action='store_true',
+            help='No reconstruye: compara el resumen y el índice de vigencias con un conteo directo de RegistroEncuesta'
+        )
+        parser.add_argument(
+            '--vigencias', action='store_true',
+            help='Solo el índice de vigencias (una consulta agregada por empresa, sin recorrer los registros)'
+        )
+
+    def handle(self, *args, **options):
+        empresas = EmpresaCliente.objects.all().order_by('id')
+        if options['empresa']:
+            empresas = empresas.filter(id=options['empresa'])
+
+        if options['verificar']:
+            self.verificar(empresas)
+            return
+
+        if options['vigencias']:
+            for empresa in empresas:
+                self.stdout.write(f"{empresa.nombre}: {resumen.reconstruir_vigencias(empresa)} vigencia(s)")
+            self.stdout.write(self.style.SUCCESS('Índice de vigencias reconstruido.'))
+            return
+
+        for empresa in empresas:
+            registros = empresa.registros.only(
+                'fecha_registro', 'tipo_tercero', 'respuestas_data'
+            ).order_by().iterator(chunk_size=options['chunk'])
+            # Las vigencias archivadas también cuentan: su resumen es lo único que queda en la base
+            registros = itertools.chain(registros, archivo.de_empresa(empresa).iterar())
+
+            conteos = Counter()
+            total = 0
+            for reg in registros:
+                resumen.contar_registros(empresa, [reg], conteos)
+                total += 1
+
+            # Borrado y recarga en la misma transacción: el tablero nunca ve el resumen vacío
+            with transaction.atomic():
+                ResumenDiario.objects.filter(empresa=empresa).delete()
+                if conteos:
+                    resumen.guardar_conteos(conteos)
+            vigencias = resumen.reconstruir_vigencias(empresa)
+
+            self.stdout.write(f"{empresa.nombre}: {total} registros, {len(conteos)} filas de resumen, {vigencias} vigencia(s)")
+
+        self.stdout.write(self.style.SUCCESS('Resumen reconstruido.'))
+
+    def verificar(self, empresas):
+        diferencias = 0
+        for empresa in empresas:
+            preguntas = catalogo.catalogo_preguntas(empresa, solo_activas=False)
+            directo = catalogo.estadisticas_registros(empresa.registros.all(), preguntas)
+            # Los registros archivados no se pueden contar en SQL: se compara solo lo que está en la tabla
+            archivados = archivo.de_empresa(empresa).anios
+            acumulado = catalogo.estadisticas_resumen(resumen.conteos_vigencia(empresa, excluir=archivados), preguntas)
+            if directo != acumulado:
+                diferencias += 1
+                self.stdout.write(self.style.WARNING(
+                    f"{empresa.nombre}: el resumen no coincide (registros: {directo['total']}, resumen: {acumulado['total']})"
+                ))
+            indice = {
+                (v.empresa_id, v.anio): [v.total, v.primera, v.ultima] for v in VigenciaEmpresa.objects.filter(empresa=empresa)
+            }
+            if indice != resumen.vigencias_reales(empresa):
+                diferencias += 1
+                self.stdout.write(self.style.WARNING(f"{empresa.nombre}: el índice de vigencias no coincide"))
+
+        if diferencias:
+            self.stdout.write(self.style.ERROR(f'{diferencias} empresa(s) con diferencias. Ejecuta el comando sin --verificar.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('El resumen coincide con los registros.'))
@@ -0,0 +1,90 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from empresas.models import EmpresaCliente
+from formularios import catalogo, esquema, sino
+from formularios.models import RegistroEncuesta
+
+
+class Command(BaseCommand):
+    help = (
+        'Crea o completa el índice de preguntas de cada empresa y rellena las máscaras SI/NO '
+        'de sus registros a partir de respuestas_data. Ejecutar tras desplegar las máscaras, '
+        'fuera de campañas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID de la empresa (por defecto, todas)')
+        parser.add_argument('--chunk', type=int, default=2000, help='Registros actualizados por sentencia')
+        parser.add_argument(
+            '--verificar', action='store_true',
+            help='No modifica nada: compara las estadísticas por máscaras con las del JSON'
+        )
+
+    def handle(self, *args, **options):
+        empresas = EmpresaCliente.objects.all().order_by('id')
+        if options['empresa']:
+            empresas = empresas.filter(id=options['empresa'])
+
+        if options['verificar']:
+            self.verificar(empresas)
+            return
+
+        for empresa in empresas:
+            if sino.extender_indice(empresa):
+                # update() y no save(): no re-publica la encuesta ni toca otros campos
+                EmpresaCliente.objects.filter(pk=empresa.pk).update(indice_preguntas=empresa.indice_preguntas)
+                # Los envíos siguientes ya calculan las máscaras con el índice nuevo
+                esquema.invalidar()
+
+            total = self.rellenar(empresa, sino.indice(empresa), options['chunk'])
+            self.stdout.write(f"{empresa.nombre}: {len(empresa.indice_preguntas)} preguntas, {total} registros")
+
+        self.stdout.write(self.style.SUCCESS('Máscaras SI/NO rellenadas.'))
+
+    def rellenar(self, empresa, indice, chunk):
+        tabla = connection.ops.quote_name(RegistroEncuesta._meta.db_table)
+        total = ultimo = 0
+        # Por id creciente hasta agotar: también cubre lo que llegue mientras tanto
+        while True:
+            lote = list(
+                empresa.registros.filter(id__gt=ultimo).order_by('id').values_list('id', 'respuestas_data')[:chunk]
+            )
+            if not lote:
+                return total
+
+            params = []
+            for registro_id, respuestas_data in lote:
+                params.append(registro_id)
+                params.extend(sino.mascaras(indice, respuestas_data))
+            placeholders = ', '.join(['(%s, %s::bigint, %s::bigint, %s::bigint)'] * len(lote))
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {tabla} AS r SET respuestas_si = v.si, respuestas_no = v.no, "
+                    f"respuestas_contestadas = v.contestadas "
+                    f"FROM (VALUES {placeholders}) AS v(id, si, no, contestadas) WHERE r.id = v.id",
+                    params,
+                )
+
+            total += len(lote)
+            ultimo = lote[-1][0]
+
+    def verificar(self, empresas):
+        diferencias = 0
+        for empresa in empresas:
+            indice = sino.indice(empresa)
+            if not indice:
+                self.stdout.write(f"{empresa.nombre}: sin índice (las estadísticas leen el JSON)")
+                continue
+            preguntas = catalogo.catalogo_preguntas(empresa, solo_activas=False)
+            por_json = catalogo.estadisticas_registros(empresa.registros.all(), preguntas)
+            por_bits = catalogo.estadisticas_registros(empresa.registros.all(), preguntas, indice)
+            if por_json != por_bits:
+                diferencias += 1
+                distintas = [p['name'] for p in preguntas if por_json[p['name']] != por_bits[p['name']]]
+                self.stdout.write(self.style.WARNING(f"{empresa.nombre}: difieren {', '.join(distintas)}"))
+
+        if diferencias:
+            self.stdout.write(self.style.ERROR(f'{diferencias} empresa(s) con diferencias. Ejecuta el comando sin --verificar.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Las máscaras coinciden con respuestas_data.'))
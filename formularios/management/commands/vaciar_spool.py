@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from formularios import spool
+
+
+class Command(BaseCommand):
+    help = (
+        'Pasa a la base de datos los envíos guardados en el spool local (SPOOL_ENCUESTAS_DB) '
+        'por lotes con bulk_create. Debe correr en el mismo servidor que la web.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true', help='Vaciar lo pendiente y terminar')
+        parser.add_argument('--intervalo', type=float, default=1, help='Segundos de espera cuando el spool está vacío')
+        parser.add_argument('--lote', type=int, default=spool.TAMANO_LOTE, help='Envíos por lote')
+
+    def handle(self, *args, **options):
+        pendientes = spool.pendientes()
+        self.stdout.write(f'{pendientes} envío(s) pendiente(s) en el spool.')
+
+        total = 0
+        while True:
+            # Proceso de larga vida: descartar conexiones caídas o vencidas entre lotes
+            close_old_connections()
+            leidos, insertados = spool.vaciar_lote(options['lote'])
+
+            if not leidos:
+                if options['una_vez']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+
+            total += insertados
+            repetidos = leidos - insertados
+            mensaje = f'  {insertados} envío(s) guardado(s)'
+            if repetidos:
+                mensaje += f', {repetidos} ya estaban en la base o descartados'
+            self.stdout.write(mensaje)
+
+        self.stdout.write(self.style.SUCCESS(f'{total} envío(s) pasado(s) a la base.'))
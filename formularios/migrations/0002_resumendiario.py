@@ -0,0 +1,30 @@
+# Generated by Django 5.2.9 on 2026-10-18 08:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0004_config_encuesta'),
+        ('formularios', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('tipo_tercero', models.CharField(max_length=20)),
+                ('pregunta', models.CharField(max_length=100)),
+                ('valor', models.CharField(blank=True, default='', max_length=50)),
+                ('cantidad', models.PositiveIntegerField(default=0)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumen_diario', to='empresas.empresacliente')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('empresa', 'fecha', 'tipo_tercero', 'pregunta', 'valor'), name='resumen_diario_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.9 on 2026-10-18 08:26
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY no puede correr dentro de una transacción;
+    # así la tabla de registros sigue recibiendo encuestas mientras se crean.
+    atomic = False
+
+    dependencies = [
+        ('empresas', '0004_config_encuesta'),
+        ('formularios', '0002_resumendiario'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='registroencuesta',
+            index=models.Index(fields=['empresa', '-fecha_registro'], name='registro_empresa_fecha_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='registroencuesta',
+            index=models.Index(fields=['-fecha_registro'], name='registro_fecha_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='registroencuesta',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['respuestas_data'], name='registro_respuestas_gin', opclasses=['jsonb_path_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='registroencuesta',
+            index=models.Index(condition=models.Q(('tipo_tercero', ''), _negated=True), fields=['empresa', 'tipo_tercero', '-fecha_registro'], name='registro_tipo_tercero_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-18 08:31
+
+import core.busqueda
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Índice creado CONCURRENTLY: no bloquea la recepción de encuestas
+    atomic = False
+
+    dependencies = [
+        ('empresas', '0005_busqueda_trigramas'),
+        ('formularios', '0003_indices_registro'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='registroencuesta',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(core.busqueda.SinTildes('nombre_respondiente'), name='gin_trgm_ops'), name='registro_nombre_trgm'),
+        ),
+    ]
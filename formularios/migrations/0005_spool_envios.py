@@ -0,0 +1,24 @@
+# Generated by Django 5.2.9 on 2026-10-18 08:36
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('formularios', '0004_registro_nombre_trgm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registroencuesta',
+            name='spool_id',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='registroencuesta',
+            name='fecha_registro',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.9 on 2026-10-18 08:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('formularios', '0005_spool_envios'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registroencuesta',
+            name='respuestas_contestadas',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='registroencuesta',
+            name='respuestas_no',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='registroencuesta',
+            name='respuestas_si',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,172 @@
+"""
+Particiona RegistroEncuesta por año de fecha_registro (ver formularios/particiones.py).
+
+Postgres no convierte una tabla existente en particionada: se renombra la
+actual, se crea la nueva con las mismas columnas, las particiones anuales
+desde el primer año con datos hasta el siguiente al actual más DEFAULT, se
+copian las filas y se recrean la identidad del id, la llave foránea y los
+índices tal como estaban en la base (quedan definidos en la tabla padre y
+Postgres los replica en cada partición).
+
+Dos restricciones cambian porque en una tabla particionada toda restricción
+única debe incluir la columna de partición:
+  - la llave primaria pasa a ser (id, fecha_registro); id sigue siendo único
+    por la identidad y es lo que usa el ORM;
+  - spool_id deja de ser único por sí solo y pasa a serlo junto con
+    fecha_registro (registro_spool_unico). La fecha de un envío del spool es
+    fija, así que un reintento choca igual; además vaciar_lote filtra los ya
+    insertados bajo candado antes del bulk_create.
+
+La migración reescribe la tabla completa con un bloqueo exclusivo: correrla
+en una ventana de mantenimiento (o con SPOOL_ENCUESTAS activo, que deja los
+envíos en el diario mientras tanto).
+"""
+import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+TABLA = 'formularios_registroencuesta'
+ANTERIOR = f'{TABLA}_sin_particionar'
+
+
+def _limites(anio):
+    zona = timezone.get_default_timezone()
+    return datetime.datetime(anio, 1, 1, tzinfo=zona), datetime.datetime(anio + 1, 1, 1, tzinfo=zona)
+
+
+def _definiciones(cursor):
+    """
+    Índices (sin los de restricciones) y llaves foráneas de la tabla tal como
+    están en la base, para recrearlos con el mismo nombre en la tabla nueva.
+    """
+    cursor.execute(
+        "SELECT pg_get_indexdef(x.indexrelid) FROM pg_index x "
+        "WHERE x.indrelid = to_regclass(%s) "
+        "AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)",
+        [TABLA],
+    )
+    indices = [fila[0] for fila in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+        [TABLA],
+    )
+    return indices, cursor.fetchall()
+
+
+def _reemplazar(schema_editor, cursor, crear_tabla, llave_primaria, unico_spool):
+    """
+    Cambia la tabla por una nueva con las mismas columnas, filas, identidad,
+    índices y llaves foráneas. `crear_tabla` recibe el nombre de la anterior y
+    crea la nueva (y sus particiones).
+    """
+    quote = schema_editor.quote_name
+    indices, foraneas = _definiciones(cursor)
+
+    cursor.execute(f'LOCK TABLE {quote(TABLA)} IN ACCESS EXCLUSIVE MODE')
+    cursor.execute(f'ALTER TABLE {quote(TABLA)} RENAME TO {quote(ANTERIOR)}')
+    # Libera los nombres de restricciones e índices para la tabla nueva (en una tabla
+    # particionada, los de las particiones cuelgan de los del padre y caen con ellos)
+    cursor.execute(
+        "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype IN ('p', 'u', 'f')",
+        [ANTERIOR],
+    )
+    for (restriccion,) in cursor.fetchall():
+        cursor.execute(f'ALTER TABLE {quote(ANTERIOR)} DROP CONSTRAINT {quote(restriccion)}')
+    cursor.execute(
+        "SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = to_regclass(%s)", [ANTERIOR],
+    )
+    for (indice,) in cursor.fetchall():
+        cursor.execute(f'DROP INDEX {indice}')
+    # La identidad se recrea en la tabla nueva, con el mismo nombre de secuencia
+    cursor.execute(f'ALTER TABLE {quote(ANTERIOR)} ALTER COLUMN id DROP IDENTITY IF EXISTS')
+
+    crear_tabla(cursor, quote(ANTERIOR))
+    cursor.execute(f'ALTER TABLE {quote(TABLA)} ADD CONSTRAINT {quote(TABLA + "_pkey")} PRIMARY KEY ({llave_primaria})')
+
+    cursor.execute(f'INSERT INTO {quote(TABLA)} SELECT * FROM {quote(ANTERIOR)}')
+    # Si la anterior era particionada, DROP TABLE también elimina sus particiones
+    cursor.execute(f'DROP TABLE {quote(ANTERIOR)}')
+
+    cursor.execute(f'ALTER TABLE {quote(TABLA)} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+    cursor.execute(
+        f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {quote(TABLA)}",
+        [TABLA],
+    )
+
+    nombre, columnas = unico_spool
+    cursor.execute(f'ALTER TABLE {quote(TABLA)} ADD CONSTRAINT {quote(nombre)} UNIQUE ({columnas})')
+    for restriccion, definicion in foraneas:
+        cursor.execute(f'ALTER TABLE {quote(TABLA)} ADD CONSTRAINT {quote(restriccion)} {definicion}')
+    # Sobre la tabla particionada, Postgres crea el índice equivalente en cada partición
+    for definicion in indices:
+        cursor.execute(definicion)
+    # La tabla nueva no tiene estadísticas: sin ANALYZE el planificador estima a ciegas
+    cursor.execute(f'ANALYZE {quote(TABLA)}')
+
+
+def particionar(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    quote = schema_editor.quote_name
+
+    def crear_tabla(cursor, anterior):
+        cursor.execute(f'CREATE TABLE {quote(TABLA)} (LIKE {anterior} INCLUDING DEFAULTS) PARTITION BY RANGE (fecha_registro)')
+        cursor.execute(
+            f'SELECT EXTRACT(YEAR FROM MIN(fecha_registro) AT TIME ZONE %s)::int FROM {anterior}',
+            [settings.TIME_ZONE],
+        )
+        actual = timezone.localdate().year
+        primero = min(cursor.fetchone()[0] or actual, actual)
+        for anio in range(primero, actual + 2):
+            desde, hasta = _limites(anio)
+            cursor.execute(
+                f'CREATE TABLE {quote(f"{TABLA}_{anio}")} PARTITION OF {quote(TABLA)} FOR VALUES FROM (%s) TO (%s)',
+                [desde, hasta],
+            )
+        cursor.execute(f'CREATE TABLE {quote(TABLA + "_default")} PARTITION OF {quote(TABLA)} DEFAULT')
+
+    with schema_editor.connection.cursor() as cursor:
+        _reemplazar(schema_editor, cursor, crear_tabla, 'id, fecha_registro', ('registro_spool_unico', 'spool_id, fecha_registro'))
+
+
+def desparticionar(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    quote = schema_editor.quote_name
+
+    def crear_tabla(cursor, anterior):
+        cursor.execute(f'CREATE TABLE {quote(TABLA)} (LIKE {anterior} INCLUDING DEFAULTS)')
+
+    with schema_editor.connection.cursor() as cursor:
+        _reemplazar(schema_editor, cursor, crear_tabla, 'id', (f'{TABLA}_spool_id_key', 'spool_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0005_busqueda_trigramas'),
+        ('formularios', '0006_respuestas_sino'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='registroencuesta',
+                    name='spool_id',
+                    field=models.UUIDField(blank=True, editable=False, null=True),
+                ),
+                migrations.AddConstraint(
+                    model_name='registroencuesta',
+                    constraint=models.UniqueConstraint(fields=['spool_id', 'fecha_registro'], name='registro_spool_unico'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(particionar, desparticionar),
+            ],
+        ),
+    ]
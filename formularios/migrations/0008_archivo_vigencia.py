@@ -0,0 +1,33 @@
+# Generated by Django 5.2.9 on 2026-10-18 09:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0006_indice_preguntas'),
+        ('formularios', '0007_particion_anual_registros'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivoVigencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('anio', models.PositiveSmallIntegerField()),
+                ('archivo', models.FileField(upload_to='archivo_vigencias/')),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('indice', models.JSONField(default=list)),
+                ('id_min', models.BigIntegerField(default=0)),
+                ('id_max', models.BigIntegerField(default=0)),
+                ('archivado', models.DateTimeField(auto_now=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archivos', to='empresas.empresacliente')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['id_min', 'id_max'], name='archivo_vigencia_ids_idx')],
+                'constraints': [models.UniqueConstraint(fields=('empresa', 'anio'), name='archivo_vigencia_unico')],
+            },
+        ),
+    ]
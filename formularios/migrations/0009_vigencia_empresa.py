@@ -0,0 +1,64 @@
+# Generated by Django 5.2.9 on 2026-10-18 09:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+from django.db.models.functions import ExtractYear
+from django.utils.dateparse import parse_datetime
+
+
+def llenar_vigencias(apps, schema_editor):
+    """Índice inicial desde la tabla y los archivos (lo mismo que `reconstruir_resumen --vigencias`)."""
+    RegistroEncuesta = apps.get_model('formularios', 'RegistroEncuesta')
+    ArchivoVigencia = apps.get_model('formularios', 'ArchivoVigencia')
+    VigenciaEmpresa = apps.get_model('formularios', 'VigenciaEmpresa')
+
+    vigencias = {}
+    filas = RegistroEncuesta.objects.annotate(anio=ExtractYear('fecha_registro')).values('empresa_id', 'anio').annotate(
+        total=Count('id'), primera=Min('fecha_registro'), ultima=Max('fecha_registro')
+    ).order_by()
+    for fila in filas:
+        vigencias[(fila['empresa_id'], fila['anio'])] = VigenciaEmpresa(
+            empresa_id=fila['empresa_id'], anio=fila['anio'], total=fila['total'],
+            primera=fila['primera'], ultima=fila['ultima'],
+        )
+    for archivado in ArchivoVigencia.objects.exclude(total=0):
+        primera = min(parse_datetime(bloque['desde']) for bloque in archivado.indice)
+        ultima = max(parse_datetime(bloque['hasta']) for bloque in archivado.indice)
+        vigencia = vigencias.get((archivado.empresa_id, archivado.anio))
+        if vigencia is None:
+            vigencias[(archivado.empresa_id, archivado.anio)] = VigenciaEmpresa(
+                empresa_id=archivado.empresa_id, anio=archivado.anio, total=archivado.total,
+                primera=primera, ultima=ultima,
+            )
+        else:
+            vigencia.total += archivado.total
+            vigencia.primera = min(vigencia.primera, primera)
+            vigencia.ultima = max(vigencia.ultima, ultima)
+    VigenciaEmpresa.objects.bulk_create(vigencias.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0006_indice_preguntas'),
+        ('formularios', '0008_archivo_vigencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VigenciaEmpresa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('anio', models.PositiveSmallIntegerField()),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('primera', models.DateTimeField()),
+                ('ultima', models.DateTimeField()),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vigencias', to='empresas.empresacliente')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('empresa', 'anio'), name='vigencia_empresa_unica')],
+            },
+        ),
+        migrations.RunPython(llenar_vigencias, migrations.RunPython.noop),
+    ]
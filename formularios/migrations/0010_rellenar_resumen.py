@@ -0,0 +1,70 @@
+from collections import Counter
+
+from django.db import migrations
+from django.utils import timezone
+
+# Copia de lo que cuenta formularios/resumen.py al crear esta migración: una
+# migración no importa código de la app, que puede cambiar después
+PREGUNTA_TOTAL = '_total'
+PREGUNTAS_FIJAS = [
+    'p5_sagrilaft_conoce', 'p6_sagrilaft_actualizado', 'p7_sagrilaft_informado', 'p8_sagrilaft_denuncia',
+    'p5_sarlaft_conoce', 'p6_sarlaft_actualizado', 'p7_sarlaft_informado', 'p8_sarlaft_denuncia',
+    'p9_ptee_conoce', 'p10_ptee_codigo', 'p11_ptee_conflicto', 'p12_ptee_corrupcion',
+]
+
+
+def rellenar_resumen(apps, schema_editor):
+    """
+    Resumen inicial de las empresas que ya tienen registros y aún no tienen
+    resumen: sin esto, tras desplegar, los tableros muestran 0 respuestas hasta
+    correr `reconstruir_resumen`. Las que ya tienen resumen no se tocan (lo
+    mantienen los envíos; sumarles otra vez sus registros los contaría doble).
+    El índice de vigencias ya lo llena 0009_vigencia_empresa.
+    """
+    EmpresaCliente = apps.get_model('empresas', 'EmpresaCliente')
+    RegistroEncuesta = apps.get_model('formularios', 'RegistroEncuesta')
+    ResumenDiario = apps.get_model('formularios', 'ResumenDiario')
+    max_valor = ResumenDiario._meta.get_field('valor').max_length
+
+    con_resumen = ResumenDiario.objects.values('empresa_id')
+    for empresa in EmpresaCliente.objects.exclude(id__in=con_resumen).order_by('id'):
+        # Preguntas adicionales de la sección 1 y las de todos los bloques (como resumen.preguntas_resumibles)
+        config = empresa.config_encuesta or {}
+        preguntas = [p['name'] for p in config.get('preguntas_seccion1', []) if p.get('name')] + PREGUNTAS_FIJAS
+
+        conteos = Counter()
+        registros = RegistroEncuesta.objects.filter(empresa_id=empresa.id).only(
+            'fecha_registro', 'tipo_tercero', 'respuestas_data'
+        ).order_by().iterator(chunk_size=2000)
+        for reg in registros:
+            base = (timezone.localdate(reg.fecha_registro), reg.tipo_tercero)
+            conteos[base + (PREGUNTA_TOTAL, '')] += 1
+            data = reg.respuestas_data or {}
+            for pregunta in preguntas:
+                valor = data.get(pregunta)
+                if isinstance(valor, str) and valor:
+                    conteos[base + (pregunta, valor[:max_valor])] += 1
+
+        # La empresa no tenía resumen: no hay filas con las que chocar
+        ResumenDiario.objects.bulk_create(
+            [
+                ResumenDiario(
+                    empresa_id=empresa.id, fecha=fecha, tipo_tercero=tipo, pregunta=pregunta, valor=valor,
+                    cantidad=cantidad,
+                )
+                for (fecha, tipo, pregunta, valor), cantidad in sorted(conteos.items())
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0007_logo_variantes'),
+        ('formularios', '0009_vigencia_empresa'),
+    ]
+
+    operations = [
+        migrations.RunPython(rellenar_resumen, migrations.RunPython.noop),
+    ]
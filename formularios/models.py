@@ -1,6 +1,33 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db import models, transaction
+from django.utils import timezone
+from core.busqueda import SinTildes
 from empresas.models import EmpresaCliente
 
+
+class RegistroEncuestaQuerySet(models.QuerySet):
+
+    def delete(self, descontar=True):
+        """
+        Borra los registros y los descuenta del resumen diario y del índice de
+        vigencias (formularios/resumen.py). descontar=False solo borra: lo usa
+        archivo.archivar, porque los registros archivados siguen contando.
+        Los borrados en cascada al borrar la empresa no pasan por aquí; su
+        resumen se borra con ella.
+        """
+        if not descontar:
+            return super().delete()
+        from . import resumen
+
+        with transaction.atomic(using=self.db):
+            empresas = resumen.descontar(
+                self.only('empresa_id', 'fecha_registro', 'tipo_tercero', 'respuestas_data').order_by().iterator(chunk_size=2000)
+            )
+            borrados = super().delete()
+            resumen.ajustar_vigencias(empresas)
+        return borrados
+
+
 class RegistroEncuesta(models.Model):
     TIPO_TERCERO_CHOICES = [
         ('CLIENTE', 'Cliente'),
@@ -20,10 +47,132 @@ class RegistroEncuesta(models.Model):
     # 2. Las Respuestas se guardan en JSON para flexibilidad
     # Ejemplo: {"p5_sagrilaft": "SI", "p6_datos": "NO"}
     respuestas_data = models.JSONField(default=dict)
+
+    # Las respuestas SI / NO también como máscaras de bits, un bit por pregunta según
+    # EmpresaCliente.indice_preguntas; las estadísticas suman bits sin leer el JSON (formularios/sino.py)
+    respuestas_si = models.BigIntegerField(default=0, editable=False)
+    respuestas_no = models.BigIntegerField(default=0, editable=False)
+    respuestas_contestadas = models.BigIntegerField(default=0, editable=False)
     
     # Metadatos
-    fecha_registro = models.DateTimeField(auto_now_add=True)
+    # default (y no auto_now_add) para conservar la hora real de envío de los registros que pasan por el spool
+    fecha_registro = models.DateTimeField(default=timezone.now, editable=False)
     ip_origen = models.GenericIPAddressField(null=True, blank=True)
+    # Identificador del envío en el spool (formularios/spool.py); evita duplicados al reintentar.
+    # Único junto con fecha_registro (registro_spool_unico): la tabla está particionada por fecha
+    spool_id = models.UUIDField(null=True, blank=True, editable=False)
+
+    objects = RegistroEncuestaQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Todas las consultas del tablero: empresa + rango de fechas, más reciente primero
+            models.Index(fields=['empresa', '-fecha_registro'], name='registro_empresa_fecha_idx'),
+            # Últimas respuestas de todas las empresas (métricas globales)
+            models.Index(fields=['-fecha_registro'], name='registro_fecha_idx'),
+            # Búsquedas por contenido del JSON (respuestas_data @> {...})
+            GinIndex(fields=['respuestas_data'], opclasses=['jsonb_path_ops'], name='registro_respuestas_gin'),
+            # Búsqueda de respondientes por nombre sin tildes (core.busqueda)
+            GinIndex(OpClass(SinTildes('nombre_respondiente'), name='gin_trgm_ops'), name='registro_nombre_trgm'),
+            # Agrupación / filtro por tipo de tercero; se excluyen filas sin tipo
+            models.Index(
+                fields=['empresa', 'tipo_tercero', '-fecha_registro'],
+                name='registro_tipo_tercero_idx',
+                condition=~models.Q(tipo_tercero=''),
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['spool_id', 'fecha_registro'], name='registro_spool_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.nombre_respondiente} - {self.empresa.nombre}"
+
+    def delete(self, using=None, keep_parents=False):
+        # Como RegistroEncuestaQuerySet.delete: el envío deja de contar en el resumen
+        from . import resumen
+
+        with transaction.atomic(using=using):
+            empresas = resumen.descontar([self])
+            borrados = super().delete(using, keep_parents)
+            resumen.ajustar_vigencias(empresas)
+        return borrados
+
+class ResumenDiario(models.Model):
+    """
+    Conteo acumulado de respuestas por empresa, día, tipo de tercero, pregunta y valor.
+    Se alimenta con cada envío, descuenta los registros borrados (ver
+    formularios/resumen.py) y se puede reconstruir con `python manage.py reconstruir_resumen`.
+    """
+    # Fila especial que cuenta envíos (no respuestas a una pregunta concreta)
+    PREGUNTA_TOTAL = '_total'
+
+    empresa = models.ForeignKey(EmpresaCliente, on_delete=models.CASCADE, related_name='resumen_diario')
+    fecha = models.DateField()
+    tipo_tercero = models.CharField(max_length=20)
+    pregunta = models.CharField(max_length=100)
+    valor = models.CharField(max_length=50, blank=True, default='')
+    cantidad = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['empresa', 'fecha', 'tipo_tercero', 'pregunta', 'valor'],
+                name='resumen_diario_unico',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.empresa_id} {self.fecha} {self.pregunta}={self.valor}: {self.cantidad}"
+
+
+class VigenciaEmpresa(models.Model):
+    """
+    Índice de vigencias de una empresa: por año, cuántos envíos hay y cuándo
+    llegaron el primero y el último. Se actualiza con cada envío y cada borrado
+    junto con el resumen diario y se reconstruye con `python manage.py reconstruir_resumen`.
+    Incluye las vigencias archivadas.
+    """
+    empresa = models.ForeignKey(EmpresaCliente, on_delete=models.CASCADE, related_name='vigencias')
+    anio = models.PositiveSmallIntegerField()
+    total = models.PositiveIntegerField(default=0)
+    primera = models.DateTimeField()
+    ultima = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['empresa', 'anio'], name='vigencia_empresa_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.empresa_id} {self.anio}: {self.total} envíos"
+
+
+class ArchivoVigencia(models.Model):
+    """
+    Registros de una vigencia cerrada de una empresa, sacados de RegistroEncuesta
+    a un archivo comprimido (ver formularios/archivo.py). Su resumen diario se
+    conserva en ResumenDiario.
+    """
+    empresa = models.ForeignKey(EmpresaCliente, on_delete=models.CASCADE, related_name='archivos')
+    anio = models.PositiveSmallIntegerField()
+    # JSON Lines en bloques gzip, en el almacenamiento por defecto (MediaStorage en producción)
+    archivo = models.FileField(upload_to='archivo_vigencias/')
+    total = models.PositiveIntegerField(default=0)
+    # Un elemento por bloque: posición y tamaño en el archivo, filas, rango de fechas e ids, conteo por tipo
+    indice = models.JSONField(default=list)
+    # Rango de ids de todo el archivo: ubica un registro archivado sin leer el índice de los demás
+    id_min = models.BigIntegerField(default=0)
+    id_max = models.BigIntegerField(default=0)
+    archivado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['empresa', 'anio'], name='archivo_vigencia_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['id_min', 'id_max'], name='archivo_vigencia_ids_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.nombre_respondiente} - {self.empresa.nombre}"
\ No newline at end of file
+        return f"{self.empresa_id} {self.anio}: {self.total} registros"
@@ -0,0 +1,146 @@
+"""
+Particiones anuales de RegistroEncuesta.
+
+La tabla de registros está particionada por rango de fecha_registro, una
+partición por año calendario en la zona horaria del proyecto (la misma en que
+el tablero arma `fecha_registro__year=vigencia`), más una partición DEFAULT
+que recibe cualquier fecha sin partición propia para que ningún envío falle.
+Con los límites alineados al filtro de vigencia, Postgres descarta las demás
+particiones al planificar (partition pruning): las consultas del año en curso
+no se vuelven más lentas a medida que se acumulan años.
+
+Las particiones del año actual y del siguiente se crean al migrar (señal
+post_migrate) y con `python manage.py crear_particiones`, que conviene correr
+desde cron una vez al mes. Si al crear un año ya hay filas suyas en DEFAULT,
+se mueven a la partición nueva en la misma transacción.
+
+La conversión de la tabla existente está en la migración 0007.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import RegistroEncuesta
+
+
+TABLA = RegistroEncuesta._meta.db_table
+PARTICION_DEFAULT = f'{TABLA}_default'
+
+
+def nombre(anio):
+    return f'{TABLA}_{anio}'
+
+
+def limites(anio):
+    """Inicio (incluido) y fin (excluido) del año en la zona horaria del proyecto."""
+    zona = timezone.get_default_timezone()
+    return (
+        datetime.datetime(anio, 1, 1, tzinfo=zona),
+        datetime.datetime(anio + 1, 1, 1, tzinfo=zona),
+    )
+
+
+def particionada():
+    """True si la tabla de registros ya es una tabla particionada (migración 0007 aplicada)."""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLA])
+        fila = cursor.fetchone()
+    return fila is not None and fila[0] == 'p'
+
+
+def existentes():
+    """Años que ya tienen partición propia."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s)",
+            [TABLA],
+        )
+        nombres = [fila[0] for fila in cursor.fetchall()]
+    prefijo = f'{TABLA}_'
+    return sorted(int(n[len(prefijo):]) for n in nombres if n[len(prefijo):].isdigit())
+
+
+def crear(anio):
+    """
+    Crea la partición de un año. Las filas de ese año que hubieran caído en
+    DEFAULT pasan a la nueva partición antes de adjuntarla (Postgres no deja
+    crear una partición cuyo rango ya tiene filas en DEFAULT).
+    """
+    quote = connection.ops.quote_name
+    tabla, particion, default = quote(TABLA), quote(nombre(anio)), quote(PARTICION_DEFAULT)
+    desde, hasta = limites(anio)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [PARTICION_DEFAULT])
+        hay_default = cursor.fetchone()[0]
+        pendientes = False
+        if hay_default:
+            # Bloquea los envíos que caerían en DEFAULT mientras se mueven las filas
+            cursor.execute(f"LOCK TABLE {default} IN SHARE ROW EXCLUSIVE MODE")
+            cursor.execute(
+                f"SELECT EXISTS (SELECT 1 FROM {default} WHERE fecha_registro >= %s AND fecha_registro < %s)",
+                [desde, hasta],
+            )
+            pendientes = cursor.fetchone()[0]
+
+        if not pendientes:
+            cursor.execute(
+                f"CREATE TABLE {particion} PARTITION OF {tabla} FOR VALUES FROM (%s) TO (%s)",
+                [desde, hasta],
+            )
+            return 0
+
+        cursor.execute(f"CREATE TABLE {particion} (LIKE {tabla} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"WITH movidas AS (DELETE FROM {default} WHERE fecha_registro >= %s AND fecha_registro < %s RETURNING *) "
+            f"INSERT INTO {particion} SELECT * FROM movidas",
+            [desde, hasta],
+        )
+        movidas = cursor.rowcount
+        cursor.execute(f"ALTER TABLE {tabla} ATTACH PARTITION {particion} FOR VALUES FROM (%s) TO (%s)", [desde, hasta])
+        return movidas
+
+
+def asegurar(anios_adelante=1):
+    """
+    Crea las particiones que falten desde el año actual hasta `anios_adelante`
+    años después. Devuelve [(anio, filas movidas desde DEFAULT)] de las creadas.
+    """
+    if not particionada():
+        return []
+    actual = timezone.localdate().year
+    hay = set(existentes())
+    creadas = []
+    for anio in range(actual, actual + anios_adelante + 1):
+        if anio not in hay:
+            creadas.append((anio, crear(anio)))
+    return creadas
+
+
+def en_default():
+    """Filas en la partición DEFAULT por año (debería estar vacía)."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [PARTICION_DEFAULT])
+        if not cursor.fetchone()[0]:
+            return {}
+        cursor.execute(
+            f"SELECT EXTRACT(YEAR FROM fecha_registro AT TIME ZONE %s)::int, COUNT(*) "
+            f"FROM {connection.ops.quote_name(PARTICION_DEFAULT)} GROUP BY 1 ORDER BY 1",
+            [settings.TIME_ZONE],
+        )
+        return dict(cursor.fetchall())
+
+
+@receiver(post_migrate)
+def crear_al_migrar(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """Cada `migrate` deja lista la partición del año siguiente."""
+    if sender.name != 'formularios' or using != DEFAULT_DB_ALIAS:
+        return
+    asegurar()
@@ -0,0 +1,120 @@
+"""
+Publicación estática de la encuesta pública.
+
+El HTML de la encuesta solo cambia cuando cambia la empresa (marca, bloques,
+config_encuesta), así que se pre-renderiza y se guarda en el storage de media:
+
+    <ENCUESTAS_PUBLICADAS_DIR>/<slug>/index.html    -> /encuesta/<slug>/
+    <ENCUESTAS_PUBLICADAS_DIR>/<slug>/gracias.html  -> /encuesta/<slug>/gracias/
+
+El proxy o la CDN sirve esos archivos en las URLs de la derecha para los GET y
+manda a Django solo el POST del formulario (y /token/ y /logo/). Si un archivo no
+existe, el proxy debe caer en Django, que sigue sirviendo la encuesta dinámica.
+
+Las páginas publicadas no traen token CSRF: al cargar piden uno a
+/encuesta/<slug>/token/. El logo apunta a /encuesta/<slug>/logo/ (y al WebP
+con ?formato=webp), que redirige a una URL firmada vigente.
+
+Se publica al guardar la empresa (si ENCUESTAS_PUBLICADAS está activo) y con
+`python manage.py publicar_encuestas`, que hay que correr en cada despliegue
+que cambie las plantillas o los estáticos: las páginas guardan la URL con hash
+de static/css/app.css del momento en que se publicaron (la versión anterior
+sigue en el bucket, así que no se rompen, pero se ven con el CSS viejo).
+"""
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.template.loader import render_to_string
+
+from empresas.models import EmpresaCliente
+from .esquema import EsquemaEncuesta
+
+logger = logging.getLogger(__name__)
+
+
+# Archivo publicado -> (plantilla, método del esquema que arma su contexto)
+PAGINAS = {
+    'index.html': ('formularios/encuesta_publica.html', 'contexto'),
+    'gracias.html': ('formularios/gracias.html', 'contexto_gracias'),
+}
+
+
+def ruta(slug, archivo):
+    return f'{settings.ENCUESTAS_PUBLICADAS_DIR}/{slug}/{archivo}'
+
+
+def renderizar(empresa):
+    """HTML de cada página publicada de la empresa: {archivo: html}."""
+    esquema = EsquemaEncuesta(empresa, version=None)
+    return {
+        archivo: render_to_string(plantilla, getattr(esquema, metodo)(publicado=True))
+        for archivo, (plantilla, metodo) in PAGINAS.items()
+    }
+
+
+def publicar(empresa):
+    """
+    Publica (o re-publica) las páginas de la empresa. Si la empresa está
+    inactiva, las retira para que el proxy caiga en Django y responda 404.
+    Devuelve las rutas escritas en el storage.
+    """
+    if not empresa.activo:
+        retirar(empresa.slug)
+        return []
+
+    rutas = []
+    for archivo, html in renderizar(empresa).items():
+        destino = ruta(empresa.slug, archivo)
+        # MediaStorage no sobrescribe (file_overwrite=False): se borra antes para conservar el nombre
+        if default_storage.exists(destino):
+            default_storage.delete(destino)
+        rutas.append(default_storage.save(destino, ContentFile(html.encode('utf8'))))
+    return rutas
+
+
+def retirar(slug):
+    """Borra las páginas publicadas de un slug (si existen)."""
+    for archivo in PAGINAS:
+        destino = ruta(slug, archivo)
+        if default_storage.exists(destino):
+            default_storage.delete(destino)
+
+
+def _publicar_tras_commit(empresa_id, slug_anterior):
+    try:
+        if slug_anterior:
+            retirar(slug_anterior)
+        empresa = EmpresaCliente.objects.filter(id=empresa_id).first()
+        if empresa is not None:
+            publicar(empresa)
+    except Exception:
+        # Publicar no debe impedir guardar la empresa: la versión dinámica sigue funcionando
+        logger.exception('No se pudo publicar la encuesta de la empresa %s', empresa_id)
+
+
+@receiver(pre_save, sender=EmpresaCliente)
+def _recordar_slug(sender, instance, **kwargs):
+    # Si el slug cambia hay que retirar las páginas del slug viejo
+    instance._slug_publicado = None
+    if settings.ENCUESTAS_PUBLICADAS and instance.pk:
+        instance._slug_publicado = EmpresaCliente.objects.filter(pk=instance.pk).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=EmpresaCliente)
+def _empresa_guardada(sender, instance, **kwargs):
+    if not settings.ENCUESTAS_PUBLICADAS:
+        return
+    anterior = getattr(instance, '_slug_publicado', None)
+    slug_anterior = anterior if anterior and anterior != instance.slug else None
+    transaction.on_commit(lambda: _publicar_tras_commit(instance.id, slug_anterior))
+
+
+@receiver(post_delete, sender=EmpresaCliente)
+def _empresa_borrada(sender, instance, **kwargs):
+    if settings.ENCUESTAS_PUBLICADAS:
+        transaction.on_commit(lambda: retirar(instance.slug))
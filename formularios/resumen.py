@@ -0,0 +1,292 @@
+"""
+Resumen diario de respuestas (rollup).
+
+Mantiene, por empresa, día, tipo de tercero, pregunta y valor, cuántas
+respuestas se han recibido. Los tableros leen de aquí en lugar de recontar
+el JSON de cada `RegistroEncuesta` en cada visita. Con cada envío se
+actualiza también el índice de vigencias (`VigenciaEmpresa`); al borrar
+registros (RegistroEncuesta.delete o un QuerySet) se descuentan de ambos.
+"""
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from empresas.models import EmpresaCliente
+from .models import ResumenDiario, VigenciaEmpresa
+from . import catalogo
+
+
+# Filas por sentencia INSERT al volcar conteos
+TAMANO_LOTE = 500
+
+
+def preguntas_resumibles(empresa):
+    """
+    Claves de respuestas_data que se acumulan para una empresa. Incluye los
+    bloques no contratados para que activarlos después no exija reconstruir.
+    """
+    return [p['name'] for p in catalogo.catalogo_preguntas(empresa, solo_activas=False)]
+
+
+def contar_registros(empresa, registros, conteos=None):
+    """
+    Cuenta los registros de una empresa en un Counter con claves
+    (empresa_id, fecha, tipo_tercero, pregunta, valor).
+    """
+    if conteos is None:
+        conteos = Counter()
+    preguntas = preguntas_resumibles(empresa)
+    max_valor = ResumenDiario._meta.get_field('valor').max_length
+
+    for reg in registros:
+        fecha = timezone.localdate(reg.fecha_registro)
+        base = (empresa.id, fecha, reg.tipo_tercero)
+        conteos[base + (ResumenDiario.PREGUNTA_TOTAL, '')] += 1
+
+        data = reg.respuestas_data or {}
+        for pregunta in preguntas:
+            valor = data.get(pregunta)
+            if isinstance(valor, str) and valor:
+                conteos[base + (pregunta, valor[:max_valor])] += 1
+
+    return conteos
+
+
+def guardar_conteos(conteos):
+    """
+    Suma los conteos en la tabla de resumen con un único UPSERT por lote.
+    Las filas se ordenan para que envíos concurrentes bloqueen en el mismo orden.
+    """
+    tabla = connection.ops.quote_name(ResumenDiario._meta.db_table)
+    filas = sorted(conteos.items())
+
+    with connection.cursor() as cursor:
+        for inicio in range(0, len(filas), TAMANO_LOTE):
+            lote = filas[inicio:inicio + TAMANO_LOTE]
+            placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(lote))
+            params = []
+            for clave, cantidad in lote:
+                params.extend(clave)
+                params.append(cantidad)
+            cursor.execute(
+                f"INSERT INTO {tabla} (empresa_id, fecha, tipo_tercero, pregunta, valor, cantidad) "
+                f"VALUES {placeholders} "
+                f"ON CONFLICT (empresa_id, fecha, tipo_tercero, pregunta, valor) "
+                f"DO UPDATE SET cantidad = {tabla}.cantidad + EXCLUDED.cantidad",
+                params,
+            )
+
+
+def contar_vigencias(empresa, registros, vigencias=None):
+    """
+    Agrupa los registros de una empresa por año local en un dict
+    {(empresa_id, anio): [envíos, primera fecha, última fecha]}.
+    """
+    if vigencias is None:
+        vigencias = {}
+    for reg in registros:
+        clave = (empresa.id, timezone.localdate(reg.fecha_registro).year)
+        _sumar_vigencia(vigencias, clave, 1, reg.fecha_registro, reg.fecha_registro)
+    return vigencias
+
+
+def _sumar_vigencia(vigencias, clave, total, primera, ultima):
+    actual = vigencias.get(clave)
+    if actual is None:
+        vigencias[clave] = [total, primera, ultima]
+    else:
+        actual[0] += total
+        actual[1] = min(actual[1], primera)
+        actual[2] = max(actual[2], ultima)
+
+
+def guardar_vigencias(vigencias):
+    """Suma las vigencias al índice con un único UPSERT (filas ordenadas, como el resumen)."""
+    if not vigencias:
+        return
+    tabla = connection.ops.quote_name(VigenciaEmpresa._meta.db_table)
+    filas = sorted(vigencias.items())
+    params = []
+    for (empresa_id, anio), (total, primera, ultima) in filas:
+        params.extend([empresa_id, anio, total, primera, ultima])
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {tabla} (empresa_id, anio, total, primera, ultima) "
+            f"VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(filas))} "
+            f"ON CONFLICT (empresa_id, anio) DO UPDATE SET "
+            f"total = {tabla}.total + EXCLUDED.total, "
+            f"primera = LEAST({tabla}.primera, EXCLUDED.primera), "
+            f"ultima = GREATEST({tabla}.ultima, EXCLUDED.ultima)",
+            params,
+        )
+
+
+def acumular(empresa, registros):
+    """Agrega nuevos registros de una empresa al resumen y al índice de vigencias."""
+    conteos = contar_registros(empresa, registros)
+    if conteos:
+        guardar_conteos(conteos)
+    guardar_vigencias(contar_vigencias(empresa, registros))
+
+
+def descontar(registros):
+    """
+    Resta del resumen y del total de cada vigencia registros que se van a
+    borrar, de una o varias empresas. Devuelve las empresas afectadas, para
+    `ajustar_vigencias` después del borrado.
+    """
+    empresas = {}
+    conteos = Counter()
+    vigencias = {}
+    for reg in registros:
+        empresa = empresas.get(reg.empresa_id)
+        if empresa is None:
+            empresa = empresas[reg.empresa_id] = EmpresaCliente.objects.get(pk=reg.empresa_id)
+        contar_registros(empresa, [reg], conteos)
+        contar_vigencias(empresa, [reg], vigencias)
+
+    # Filas ordenadas, como al sumar: los borrados y los envíos concurrentes bloquean en el mismo orden
+    with connection.cursor() as cursor:
+        tabla = connection.ops.quote_name(ResumenDiario._meta.db_table)
+        filas = sorted(conteos.items())
+        for inicio in range(0, len(filas), TAMANO_LOTE):
+            lote = filas[inicio:inicio + TAMANO_LOTE]
+            params = []
+            for clave, cantidad in lote:
+                params.extend(clave)
+                params.append(cantidad)
+            cursor.execute(
+                f"UPDATE {tabla} AS r SET cantidad = GREATEST(r.cantidad - v.cantidad, 0) "
+                f"FROM (VALUES {', '.join(['(%s::bigint, %s::date, %s, %s, %s, %s::integer)'] * len(lote))}) "
+                f"AS v (empresa_id, fecha, tipo_tercero, pregunta, valor, cantidad) "
+                f"WHERE (r.empresa_id, r.fecha, r.tipo_tercero, r.pregunta, r.valor) "
+                f"= (v.empresa_id, v.fecha, v.tipo_tercero, v.pregunta, v.valor)",
+                params,
+            )
+
+        tabla = connection.ops.quote_name(VigenciaEmpresa._meta.db_table)
+        filas = sorted(vigencias.items())
+        if filas:
+            params = []
+            for (empresa_id, anio), (total, _, _) in filas:
+                params.extend([empresa_id, anio, total])
+            cursor.execute(
+                f"UPDATE {tabla} AS t SET total = GREATEST(t.total - v.total, 0) "
+                f"FROM (VALUES {', '.join(['(%s::bigint, %s::integer, %s::integer)'] * len(filas))}) "
+                f"AS v (empresa_id, anio, total) "
+                f"WHERE t.empresa_id = v.empresa_id AND t.anio = v.anio",
+                params,
+            )
+
+    ResumenDiario.objects.filter(empresa_id__in=empresas, cantidad=0).delete()
+    return list(empresas.values())
+
+
+def ajustar_vigencias(empresas):
+    """
+    Después de borrar registros: quita las vigencias que quedaron sin envíos y
+    recalcula su primer y último envío. Los totales ya los restó `descontar`
+    (así no se pierden los envíos que lleguen mientras tanto).
+    """
+    for empresa in empresas:
+        reales = vigencias_reales(empresa)
+        for vigencia in VigenciaEmpresa.objects.filter(empresa=empresa):
+            real = reales.get((empresa.id, vigencia.anio))
+            if real is None:
+                vigencia.delete()
+            elif (vigencia.primera, vigencia.ultima) != (real[1], real[2]):
+                vigencia.primera, vigencia.ultima = real[1], real[2]
+                vigencia.save(update_fields=['primera', 'ultima'])
+
+
+def vigencias_reales(empresa):
+    """
+    El índice de vigencias calculado desde cero: una consulta agregada sobre
+    la tabla más el índice de cada vigencia archivada (sin leer sus archivos).
+    """
+    vigencias = {}
+    filas = empresa.registros.annotate(anio=ExtractYear('fecha_registro')).values('anio').annotate(
+        total=Count('id'), primera=Min('fecha_registro'), ultima=Max('fecha_registro')
+    ).order_by()
+    for fila in filas:
+        _sumar_vigencia(vigencias, (empresa.id, fila['anio']), fila['total'], fila['primera'], fila['ultima'])
+    # Un año archivado puede tener además filas en la tabla (envíos tardíos)
+    for archivado in empresa.archivos.all():
+        if archivado.total:
+            _sumar_vigencia(
+                vigencias, (empresa.id, archivado.anio), archivado.total,
+                min(parse_datetime(bloque['desde']) for bloque in archivado.indice),
+                max(parse_datetime(bloque['hasta']) for bloque in archivado.indice),
+            )
+    return vigencias
+
+
+def reconstruir_vigencias(empresa):
+    """Rehace el índice de vigencias de una empresa. Devuelve cuántas vigencias quedaron."""
+    vigencias = vigencias_reales(empresa)
+    with transaction.atomic():
+        VigenciaEmpresa.objects.filter(empresa=empresa).delete()
+        guardar_vigencias(vigencias)
+    return len(vigencias)
+
+
+def conteos_vacios():
+    """Conteos de una vigencia sin envíos, con la misma forma que `conteos_vigencia`."""
+    return _agrupar_conteos([])
+
+
+def conteos_vigencia(empresa, anio=None, excluir=()):
+    """
+    Devuelve los conteos de un año (o de toda la historia si anio es None,
+    salvo los años en `excluir`) para una empresa en una sola consulta:
+    {'total': int, 'por_tipo': {tipo: n}, 'respuestas': {pregunta: {valor: n}}}
+    """
+    return _agrupar_conteos(_filas_vigencia(empresa, anio, excluir))
+
+
+async def aconteos_vigencia(empresa, anio=None):
+    """`conteos_vigencia` con el ORM async, para las vistas async."""
+    return _agrupar_conteos([fila async for fila in _filas_vigencia(empresa, anio)])
+
+
+def _filas_vigencia(empresa, anio, excluir=()):
+    filas = ResumenDiario.objects.filter(empresa=empresa)
+    if anio is not None:
+        filas = filas.filter(fecha__year=anio)
+    if excluir:
+        filas = filas.exclude(fecha__year__in=excluir)
+    return filas.values('tipo_tercero', 'pregunta', 'valor').annotate(n=Sum('cantidad')).order_by()
+
+
+def _agrupar_conteos(filas):
+    resultado = {'total': 0, 'por_tipo': {}, 'respuestas': {}}
+    for fila in filas:
+        if fila['pregunta'] == ResumenDiario.PREGUNTA_TOTAL:
+            resultado['total'] += fila['n']
+            tipo = fila['tipo_tercero']
+            resultado['por_tipo'][tipo] = resultado['por_tipo'].get(tipo, 0) + fila['n']
+        else:
+            valores = resultado['respuestas'].setdefault(fila['pregunta'], {})
+            valores[fila['valor']] = valores.get(fila['valor'], 0) + fila['n']
+
+    return resultado
+
+
+def conteos_rango(empresa, tipo=None, desde=None, hasta=None):
+    """
+    `conteos_vigencia` de un tipo de tercero y rango de fechas locales (ambos
+    extremos incluidos), en una sola consulta.
+    """
+    filas = ResumenDiario.objects.filter(empresa=empresa)
+    if tipo:
+        filas = filas.filter(tipo_tercero=tipo)
+    if desde:
+        filas = filas.filter(fecha__gte=desde)
+    if hasta:
+        filas = filas.filter(fecha__lte=hasta)
+    return _agrupar_conteos(filas.values('tipo_tercero', 'pregunta', 'valor').annotate(n=Sum('cantidad')).order_by())
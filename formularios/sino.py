@@ -0,0 +1,93 @@
+"""
+Respuestas SI / NO compactas.
+
+Casi todas las respuestas de la encuesta son "SI" o "NO". Además de guardarse
+en respuestas_data, cada registro las lleva en tres máscaras de bits:
+
+    respuestas_si           bit i = 1 si la pregunta i se respondió "SI"
+    respuestas_no           bit i = 1 si se respondió "NO"
+    respuestas_contestadas  bit i = 1 si la pregunta está en respuestas_data (con cualquier valor)
+
+El bit de cada pregunta es su posición en EmpresaCliente.indice_preguntas. La
+lista solo crece: una pregunta que sale de la configuración conserva su bit, y
+una nueva toma el siguiente libre, así que las máscaras ya guardadas siguen
+siendo válidas. Contar los SI de una pregunta es sumar un bit de un entero, sin
+decodificar el JSON de cada fila (ver catalogo.estadisticas_registros). Así se
+cuentan las respuestas de una búsqueda por nombre en la tabla de registros,
+que el resumen diario no puede responder (dashboard/paginacion.py).
+
+Las máscaras se llenan al guardar el registro (señal pre_save) y al vaciar el
+spool (bulk_create no dispara señales). Mientras una empresa no tiene índice,
+las estadísticas leen el JSON: el índice de las empresas con registros previos
+lo crea `python manage.py rellenar_respuestas_sino`, que a la vez rellena las
+máscaras de esos registros.
+"""
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+
+from empresas.models import EmpresaCliente
+from .models import RegistroEncuesta
+from . import catalogo
+
+
+# BigInteger con signo: los bits 0..62 no tocan el signo
+LIMITE_BITS = 63
+
+
+def indice(empresa):
+    """Bit de cada pregunta de la empresa: {nombre: bit}. Vacío si aún no tiene índice."""
+    return {nombre: bit for bit, nombre in enumerate(empresa.indice_preguntas or []) if bit < LIMITE_BITS}
+
+
+def extender_indice(empresa):
+    """
+    Agrega al índice de la empresa (sin guardarla) las preguntas del catálogo,
+    incluidos los bloques no contratados, que aún no tienen bit. Devuelve True
+    si el índice cambió.
+    """
+    actual = list(empresa.indice_preguntas or [])
+    conocidas = set(actual)
+    nuevas = [
+        pregunta['name'] for pregunta in catalogo.catalogo_preguntas(empresa, solo_activas=False)
+        if pregunta['name'] not in conocidas
+    ]
+    if not nuevas:
+        return False
+    empresa.indice_preguntas = actual + nuevas
+    return True
+
+
+def mascaras(indice_empresa, respuestas_data):
+    """(si, no, contestadas) de un respuestas_data según el índice de la empresa."""
+    si = no = contestadas = 0
+    data = respuestas_data or {}
+    for nombre, bit in indice_empresa.items():
+        if nombre not in data:
+            continue
+        contestadas |= 1 << bit
+        valor = data[nombre]
+        if valor == 'SI':
+            si |= 1 << bit
+        elif valor == 'NO':
+            no |= 1 << bit
+    return si, no, contestadas
+
+
+def completar(registro, indice_empresa):
+    """Calcula las máscaras del registro (sin guardarlo)."""
+    registro.respuestas_si, registro.respuestas_no, registro.respuestas_contestadas = mascaras(
+        indice_empresa, registro.respuestas_data
+    )
+
+
+@receiver(pre_save, sender=RegistroEncuesta)
+def _registro_guardado(sender, instance, **kwargs):
+    completar(instance, indice(instance.empresa))
+
+
+@receiver(pre_save, sender=EmpresaCliente)
+def _empresa_guardada(sender, instance, **kwargs):
+    # Empresas nuevas nacen con índice; las que ya tienen registros lo reciben de
+    # rellenar_respuestas_sino, que también rellena las máscaras de esos registros
+    if instance.pk is None or instance.indice_preguntas:
+        extender_indice(instance)
@@ -0,0 +1,192 @@
+"""
+Spool de envíos (write-behind) para campañas masivas.
+
+Con SPOOL_ENCUESTAS activo, el POST de la encuesta no escribe en Postgres:
+guarda el envío ya sanitizado en un diario SQLite local (SPOOL_ENCUESTAS_DB)
+con fsync al confirmar, y responde de inmediato. El proceso
+`python manage.py vaciar_spool` lee el diario por lotes, inserta con
+bulk_create, actualiza el resumen diario y recién entonces borra las filas
+del diario.
+
+Cada envío lleva un UUID (RegistroEncuesta.spool_id). Si el proceso cae entre
+el commit en Postgres y el borrado del diario, al reintentar esos envíos se
+reconocen por su spool_id y no se duplican (ni se cuentan dos veces en el resumen).
+"""
+import ipaddress
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from empresas.models import EmpresaCliente
+from .models import RegistroEncuesta
+from . import resumen, sino
+
+logger = logging.getLogger(__name__)
+
+
+# Envíos por viaje a Postgres
+TAMANO_LOTE = 500
+
+# Clave del candado de Postgres que serializa a los procesos que vacían el spool
+CANDADO_VACIADO = 730_412_001
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS envios (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    spool_id TEXT NOT NULL UNIQUE,
+    datos TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS envios_fallidos (
+    spool_id TEXT PRIMARY KEY,
+    datos TEXT NOT NULL,
+    error TEXT NOT NULL
+);
+"""
+
+_local = threading.local()
+
+
+def activo():
+    return settings.SPOOL_ENCUESTAS
+
+
+def _conexion():
+    # Una conexión por hilo y proceso (sqlite3 no se comparte entre hilos ni sobrevive a un fork)
+    conexion = getattr(_local, 'conexion', None)
+    if conexion is None or _local.pid != os.getpid() or _local.ruta != settings.SPOOL_ENCUESTAS_DB:
+        ruta = settings.SPOOL_ENCUESTAS_DB
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        conexion = sqlite3.connect(ruta, timeout=10, isolation_level=None, check_same_thread=False)
+        conexion.execute('PRAGMA journal_mode=WAL')
+        # FULL: cada envío confirmado ya está en disco antes de responder al respondiente
+        conexion.execute('PRAGMA synchronous=FULL')
+        conexion.executescript(ESQUEMA)
+        _local.conexion, _local.pid, _local.ruta = conexion, os.getpid(), ruta
+    return conexion
+
+
+def encolar(empresa, tipo_tercero, nombre_respondiente, area, cargo, respuestas_data, ip_origen):
+    """Guarda un envío en el diario local y devuelve su spool_id."""
+    spool_id = str(uuid.uuid4())
+    try:
+        # Una IP inválida (X-Forwarded-For manipulado) haría fallar el lote entero al vaciar
+        ip_origen = str(ipaddress.ip_address(ip_origen)) if ip_origen else None
+    except ValueError:
+        ip_origen = None
+    datos = {
+        'empresa_id': empresa.id,
+        'tipo_tercero': tipo_tercero,
+        'nombre_respondiente': nombre_respondiente,
+        'area': area,
+        'cargo': cargo,
+        'respuestas_data': respuestas_data,
+        'ip_origen': ip_origen,
+        'fecha_registro': timezone.now().isoformat(),
+    }
+    _conexion().execute(
+        'INSERT INTO envios (spool_id, datos) VALUES (?, ?)',
+        (spool_id, json.dumps(datos, ensure_ascii=False)),
+    )
+    return spool_id
+
+
+def pendientes():
+    """Número de envíos que esperan en el diario."""
+    return _conexion().execute('SELECT COUNT(*) FROM envios').fetchone()[0]
+
+
+def _registro(spool_id, datos):
+    return RegistroEncuesta(
+        spool_id=uuid.UUID(spool_id),
+        empresa_id=datos['empresa_id'],
+        tipo_tercero=datos['tipo_tercero'],
+        nombre_respondiente=datos['nombre_respondiente'],
+        area=datos['area'],
+        cargo=datos['cargo'],
+        respuestas_data=datos['respuestas_data'],
+        ip_origen=datos['ip_origen'],
+        fecha_registro=parse_datetime(datos['fecha_registro']),
+    )
+
+
+def vaciar_lote(tamano=TAMANO_LOTE):
+    """
+    Pasa a Postgres el lote más antiguo del diario. Devuelve (leídos, insertados):
+    los leídos que no se insertan ya estaban en la base (reintento tras una caída).
+    """
+    conexion = _conexion()
+    filas = conexion.execute('SELECT id, spool_id, datos FROM envios ORDER BY id LIMIT ?', (tamano,)).fetchall()
+    if not filas:
+        return 0, 0
+
+    registros = {spool_id: _registro(spool_id, json.loads(datos)) for _, spool_id, datos in filas}
+
+    try:
+        insertados = _insertar(list(registros.values()), tamano)
+    except (DataError, IntegrityError):
+        # Algún envío no entra (dato inválido): se insertan de a uno y los que fallan se apartan.
+        # Los errores de conexión (Postgres caído) no llegan aquí: el lote queda en el diario.
+        logger.exception('Falló el lote del spool; se reintenta envío por envío')
+        insertados = 0
+        for spool_id, registro in registros.items():
+            try:
+                insertados += _insertar([registro], tamano)
+            except (DataError, IntegrityError) as exc:
+                logger.error('Envío %s apartado en envios_fallidos: %s', spool_id, exc)
+                conexion.execute(
+                    'INSERT OR REPLACE INTO envios_fallidos (spool_id, datos, error) '
+                    'SELECT spool_id, datos, ? FROM envios WHERE spool_id = ?',
+                    (str(exc)[:2000], spool_id),
+                )
+
+    # Solo después del commit en Postgres se borran del diario
+    conexion.execute('DELETE FROM envios WHERE id <= ?', (filas[-1][0],))
+    return len(filas), insertados
+
+
+def _insertar(registros, tamano):
+    """Inserta los registros que aún no están en la base y los suma al resumen. Devuelve cuántos insertó."""
+    with transaction.atomic():
+        # Un solo proceso vaciando a la vez: así el filtro de ya existentes no tiene carreras
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [CANDADO_VACIADO])
+
+        existentes = set(RegistroEncuesta.objects.filter(
+            spool_id__in=[r.spool_id for r in registros]
+        ).values_list('spool_id', flat=True))
+        empresas = EmpresaCliente.objects.in_bulk({r.empresa_id for r in registros})
+
+        nuevos = []
+        for registro in registros:
+            if registro.spool_id in existentes:
+                continue
+            if registro.empresa_id not in empresas:
+                logger.warning('Envío %s descartado: la empresa %s ya no existe', registro.spool_id, registro.empresa_id)
+                continue
+            nuevos.append(registro)
+
+        if nuevos:
+            # bulk_create no dispara pre_save: las máscaras SI/NO se calculan aquí
+            for registro in nuevos:
+                sino.completar(registro, sino.indice(empresas[registro.empresa_id]))
+            RegistroEncuesta.objects.bulk_create(nuevos, batch_size=tamano)
+
+            # Resumen diario: una sola pasada por empresa
+            por_empresa = defaultdict(list)
+            for registro in nuevos:
+                por_empresa[registro.empresa_id].append(registro)
+            for empresa_id, registros_empresa in por_empresa.items():
+                resumen.acumular(empresas[empresa_id], registros_empresa)
+
+    return len(nuevos)
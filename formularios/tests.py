@@ -1,3 +1,645 @@
-from django.test import TestCase
+import datetime
+import importlib
+import io
+import json
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.storage import FileSystemStorage
+from django.core.management import CommandError, call_command
+from django.apps import apps
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.tests import ConLimitadorTemporal
+from empresas.models import EmpresaCliente
+from .management.commands import generar_datos_prueba
+from .models import RegistroEncuesta, ResumenDiario, VigenciaEmpresa
+from . import archivo, catalogo, esquema, particiones, resumen, sino, spool
+
+
+class ConMediaTemporal:
+    """Los archivos que escriben las pruebas van a un directorio temporal."""
+
+    @classmethod
+    def setUpClass(cls):
+        # Antes de super(): setUpTestData también puede escribir archivos
+        media = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=media))
+        super().setUpClass()
+
+
+def crear_registros(empresa, respuestas, tipo='CLIENTE', nombre='Persona'):
+    """Un registro por cada respuestas_data, guardados uno a uno (como la vista) y sumados al resumen."""
+    registros = []
+    for i, data in enumerate(respuestas):
+        registro = RegistroEncuesta.objects.create(
+            empresa=empresa, tipo_tercero=tipo, nombre_respondiente=f'{nombre} {i}',
+            area='Ventas', cargo='Analista', respuestas_data=data,
+        )
+        registros.append(registro)
+    resumen.acumular(empresa, registros)
+    return registros
+
+
+class RespuestasSinoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = EmpresaCliente.objects.create(
+            nombre='Acme', slug='acme', tiene_ptee=True,
+            config_encuesta={'preguntas_seccion1': [{'name': 'p_extra', 'texto': '¿Extra?'}]},
+        )
+        cls.registros = crear_registros(cls.empresa, [
+            {'p5_sagrilaft_conoce': 'SI', 'p9_ptee_conoce': 'NO', 'p_extra': 'SI'},
+            {'p5_sagrilaft_conoce': 'NO', 'p9_ptee_conoce': 'NO RECUERDA'},
+            {'p5_sagrilaft_conoce': 'SI', 'p6_sagrilaft_actualizado': 'SI'},
+            {},
+        ])
+        cls.preguntas = catalogo.catalogo_preguntas(cls.empresa)
+
+    def test_empresa_nueva_nace_con_indice(self):
+        self.assertEqual(
+            set(sino.indice(self.empresa)),
+            {pregunta['name'] for pregunta in catalogo.catalogo_preguntas(self.empresa, solo_activas=False)},
+        )
+
+    def test_mascaras_al_guardar(self):
+        indice = sino.indice(self.empresa)
+        registro = self.registros[1]
+        registro.refresh_from_db()
+        self.assertEqual(registro.respuestas_no, 1 << indice['p5_sagrilaft_conoce'])
+        self.assertEqual(registro.respuestas_si, 0)
+        # Un valor distinto de SI / NO cuenta como contestada
+        self.assertEqual(
+            registro.respuestas_contestadas,
+            (1 << indice['p5_sagrilaft_conoce']) | (1 << indice['p9_ptee_conoce']),
+        )
+
+    def test_estadisticas_por_mascaras_igual_que_por_json(self):
+        registros = self.empresa.registros.all()
+        por_json = catalogo.estadisticas_registros(registros, self.preguntas)
+        por_bits = catalogo.estadisticas_registros(registros, self.preguntas, sino.indice(self.empresa))
+        self.assertEqual(por_bits, por_json)
+        self.assertEqual(por_bits['p5_sagrilaft_conoce'], {'si': 2, 'no': 1, 'sin_respuesta': 1})
+        self.assertEqual(por_bits['p9_ptee_conoce'], {'si': 0, 'no': 1, 'sin_respuesta': 2})
+
+    def test_sumar_estadisticas_en_memoria(self):
+        vacias = catalogo.estadisticas_resumen(resumen.conteos_vacios(), self.preguntas)
+        en_memoria = catalogo.sumar_estadisticas(vacias, self.registros, self.preguntas)
+        self.assertEqual(en_memoria, catalogo.estadisticas_registros(self.empresa.registros.all(), self.preguntas))
+
+    def test_resumen_igual_que_registros(self):
+        self.assertEqual(
+            catalogo.estadisticas_resumen(resumen.conteos_rango(self.empresa), self.preguntas),
+            catalogo.estadisticas_registros(self.empresa.registros.all(), self.preguntas),
+        )
+
+
+@override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'compartida': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pruebas-esquema'},
+    },
+    SPOOL_ENCUESTAS=False,
+)
+class EsquemaEncuestaTests(ConLimitadorTemporal, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = EmpresaCliente.objects.create(
+            nombre='Acme', slug='acme', tiene_ptee=True, email_soporte='soporte@acme.co',
+            config_encuesta={
+                'tipos_tercero': [{'value': 'ACCIONISTA', 'label': 'Accionista'}],
+                'preguntas_seccion1': [{'name': 'p_extra', 'texto': '¿Extra?'}],
+            },
+        )
+
+    def setUp(self):
+        super().setUp()
+        esquema.invalidar()
+
+    def test_cache_compartida_guarda_solo_campos(self):
+        esquema.obtener('acme')
+        clave = f'esquema_encuesta:{esquema.FORMATO}:{esquema.version_actual()}:acme'
+        campos = caches['compartida'].get(clave)
+        self.assertEqual(tuple(campos), esquema.CAMPOS_EMPRESA)
+        self.assertTrue(all(isinstance(valor, (int, str, bool, dict, list)) for valor in campos.values()))
+
+    def test_otro_proceso_rearma_la_empresa_sin_consultas(self):
+        esquema.obtener('acme')
+        esquema._esquemas.clear()
+        with self.assertNumQueries(0):
+            compilado = esquema.obtener('acme')
+            contexto = compilado.contexto()
+        self.assertEqual(compilado.empresa.pk, self.empresa.pk)
+        self.assertEqual(contexto['empresa'].email_soporte, 'soporte@acme.co')
+        self.assertEqual(compilado.secciones, {'info_general': 1, 'sagrilaft': 2, 'ptee': 3, 'observaciones': 4})
+        self.assertEqual(sino.indice(compilado.empresa), sino.indice(self.empresa))
+        self.assertEqual(compilado.tipos_validos, {'ACCIONISTA'})
+
+    def test_envio_con_tipo_de_tercero_ajeno_se_rechaza(self):
+        url = reverse('ver_encuesta', args=['acme'])
+        datos = {'nombre': 'Ana', 'p5_sagrilaft_conoce': 'SI', 'p_extra': 'NO'}
+        with self.assertLogs('core.sql', 'INFO'):
+            rechazado = self.client.post(url, {**datos, 'tipo_tercero': 'CLIENTE'})
+            aceptado = self.client.post(url, {**datos, 'tipo_tercero': 'ACCIONISTA'})
+        self.assertEqual(rechazado.status_code, 400)
+        self.assertRedirects(aceptado, reverse('encuesta_exito', args=['acme']), fetch_redirect_response=False)
+        registro = RegistroEncuesta.objects.get()
+        self.assertEqual(registro.tipo_tercero, 'ACCIONISTA')
+        # El envío se guarda con la empresa rearmada: máscaras SI/NO y resumen al día
+        indice = sino.indice(self.empresa)
+        self.assertEqual(registro.respuestas_si, 1 << indice['p5_sagrilaft_conoce'])
+        self.assertEqual(registro.respuestas_no, 1 << indice['p_extra'])
+        self.assertEqual(
+            catalogo.estadisticas_resumen(resumen.conteos_rango(self.empresa), catalogo.catalogo_preguntas(self.empresa)),
+            catalogo.estadisticas_registros(self.empresa.registros.all(), catalogo.catalogo_preguntas(self.empresa)),
+        )
+
+
+class GenerarDatosPruebaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'generar_datos_prueba', empresas=4, registros=300, anios=3, semilla=7, lote=50, stdout=io.StringIO(),
+        )
+        cls.empresas = list(EmpresaCliente.objects.filter(slug__startswith=generar_datos_prueba.PREFIJO_SLUG))
+
+    def test_combinaciones_de_aliado_y_bloques(self):
+        campos = ('aliado', 'tiene_sagrilaft', 'tiene_sarlaft', 'tiene_ptee')
+        self.assertEqual(
+            {tuple(getattr(empresa, campo) for campo in campos) for empresa in self.empresas},
+            {tuple(perfil[campo] for campo in campos) for perfil in generar_datos_prueba.PERFILES},
+        )
+        personalizadas = [empresa for empresa in self.empresas if empresa.config_encuesta]
+        self.assertEqual(len(personalizadas), 1)
+        self.assertEqual(personalizadas[0].config_encuesta, generar_datos_prueba.CONFIG_PERSONALIZADA)
+
+    def test_registros_repartidos_en_varios_anios(self):
+        registros = RegistroEncuesta.objects.filter(empresa__in=self.empresas)
+        self.assertAlmostEqual(registros.count(), 300, delta=len(self.empresas))
+        self.assertGreater(len(registros.dates('fecha_registro', 'year')), 1)
+
+    def test_resumen_y_mascaras_coinciden_con_un_reconteo(self):
+        for empresa in self.empresas:
+            with self.subTest(empresa=empresa.slug):
+                preguntas = catalogo.catalogo_preguntas(empresa, solo_activas=False)
+                directo = catalogo.estadisticas_registros(empresa.registros.all(), preguntas)
+                self.assertGreater(directo['total'], 0)
+                self.assertEqual(catalogo.estadisticas_resumen(resumen.conteos_vigencia(empresa), preguntas), directo)
+                self.assertEqual(
+                    catalogo.estadisticas_registros(empresa.registros.all(), preguntas, sino.indice(empresa)), directo,
+                )
+                self.assertEqual(
+                    {(v.empresa_id, v.anio): [v.total, v.primera, v.ultima] for v in VigenciaEmpresa.objects.filter(empresa=empresa)},
+                    resumen.vigencias_reales(empresa),
+                )
+
+                indice = sino.indice(empresa)
+                for registro in empresa.registros.all():
+                    self.assertEqual(
+                        (registro.respuestas_si, registro.respuestas_no, registro.respuestas_contestadas),
+                        sino.mascaras(indice, registro.respuestas_data),
+                    )
+
+
+class ArchivoVigenciaTests(ConMediaTemporal, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = EmpresaCliente.objects.create(nombre='Acme', slug='acme')
+        cls.anio = timezone.localdate().year - 1
+        inicio = timezone.make_aware(datetime.datetime(cls.anio, 1, 1, 8))
+        RegistroEncuesta.objects.bulk_create([
+            RegistroEncuesta(
+                empresa=cls.empresa, tipo_tercero='PROVEEDOR' if i % 3 == 0 else 'CLIENTE',
+                nombre_respondiente='José Pérez' if i % 4 == 0 else f'Persona {i}', area='Ventas', cargo='Analista',
+                respuestas_data={'p5_sagrilaft_conoce': 'SI'}, fecha_registro=inicio + datetime.timedelta(days=3 * i),
+            )
+            for i in range(23)
+        ])
+        cls.esperados = list(cls.empresa.registros.order_by('-fecha_registro', '-id'))
+        # Bloques de 5 filas: 23 registros son 5 bloques, el último incompleto
+        with mock.patch.object(archivo, 'FILAS_POR_BLOQUE', 5):
+            archivo.archivar(cls.empresa, cls.anio)
+
+    def setUp(self):
+        self.archivados = archivo.de_empresa(self.empresa)
+        self.lecturas = []
+
+    def leyendo_rangos(self):
+        """El storage local como si fuera S3: lee por rangos (y se anotan) y open() falla."""
+        lecturas = self.lecturas
+
+        def leer_rango(storage, name, inicio, largo):
+            lecturas.append((inicio, largo))
+            with open(storage.path(name), 'rb') as manejador:
+                manejador.seek(inicio)
+                return manejador.read(largo)
+
+        parches = [
+            mock.patch.object(FileSystemStorage, 'leer_rango', leer_rango, create=True),
+            mock.patch.object(FileSystemStorage, 'open', side_effect=AssertionError('open() descarga el archivo completo')),
+        ]
+        for parche in parches:
+            parche.start()
+            self.addCleanup(parche.stop)
+        return self.archivados.archivos[0].indice
+
+    def test_archiva_en_bloques(self):
+        self.assertFalse(self.empresa.registros.exists())
+        self.assertEqual(self.archivados.anios, [self.anio])
+        self.assertEqual([bloque['filas'] for bloque in self.archivados.archivos[0].indice], [5, 5, 5, 5, 3])
+
+    def test_iterar_en_el_orden_de_la_tabla(self):
+        ids = [registro.id for registro in self.esperados]
+        self.assertEqual([registro.id for registro in self.archivados.iterar()], ids)
+        self.assertEqual([registro.id for registro in self.archivados.iterar(ascendente=True)], ids[::-1])
+        # Página siguiente a la fila 7, como la paginación por cursor
+        pagina = self.archivados.iterar(cursor=archivo.clave(self.esperados[7]), limite=4)
+        self.assertEqual([registro.id for registro in pagina], ids[8:12])
+
+    def test_contar_con_filtros(self):
+        desde, hasta = self.esperados[17].fecha_registro, self.esperados[6].fecha_registro
+        casos = [
+            ({}, lambda r: True),
+            ({'tipo': 'PROVEEDOR'}, lambda r: r.tipo_tercero == 'PROVEEDOR'),
+            ({'desde': desde, 'hasta': hasta}, lambda r: desde <= r.fecha_registro < hasta),
+            ({'tipo': 'CLIENTE', 'desde': desde}, lambda r: r.tipo_tercero == 'CLIENTE' and r.fecha_registro >= desde),
+            ({'nombre': 'jose perez'}, lambda r: r.nombre_respondiente == 'José Pérez'),
+        ]
+        for filtros, cumple in casos:
+            with self.subTest(filtros=filtros):
+                esperado = sum(1 for registro in self.esperados if cumple(registro))
+                self.assertEqual(self.archivados.filtrar(**filtros).contar(), esperado)
+
+    def test_lee_solo_los_bloques_necesarios(self):
+        indice = self.leyendo_rangos()
+
+        primeros = list(self.archivados.iterar(limite=5))
+        self.assertEqual([registro.id for registro in primeros], [registro.id for registro in self.esperados[:5]])
+        self.assertEqual(self.lecturas, [(indice[0]['inicio'], indice[0]['largo'])])
+
+        # Sin filtro de nombre y con bloques completos basta el índice
+        self.lecturas.clear()
+        self.assertEqual(self.archivados.filtrar(tipo='CLIENTE').contar(), 15)
+        self.assertEqual(self.lecturas, [])
+
+        # Rango que corta los bloques 1 y 3: solo se leen esos dos
+        desde, hasta = self.esperados[17].fecha_registro, self.esperados[6].fecha_registro
+        self.archivados.filtrar(desde=desde, hasta=hasta).contar()
+        self.assertEqual(self.lecturas, [(indice[i]['inicio'], indice[i]['largo']) for i in (1, 3)])
+
+        # Recorrido completo: un GET por bloque
+        self.lecturas.clear()
+        self.assertEqual(len(list(self.archivados.iterar())), 23)
+        self.assertEqual(self.lecturas, [(bloque['inicio'], bloque['largo']) for bloque in indice])
+
+        # Detalle de un registro: solo su bloque
+        self.lecturas.clear()
+        self.assertEqual(archivo.buscar(self.esperados[12].id).nombre_respondiente, self.esperados[12].nombre_respondiente)
+        self.assertEqual(self.lecturas, [(indice[2]['inicio'], indice[2]['largo'])])
+
+
+class BorradoRegistrosTests(ConMediaTemporal, TestCase):
+    """Borrar registros los descuenta del resumen y del índice de vigencias."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = EmpresaCliente.objects.create(
+            nombre='Acme', slug='acme', config_encuesta={'preguntas_seccion1': [{'name': 'p_extra', 'texto': '¿Extra?'}]},
+        )
+        cls.anio = timezone.localdate().year
+        registros = []
+        for anio, cantidad in ((cls.anio - 1, 4), (cls.anio, 6)):
+            inicio = timezone.make_aware(datetime.datetime(anio, 1, 10, 9))
+            registros += [
+                RegistroEncuesta.objects.create(
+                    empresa=cls.empresa, tipo_tercero='PROVEEDOR' if i % 2 else 'CLIENTE',
+                    nombre_respondiente=f'Persona {i}', area='Ventas', cargo='Analista',
+                    respuestas_data={'p5_sagrilaft_conoce': 'SI' if i % 3 else 'NO', 'p_extra': 'SI'},
+                    fecha_registro=inicio + datetime.timedelta(days=i),
+                )
+                for i in range(cantidad)
+            ]
+        resumen.acumular(cls.empresa, registros)
+
+    def assertResumenAlDia(self):
+        salida = io.StringIO()
+        call_command('reconstruir_resumen', verificar=True, stdout=salida)
+        self.assertIn('El resumen coincide con los registros.', salida.getvalue())
+
+    def vigencia(self, anio):
+        return VigenciaEmpresa.objects.filter(empresa=self.empresa, anio=anio).first()
+
+    def test_borrar_un_registro(self):
+        ultimo, penultimo = self.empresa.registros.order_by('-fecha_registro')[:2]
+        ultimo.delete()
+        self.assertEqual(self.vigencia(self.anio).total, 5)
+        self.assertEqual(self.vigencia(self.anio).ultima, penultimo.fecha_registro)
+        self.assertResumenAlDia()
+
+    def test_borrar_una_vigencia_entera(self):
+        borrados, _ = self.empresa.registros.filter(fecha_registro__year=self.anio - 1).delete()
+        self.assertEqual(borrados, 4)
+        self.assertIsNone(self.vigencia(self.anio - 1))
+        # Sin filas en cero
+        self.assertFalse(ResumenDiario.objects.filter(fecha__year=self.anio - 1).exists())
+        self.assertFalse(ResumenDiario.objects.filter(cantidad=0).exists())
+        self.assertEqual(resumen.conteos_vigencia(self.empresa)['total'], 6)
+        self.assertResumenAlDia()
+
+    def test_archivar_no_descuenta(self):
+        archivo.archivar(self.empresa, self.anio - 1)
+        self.assertEqual(resumen.conteos_vigencia(self.empresa, self.anio - 1)['total'], 4)
+        self.assertEqual(self.vigencia(self.anio - 1).total, 4)
+        self.empresa.registros.filter(tipo_tercero='PROVEEDOR').delete()
+        # Los proveedores archivados siguen contando; los de la tabla no
+        self.assertEqual(resumen.conteos_vigencia(self.empresa)['por_tipo'], {'CLIENTE': 5, 'PROVEEDOR': 2})
+        self.assertResumenAlDia()
+
+    def test_borrar_la_empresa(self):
+        self.empresa.delete()
+        self.assertFalse(ResumenDiario.objects.exists())
+        self.assertFalse(VigenciaEmpresa.objects.exists())
+
+
+class IndiceVigenciasTests(ConMediaTemporal, TestCase):
+    """VigenciaEmpresa: por año local, cuántos envíos hay y cuándo llegaron el primero y el último."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = EmpresaCliente.objects.create(nombre='Acme', slug='acme')
+        cls.anio = timezone.localdate().year - 1
+        zona = timezone.get_default_timezone()
+        cls.fechas = [
+            datetime.datetime(cls.anio - 1, 3, 1, 9, tzinfo=zona),
+            # Última noche del año en la zona del proyecto: en UTC ya es el año siguiente
+            datetime.datetime(cls.anio - 1, 12, 31, 22, tzinfo=zona),
+            datetime.datetime(cls.anio, 2, 1, 9, tzinfo=zona),
+            datetime.datetime(cls.anio, 5, 1, 9, tzinfo=zona),
+        ]
+
+    def registrar(self, fechas):
+        registros = [
+            RegistroEncuesta.objects.create(
+                empresa=self.empresa, tipo_tercero='CLIENTE', nombre_respondiente=f'Persona {i}',
+                area='Ventas', cargo='Analista', respuestas_data={'p5_sagrilaft_conoce': 'SI'}, fecha_registro=fecha,
+            )
+            for i, fecha in enumerate(fechas)
+        ]
+        resumen.acumular(self.empresa, registros)
+
+    def indice(self):
+        return {
+            v.anio: (v.total, v.primera, v.ultima)
+            for v in VigenciaEmpresa.objects.filter(empresa=self.empresa)
+        }
+
+    def esperado(self):
+        return {
+            self.anio - 1: (2, self.fechas[0], self.fechas[1]),
+            self.anio: (2, self.fechas[2], self.fechas[3]),
+        }
+
+    def test_acumular_suma_al_indice(self):
+        # En desorden y en dos tandas: primera y última se ajustan, el total se suma
+        self.registrar([self.fechas[3], self.fechas[0]])
+        self.registrar([self.fechas[1], self.fechas[2]])
+        self.assertEqual(self.indice(), self.esperado())
+
+    def test_reconstruir_solo_las_vigencias(self):
+        self.registrar(self.fechas)
+        archivo.archivar(self.empresa, self.anio - 1)
+        VigenciaEmpresa.objects.filter(empresa=self.empresa, anio=self.anio).update(total=99)
+        VigenciaEmpresa.objects.filter(empresa=self.empresa, anio=self.anio - 1).delete()
+
+        salida = io.StringIO()
+        call_command('reconstruir_resumen', verificar=True, stdout=salida)
+        self.assertIn('Acme: el índice de vigencias no coincide', salida.getvalue())
+
+        salida = io.StringIO()
+        # Empresas, una consulta agregada, los archivos de la empresa y la recarga: sin recorrer registros
+        with self.assertNumQueries(7):
+            call_command('reconstruir_resumen', vigencias=True, stdout=salida)
+        self.assertIn('Acme: 2 vigencia(s)', salida.getvalue())
+        # La vigencia archivada sale del índice del archivo, sin leer sus bloques
+        self.assertEqual(self.indice(), self.esperado())
+
+        salida = io.StringIO()
+        call_command('reconstruir_resumen', verificar=True, stdout=salida)
+        self.assertIn('El resumen coincide con los registros.', salida.getvalue())
+
+
+class RellenarResumenMigracionTests(TestCase):
+    """0010_rellenar_resumen cuenta igual que formularios/resumen.py, solo con modelos históricos."""
+
+    def test_rellena_solo_empresas_sin_resumen(self):
+        sin_resumen = EmpresaCliente.objects.create(
+            nombre='Acme', slug='acme', tiene_ptee=True,
+            config_encuesta={'preguntas_seccion1': [{'name': 'p_extra', 'texto': '¿Extra?'}]},
+        )
+        RegistroEncuesta.objects.bulk_create([
+            RegistroEncuesta(
+                empresa=sin_resumen, tipo_tercero=tipo, nombre_respondiente='Ana', area='Ventas', cargo='Analista',
+                respuestas_data=data,
+            )
+            for tipo, data in [
+                ('CLIENTE', {'p5_sagrilaft_conoce': 'SI', 'p9_ptee_conoce': 'NO', 'p_extra': 'SI'}),
+                ('PROVEEDOR', {'p5_sarlaft_conoce': 'NO RECUERDA', 'p12_ptee_corrupcion': 'SI'}),
+                ('CLIENTE', {}),
+            ]
+        ])
+        con_resumen = EmpresaCliente.objects.create(nombre='Beta', slug='beta')
+        crear_registros(con_resumen, [{'p5_sagrilaft_conoce': 'SI'}])
+
+        migracion = importlib.import_module('formularios.migrations.0010_rellenar_resumen')
+        migracion.rellenar_resumen(apps, None)
+
+        preguntas = catalogo.catalogo_preguntas(sin_resumen, solo_activas=False)
+        self.assertEqual(
+            catalogo.estadisticas_resumen(resumen.conteos_vigencia(sin_resumen), preguntas),
+            catalogo.estadisticas_registros(sin_resumen.registros.all(), preguntas),
+        )
+        self.assertEqual(resumen.conteos_vigencia(sin_resumen)['total'], 3)
+        # La que ya tenía resumen no se cuenta dos veces
+        self.assertEqual(resumen.conteos_vigencia(con_resumen)['total'], 1)
+
+
+@override_settings(SPOOL_ENCUESTAS=True)
+class SpoolEnviosTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = EmpresaCliente.objects.create(nombre='Acme', slug='acme')
+
+    def setUp(self):
+        carpeta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, carpeta)
+        ajuste = override_settings(SPOOL_ENCUESTAS_DB=f'{carpeta}/spool.sqlite3')
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        self.addCleanup(lambda: spool._conexion().close())
+
+    def encolar(self, cantidad=1, empresa=None, **envio):
+        datos = {
+            'tipo_tercero': 'CLIENTE', 'nombre_respondiente': 'Ana', 'area': 'Ventas', 'cargo': 'Analista',
+            'respuestas_data': {'p5_sagrilaft_conoce': 'SI'}, 'ip_origen': '10.0.0.1', **envio,
+        }
+        return [spool.encolar(empresa or self.empresa, **datos) for _ in range(cantidad)]
+
+    def assertResumen(self, total):
+        preguntas = catalogo.catalogo_preguntas(self.empresa)
+        self.assertEqual(resumen.conteos_vigencia(self.empresa)['total'], total)
+        self.assertEqual(
+            catalogo.estadisticas_resumen(resumen.conteos_vigencia(self.empresa), preguntas),
+            catalogo.estadisticas_registros(self.empresa.registros.all(), preguntas),
+        )
+
+    def test_vaciar_por_lotes(self):
+        antes = timezone.now()
+        spool_ids = self.encolar(5, ip_origen='no-es-una-ip')
+        self.assertEqual(spool.pendientes(), 5)
+        self.assertFalse(RegistroEncuesta.objects.exists())
+
+        salida = io.StringIO()
+        # Dentro del TestCase la conexión está en una transacción: close_old_connections la cerraría
+        with mock.patch('formularios.management.commands.vaciar_spool.close_old_connections'):
+            call_command('vaciar_spool', una_vez=True, lote=2, stdout=salida)
+        self.assertIn('5 envío(s) pasado(s) a la base.', salida.getvalue())
+        self.assertEqual(spool.pendientes(), 0)
+
+        registros = self.empresa.registros.order_by('id')
+        self.assertEqual([str(r.spool_id) for r in registros], spool_ids)
+        registro = registros[0]
+        # Hora del envío (no la del vaciado), máscaras SI/NO e IP inválida descartada
+        self.assertLess(registro.fecha_registro - antes, datetime.timedelta(seconds=5))
+        self.assertEqual(registro.respuestas_si, 1 << sino.indice(self.empresa)['p5_sagrilaft_conoce'])
+        self.assertIsNone(registro.ip_origen)
+        self.assertResumen(5)
+        self.assertEqual(VigenciaEmpresa.objects.get(empresa=self.empresa).total, 5)
+
+    def test_reintento_no_duplica(self):
+        self.encolar(3)
+        # Caída entre el commit en Postgres y el borrado del diario: el lote ya está en la base
+        filas = spool._conexion().execute('SELECT spool_id, datos FROM envios').fetchall()
+        spool._insertar([spool._registro(spool_id, json.loads(datos)) for spool_id, datos in filas], spool.TAMANO_LOTE)
+        self.encolar(1)
+
+        # Los ya insertados se saltan por su spool_id, sin pasar por el camino de errores
+        with self.assertNoLogs('formularios.spool', 'WARNING'):
+            self.assertEqual(spool.vaciar_lote(), (4, 1))
+        self.assertEqual(spool.pendientes(), 0)
+        self.assertEqual(spool._conexion().execute('SELECT COUNT(*) FROM envios_fallidos').fetchone()[0], 0)
+        self.assertEqual(self.empresa.registros.count(), 4)
+        self.assertResumen(4)
+
+    def test_envios_invalidos_se_apartan(self):
+        buenos = self.encolar(2)
+        malo, = self.encolar(tipo_tercero='X' * 50)
+        borrada = EmpresaCliente.objects.create(nombre='Beta', slug='beta')
+        self.encolar(empresa=borrada)
+        borrada.delete()
+
+        with self.assertLogs('formularios.spool', 'WARNING') as logs:
+            self.assertEqual(spool.vaciar_lote(), (4, 2))
+        self.assertTrue(any('Falló el lote del spool' in linea for linea in logs.output))
+        self.assertTrue(any('la empresa' in linea and 'ya no existe' in linea for linea in logs.output))
+
+        self.assertEqual(spool.pendientes(), 0)
+        self.assertEqual(sorted(str(r.spool_id) for r in self.empresa.registros.all()), sorted(buenos))
+        fallidos = spool._conexion().execute('SELECT spool_id, error FROM envios_fallidos').fetchall()
+        self.assertEqual([spool_id for spool_id, _ in fallidos], [malo])
+        self.assertIn('value too long', fallidos[0][1])
+        self.assertResumen(2)
+
+    def test_la_encuesta_encola_en_vez_de_guardar(self):
+        with self.assertLogs('core.sql', 'INFO'):
+            respuesta = self.client.post(reverse('ver_encuesta', args=['acme']), {'tipo_tercero': 'CLIENTE', 'nombre': 'Ana'})
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(spool.pendientes(), 1)
+        self.assertFalse(RegistroEncuesta.objects.exists())
+
+
+class ParticionesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = EmpresaCliente.objects.create(nombre='Acme', slug='acme')
+
+    def registrar(self, anio, cantidad=1):
+        # Última noche del año en la zona del proyecto: en UTC ya es el año siguiente
+        fecha = datetime.datetime(anio, 12, 31, 22, 0, tzinfo=timezone.get_default_timezone())
+        return [
+            RegistroEncuesta.objects.create(
+                empresa=self.empresa, tipo_tercero='CLIENTE', nombre_respondiente=f'Persona {i}',
+                area='Ventas', cargo='Analista', respuestas_data={}, fecha_registro=fecha,
+            )
+            for i in range(cantidad)
+        ]
+
+    def particion_de(self, registro):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT tableoid::regclass::text FROM {particiones.TABLA} WHERE id = %s', [registro.id]
+            )
+            return cursor.fetchone()[0]
+
+    def test_migrar_deja_el_anio_actual_y_el_siguiente(self):
+        self.assertTrue(particiones.particionada())
+        actual = timezone.localdate().year
+        self.assertLessEqual({actual, actual + 1}, set(particiones.existentes()))
+        self.assertEqual(particiones.en_default(), {})
+        self.assertEqual(particiones.asegurar(), [])
+
+    def test_asegurar_crea_los_anios_que_faltan(self):
+        with mock.patch('django.utils.timezone.localdate', return_value=datetime.date(2071, 6, 1)):
+            self.assertEqual(particiones.asegurar(2), [(2071, 0), (2072, 0), (2073, 0)])
+            self.assertEqual(particiones.asegurar(2), [])
+        self.assertLessEqual({2071, 2072, 2073}, set(particiones.existentes()))
+
+        registro, = self.registrar(2072)
+        self.assertEqual(self.particion_de(registro), particiones.nombre(2072))
+
+    def test_crear_mueve_las_filas_de_default(self):
+        registros = self.registrar(1990, cantidad=3)
+        self.assertEqual({self.particion_de(r) for r in registros}, {particiones.PARTICION_DEFAULT})
+        self.assertEqual(particiones.en_default(), {1990: 3})
+
+        self.assertEqual(particiones.crear(1990), 3)
+
+        self.assertEqual(particiones.en_default(), {})
+        self.assertIn(1990, particiones.existentes())
+        self.assertEqual({self.particion_de(r) for r in registros}, {particiones.nombre(1990)})
+        self.assertEqual(RegistroEncuesta.objects.filter(fecha_registro__year=1990).count(), 3)
+
+    def test_comando_crear_particiones(self):
+        self.registrar(1990, cantidad=2)
+
+        salida = io.StringIO()
+        call_command('crear_particiones', stdout=salida)
+        self.assertIn('Filas en DEFAULT: 1990: 2. Créales partición con --anio.', salida.getvalue())
+
+        salida = io.StringIO()
+        call_command('crear_particiones', anio=[1990], stdout=salida)
+        self.assertIn(
+            f'Partición {particiones.nombre(1990)} creada (2 fila(s) movidas desde DEFAULT).', salida.getvalue()
+        )
+        self.assertIn('La partición DEFAULT está vacía.', salida.getvalue())
+
+        with self.assertRaisesMessage(CommandError, '--anios no puede ser negativo.'):
+            call_command('crear_particiones', anios=-1, stdout=io.StringIO())
+
+    def test_filtro_de_vigencia_descarta_las_demas_particiones(self):
+        actual = timezone.localdate().year
+        plan = RegistroEncuesta.objects.filter(empresa=self.empresa, fecha_registro__year=actual).explain()
+        self.assertIn(particiones.nombre(actual), plan)
+        self.assertNotIn(particiones.nombre(actual + 1), plan)
+        self.assertNotIn(particiones.PARTICION_DEFAULT, plan)
@@ -5,4 +5,7 @@ urlpatterns = [
     # Esta es la nueva URL única por empresa (ej: /encuesta/coca-cola/)
     path('encuesta/<slug:slug>/', views.ver_encuesta_publica, name='ver_encuesta'),
     path('encuesta/<slug:slug>/gracias/', views.encuesta_exito, name='encuesta_exito'),
+    # Apoyo a las páginas publicadas (ver formularios/publicacion.py)
+    path('encuesta/<slug:slug>/token/', views.token_encuesta, name='token_encuesta'),
+    path('encuesta/<slug:slug>/logo/', views.logo_encuesta, name='logo_encuesta'),
 ]
\ No newline at end of file
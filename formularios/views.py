@@ -1,78 +1,104 @@
-from django.shortcuts import render, get_object_or_404, redirect
-from empresas.models import EmpresaCliente
+import logging
+import sqlite3
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
+from django.middleware.csrf import get_token
+from django.views.decorators.cache import never_cache
+from django.shortcuts import render, redirect
 from .models import RegistroEncuesta
-from core.security import sanitize_string, sanitize_dict, get_client_ip, rate_limit
+from . import esquema as esquema_encuesta, resumen, spool
+from core import metricas
+from core.security import sanitize_string, sanitize_fields, get_client_ip, rate_limit
 
+logger = logging.getLogger(__name__)
 
-# Tipos de tercero por defecto (para empresas sin configuración personalizada)
-TIPOS_TERCERO_DEFAULT = [
-    {'value': 'CLIENTE', 'label': 'Cliente'},
-    {'value': 'PROVEEDOR', 'label': 'Proveedor'},
-    {'value': 'EMPLEADO', 'label': 'Empleado'},
-    {'value': 'OTRO', 'label': 'Otro'},
-]
 
-
-@rate_limit(key_prefix='encuesta', max_requests=10, window_seconds=60)
-def ver_encuesta_publica(request, slug):
-    empresa = get_object_or_404(EmpresaCliente, slug=slug, activo=True)
-
-    # Extraer configuración personalizada o usar defaults
-    config = empresa.config_encuesta or {}
-    tipos_tercero = config.get('tipos_tercero', TIPOS_TERCERO_DEFAULT)
-    campos_seccion1 = config.get('campos_seccion1', [])
-    preguntas_seccion1 = config.get('preguntas_seccion1', [])
+@rate_limit(key_prefix='encuesta_ver', max_requests=settings.RATE_LIMIT_VER_ENCUESTA, window_seconds=60, methods=['GET', 'HEAD'])
+@rate_limit(key_prefix='encuesta_enviar', max_requests=settings.RATE_LIMIT_ENVIAR_ENCUESTA, window_seconds=60, methods=['POST'])
+async def ver_encuesta_publica(request, slug):
+    # Esquema compilado (empresa, secciones, preguntas): en memoria tras la primera visita
+    esquema = await obtener_esquema(slug)
+    empresa = esquema.empresa
 
     if request.method == 'POST':
         datos = request.POST
 
-        # SEGURIDAD: Sanitizar todos los datos de entrada para prevenir XSS
-        campos_excluidos = ['csrfmiddlewaretoken', 'nombre', 'area', 'cargo', 'tipo_tercero', 'nombre_contacto']
-        respuestas_raw = {k: v for k, v in datos.items() if k not in campos_excluidos}
-        respuestas_sanitizadas = sanitize_dict(respuestas_raw)
-
-        # Guardamos la respuesta con datos sanitizados
-        RegistroEncuesta.objects.create(
-            empresa=empresa,
-            tipo_tercero=sanitize_string(datos.get('tipo_tercero', '')),
-            nombre_respondiente=sanitize_string(datos.get('nombre', '')),
-            area=sanitize_string(datos.get('area', '')),
-            cargo=sanitize_string(datos.get('cargo', '')),
-            respuestas_data=respuestas_sanitizadas,
-            ip_origen=get_client_ip(request)  # SEGURIDAD: Obtener IP real considerando proxies
-        )
+        # SEGURIDAD: Sanitizar todos los datos de entrada para prevenir XSS.
+        # Solo se guardan las claves del esquema de la empresa, recortadas a su longitud máxima
+        longitudes = esquema.longitudes_registro
+        envio = {
+            'tipo_tercero': sanitize_string(datos.get('tipo_tercero', ''), longitudes['tipo_tercero']),
+            'nombre_respondiente': sanitize_string(datos.get('nombre', ''), longitudes['nombre_respondiente']),
+            'area': sanitize_string(datos.get('area', ''), longitudes['area']),
+            'cargo': sanitize_string(datos.get('cargo', ''), longitudes['cargo']),
+            'respuestas_data': sanitize_fields(datos, esquema.claves_permitidas, esquema.longitudes),
+            'ip_origen': get_client_ip(request),  # SEGURIDAD: Obtener IP real considerando proxies
+        }
+        # El selector solo ofrece los tipos de la empresa: otro valor es un envío manipulado
+        if envio['tipo_tercero'] not in esquema.tipos_validos:
+            return HttpResponseBadRequest('Tipo de tercero no válido')
+        await sync_to_async(guardar_envio)(empresa, envio)
 
         return redirect('encuesta_exito', slug=slug)
 
-    # Calcular números de sección dinámicamente
-    seccion_num = 1  # Información General siempre es 1
-    secciones = {'info_general': seccion_num}
-
-    if empresa.tiene_sagrilaft:
-        seccion_num += 1
-        secciones['sagrilaft'] = seccion_num
-
-    if empresa.tiene_sarlaft:
-        seccion_num += 1
-        secciones['sarlaft'] = seccion_num
+    return render(request, 'formularios/encuesta_publica.html', esquema.contexto())
 
-    if empresa.tiene_ptee:
-        seccion_num += 1
-        secciones['ptee'] = seccion_num
 
-    seccion_num += 1
-    secciones['observaciones'] = seccion_num
+def guardar_envio(empresa, envio):
+    """Guarda un envío ya sanitizado (síncrono: transacción y SQLite)."""
+    # En campaña masiva el envío va al spool local y `vaciar_spool` lo pasa a la base por lotes
+    if spool.activo():
+        try:
+            spool.encolar(empresa, **envio)
+            metricas.incrementar('encuestas_envios_total', empresa=empresa.slug)
+            return
+        except (sqlite3.Error, OSError):
+            logger.exception('Spool de envíos no disponible; se guarda directo en la base')
 
-    return render(request, 'formularios/encuesta_publica.html', {
-        'empresa': empresa,
-        'secciones': secciones,
-        'tipos_tercero': tipos_tercero,
-        'campos_seccion1': campos_seccion1,
-        'preguntas_seccion1': preguntas_seccion1,
-    })
+    # Guardamos la respuesta con datos sanitizados y actualizamos el resumen diario
+    with transaction.atomic():
+        registro = RegistroEncuesta.objects.create(empresa=empresa, **envio)
+        resumen.acumular(empresa, [registro])
+    metricas.incrementar('encuestas_envios_total', empresa=empresa.slug)
 
 
-def encuesta_exito(request, slug):
+async def encuesta_exito(request, slug):
     # SEGURIDAD: Solo mostrar página de gracias si la empresa está activa
-    empresa = get_object_or_404(EmpresaCliente, slug=slug, activo=True)
-    return render(request, 'formularios/gracias.html', {'empresa': empresa})
\ No newline at end of file
+    esquema = await obtener_esquema(slug)
+    return render(request, 'formularios/gracias.html', esquema.contexto_gracias())
+
+
+@never_cache
+@rate_limit(key_prefix='encuesta_ver', max_requests=settings.RATE_LIMIT_VER_ENCUESTA, window_seconds=60)
+async def token_encuesta(request, slug):
+    """
+    Token CSRF para las páginas publicadas (pre-renderizadas, sin token propio).
+    get_token() además deja lista la cookie csrftoken en la respuesta.
+    """
+    return JsonResponse({'token': get_token(request)})
+
+
+async def logo_encuesta(request, slug):
+    """
+    Redirige a una URL vigente del logo (las URLs firmadas de S3 vencen): la
+    versión reducida en PNG, o en WebP con ?formato=webp.
+    """
+    esquema = await obtener_esquema(slug)
+    if not esquema.empresa.logo:
+        raise Http404('La empresa no tiene logo')
+    logo = esquema.empresa.logo_grande
+    response = redirect(logo['webp'] if request.GET.get('formato') == 'webp' and logo['webp'] else logo['img'])
+    # Una URL entregada por MediaStorage sigue vigente al menos una ventana más (core/storages.py)
+    response['Cache-Control'] = f'public, max-age={settings.MEDIA_URL_VENTANA}'
+    return response
+
+
+async def obtener_esquema(slug):
+    """Esquema de una empresa activa o 404 (equivale a get_object_or_404(..., activo=True))."""
+    esquema = await esquema_encuesta.aobtener(slug)
+    if esquema is None or not esquema.activa:
+        raise Http404('Encuesta no encontrada')
+    return esquema
@@ -0,0 +1,123 @@
+"""
+Benchmark de las conexiones a Postgres: peticiones por segundo de la encuesta
+pública (GET y POST) con y sin reutilizar conexiones.
+
+Cada --url es un servidor levantado con un modo de conexión distinto (sección
+CONEXIONES A POSTGRES de settings). Contra cada uno corren --concurrencia
+clientes durante --duracion segundos, primero solo GET de la encuesta y luego
+solo envíos (GET /token/ + POST; se mide el POST). El GET no toca la base una
+vez el esquema está en memoria, así que es la referencia: la diferencia entre
+modos aparece en el POST, que abre transacción, inserta y actualiza el resumen.
+
+Uso (desde la raíz del proyecto, contra una base de pruebas: los POST crean registros):
+
+    # WSGI: conexión nueva por petición / persistente
+    DB_CONN_MAX_AGE=0 gunicorn core.wsgi:application -w 4 -b 127.0.0.1:8001
+    gunicorn core.wsgi:application -w 4 -b 127.0.0.1:8002
+    # ASGI: sin pool (conexión por petición) / con pool
+    uvicorn core.asgi:application --workers 4 --port 8003
+    DB_POOL=True uvicorn core.asgi:application --workers 4 --port 8004
+
+    python scripts/benchmark_conexiones.py --slug acme --url http://127.0.0.1:8001 \\
+        --url http://127.0.0.1:8002 --url http://127.0.0.1:8003 --url http://127.0.0.1:8004
+
+Los envíos quedan con nombre "Prueba de carga"; después de medir se pueden
+borrar y correr `python manage.py reconstruir_resumen`. Contra una base local el
+costo de conectar es menor que contra RDS (sin TLS ni latencia de red): la
+diferencia en producción es mayor que la medida aquí.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from carga_encuesta import peticion, percentil
+
+
+class Resultados:
+    def __init__(self):
+        self.latencias = []
+        self.errores = 0
+
+
+async def cliente_get(host, puerto, slug, fin, resultados):
+    while time.monotonic() < fin:
+        inicio = time.perf_counter()
+        try:
+            status, _, _ = await peticion(host, puerto, 'GET', f'/encuesta/{slug}/')
+        except OSError:
+            status = None
+        if status == 200:
+            resultados.latencias.append(time.perf_counter() - inicio)
+        else:
+            resultados.errores += 1
+
+
+async def cliente_post(host, puerto, slug, fin, resultados):
+    while time.monotonic() < fin:
+        try:
+            _, cabeceras, _ = await peticion(host, puerto, 'GET', f'/encuesta/{slug}/token/')
+            cookies = SimpleCookie()
+            for nombre, valor in cabeceras:
+                if nombre == 'set-cookie':
+                    cookies.load(valor)
+            token = cookies['csrftoken'].value
+            cuerpo = urlencode({
+                'csrfmiddlewaretoken': token,
+                'nombre': 'Prueba de carga',
+                'tipo_tercero': 'CLIENTE',
+            }).encode()
+            inicio = time.perf_counter()
+            status, _, _ = await peticion(host, puerto, 'POST', f'/encuesta/{slug}/', {
+                'Content-Type': 'application/x-www-form-urlencoded',
+                'Cookie': f'csrftoken={token}',
+                'Referer': f'http://{host}:{puerto}/encuesta/{slug}/',
+            }, cuerpo)
+        except (OSError, KeyError, IndexError, ValueError):
+            resultados.errores += 1
+            continue
+        if status == 302:
+            resultados.latencias.append(time.perf_counter() - inicio)
+        else:
+            resultados.errores += 1
+
+
+async def medir(url, cliente, opciones):
+    partes = urlsplit(url)
+    host, puerto = partes.hostname, partes.port or 80
+    resultados = Resultados()
+    fin = time.monotonic() + opciones.duracion
+    await asyncio.gather(*(
+        cliente(host, puerto, opciones.slug, fin, resultados) for _ in range(opciones.concurrencia)
+    ))
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', action='append', required=True, help='Servidor a medir (repetible)')
+    parser.add_argument('--slug', required=True, help='Slug de una empresa activa')
+    parser.add_argument('--duracion', type=float, default=15, help='Segundos por servidor y tipo de petición')
+    parser.add_argument('--concurrencia', type=int, default=16, help='Clientes simultáneos')
+    opciones = parser.parse_args()
+
+    print(f'{opciones.concurrencia} clientes, {opciones.duracion:g} s por servidor y tipo de petición\n')
+    print(f"{'servidor':<28}{'petición':<10}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errores':>9}")
+    for url in opciones.url:
+        for nombre, cliente in (('GET', cliente_get), ('POST', cliente_post)):
+            resultados = asyncio.run(medir(url, cliente, opciones))
+            latencias_ms = [l * 1000 for l in resultados.latencias]
+            print(
+                f'{url:<28}{nombre:<10}'
+                f'{len(latencias_ms) / opciones.duracion:>8.1f}'
+                f'{(statistics.median(latencias_ms) if latencias_ms else float("nan")):>9.1f}'
+                f'{percentil(latencias_ms, 95):>9.1f}'
+                f'{percentil(latencias_ms, 99):>9.1f}'
+                f'{resultados.errores:>9}'
+            )
+
+
+if __name__ == '__main__':
+    main()
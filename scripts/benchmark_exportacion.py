@@ -0,0 +1,140 @@
+"""
+Benchmark de la exportación: CSV (;) vs XLSX en streaming.
+
+Mide filas por segundo y pico de memoria (RSS) de cada formato generando
+registros sintéticos en memoria (no necesita base de datos). Cada medición
+corre en un subproceso aparte para que el pico de RSS de una no contamine a la otra.
+
+Uso (desde la raíz del proyecto):
+
+    python scripts/benchmark_exportacion.py                 # 100k y 1M filas
+    python scripts/benchmark_exportacion.py --filas 100000  # solo 100k
+"""
+import argparse
+import datetime
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+
+def configurar_django():
+    from django.conf import settings
+    if not settings.configured:
+        settings.configure(USE_TZ=True, TIME_ZONE='America/Bogota')
+
+
+class RegistrosSinteticos:
+    """Imita el queryset de la exportación: solo expone iterator(chunk_size)."""
+
+    def __init__(self, total):
+        self.total = total
+
+    def iterator(self, chunk_size=None):
+        inicio = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        for i in range(self.total):
+            yield SimpleNamespace(
+                id=i + 1,
+                fecha_registro=inicio + datetime.timedelta(minutes=i),
+                tipo_tercero='PROVEEDOR' if i % 3 else 'CLIENTE',
+                nombre_respondiente=f'Proveedor Ñandú {i}',
+                area='Compras',
+                cargo='Analista',
+                ip_origen='10.0.0.1',
+                respuestas_data={
+                    'nit_cedula': f'00{900000000 + i}',
+                    'tiene_programa_laft': 'SI' if i % 2 else 'NO',
+                    'p5_sagrilaft_conoce': 'SI',
+                    'p6_sagrilaft_actualizado': 'SI_ACTUALIZADO',
+                    'p7_sagrilaft_informado': 'NO',
+                    'p8_sagrilaft_denuncia': 'SI',
+                    'p9_ptee_conoce': 'NO_RECUERDO',
+                    'observaciones': 'Sin observaciones adicionales.',
+                },
+            )
+
+
+def empresa_sintetica():
+    return SimpleNamespace(
+        nombre='Benchmark S.A.',
+        slug='benchmark',
+        tiene_sagrilaft=True,
+        tiene_sarlaft=False,
+        tiene_ptee=True,
+        config_encuesta={
+            'campos_seccion1': [{'name': 'nit_cedula', 'label': 'NIT o Cédula'}],
+            'preguntas_seccion1': [{'name': 'tiene_programa_laft', 'texto': '¿Cuenta con programa LA/FT?'}],
+        },
+    )
+
+
+def medir(formato, filas):
+    """Corre una exportación completa y devuelve sus métricas (se ejecuta en el subproceso)."""
+    configurar_django()
+    from dashboard import exportacion
+
+    rss_inicial = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    inicio = time.perf_counter()
+    total_bytes = 0
+    primer_bloque = None
+    for bloque in exportacion.generar(formato, empresa_sintetica(), RegistrosSinteticos(filas)):
+        if primer_bloque is None:
+            primer_bloque = time.perf_counter() - inicio
+        total_bytes += len(bloque)
+    duracion = time.perf_counter() - inicio
+    rss_final = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return {
+        'formato': formato,
+        'filas': filas,
+        'segundos': round(duracion, 2),
+        'filas_por_segundo': round(filas / duracion),
+        'primer_bloque_ms': round(primer_bloque * 1000, 1),
+        'megabytes': round(total_bytes / 1e6, 1),
+        # ru_maxrss está en KB en Linux
+        'rss_pico_mb': round(rss_final / 1024, 1),
+        'rss_crecimiento_mb': round((rss_final - rss_inicial) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filas', type=int, action='append', help='Número de filas (repetible)')
+    parser.add_argument('--formato', choices=['csv', 'xlsx'], action='append')
+    parser.add_argument('--json', action='store_true', help='Imprimir resultados como JSON')
+    parser.add_argument('--_medir', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._medir:
+        print(json.dumps(medir(args._medir[0], int(args._medir[1]))))
+        return
+
+    resultados = []
+    for filas in args.filas or [100_000, 1_000_000]:
+        for formato in args.formato or ['csv', 'xlsx']:
+            salida = subprocess.run(
+                [sys.executable, __file__, '--_medir', formato, str(filas)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            resultados.append(json.loads(salida))
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+
+    print(f"{'formato':<8}{'filas':>10}{'seg':>9}{'filas/s':>11}{'1er bloque':>12}{'MB':>8}{'RSS pico':>10}{'RSS +':>8}")
+    for r in resultados:
+        print(
+            f"{r['formato']:<8}{r['filas']:>10}{r['segundos']:>9}{r['filas_por_segundo']:>11}"
+            f"{r['primer_bloque_ms']:>10}ms{r['megabytes']:>8}{r['rss_pico_mb']:>10}{r['rss_crecimiento_mb']:>8}"
+        )
+
+
+if __name__ == '__main__':
+    main()
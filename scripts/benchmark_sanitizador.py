@@ -0,0 +1,139 @@
+"""
+Benchmark del sanitizador de envíos: versión anterior vs actual.
+
+Mide el costo por envío de sanitizar un POST típico de la encuesta (columnas
+del registro + respuestas) con distintos tamaños de `observaciones`:
+
+  - anterior: html.escape + cuatro re.sub por campo, sanitize_dict sin esquema
+  - actual:   un solo regex precompilado, solo claves del esquema y recorte por campo
+              (core.security.sanitize_string / sanitize_fields)
+
+No necesita base de datos. Uso (desde la raíz del proyecto):
+
+    python scripts/benchmark_sanitizador.py
+    python scripts/benchmark_sanitizador.py --tamano 1000 --tamano 100000 --json
+"""
+import argparse
+import html
+import json
+import os
+import re
+import sys
+import timeit
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from core.security import sanitize_fields, sanitize_string  # noqa: E402
+
+
+# Mismos límites que formularios/esquema.py para una empresa con SAGRILAFT y PTEE
+PREGUNTAS = [
+    'tiene_programa_laft', 'p5_sagrilaft_conoce', 'p6_sagrilaft_actualizado', 'p7_sagrilaft_informado',
+    'p8_sagrilaft_denuncia', 'p9_ptee_conoce', 'p10_ptee_codigo', 'p11_ptee_conflicto', 'p12_ptee_corrupcion',
+]
+LONGITUDES = {'nit_cedula': 255, 'observaciones': 5000, **{pregunta: 50 for pregunta in PREGUNTAS}}
+CLAVES_PERMITIDAS = frozenset(LONGITUDES)
+LONGITUDES_REGISTRO = {'tipo_tercero': 20, 'nombre_respondiente': 255, 'area': 100, 'cargo': 100}
+CAMPOS_REGISTRO = ['csrfmiddlewaretoken', 'nombre', 'area', 'cargo', 'tipo_tercero', 'nombre_contacto']
+
+
+def sanitize_string_anterior(value):
+    if not isinstance(value, str):
+        return value
+    sanitized = html.escape(value, quote=True)
+    dangerous_patterns = [
+        r'javascript:',
+        r'vbscript:',
+        r'data:text/html',
+        r'on\w+\s*=',
+    ]
+    for pattern in dangerous_patterns:
+        sanitized = re.sub(pattern, '', sanitized, flags=re.IGNORECASE)
+    return sanitized
+
+
+def sanitize_dict_anterior(data):
+    return {key: sanitize_string_anterior(value) if isinstance(value, str) else value
+            for key, value in data.items()}
+
+
+def envio(tamano_observaciones):
+    """POST típico; las observaciones mezclan texto, tildes, '&' y comillas."""
+    frase = 'Sin novedad en el proceso de "debida diligencia" & controles; revisión OK. '
+    datos = {
+        'csrfmiddlewaretoken': 'x' * 64,
+        'nombre': 'Ñandú & Asociados S.A.S.',
+        'area': 'Compras',
+        'cargo': 'Analista <senior>',
+        'tipo_tercero': 'PROVEEDOR',
+        'nit_cedula': '900123456-7',
+        'observaciones': (frase * (tamano_observaciones // len(frase) + 1))[:tamano_observaciones],
+    }
+    datos.update({pregunta: 'SI' for pregunta in PREGUNTAS})
+    return datos
+
+
+def procesar_anterior(datos):
+    respuestas = sanitize_dict_anterior({k: v for k, v in datos.items() if k not in CAMPOS_REGISTRO})
+    return (
+        sanitize_string_anterior(datos['tipo_tercero']),
+        sanitize_string_anterior(datos['nombre']),
+        sanitize_string_anterior(datos['area']),
+        sanitize_string_anterior(datos['cargo']),
+        respuestas,
+    )
+
+
+def procesar_actual(datos):
+    return (
+        sanitize_string(datos['tipo_tercero'], LONGITUDES_REGISTRO['tipo_tercero']),
+        sanitize_string(datos['nombre'], LONGITUDES_REGISTRO['nombre_respondiente']),
+        sanitize_string(datos['area'], LONGITUDES_REGISTRO['area']),
+        sanitize_string(datos['cargo'], LONGITUDES_REGISTRO['cargo']),
+        sanitize_fields(datos, CLAVES_PERMITIDAS, LONGITUDES),
+    )
+
+
+def medir(funcion, datos, objetivo=0.5):
+    """Microsegundos por envío: mejor de 5 repeticiones de ~objetivo segundos."""
+    temporizador = timeit.Timer(lambda: funcion(datos))
+    numero, _ = temporizador.autorange()
+    numero = max(1, int(numero * objetivo / 0.2))
+    return min(temporizador.repeat(repeat=5, number=numero)) / numero * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tamano', type=int, action='append', help='Caracteres de observaciones (repetible)')
+    parser.add_argument('--json', action='store_true', help='Imprimir resultados como JSON')
+    args = parser.parse_args()
+
+    resultados = []
+    for tamano in args.tamano or [0, 1_000, 10_000, 100_000, 1_000_000]:
+        datos = envio(tamano)
+        anterior = medir(procesar_anterior, datos)
+        actual = medir(procesar_actual, datos)
+        resultados.append({
+            'observaciones': tamano,
+            'anterior_us': round(anterior, 1),
+            'actual_us': round(actual, 1),
+            'aceleracion': round(anterior / actual, 1),
+            'guardado_anterior': len(procesar_anterior(datos)[4]['observaciones']),
+            'guardado_actual': len(procesar_actual(datos)[4]['observaciones']),
+        })
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+
+    print(f"{'observ.':>10}{'anterior µs':>14}{'actual µs':>12}{'x':>8}{'guardado antes':>16}{'ahora':>8}")
+    for r in resultados:
+        print(
+            f"{r['observaciones']:>10}{r['anterior_us']:>14}{r['actual_us']:>12}{r['aceleracion']:>8}"
+            f"{r['guardado_anterior']:>16}{r['guardado_actual']:>8}"
+        )
+
+
+if __name__ == '__main__':
+    main()
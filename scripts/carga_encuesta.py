@@ -0,0 +1,181 @@
+"""
+Prueba de carga de la encuesta pública: despliegue WSGI vs ASGI.
+
+Simula lo que pasa en una campaña: muchos respondientes en celulares con mala
+conexión, que tardan segundos en subir el formulario, mientras otros abren la
+encuesta. Con workers síncronos (WSGI) cada envío lento ocupa un worker hasta
+que termina de llegar; con ASGI el proceso sigue atendiendo a los demás mientras
+espera los bytes.
+
+Dos tipos de cliente, en paralelo durante --duracion segundos:
+  - lentos: piden /token/ y envían el POST goteando el cuerpo durante --lentitud segundos
+  - rápidos: abren la encuesta (GET) una y otra vez; de ellos sale la latencia reportada
+
+Solo usa la biblioteca estándar (asyncio con sockets crudos).
+
+Uso (desde la raíz del proyecto, contra una base de pruebas: los POST crean registros):
+
+    # WSGI, 4 workers síncronos
+    gunicorn core.wsgi:application -w 4 -b 127.0.0.1:8001
+    # ASGI, 4 workers uvicorn
+    uvicorn core.asgi:application --workers 4 --port 8002
+
+    python scripts/carga_encuesta.py --slug acme \\
+        --url http://127.0.0.1:8001 --url http://127.0.0.1:8002
+
+Cada petición lleva una X-Forwarded-For distinta para no chocar con el
+limitador de tasa (get_client_ip la toma como IP del respondiente).
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+
+class Resultados:
+    def __init__(self):
+        self.latencias = []
+        self.envios = 0
+        self.envios_fallidos = 0
+        self.errores = 0
+        self.limitadas = 0
+
+
+def ip_aleatoria():
+    return f'10.{random.randint(0, 255)}.{random.randint(0, 255)}.{random.randint(1, 254)}'
+
+
+async def peticion(host, puerto, metodo, ruta, cabeceras=None, cuerpo=b'', lentitud=0):
+    """Una petición HTTP/1.1 con Connection: close. Devuelve (status, cabeceras, cuerpo)."""
+    lector, escritor = await asyncio.open_connection(host, puerto)
+    try:
+        lineas = [f'{metodo} {ruta} HTTP/1.1', f'Host: {host}:{puerto}', 'Connection: close',
+                  f'X-Forwarded-For: {ip_aleatoria()}']
+        for nombre, valor in (cabeceras or {}).items():
+            lineas.append(f'{nombre}: {valor}')
+        if cuerpo:
+            lineas.append(f'Content-Length: {len(cuerpo)}')
+        escritor.write(('\r\n'.join(lineas) + '\r\n\r\n').encode('latin-1'))
+
+        if lentitud and cuerpo:
+            # El cuerpo llega en 10 pedazos repartidos en `lentitud` segundos
+            pedazo = max(1, len(cuerpo) // 10)
+            for inicio in range(0, len(cuerpo), pedazo):
+                escritor.write(cuerpo[inicio:inicio + pedazo])
+                await escritor.drain()
+                await asyncio.sleep(lentitud / 10)
+        else:
+            escritor.write(cuerpo)
+        await escritor.drain()
+
+        respuesta = await lector.read()
+    finally:
+        escritor.close()
+
+    encabezado, _, contenido = respuesta.partition(b'\r\n\r\n')
+    lineas = encabezado.decode('latin-1').split('\r\n')
+    status = int(lineas[0].split()[1])
+    cabeceras_respuesta = [linea.split(':', 1) for linea in lineas[1:] if ':' in linea]
+    return status, [(n.strip().lower(), v.strip()) for n, v in cabeceras_respuesta], contenido
+
+
+async def cliente_lento(host, puerto, slug, lentitud, fin, resultados):
+    while time.monotonic() < fin:
+        try:
+            status, cabeceras, contenido = await peticion(host, puerto, 'GET', f'/encuesta/{slug}/token/')
+            cookies = SimpleCookie()
+            for nombre, valor in cabeceras:
+                if nombre == 'set-cookie':
+                    cookies.load(valor)
+            token = cookies['csrftoken'].value
+            cuerpo = urlencode({
+                'csrfmiddlewaretoken': token,
+                'nombre': 'Prueba de carga',
+                'tipo_tercero': 'CLIENTE',
+                'observaciones': 'x' * 2000,
+            }).encode()
+            status, _, _ = await peticion(host, puerto, 'POST', f'/encuesta/{slug}/', {
+                'Content-Type': 'application/x-www-form-urlencoded',
+                'Cookie': f'csrftoken={token}',
+                'Referer': f'http://{host}:{puerto}/encuesta/{slug}/',
+            }, cuerpo, lentitud)
+        except (OSError, KeyError, IndexError, ValueError):
+            resultados.envios_fallidos += 1
+            continue
+        if status == 302:
+            resultados.envios += 1
+        else:
+            resultados.envios_fallidos += 1
+
+
+async def cliente_rapido(host, puerto, slug, fin, resultados):
+    while time.monotonic() < fin:
+        inicio = time.perf_counter()
+        try:
+            status, _, _ = await peticion(host, puerto, 'GET', f'/encuesta/{slug}/')
+        except OSError:
+            resultados.errores += 1
+            continue
+        if status == 200:
+            resultados.latencias.append(time.perf_counter() - inicio)
+        elif status == 429:
+            resultados.limitadas += 1
+        else:
+            resultados.errores += 1
+
+
+async def medir(url, opciones):
+    partes = urlsplit(url)
+    host, puerto = partes.hostname, partes.port or 80
+    resultados = Resultados()
+    fin = time.monotonic() + opciones.duracion
+
+    await asyncio.gather(
+        *(cliente_lento(host, puerto, opciones.slug, opciones.lentitud, fin, resultados)
+          for _ in range(opciones.lentos)),
+        *(cliente_rapido(host, puerto, opciones.slug, fin, resultados)
+          for _ in range(opciones.rapidos)),
+    )
+    return resultados
+
+
+def percentil(valores, p):
+    if not valores:
+        return float('nan')
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', action='append', required=True, help='Servidor a medir (repetible)')
+    parser.add_argument('--slug', required=True, help='Slug de una empresa activa')
+    parser.add_argument('--duracion', type=float, default=20, help='Segundos por servidor')
+    parser.add_argument('--lentos', type=int, default=16, help='Clientes que suben el formulario despacio')
+    parser.add_argument('--lentitud', type=float, default=4, help='Segundos que tarda en llegar cada POST')
+    parser.add_argument('--rapidos', type=int, default=8, help='Clientes que abren la encuesta')
+    opciones = parser.parse_args()
+
+    print(f'{opciones.lentos} clientes lentos ({opciones.lentitud:g} s por envío), '
+          f'{opciones.rapidos} rápidos, {opciones.duracion:g} s por servidor\n')
+    print(f"{'servidor':<28}{'GET/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'envíos':>8}{'fallos':>8}{'errores':>9}")
+    for url in opciones.url:
+        resultados = asyncio.run(medir(url, opciones))
+        latencias_ms = [l * 1000 for l in resultados.latencias]
+        print(
+            f'{url:<28}'
+            f'{len(latencias_ms) / opciones.duracion:>8.1f}'
+            f'{(statistics.median(latencias_ms) if latencias_ms else float("nan")):>9.1f}'
+            f'{percentil(latencias_ms, 95):>9.1f}'
+            f'{percentil(latencias_ms, 99):>9.1f}'
+            f'{resultados.envios:>8}'
+            f'{resultados.envios_fallidos:>8}'
+            f'{resultados.errores + resultados.limitadas:>9}'
+        )
+
+
+if __name__ == '__main__':
+    main()
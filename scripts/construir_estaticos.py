@@ -0,0 +1,229 @@
+"""
+Construye el CSS y las fuentes que sirven las plantillas, en lugar de cargar
+Tailwind, Font Awesome, Inter y Chart.js desde CDNs en cada visita.
+
+Genera en static/ (que se versiona con el código):
+  - css/app.css: Tailwind con solo las clases usadas (ver @source en
+    assets/app.css), la cara @font-face de Inter y las reglas de Font Awesome
+    de los íconos que aparecen en las plantillas, minificado.
+  - fonts/inter-latin.woff2: Inter variable (pesos 300 a 900) recortada al
+    subconjunto latino.
+  - fonts/fa-solid-900.woff2, fonts/fa-regular-400.woff2: Font Awesome Free
+    recortada a los íconos usados.
+
+Las fuentes originales están en assets/vendor/; Chart.js se sirve tal cual
+desde static/vendor/chartjs/. El despliegue solo corre collectstatic, que les
+pone el hash del contenido al nombre (ver STORAGES en settings).
+
+Correr después de agregar clases o íconos a las plantillas y confirmar los
+cambios de static/. Requiere, solo para construir:
+
+    pip install tailwindcss-bin==4.3.3 fonttools brotli
+
+Uso (desde la raíz del proyecto):
+
+    python scripts/construir_estaticos.py
+    python scripts/construir_estaticos.py --verificar   # sale con 1 si static/ está desactualizado
+"""
+import argparse
+import io
+import re
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+ASSETS = RAIZ / 'assets'
+VENDOR = ASSETS / 'vendor'
+ESTATICOS = RAIZ / 'static'
+
+VERSION_TAILWIND = '4.3.3'
+
+# Donde se buscan clases de íconos (fas fa-...); las de Tailwind las busca el propio Tailwind
+FUENTES_ICONOS = ['dashboard/templates/**/*.html', 'formularios/templates/**/*.html', 'dashboard/forms.py']
+
+# Subconjunto "latin" de Google Fonts: ASCII, Latin-1 (tildes y ñ) y puntuación general
+RANGO_LATINO = (
+    'U+0000-00FF, U+0131, U+0152-0153, U+02BB-02BC, U+02C6, U+02DA, U+02DC, U+0304, U+0308, U+0329, '
+    'U+2000-206F, U+20AC, U+2122, U+2191, U+2193, U+2212, U+2215, U+FEFF, U+FFFD'
+)
+
+# Estilos de Font Awesome usados (fas y far) -> archivo de la fuente
+FUENTES_FA = {'900': 'fa-solid-900.woff2', '400': 'fa-regular-400.woff2'}
+
+CLASE_FA = re.compile(r'(?<![\w-])(fa[srb]?|fa-[a-z0-9]+(?:-[a-z0-9]+)*)(?![\w-])')
+REGLA_ICONO = re.compile(r'([^{]+)\{\s*content:\s*"\\([0-9a-f]+)";\s*\}')
+SELECTOR_ICONO = re.compile(r'\.(fa-[\w-]+)::?before')
+
+
+def clases_iconos():
+    """Clases fa, fas, far, fa-* que aparecen en las plantillas."""
+    clases = set()
+    for patron in FUENTES_ICONOS:
+        for ruta in RAIZ.glob(patron):
+            clases.update(CLASE_FA.findall(ruta.read_text(encoding='utf-8')))
+    return clases
+
+
+def bloques(css):
+    """Reglas de primer nivel de una hoja de estilos, sin comentarios."""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    resultado, profundidad, inicio = [], 0, 0
+    for i, caracter in enumerate(css):
+        if caracter == '{':
+            profundidad += 1
+        elif caracter == '}':
+            profundidad -= 1
+            if profundidad == 0:
+                resultado.append(css[inicio:i + 1].strip())
+                inicio = i + 1
+    return resultado
+
+
+def css_font_awesome(usadas):
+    """
+    Recorta el all.css de Font Awesome a los íconos y utilidades usados.
+    Devuelve (css, puntos de código de los íconos). Quedan fuera las marcas
+    (fab) y las caras de compatibilidad con v4/v5.
+    """
+    origen = (VENDOR / 'fontawesome' / 'css' / 'all.css').read_text(encoding='utf-8')
+    reglas, animaciones, codigos = [], [], set()
+
+    for bloque in bloques(origen):
+        icono = REGLA_ICONO.fullmatch(bloque)
+        if icono and all(SELECTOR_ICONO.fullmatch(s.strip()) for s in icono.group(1).split(',')):
+            selectores = [s.strip() for s in icono.group(1).split(',')]
+            selectores = [s for s in selectores if SELECTOR_ICONO.fullmatch(s).group(1) in usadas]
+            if selectores:
+                reglas.append(f'{", ".join(selectores)} {{ content: "\\{icono.group(2)}"; }}')
+                codigos.add(int(icono.group(2), 16))
+        elif bloque.startswith('@font-face'):
+            familia = re.search(r"font-family:\s*'([^']+)'", bloque).group(1)
+            if familia == 'Font Awesome 6 Free':
+                peso = re.search(r'font-weight:\s*(\d+)', bloque).group(1)
+                reglas.append(
+                    f"@font-face {{ font-family: '{familia}'; font-style: normal; font-weight: {peso}; "
+                    f'font-display: block; src: url("../fonts/{FUENTES_FA[peso]}") format("woff2"); }}'
+                )
+        elif bloque.startswith('@keyframes'):
+            animaciones.append(bloque)
+        elif 'Brands' not in bloque:
+            # Las reglas de utilidades (fa-spin, fa-fw, ...) solo si alguna de sus clases se usa
+            clases = set(re.findall(r'\.(fa[\w-]*)', bloque if bloque.startswith('@') else bloque.split('{')[0]))
+            if not clases or clases & usadas:
+                reglas.append(bloque)
+
+    usadas_en_reglas = '\n'.join(reglas)
+    for animacion in animaciones:
+        nombre = animacion.split()[1]
+        if re.search(rf'\b{re.escape(nombre)}\b', usadas_en_reglas):
+            reglas.append(animacion)
+
+    licencia = (
+        '/*! Font Awesome Free 6.6.0 by @fontawesome - https://fontawesome.com '
+        'License - https://fontawesome.com/license/free (Icons: CC BY 4.0, Fonts: SIL OFL 1.1, Code: MIT License) */'
+    )
+    return licencia + '\n' + '\n'.join(reglas) + '\n', codigos
+
+
+def css_inter():
+    return (
+        "/*! Inter 3.19 (https://github.com/rsms/inter) - SIL Open Font License 1.1 */\n"
+        "@font-face { font-family: 'Inter'; font-style: normal; font-weight: 300 900; font-display: swap; "
+        f'src: url("../fonts/inter-latin.woff2") format("woff2"); unicode-range: {RANGO_LATINO}; }}\n'
+    )
+
+
+def puntos_de_codigo(rango):
+    codigos = set()
+    for parte in rango.split(','):
+        desde, _, hasta = parte.strip()[2:].partition('-')
+        codigos.update(range(int(desde, 16), int(hasta or desde, 16) + 1))
+    return codigos
+
+
+def recortar_fuente(origen, codigos, ejes=None):
+    """Fuente recortada a los puntos de código dados, como woff2 (bytes)."""
+    from fontTools import subset
+    from fontTools.ttLib import TTFont
+    from fontTools.varLib import instancer
+
+    # Sin recalcular la fecha de modificación: la salida tiene que ser reproducible para --verificar
+    fuente = TTFont(origen, recalcTimestamp=False)
+    opciones = subset.Options()
+    opciones.flavor = 'woff2'
+    opciones.layout_features = ['*']
+    recortador = subset.Subsetter(opciones)
+    recortador.populate(unicodes=codigos)
+    recortador.subset(fuente)
+    if ejes:
+        # Se instancia después de recortar: al revés el recorte falla en gvar (y tarda más)
+        fuente = instancer.instantiateVariableFont(fuente, ejes)
+    salida = io.BytesIO()
+    subset.save_font(fuente, salida, opciones)
+    return salida.getvalue()
+
+
+def tailwind():
+    ejecutable = shutil.which('tailwindcss')
+    if not ejecutable:
+        sys.exit(f'No se encontró tailwindcss: pip install tailwindcss-bin=={VERSION_TAILWIND}')
+    version = subprocess.run([ejecutable, '--help'], capture_output=True, text=True).stdout
+    if f'v{VERSION_TAILWIND}' not in version.split('\n', 1)[0]:
+        sys.exit(f'Se esperaba tailwindcss v{VERSION_TAILWIND}: {version.splitlines()[0] if version else "?"}')
+    return ejecutable
+
+
+def construir():
+    """Devuelve {ruta relativa a static/: contenido} de todos los archivos generados."""
+    usadas = clases_iconos()
+    iconos, codigos = css_font_awesome(usadas)
+
+    # La entrada va por stdin con cwd en assets/ para que @import y @source resuelvan
+    # relativo a assets/app.css; los url() quedan tal cual, relativos a static/css/
+    entrada = (
+        (ASSETS / 'app.css').read_text(encoding='utf-8')
+        + '\n' + css_inter()
+        + '\n@layer components {\n' + iconos + '}\n'
+    )
+    compilado = subprocess.run(
+        [tailwind(), '--input', '-', '--output', '-', '--minify'],
+        input=entrada.encode(), capture_output=True, cwd=ASSETS,
+    )
+    if compilado.returncode:
+        sys.exit(compilado.stderr.decode())
+
+    archivos = {'css/app.css': compilado.stdout}
+    archivos['fonts/inter-latin.woff2'] = recortar_fuente(
+        VENDOR / 'inter' / 'Inter-Variable.ttf', puntos_de_codigo(RANGO_LATINO), {'wght': (300, 900), 'slnt': 0},
+    )
+    for nombre in FUENTES_FA.values():
+        archivos[f'fonts/{nombre}'] = recortar_fuente(VENDOR / 'fontawesome' / 'webfonts' / nombre, codigos)
+    return archivos, len(codigos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--verificar', action='store_true', help='No escribe: falla si static/ no coincide con lo construido')
+    opciones = parser.parse_args()
+
+    archivos, iconos = construir()
+
+    if opciones.verificar:
+        distintos = [r for r, c in archivos.items() if not (ESTATICOS / r).exists() or (ESTATICOS / r).read_bytes() != c]
+        if distintos:
+            sys.exit('Desactualizado, correr scripts/construir_estaticos.py: ' + ', '.join(distintos))
+        print('static/ está al día')
+        return
+
+    for ruta, contenido in archivos.items():
+        destino = ESTATICOS / ruta
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        destino.write_bytes(contenido)
+        print(f'{ruta:<28}{len(contenido) / 1024:>8.1f} KB')
+    print(f'{iconos} íconos de Font Awesome')
+
+
+if __name__ == '__main__':
+    main()